@@ -0,0 +1,110 @@
+"""
+ベンチマークの計測・集計・閾値判定 (標準ライブラリのみで動く)。
+"""
+import fnmatch
+import gc
+import time
+from dataclasses import asdict, dataclass, field
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+METRICS = ("p50_us", "p90_us", "p99_us", "mean_us")
+
+@dataclass
+class BenchmarkResult:
+    name: str
+    samples: int
+    p50_us: float
+    p90_us: float
+    p99_us: float
+    mean_us: float
+    params: Dict[str, Any] = field(default_factory=dict)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+def percentile(sorted_values: Sequence[float], q: float) -> float:
+    """ソート済みの値の q 分位点 (0 <= q <= 1、線形補間)"""
+    if not sorted_values:
+        return 0.0
+    position = (len(sorted_values) - 1) * q
+    lower = int(position)
+    upper = min(lower + 1, len(sorted_values) - 1)
+    fraction = position - lower
+    return sorted_values[lower] * (1.0 - fraction) + sorted_values[upper] * fraction
+
+def summarize(name: str, durations_us: Sequence[float], params: Optional[Dict[str, Any]] = None) -> BenchmarkResult:
+    values = sorted(durations_us)
+    return BenchmarkResult(
+        name=name,
+        samples=len(values),
+        p50_us=percentile(values, 0.50),
+        p90_us=percentile(values, 0.90),
+        p99_us=percentile(values, 0.99),
+        mean_us=sum(values) / len(values) if values else 0.0,
+        params=dict(params or {}),
+    )
+
+def measure(
+    name: str,
+    func: Callable[[], Any],
+    repeat: int,
+    warmup: int = 10,
+    params: Optional[Dict[str, Any]] = None,
+) -> BenchmarkResult:
+    """
+    func を warmup 回空打ちした後、repeat 回の1回ごとの所要時間を計測する。
+    計測中は GC を止める (GC の発生タイミングで p99 がぶれるのを避ける)。
+    """
+    for _ in range(warmup):
+        func()
+    durations: List[float] = []
+    clock = time.perf_counter_ns
+    gc_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        for _ in range(repeat):
+            started = clock()
+            func()
+            durations.append((clock() - started) / 1000.0)
+    finally:
+        if gc_enabled:
+            gc.enable()
+    return summarize(name, durations, params)
+
+def check_thresholds(results: Sequence[BenchmarkResult], thresholds: Dict[str, Dict[str, float]]) -> List[str]:
+    """
+    絶対値の閾値判定。thresholds は {ケース名のパターン (fnmatch): {指標: 上限 (µs)}}。
+    超過したケースの説明のリストを返す (空なら合格)。
+    """
+    violations = []
+    for result in results:
+        for pattern, limits in thresholds.items():
+            if not fnmatch.fnmatchcase(result.name, pattern):
+                continue
+            for metric, limit in limits.items():
+                value = getattr(result, metric)
+                if value > limit:
+                    violations.append(f"{result.name}: {metric}={value:.1f}us exceeds threshold {limit:.1f}us")
+    return violations
+
+def compare_to_baseline(
+    results: Sequence[BenchmarkResult],
+    baseline: Dict[str, Dict[str, Any]],
+    tolerance: float = 0.25,
+    metric: str = "p90_us",
+    min_delta_us: float = 5.0,
+) -> List[str]:
+    """
+    以前の計測結果 (ケース名 -> 結果の dict) との比較。metric が (1 + tolerance) 倍を超え、
+    かつ差が min_delta_us 以上のケースを退行として返す (数 µs のケースのノイズを除くため)。
+    """
+    violations = []
+    for result in results:
+        previous = baseline.get(result.name)
+        if previous is None:
+            continue
+        before = previous[metric]
+        after = getattr(result, metric)
+        if after > before * (1.0 + tolerance) and after - before >= min_delta_us:
+            violations.append(f"{result.name}: {metric} {before:.1f}us -> {after:.1f}us (+{(after / before - 1.0) * 100.0:.0f}%)")
+    return violations
@@ -0,0 +1,87 @@
+"""
+ベンチマークの実行 CLI。
+
+    python -m benchmarks.run                              # 全ケースを計測し、表と JSON を出力
+    python -m benchmarks.run --quick --filter 'interleave/*'
+    python -m benchmarks.run --output current.json --baseline previous.json
+
+閾値 (benchmarks/thresholds.json) の超過、または --baseline との比較で退行があれば終了コード 1 を返す。
+"""
+import argparse
+import fnmatch
+import json
+import os
+import platform
+import sys
+import time
+from typing import Any, Dict, List, Optional, Sequence
+from benchmarks.harness import BenchmarkResult, check_thresholds, compare_to_baseline, measure
+from benchmarks.suite import Case, build_cases
+
+DEFAULT_THRESHOLDS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "thresholds.json")
+
+def run_cases(cases: Sequence[Case], pattern: Optional[str] = None, warmup: int = 10) -> List[BenchmarkResult]:
+    results = []
+    for case in cases:
+        if pattern is not None and not fnmatch.fnmatchcase(case.name, pattern):
+            continue
+        if case.setup is not None:
+            case.setup()
+        try:
+            results.append(measure(case.name, case.func, case.repeat, warmup=min(warmup, case.repeat), params=case.params))
+        finally:
+            if case.teardown is not None:
+                case.teardown()
+    return results
+
+def report(results: Sequence[BenchmarkResult]) -> Dict[str, Any]:
+    """機械可読な結果 (JSON にそのまま出力する)"""
+    return {
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "results": {result.name: result.to_dict() for result in results},
+    }
+
+def format_table(results: Sequence[BenchmarkResult]) -> str:
+    width = max((len(result.name) for result in results), default=4)
+    lines = [f"{'case':<{width}}  {'p50 (us)':>10}  {'p90 (us)':>10}  {'p99 (us)':>10}"]
+    for result in results:
+        lines.append(f"{result.name:<{width}}  {result.p50_us:>10.1f}  {result.p90_us:>10.1f}  {result.p99_us:>10.1f}")
+    return "\n".join(lines)
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Interleaving hot path benchmarks")
+    parser.add_argument("--quick", action="store_true", help="ケースと計測回数を減らす (スモークテスト用)")
+    parser.add_argument("--filter", default=None, help="計測するケース名のパターン (fnmatch)")
+    parser.add_argument("--output", default=None, help="結果の JSON の出力先 (省略時は標準出力)")
+    parser.add_argument("--thresholds", default=DEFAULT_THRESHOLDS, help="絶対値の閾値ファイル (空文字で無効)")
+    parser.add_argument("--baseline", default=None, help="比較する以前の結果 JSON")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="--baseline に対して許容する悪化率")
+    parser.add_argument("--metric", default="p90_us", help="--baseline との比較に使う指標")
+    args = parser.parse_args(argv)
+
+    results = run_cases(build_cases(quick=args.quick), args.filter)
+    print(format_table(results), file=sys.stderr)
+
+    output = json.dumps(report(results), indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+    violations = []
+    if args.thresholds:
+        with open(args.thresholds, encoding="utf-8") as f:
+            violations.extend(check_thresholds(results, json.load(f)))
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)["results"]
+        violations.extend(compare_to_baseline(results, baseline, args.tolerance, args.metric))
+    for violation in violations:
+        print(f"REGRESSION {violation}", file=sys.stderr)
+    return 1 if violations else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
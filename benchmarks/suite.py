@@ -0,0 +1,197 @@
+"""
+ベンチマークケースの定義と、計測用の合成ランカー。
+
+- interleave: TeamDraftInterleaver / OptimizedInterleaver をリスト長・重複率ごとに計測
+  (optimized_cold は毎回確率分布のキャッシュを空にし、キャッシュミス時のリクエストの処理を計測)
+- adapter: LambdaRankerAdapter.rank (dict -> Item 変換) をリスト長ごとに計測
+- logging: log_ranking_result (同期 / 非同期) をリスト長ごとに計測
+- config: ConfigManager.get_config (キャッシュ済みのホットパス)
+- executor: ABExecutor.run をランカーの種類 (CPU バウンド / GIL を解放) とレイテンシごとに
+  逐次 / 並行で計測 (parallel_enabled を有効にする判断材料)
+"""
+import logging
+import random
+import time
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence
+from src.config import ConfigManager, ExperimentConfig
+from src.context import Context, Item
+from src.execution.executor import ABExecutor
+from src.interleaving.method import OptimizedInterleaver, TeamDraftInterleaver
+from src.interleaving.optimized import clear_tables, wait_for_tables
+from src.observability import logging as interleaving_logging
+from src.ranker.adapter import LambdaRankerAdapter
+
+@dataclass
+class Case:
+    name: str
+    func: Callable[[], Any]
+    repeat: int
+    params: Dict[str, Any] = field(default_factory=dict)
+    # 計測の前後で呼ぶ (ログ出力先の差し替えなど)
+    setup: Optional[Callable[[], Any]] = None
+    teardown: Optional[Callable[[], Any]] = None
+
+def make_lists(n: int, overlap: float, seed: int = 0) -> Sequence[List[Item]]:
+    """
+    長さ n のランキング A / B を作る。B の n * overlap 件は A にも含まれるアイテム
+    (順位はシャッフル)、残りは B のみのアイテムとする。
+    """
+    rng = random.Random(seed)
+    list_a = [Item(id=f"a{i}", score=float(n - i)) for i in range(n)]
+    shared = rng.sample([item.id for item in list_a], int(n * overlap))
+    ids_b = shared + [f"b{i}" for i in range(n - len(shared))]
+    rng.shuffle(ids_b)
+    list_b = [Item(id=item_id, score=float(n - i)) for i, item_id in enumerate(ids_b)]
+    return list_a, list_b
+
+def _spin(iterations: int) -> int:
+    x = 0
+    for i in range(iterations):
+        x += i * i
+    return x
+
+_spin_rate: Optional[float] = None
+
+def _spin_iterations_per_second() -> float:
+    """_spin の1秒あたりの反復回数 (初回のみ計測)"""
+    global _spin_rate
+    if _spin_rate is None:
+        iterations = 200_000
+        started = time.perf_counter()
+        _spin(iterations)
+        _spin_rate = iterations / (time.perf_counter() - started)
+    return _spin_rate
+
+class CpuBoundRanker:
+    """
+    単独実行で latency 秒かかる量の Python の計算をする (GIL を保持する) 合成ランカー。
+    計算量は固定のため、並行実行では GIL の奪い合いでそのまま遅くなる。
+    """
+    def __init__(self, items: List[Item], latency: float):
+        self.items = items
+        self.iterations = int(latency * _spin_iterations_per_second())
+
+    def rank(self, context: Context) -> List[Item]:
+        _spin(self.iterations)
+        return self.items
+
+class SleepingRanker:
+    """latency 秒 sleep する (GIL を解放する I/O / NumPy 相当の) 合成ランカー"""
+    def __init__(self, items: List[Item], latency: float):
+        self.items = items
+        self.latency = latency
+
+    def rank(self, context: Context) -> List[Item]:
+        time.sleep(self.latency)
+        return self.items
+
+RANKER_KINDS = {"cpu": CpuBoundRanker, "sleep": SleepingRanker}
+
+class _NullStream:
+    def write(self, data: str) -> int:
+        return len(data)
+
+    def flush(self) -> None:
+        pass
+
+class _SilencedLogger:
+    """同期出力のケースでは logger のハンドラーの出力先を、捨てる stream に差し替える"""
+    def __init__(self):
+        self._previous: List[Any] = []
+
+    def start(self) -> None:
+        interleaving_logging.configure_logging()
+        handlers = [h for h in interleaving_logging.logger.handlers if isinstance(h, logging.StreamHandler)]
+        self._previous = [(h, h.setStream(_NullStream())) for h in handlers]
+
+    def stop(self) -> None:
+        for handler, stream in self._previous:
+            handler.setStream(stream)
+        self._previous = []
+
+def interleave_cases(sizes: Sequence[int], overlaps: Sequence[float], repeat: int) -> Iterator[Case]:
+    for n in sizes:
+        for overlap in overlaps:
+            list_a, list_b = make_lists(n, overlap)
+            params = {"n": n, "overlap": overlap, "k": 20}
+            team_draft = TeamDraftInterleaver(seed=0)
+            optimized = OptimizedInterleaver(seed=0)
+            yield Case(f"interleave/team_draft/n={n}/overlap={overlap}",
+                       lambda i=team_draft, a=list_a, b=list_b: i.interleave(a, b, k=20), repeat, params)
+            yield Case(f"interleave/optimized/n={n}/overlap={overlap}",
+                       lambda i=optimized, a=list_a, b=list_b: i.interleave(a, b, k=20), repeat, params)
+            # 同じリストでも毎回キャッシュを空にするため、重複構造は常に未解決 (実際のトラフィックの初見の構造)。
+            # 求解はバックグラウンドのスレッドで進むため、その GIL の奪い合いも計測に含まれる
+            yield Case(f"interleave/optimized_cold/n={n}/overlap={overlap}",
+                       lambda i=optimized, a=list_a, b=list_b: _cold_interleave(i, a, b), repeat, params,
+                       teardown=wait_for_tables)
+
+def _cold_interleave(interleaver: OptimizedInterleaver, list_a: List[Item], list_b: List[Item]) -> List[Item]:
+    clear_tables()
+    return interleaver.interleave(list_a, list_b, k=20)
+
+def adapter_cases(sizes: Sequence[int], repeat: int) -> Iterator[Case]:
+    ctx = Context(user_id="bench-user", user_hash=1, params={"q": "bench"})
+    for n in sizes:
+        raw = [{"id": f"item{i}", "score": float(n - i), "category": "c", "price": i} for i in range(n)]
+        for lazy_meta in (False, True):
+            adapter = LambdaRankerAdapter(lambda _, raw=raw: raw, lazy_meta=lazy_meta)
+            yield Case(f"adapter/rank/n={n}/lazy_meta={lazy_meta}", lambda a=adapter: a.rank(ctx), repeat,
+                       {"n": n, "lazy_meta": lazy_meta})
+
+def logging_cases(sizes: Sequence[int], repeat: int) -> Iterator[Case]:
+    ctx = Context(user_id="bench-user", user_hash=1)
+    for n in sizes:
+        list_a, list_b = make_lists(n, 0.5)
+        items = TeamDraftInterleaver(seed=0).interleave(list_a, list_b)
+        func = lambda items=items: interleaving_logging.log_ranking_result("bench-ranking", "INTERLEAVE", ctx, items)
+        silenced = _SilencedLogger()
+        yield Case(f"logging/sync/n={n}", func, repeat, {"n": n, "asynchronous": False},
+                   setup=silenced.start, teardown=silenced.stop)
+        yield Case(f"logging/async/n={n}", func, repeat, {"n": n, "asynchronous": True},
+                   setup=lambda: interleaving_logging.configure_logging(asynchronous=True, stream=_NullStream()),
+                   teardown=lambda: (interleaving_logging.flush_logs(), interleaving_logging.configure_logging()))
+
+def config_cases(repeat: int) -> Iterator[Case]:
+    manager = ConfigManager(ssm_client=_StaticSsmClient(), ttl_seconds=3600.0)
+    manager.get_config()
+    yield Case("config/get_config/cached", manager.get_config, repeat, {"ttl_seconds": 3600.0})
+
+class _StaticSsmClient:
+    """get_parameters に固定値を返す SSM クライアント (ネットワークに出ない)"""
+    def get_parameters(self, Names: Sequence[str], **kwargs: Any) -> Dict[str, Any]:
+        values = {"mode": "INTERLEAVE", "sampling_rate": "0.1", "parallel_enabled": "true"}
+        return {"Parameters": [
+            {"Name": name, "Value": values[name.rsplit("/", 1)[-1]]}
+            for name in Names if name.rsplit("/", 1)[-1] in values
+        ]}
+
+def executor_cases(latencies_ms: Sequence[float], repeat: int) -> Iterator[Case]:
+    ctx = Context(user_id="bench-user", user_hash=1)
+    list_a, list_b = make_lists(100, 0.5)
+    executor = ABExecutor()
+    for kind, ranker_class in RANKER_KINDS.items():
+        for latency_ms in latencies_ms:
+            ranker_a = ranker_class(list_a, latency_ms / 1000.0)
+            ranker_b = ranker_class(list_b, latency_ms / 1000.0)
+            for parallel in (False, True):
+                config = ExperimentConfig(mode="INTERLEAVE", sampling_rate=1.0, parallel_enabled=parallel)
+                mode = "parallel" if parallel else "sequential"
+                yield Case(f"executor/{kind}/latency_ms={latency_ms}/{mode}",
+                           lambda a=ranker_a, b=ranker_b, c=config: executor.run(a, b, ctx, c), repeat,
+                           {"ranker": kind, "latency_ms": latency_ms, "parallel": parallel})
+
+def build_cases(quick: bool = False) -> List[Case]:
+    """quick=True の場合はケースと計測回数を減らす (CI のスモークテスト用)"""
+    if quick:
+        sizes, overlaps, repeat, slow_repeat, latencies = (20, 100), (0.0, 0.5), 50, 5, (1.0,)
+    else:
+        sizes, overlaps, repeat, slow_repeat, latencies = (20, 100, 1000), (0.0, 0.5, 0.9), 1000, 100, (1.0, 5.0, 20.0)
+    cases: List[Case] = []
+    cases.extend(interleave_cases(sizes, overlaps, repeat))
+    cases.extend(adapter_cases(sizes, repeat))
+    cases.extend(logging_cases(sizes, repeat))
+    cases.extend(config_cases(repeat * 10))
+    cases.extend(executor_cases(latencies, slow_repeat))
+    return cases
@@ -1,71 +1,246 @@
 
+import os
+import random
+import threading
 import time
-import boto3
 from dataclasses import dataclass
-from typing import Optional, Dict, Any
+from types import MappingProxyType
+from typing import Optional, Dict, Any, Hashable, Mapping, NamedTuple, Tuple, Union
+from src.config_source import (
+    CONFIG_KEYS, ENV_PREFIX, SSM_PREFIX, ConfigSource, EnvConfigSource, FileConfigSource, SsmConfigSource,
+)
+from src.observability.logging import log_config_refresh_failed
+from src.observability.tracing import current_trace
 
-@dataclass
+@dataclass(frozen=True)
 class ExperimentConfig:
     mode: str
     sampling_rate: float
     parallel_enabled: bool
     interleave_method: str = "team_draft"
+    # Optimized Interleaving のクレジットの順位割引の指数 (get_interleaver の tau)
+    tau: float = 1.0
+    # 並行実行のバックエンド ("thread" / "process")。parallel_enabled が True の場合のみ使われる
+    execution_backend: str = "thread"
+    # MULTILEAVE モードで合成するランカー名 (先頭がベースライン)
+    rankers: Tuple[str, ...] = ("A", "B")
+    multileave_method: str = "team_draft"
+    # バケット判定用のハッシュ salt (実験ごとに変えるとバケットが独立になる。空なら salt なし)
+    salt: str = ""
+    # 遅いランカーのヘッジ実行 (src/ranker/hedge.py の HedgedRanker で使う)
+    hedge_enabled: bool = False
+    # ヘッジまでの待ち時間 (ms)。None の場合は直近の所要時間の hedge_percentile 分位点
+    hedge_delay_ms: Optional[float] = None
+    hedge_percentile: float = 0.95
+
+    @property
+    def baseline(self) -> str:
+        """サンプリング対象外のユーザーに返すランカー名"""
+        return self.rankers[0] if self.rankers else "A"
+
+# 1つの実験だけを定義したドキュメント (従来の形式) の実験名
+DEFAULT_EXPERIMENT = "default"
+
+class ExperimentSet(NamedTuple):
+    """
+    設定ドキュメントを解析した結果 (実験名 -> ExperimentConfig)。イミュータブルで、
+    ConfigManager は更新のたびに新しいものを作って参照ごと差し替える (読み出し側はロック不要)。
+    """
+    experiments: Mapping[str, ExperimentConfig]
+    default: str
+
+    @classmethod
+    def build(cls, experiments: Dict[str, ExperimentConfig], default: str) -> "ExperimentSet":
+        return cls(MappingProxyType(dict(experiments)), default)
+
+    def get(self, name: Optional[str] = None) -> Optional[ExperimentConfig]:
+        """name の実験の設定 (None の場合は default の実験)。未定義の名前は None"""
+        return self.experiments.get(self.default if name is None else name)
+
+# 設定ソースの選択 ("ssm", "env", "file")。コンストラクタ引数が優先される
+ENV_CONFIG_SOURCE = 'INTERLEAVING_CONFIG_SOURCE'
+ENV_CONFIG_PATH = 'INTERLEAVING_CONFIG_PATH'
+# SSM で複数の実験をまとめた JSON ドキュメントを1つのパラメータとして読む場合のパラメータ名
+ENV_CONFIG_PARAMETER = 'INTERLEAVING_CONFIG_PARAMETER'
+
+def build_source(
+    source: Optional[str] = None,
+    ssm_client: Optional[Any] = None,
+    config_path: Optional[str] = None,
+    ssm_parameter: Optional[str] = None,
+) -> ConfigSource:
+    """
+    ソース名 ("ssm" / "env" / "file"、未指定時は環境変数 INTERLEAVING_CONFIG_SOURCE、それもなければ "ssm")
+    から ConfigSource を作る。
+    """
+    name = source or os.environ.get(ENV_CONFIG_SOURCE, 'ssm')
+    if name == 'env':
+        return EnvConfigSource()
+    if name == 'file':
+        return FileConfigSource(config_path or os.environ.get(ENV_CONFIG_PATH, ''))
+    return SsmConfigSource(ssm_client, parameter=ssm_parameter or os.environ.get(ENV_CONFIG_PARAMETER))
 
 class ConfigManager:
-    def __init__(self, ttl_seconds: float = 60.0):
+    """
+    実験設定を設定ソース (ConfigSource。既定は SSM) から取得し、キャッシュする。
+    
+    設定ソースは source ("ssm" / "env" / "file" または ConfigSource のインスタンス) で切り替えられる
+    (未指定時は環境変数 INTERLEAVING_CONFIG_SOURCE、それもなければ "ssm")。boto3 の import と SSM クライアントの
+    生成は最初の SSM 取得時まで遅延するため、env / file ソースでは boto3 を一切読み込まない。
+    
+    1つのドキュメントに複数の実験を定義でき ({"experiments": {名前: 設定}, "default": 名前})、
+    get_config(name) で実験ごとの設定を返す。ドキュメントは src/config_schema.py (pydantic) で検証し、
+    イミュータブルな ExperimentSet に変換してから参照ごと差し替えるため、読み出し側はロックを取らない。
+    ソースの版 (SSM の値、ファイルの mtime など) が前回と同じ場合は解析を省く。
+    
+    stale-while-revalidate 方式:
+    - 初回のみリクエスト内で同期取得する (コールドスタート)。
+    - 以降は TTL が切れていてもキャッシュ済みの設定を即座に返し、更新はバックグラウンドスレッドで行う。
+    - TTL にはジッターを掛け、多数のコンテナの更新タイミングが揃って SSM がスロットリングされるのを避ける。
+    - 取得・検証の失敗時は指数バックオフで再試行し、その間は最後に取得できた設定を返し続ける
+      (一度も取得できていない場合のみデフォルト設定を返す)。
+    """
+    def __init__(
+        self,
+        ttl_seconds: float = 60.0,
+        ssm_client: Optional[Any] = None,
+        jitter_ratio: float = 0.1,
+        backoff_base_seconds: float = 1.0,
+        backoff_max_seconds: float = 60.0,
+        source: Optional[Union[str, ConfigSource]] = None,
+        config_path: Optional[str] = None,
+        ssm_parameter: Optional[str] = None,
+    ):
         self.ttl_seconds = ttl_seconds
-        self._cached_config: Optional[ExperimentConfig] = None
+        self.jitter_ratio = jitter_ratio
+        self.backoff_base_seconds = backoff_base_seconds
+        self.backoff_max_seconds = backoff_max_seconds
+        self._experiments: Optional[ExperimentSet] = None
+        self._version: Optional[Hashable] = None
         self._last_fetched_at: float = 0.0
-        self._ssm_client = boto3.client('ssm')
+        self._next_refresh_at: float = 0.0
+        self._consecutive_failures = 0
+        self._initial_fetch_done = False
+        self._lock = threading.Lock()
+        self._refresh_thread: Optional[threading.Thread] = None
+        self._rng = random.Random()
+        if source is None or isinstance(source, str):
+            source = build_source(source, ssm_client, config_path, ssm_parameter)
+        self.source: ConfigSource = source
 
-    def get_config(self) -> ExperimentConfig:
-        current_time = time.time()
-        
-        if self._cached_config and (current_time - self._last_fetched_at < self.ttl_seconds):
-            return self._cached_config
-            
-        try:
-            config = self._fetch_from_ssm()
-            self._cached_config = config
-            self._last_fetched_at = current_time
-            return config
-        except Exception as e:
-            # エラーログを出力すべきだが、ここでは最小実装としてデフォルトを返す
-            # print(f"Error fetching config: {e}") 
-            return self._get_default_config()
-
-    def _fetch_from_ssm(self) -> ExperimentConfig:
-        names = [
-            '/reco/exp/mode',
-            '/reco/exp/sampling_rate',
-            '/reco/exp/parallel_enabled',
-            '/reco/exp/interleave_method'
-        ]
+    def get_config(self, experiment: Optional[str] = None) -> ExperimentConfig:
+        """
+        experiment の設定 (None の場合はドキュメントの default の実験)。
+        ドキュメントに無い実験名の場合は安全側のデフォルト設定 (Mode A) を返す。
+        """
+        trace = current_trace()
+        if trace is None:
+            return self._get_config(experiment)[0]
+        # 計測中は所要時間 (config) とキャッシュの状態 (config_cache) を記録する
+        started_at = time.perf_counter()
+        config, cache_state = self._get_config(experiment)
+        trace.record_since("config", started_at)
+        trace.fields["config_cache"] = cache_state
+        return config
+
+    def get_experiments(self) -> Optional[ExperimentSet]:
+        """現在の ExperimentSet (一度も取得できていない場合は None)"""
+        self._get_config(None)
+        return self._experiments
+
+    def _get_config(self, experiment: Optional[str]) -> Tuple[ExperimentConfig, str]:
+        """
+        (設定, キャッシュの状態) を返す。状態は "hit" (キャッシュが TTL 内)、
+        "stale" (TTL を過ぎたキャッシュ。裏で更新中または再試行待ち)、"miss" (初回取得)、
+        "default" (一度も取得できていない) のいずれか。
+        """
+        experiments = self._experiments
         
-        response = self._ssm_client.get_parameters(Names=names)
-        params = {p['Name']: p['Value'] for p in response.get('Parameters', [])}
+        if not self._initial_fetch_done:
+            experiments = self._initial_fetch()
+            if experiments is None:
+                return self._get_default_config(), "default"
+            return self._select(experiments, experiment), "miss"
         
-        mode = params.get('/reco/exp/mode', 'A')
-        sampling_rate = float(params.get('/reco/exp/sampling_rate', '0.0'))
+        if time.monotonic() >= self._next_refresh_at:
+            self._start_background_refresh()
         
-        # parallel_enabled assumes "true" (case-insensitive) is True
-        parallel_str = params.get('/reco/exp/parallel_enabled', 'false').lower()
-        parallel_enabled = parallel_str == 'true'
+        if experiments is not None:
+            stale = time.time() - self._last_fetched_at >= self.ttl_seconds
+            return self._select(experiments, experiment), "stale" if stale else "hit"
+        # まだ一度も取得できていない (初回取得が失敗した) 場合
+        return self._get_default_config(), "default"
+
+    def _select(self, experiments: ExperimentSet, experiment: Optional[str]) -> ExperimentConfig:
+        config = experiments.get(experiment)
+        return config if config is not None else self._get_default_config()
+
+    def wait_for_refresh(self, timeout: Optional[float] = None) -> None:
+        """
+        実行中のバックグラウンド更新があれば完了を待つ (テスト・シャットダウン用)。
+        """
+        thread = self._refresh_thread
+        if thread is not None:
+            thread.join(timeout)
+
+    def _initial_fetch(self) -> Optional[ExperimentSet]:
+        with self._lock:
+            if not self._initial_fetch_done:
+                self._refresh()
+                self._initial_fetch_done = True
+        return self._experiments
 
-        interleave_method = params.get('/reco/exp/interleave_method', 'team_draft')
+    def _start_background_refresh(self) -> None:
+        with self._lock:
+            if self._refresh_thread is not None and self._refresh_thread.is_alive():
+                return
+            # 同じ期限切れで複数のリクエストがスレッドを起動しないよう、先に次回時刻を進めておく
+            self._next_refresh_at = time.monotonic() + self.ttl_seconds
+            self._refresh_thread = threading.Thread(
+                target=self._refresh,
+                name="interleaving-config-refresh",
+                daemon=True,
+            )
+            self._refresh_thread.start()
+
+    def _refresh(self) -> None:
+        try:
+            loaded = self.source.load(self._version)
+            if loaded is not None:
+                version, document = loaded
+                # pydantic の import はコールドスタート時間に効くため、最初の解析まで遅延する
+                from src.config_schema import parse_document
+                experiments = parse_document(document)
+                # 参照の代入1回で差し替える (読み出し側は古い方か新しい方のどちらかを丸ごと見る)
+                self._experiments = experiments
+                self._version = version
+        except Exception as e:
+            self._consecutive_failures += 1
+            delay = min(
+                self.backoff_base_seconds * (2 ** (self._consecutive_failures - 1)),
+                self.backoff_max_seconds,
+            )
+            delay = self._jittered(delay)
+            self._next_refresh_at = time.monotonic() + delay
+            log_config_refresh_failed(e, self._consecutive_failures, delay)
+            return
         
-        return ExperimentConfig(
-            mode=mode,
-            sampling_rate=sampling_rate,
-            parallel_enabled=parallel_enabled,
-            interleave_method=interleave_method
-        )
+        self._last_fetched_at = time.time()
+        self._consecutive_failures = 0
+        self._next_refresh_at = time.monotonic() + self._jittered(self.ttl_seconds)
+
+    def _jittered(self, seconds: float) -> float:
+        if self.jitter_ratio <= 0:
+            return seconds
+        return seconds * self._rng.uniform(1.0 - self.jitter_ratio, 1.0 + self.jitter_ratio)
 
     def _get_default_config(self) -> ExperimentConfig:
         # 安全側に倒す(Mode A, no sampling)
-        return ExperimentConfig(
-            mode="A",
-            sampling_rate=0.0,
-            parallel_enabled=False,
-            interleave_method="team_draft"
-        )
+        return _DEFAULT_CONFIG
+
+_DEFAULT_CONFIG = ExperimentConfig(
+    mode="A",
+    sampling_rate=0.0,
+    parallel_enabled=False,
+    interleave_method="team_draft"
+)
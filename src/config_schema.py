@@ -0,0 +1,80 @@
+
+from typing import Any, Dict, Literal, Optional, Tuple
+from pydantic import BaseModel, ConfigDict, Field, field_validator, model_validator
+from src.config import DEFAULT_EXPERIMENT, ExperimentConfig, ExperimentSet
+
+class ExperimentSettings(BaseModel):
+    """
+    1つの実験の設定 (検証用)。SSM / 環境変数の値は文字列のため、pydantic の型変換に任せる
+    ("true" -> True, "0.1" -> 0.1)。未知のキーはタイプミスとみなしてエラーにする。
+    """
+    model_config = ConfigDict(frozen=True, extra='forbid')
+
+    mode: str = "A"
+    sampling_rate: float = Field(0.0, ge=0.0, le=1.0)
+    parallel_enabled: bool = False
+    interleave_method: Literal["team_draft", "optimized"] = "team_draft"
+    tau: float = Field(1.0, gt=0.0)
+    execution_backend: Literal["thread", "process"] = "thread"
+    rankers: Tuple[str, ...] = ("A", "B")
+    multileave_method: Literal["team_draft", "probabilistic"] = "team_draft"
+    salt: str = ""
+    hedge_enabled: bool = False
+    hedge_delay_ms: Optional[float] = Field(None, gt=0.0)
+    hedge_percentile: float = Field(0.95, gt=0.0, le=1.0)
+
+    @model_validator(mode='before')
+    @classmethod
+    def _hedge_delay(cls, values: Any) -> Any:
+        # hedge_delay_ms は "off" (既定。ヘッジしない) / "auto" (パーセンタイルから決める) / ミリ秒の数値
+        if isinstance(values, dict) and isinstance(values.get('hedge_delay_ms'), str):
+            values = dict(values)
+            delay = values['hedge_delay_ms'].strip().lower()
+            values['hedge_enabled'] = delay not in ('off', '')
+            values['hedge_delay_ms'] = None if delay in ('off', '', 'auto') else delay
+        elif isinstance(values, dict) and isinstance(values.get('hedge_delay_ms'), (int, float)):
+            values = {'hedge_enabled': True, **values}
+        return values
+
+    @field_validator('rankers', mode='before')
+    @classmethod
+    def _split_rankers(cls, value: Any) -> Any:
+        # "A,B,C" 形式の文字列 (SSM / 環境変数) またはリスト (ファイル)。空の場合は既定の A, B
+        if isinstance(value, str):
+            value = value.split(',')
+        names = tuple(str(name).strip() for name in value if str(name).strip())
+        return names or ("A", "B")
+
+    @model_validator(mode='after')
+    def _check_mode(self) -> "ExperimentSettings":
+        if self.mode not in ("INTERLEAVE", "MULTILEAVE", "A", "B") and self.mode not in self.rankers:
+            raise ValueError(f"mode must be INTERLEAVE, MULTILEAVE or a ranker name: {self.mode!r}")
+        return self
+
+    def to_config(self) -> ExperimentConfig:
+        return ExperimentConfig(**self.model_dump())
+
+class ConfigDocument(BaseModel):
+    """複数の実験をまとめた設定ドキュメント ({"experiments": {名前: 設定}, "default": 名前})"""
+    model_config = ConfigDict(frozen=True, extra='forbid')
+
+    experiments: Dict[str, ExperimentSettings] = Field(min_length=1)
+    default: Optional[str] = None
+
+    @model_validator(mode='after')
+    def _check_default(self) -> "ConfigDocument":
+        if self.default is not None and self.default not in self.experiments:
+            raise ValueError(f"default experiment {self.default!r} is not defined")
+        return self
+
+def parse_document(document: Dict[str, Any]) -> ExperimentSet:
+    """
+    設定ドキュメントを検証し、イミュータブルな ExperimentSet に変換する。
+    "experiments" キーが無い場合は1つの実験 (名前は DEFAULT_EXPERIMENT) の設定とみなす。
+    不正な場合は pydantic.ValidationError (ValueError のサブクラス) を送出する。
+    """
+    if 'experiments' not in document:
+        document = {'experiments': {DEFAULT_EXPERIMENT: document}}
+    parsed = ConfigDocument.model_validate(document)
+    experiments = {name: settings.to_config() for name, settings in parsed.experiments.items()}
+    return ExperimentSet.build(experiments, parsed.default or next(iter(experiments)))
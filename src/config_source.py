@@ -0,0 +1,129 @@
+
+import json
+import os
+from typing import Any, Dict, Hashable, Mapping, Optional, Protocol, Tuple
+
+# 設定キー (SSM ではプレフィックス付きのパラメータ名、環境変数では大文字化して利用する)
+# (SSM の GetParameters は1回に 10 件までのため、キーは 10 個以内に収める。
+#  ヘッジの有効・無効は hedge_delay_ms の "off" で表す。tau や複数の実験はドキュメント形式で指定する)
+CONFIG_KEYS = ('mode', 'sampling_rate', 'parallel_enabled', 'interleave_method', 'rankers', 'multileave_method', 'salt', 'execution_backend',
+               'hedge_delay_ms', 'hedge_percentile')
+SSM_PREFIX = '/reco/exp/'
+ENV_PREFIX = 'INTERLEAVING_'
+
+# load の戻り値: (版, 設定ドキュメント)。版が前回と同じ場合は None を返し、解析を省く
+Loaded = Optional[Tuple[Hashable, Dict[str, Any]]]
+
+class ConfigSource(Protocol):
+    def load(self, since: Optional[Hashable] = None) -> Loaded:
+        """
+        設定ドキュメント (dict) をその版 (変更の検出に使うハッシュ可能な値) と共に返す。
+        版が since と同じ (前回解析したものから変わっていない) 場合は None を返す。
+        ドキュメントは1つの実験のキー (CONFIG_KEYS) か、{"experiments": {名前: キー}, "default": 名前} の形式。
+        取得に失敗した場合は例外を送出する (ConfigManager がバックオフして再試行する)。
+        """
+        ...
+
+class SsmConfigSource:
+    """
+    SSM Parameter Store から読む。
+
+    - parameter を指定した場合は、その1つのパラメータ (JSON のドキュメント) を GetParameter で読む
+      (実験がいくつあっても更新1回につき API 呼び出しは1回)。
+    - 省略した場合は prefix + CONFIG_KEYS のパラメータを GetParameters 1回でまとめて読む (1つの実験)。
+
+    boto3 の import とクライアントの生成は最初の load まで遅延する。
+    """
+    def __init__(self, client: Optional[Any] = None, prefix: str = SSM_PREFIX, parameter: Optional[str] = None):
+        self.prefix = prefix
+        self.parameter = parameter
+        self._client = client
+
+    def _get_client(self) -> Any:
+        if self._client is None:
+            # boto3 の import とクライアント生成は数百 ms かかるため、実際に SSM を参照するまで遅延する
+            import boto3
+            self._client = boto3.client('ssm')
+        return self._client
+
+    def load(self, since: Optional[Hashable] = None) -> Loaded:
+        if self.parameter:
+            parameter = self._get_client().get_parameter(Name=self.parameter)['Parameter']
+            version = (parameter.get('Version'), parameter['Value'])
+            if version == since:
+                return None
+            return version, json.loads(parameter['Value'])
+
+        names = [self.prefix + key for key in CONFIG_KEYS]
+        response = self._get_client().get_parameters(Names=names)
+        values = {
+            p['Name'][len(self.prefix):]: p['Value']
+            for p in response.get('Parameters', [])
+            if p['Name'].startswith(self.prefix)
+        }
+        version = tuple(sorted(values.items()))
+        if version == since:
+            return None
+        return version, values
+
+class EnvConfigSource:
+    """環境変数 (例: INTERLEAVING_MODE=INTERLEAVE, INTERLEAVING_SAMPLING_RATE=0.1) から1つの実験を読む"""
+    def __init__(self, environ: Optional[Mapping[str, str]] = None):
+        self._environ = environ
+
+    def load(self, since: Optional[Hashable] = None) -> Loaded:
+        environ = self._environ if self._environ is not None else os.environ
+        values = {
+            key: environ[ENV_PREFIX + key.upper()]
+            for key in CONFIG_KEYS
+            if ENV_PREFIX + key.upper() in environ
+        }
+        version = tuple(sorted(values.items()))
+        if version == since:
+            return None
+        return version, values
+
+class FileConfigSource:
+    """
+    ローカルの JSON / YAML ファイル (拡張子 .yaml / .yml は YAML) から読む。
+    版はファイルの mtime とサイズで、変わっていなければファイルを開かない (更新ごとのコストは stat 1回)。
+    YAML の読み込みには PyYAML が必要 (import は YAML ファイルを読む場合のみ)。
+
+    例: {"mode": "INTERLEAVE", "sampling_rate": 0.1, "parallel_enabled": true}
+    (MULTILEAVE の場合は "rankers": ["A", "B", "C", "D"] のようにリストで指定できる)
+    """
+    def __init__(self, path: str):
+        self.path = path
+
+    def load(self, since: Optional[Hashable] = None) -> Loaded:
+        if not self.path:
+            raise ValueError("config_path (or INTERLEAVING_CONFIG_PATH) is required for the file config source")
+        stat = os.stat(self.path)
+        version = (stat.st_mtime_ns, stat.st_size)
+        if version == since:
+            return None
+        with open(self.path, encoding='utf-8') as f:
+            if self.path.endswith(('.yaml', '.yml')):
+                import yaml
+                document = yaml.safe_load(f)
+            else:
+                document = json.load(f)
+        if not isinstance(document, dict):
+            raise ValueError(f"config file must contain a mapping: {self.path}")
+        return version, document
+
+class StaticConfigSource:
+    """固定のドキュメントを返す (テスト・ローカル実行用)。update で差し替えると次の更新で反映される"""
+    def __init__(self, document: Dict[str, Any]):
+        self.document = document
+        self._version = 0
+
+    def update(self, document: Dict[str, Any]) -> None:
+        self.document = document
+        self._version += 1
+
+    def load(self, since: Optional[Hashable] = None) -> Loaded:
+        version = self._version
+        if version == since:
+            return None
+        return version, self.document
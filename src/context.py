@@ -1,6 +1,7 @@
 
+from collections.abc import Mapping
 from dataclasses import dataclass, field
-from typing import Optional, Dict, List, Any
+from typing import Any, Dict, Iterator, List, NamedTuple, Optional, Sequence
 
 @dataclass
 class Item:
@@ -10,6 +11,162 @@ class Item:
     original_rank: Optional[int] = None
     prob: Optional[float] = None
     meta: Dict[str, Any] = field(default_factory=dict)
+    credit: Optional[float] = None  # Optimized Interleaving のクリック時のクレジット δ (正なら A、負なら B)
+
+    def with_attribution(self, source_ranker: str, prob: Optional[float], credit: Optional[float] = None) -> "Item":
+        """
+        source_ranker / prob (/ credit) を付与したコピーを返す (自身は変更しない)。
+        dataclasses.replace はフィールド走査が入るため、直接コンストラクタを呼ぶ。
+        """
+        return Item(self.id, self.score, source_ranker, self.original_rank, prob, self.meta, credit)
+
+_RESERVED_KEYS = ('id', 'score')
+
+class MetaView(Mapping):
+    """
+    ランカーが返した raw dict から id / score を除いた読み取り専用ビュー。
+    dict をコピーせずに Item.meta と同じ見え方を提供する。
+    """
+    __slots__ = ('_raw',)
+
+    def __init__(self, raw: Mapping):
+        self._raw = raw
+
+    def __getitem__(self, key):
+        if key in _RESERVED_KEYS:
+            raise KeyError(key)
+        return self._raw[key]
+
+    def __iter__(self) -> Iterator[str]:
+        return (key for key in self._raw if key not in _RESERVED_KEYS)
+
+    def __len__(self) -> int:
+        return sum(1 for key in self._raw if key not in _RESERVED_KEYS)
+
+    def __repr__(self) -> str:
+        return f"MetaView({dict(self)!r})"
+
+_EMPTY_META: Mapping = MetaView({})
+
+class CompactItem(NamedTuple):
+    """
+    Item のイミュータブル・省メモリ版 (tuple ベースのため __dict__ を持たない)。
+    meta はランカーの raw dict を保持し、アクセス時に MetaView として見せる。
+    Interleaver / ログ出力では Item と同じ属性で扱える。
+    """
+    id: str
+    score: float
+    source_ranker: Optional[str] = None
+    original_rank: Optional[int] = None
+    prob: Optional[float] = None
+    raw: Optional[Mapping] = None
+    credit: Optional[float] = None
+
+    @property
+    def meta(self) -> Mapping:
+        raw = self.raw
+        return MetaView(raw) if raw is not None else _EMPTY_META
+
+    def with_attribution(self, source_ranker: str, prob: Optional[float], credit: Optional[float] = None) -> "CompactItem":
+        return CompactItem(self.id, self.score, source_ranker, self.original_rank, prob, self.raw, credit)
+
+class ItemBatch:
+    """
+    ランキング結果の列指向表現 (ids + NumPy のスコア配列)。ランク順に並んでいることを前提とする。
+    生成される CompactItem の original_rank にはバッチ内の順位 (1始まり) が入る。
+    
+    イテレートすると取り出した分だけ CompactItem を生成するため、
+    Interleaver にそのまま渡しても k 件分の Item しか生成されない。
+    """
+    __slots__ = ('ids', 'scores', 'raws')
+
+    def __init__(self, ids: Sequence[str], scores: Any, raws: Optional[Sequence[Mapping]] = None):
+        # numpy の import はコールドスタート時間に効くため、実際に使うまで遅延する
+        import numpy as np
+        
+        self.ids = ids
+        self.scores = np.asarray(scores, dtype=np.float64)
+        self.raws = raws
+        if len(self.ids) != len(self.scores):
+            raise ValueError("ids and scores must have the same length")
+
+    @classmethod
+    def from_scores(cls, ids: Sequence[str], scores: Any, raws: Optional[Sequence[Mapping]] = None) -> "ItemBatch":
+        """スコアの降順 (同点は入力順) に並べ替えた ItemBatch を作る"""
+        import numpy as np
+        
+        scores = np.asarray(scores, dtype=np.float64)
+        order = np.argsort(-scores, kind='stable')
+        ids = [ids[i] for i in order.tolist()]
+        if raws is not None:
+            raws = [raws[i] for i in order.tolist()]
+        return cls(ids, scores[order], raws)
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def __getitem__(self, index: int) -> CompactItem:
+        raw = self.raws[index] if self.raws is not None else None
+        return CompactItem(self.ids[index], float(self.scores[index]), None, index + 1, None, raw)
+
+    def __iter__(self) -> Iterator[CompactItem]:
+        raws = self.raws
+        # tolist() で Python float にまとめて変換しておく (要素ごとの numpy scalar 生成を避ける)
+        for index, (item_id, score) in enumerate(zip(self.ids, self.scores.tolist())):
+            yield CompactItem(item_id, score, None, index + 1, None, raws[index] if raws is not None else None)
+
+    def to_items(self) -> List[CompactItem]:
+        return list(self)
+
+class CandidateBlock:
+    """
+    候補アイテムと特徴量の列指向表現 (2段階ランカーの retrieve の結果)。
+    features は特徴量名 -> 長さ len(ids) の NumPy 配列で、A / B など複数のスコアラーが
+    コピーせずに同じ配列を読む。誤って書き換えて他のスコアラーに影響しないよう、
+    各配列は読み取り専用のビューとして保持する (元の配列自体のフラグは変更しない)。
+    """
+    __slots__ = ('ids', 'features', 'raws')
+
+    def __init__(self, ids: Sequence[str], features: Mapping[str, Any], raws: Optional[Sequence[Mapping]] = None):
+        import numpy as np
+
+        self.ids = ids
+        self.features: Dict[str, Any] = {}
+        for name, values in features.items():
+            column = np.asarray(values).view()
+            if column.shape[:1] != (len(ids),):
+                raise ValueError(f"feature {name!r} must have the same length as ids")
+            column.flags.writeable = False
+            self.features[name] = column
+        self.raws = raws
+        if raws is not None and len(raws) != len(ids):
+            raise ValueError("raws must have the same length as ids")
+
+    @classmethod
+    def from_records(cls, records: Sequence[Mapping], features: Sequence[str], keep_raw: bool = True) -> "CandidateBlock":
+        """
+        既存ロジックが返す dict のリストから作る。features に挙げたキーを float64 の列にする
+        (キーが無いレコードは 0.0)。keep_raw=True の場合は dict を raws として保持し、
+        スコアリング後の CompactItem の meta として見せる。
+        """
+        import numpy as np
+
+        ids = [str(record['id']) for record in records]
+        columns = {
+            name: np.fromiter((record.get(name, 0.0) for record in records), dtype=np.float64, count=len(records))
+            for name in features
+        }
+        return cls(ids, columns, records if keep_raw else None)
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def __getitem__(self, name: str) -> Any:
+        return self.features[name]
+
+    def to_batch(self, scores: Any) -> ItemBatch:
+        """候補ごとのスコアから、スコア降順の ItemBatch を作る"""
+        return ItemBatch.from_scores(self.ids, scores, self.raws)
 
 @dataclass
 class Context:
@@ -0,0 +1,337 @@
+
+import concurrent.futures
+import gzip
+import json
+from dataclasses import dataclass, field
+from typing import IO, Any, Dict, Iterable, Iterator, Optional, Sequence, Set, Tuple, Union
+from src.observability.binary_log import BINARY_PREFIX, decode_line
+
+# weighting の種類
+# ログの prob は「そのアイテムを選んだステップの条件付き確率」(ランキング全体の確率ではない) で、
+# 1 / prob はクレジットの不偏な重みにならない。Optimized Interleaving は各アイテムの credit (δ) で評価する
+WEIGHTING_TEAM_DRAFT = "team_draft"    # クリック1件 = 1 クレジット
+WEIGHTING_DELTA = "delta"              # クリックされたアイテムの credit (δ、正なら A・負なら B) の合計の符号で勝敗を決める
+WEIGHTING_PROBABILITY = "probability"  # クリック1件 = 1 / prob (互換のため残す。上記の理由で不偏ではない)
+WEIGHTING_AUTO = "auto"                # クリックされたアイテムに credit があれば delta、無ければ team_draft
+
+@dataclass
+class RankingOutcome:
+    """1ランキング (ranking_id) 分のクレジット集計結果"""
+    ranking_id: str
+    credit_a: float
+    credit_b: float
+    clicks: int
+
+    @property
+    def winner(self) -> str:
+        """"A" / "B" / "TIE" (クリックが無い場合も "TIE")"""
+        if self.credit_a > self.credit_b:
+            return "A"
+        if self.credit_b > self.credit_a:
+            return "B"
+        return "TIE"
+
+@dataclass
+class WinLossStats:
+    """
+    ランキング単位の勝敗の集計。シャードごとに集計した結果を merge で足し合わせられる。
+    クリックの無いランキングは勝敗に含めず、impressions にのみ数える。
+    """
+    impressions: int = 0
+    wins_a: int = 0
+    wins_b: int = 0
+    ties: int = 0
+    credit_a: float = 0.0
+    credit_b: float = 0.0
+
+    def add(self, outcome: RankingOutcome) -> None:
+        self.impressions += 1
+        if outcome.clicks == 0:
+            return
+        self.credit_a += outcome.credit_a
+        self.credit_b += outcome.credit_b
+        winner = outcome.winner
+        if winner == "A":
+            self.wins_a += 1
+        elif winner == "B":
+            self.wins_b += 1
+        else:
+            self.ties += 1
+
+    def merge(self, other: "WinLossStats") -> "WinLossStats":
+        return WinLossStats(
+            impressions=self.impressions + other.impressions,
+            wins_a=self.wins_a + other.wins_a,
+            wins_b=self.wins_b + other.wins_b,
+            ties=self.ties + other.ties,
+            credit_a=self.credit_a + other.credit_a,
+            credit_b=self.credit_b + other.credit_b,
+        )
+
+    @property
+    def decided(self) -> int:
+        """クリックがあり勝敗 (引き分け含む) が付いたランキング数"""
+        return self.wins_a + self.wins_b + self.ties
+
+    @property
+    def preference(self) -> float:
+        """
+        Δ_AB = (wins_a + ties / 2) / decided - 0.5
+        正なら A、負なら B が優勢 (Chapelle et al. の Interleaving 評価で使われる指標)。
+        """
+        if self.decided == 0:
+            return 0.0
+        return (self.wins_a + 0.5 * self.ties) / self.decided - 0.5
+
+def compute_credit(
+    items: Sequence[Dict[str, Any]],
+    clicked_ids: Set[str],
+    weighting: str = WEIGHTING_AUTO,
+) -> Tuple[float, float, int]:
+    """
+    ranking_generated イベントの items と、クリックされた item id の集合からクレジットを計算する。
+
+    Returns:
+        (credit_a, credit_b, clicks) clicks は items に含まれるクリック数
+    """
+    credits, clicks = compute_team_credit(items, clicked_ids, weighting)
+    return credits.get("A", 0.0), credits.get("B", 0.0), clicks
+
+def compute_team_credit(
+    items: Sequence[Dict[str, Any]],
+    clicked_ids: Set[str],
+    weighting: str = WEIGHTING_AUTO,
+) -> Tuple[Dict[str, float], int]:
+    """
+    compute_credit のチーム数を問わない版 (MULTILEAVE 用)。
+
+    weighting="delta" (Optimized Interleaving) の場合、クレジットは表示したチームではなく
+    アイテムの credit δ = 1 / rank_A^tau - 1 / rank_B^tau に従い、正の δ の合計を "A"、
+    負の δ の絶対値の合計を "B" に付ける (勝敗は δ の合計の符号と一致する)。
+
+    Returns:
+        (チーム名 -> クレジット, clicks) クリックされたアイテムのあるチームのみを含む
+    """
+    credits: Dict[str, float] = {}
+    clicks = 0
+    clicked = [item for item in items if item.get("id") in clicked_ids]
+
+    if weighting == WEIGHTING_AUTO:
+        has_credit = any(item.get("credit") is not None for item in clicked)
+        weighting = WEIGHTING_DELTA if has_credit else WEIGHTING_TEAM_DRAFT
+
+    if weighting == WEIGHTING_DELTA:
+        for item in clicked:
+            clicks += 1
+            delta = item.get("credit") or 0.0
+            if delta > 0:
+                credits["A"] = credits.get("A", 0.0) + delta
+            elif delta < 0:
+                credits["B"] = credits.get("B", 0.0) - delta
+        return credits, clicks
+
+    for item in clicked:
+        clicks += 1
+        weight = 1.0
+        if weighting == WEIGHTING_PROBABILITY:
+            prob = item.get("prob")
+            if prob:
+                weight = 1.0 / prob
+        source = item.get("source_ranker")
+        if source is not None:
+            credits[source] = credits.get(source, 0.0) + weight
+    return credits, clicks
+
+@dataclass
+class MultileaveStats:
+    """
+    MULTILEAVE のランキングをチームの組ごとの勝敗に集計したもの。
+    pairs[(x, y)] (x < y) の wins_a は x の勝ち、wins_b は y の勝ちを表す。
+    """
+    pairs: Dict[Tuple[str, str], WinLossStats] = field(default_factory=dict)
+
+    def add(self, ranking_id: str, teams: Iterable[str], credits: Dict[str, float], clicks: int) -> None:
+        names = sorted(set(teams))
+        for i, x in enumerate(names):
+            for y in names[i + 1:]:
+                outcome = RankingOutcome(ranking_id, credits.get(x, 0.0), credits.get(y, 0.0), clicks)
+                self.pairs.setdefault((x, y), WinLossStats()).add(outcome)
+
+    def merge(self, other: "MultileaveStats") -> "MultileaveStats":
+        pairs = dict(self.pairs)
+        for key, stats in other.pairs.items():
+            pairs[key] = pairs[key].merge(stats) if key in pairs else stats
+        return MultileaveStats(pairs)
+
+    def pair(self, x: str, y: str) -> WinLossStats:
+        """x を A、y を B とみなした勝敗 (SequentialTest.update_stats にそのまま渡せる)"""
+        if (x, y) in self.pairs:
+            return self.pairs[(x, y)]
+        stats = self.pairs.get((y, x), WinLossStats())
+        return WinLossStats(
+            impressions=stats.impressions,
+            wins_a=stats.wins_b,
+            wins_b=stats.wins_a,
+            ties=stats.ties,
+            credit_a=stats.credit_b,
+            credit_b=stats.credit_a,
+        )
+
+    def preference_matrix(self) -> Dict[Tuple[str, str], float]:
+        """(x, y) -> x の y に対する選好 Δ (正なら x が優勢)。両方向を含む"""
+        matrix = {}
+        for (x, y), stats in self.pairs.items():
+            matrix[(x, y)] = stats.preference
+            matrix[(y, x)] = -stats.preference
+        return matrix
+
+def iter_jsonl(source: Union[str, IO[str]]) -> Iterator[Dict[str, Any]]:
+    """
+    JSON Lines を1行ずつ dict として返す (.gz はそのまま展開して読む)。
+    JSON オブジェクトでない行 (Lambda の START/END 行など) は読み飛ばす。
+    """
+    if isinstance(source, str):
+        opener = gzip.open if source.endswith(".gz") else open
+        with opener(source, "rt", encoding="utf-8") as f:
+            yield from iter_jsonl(f)
+        return
+    for line in source:
+        line = line.strip()
+        if not line.startswith("{"):
+            continue
+        yield json.loads(line)
+
+def iter_log_events(source: Union[str, IO[str]]) -> Iterator[Dict[str, Any]]:
+    """
+    iter_jsonl と同じだが、バイナリ形式 (configure_logging(log_format="binary")) の行も
+    JSON 形式と同じ dict に展開して返す。両方の形式が混在していてもよい。
+    """
+    if isinstance(source, str):
+        opener = gzip.open if source.endswith(".gz") else open
+        with opener(source, "rt", encoding="utf-8") as f:
+            yield from iter_log_events(f)
+        return
+    for line in source:
+        line = line.strip()
+        if line.startswith("{"):
+            yield json.loads(line)
+        elif line.startswith(BINARY_PREFIX):
+            yield from decode_line(line).events()
+
+def iter_record_batches(batches: Iterable[Any]) -> Iterator[Dict[str, Any]]:
+    """
+    Arrow の RecordBatch など、to_pylist() で行の dict のリストを返すバッチ列を行単位に展開する。
+    バッチ単位で読むため、メモリ使用量はバッチサイズで抑えられる。
+    """
+    for batch in batches:
+        rows = batch.to_pylist() if hasattr(batch, "to_pylist") else batch
+        yield from rows
+
+def join_sorted(
+    rankings: Iterable[Dict[str, Any]],
+    clicks: Iterable[Dict[str, Any]],
+) -> Iterator[Tuple[Dict[str, Any], Set[str]]]:
+    """
+    ranking_id の昇順に並んだランキングログとクリックイベントをマージジョインし、
+    (ranking イベント, クリックされた item_id の集合) を返す。
+    保持するのは現在の ranking_id のクリックのみのため、メモリ使用量は入力サイズに依存しない。
+
+    クリックイベントは {"ranking_id": ..., "item_id": ...} 形式とする。
+    ranking_generated 以外のイベントは読み飛ばす。
+    """
+    click_iter = iter(clicks)
+    pending = next(click_iter, None)
+    for ranking in rankings:
+        if ranking.get("event", "ranking_generated") != "ranking_generated":
+            continue
+        ranking_id = ranking["ranking_id"]
+        # 対応するランキングの無いクリックは捨てる
+        while pending is not None and pending["ranking_id"] < ranking_id:
+            pending = next(click_iter, None)
+        clicked: Set[str] = set()
+        while pending is not None and pending["ranking_id"] == ranking_id:
+            clicked.add(pending["item_id"])
+            pending = next(click_iter, None)
+        yield ranking, clicked
+
+def join_in_memory(
+    rankings: Iterable[Dict[str, Any]],
+    clicks: Iterable[Dict[str, Any]],
+) -> Iterator[Tuple[Dict[str, Any], Set[str]]]:
+    """
+    ソートされていない入力向けのハッシュジョイン。クリックのみメモリに載せ、ランキングはストリームで読む
+    (ranking_id のハッシュでシャード分割しておけば、クリックはシャードあたりの量で済む)。
+    """
+    clicked_by_ranking: Dict[str, Set[str]] = {}
+    for click in clicks:
+        clicked_by_ranking.setdefault(click["ranking_id"], set()).add(click["item_id"])
+    for ranking in rankings:
+        if ranking.get("event", "ranking_generated") != "ranking_generated":
+            continue
+        yield ranking, clicked_by_ranking.get(ranking["ranking_id"], set())
+
+def evaluate(
+    joined: Iterable[Tuple[Dict[str, Any], Set[str]]],
+    weighting: str = WEIGHTING_AUTO,
+    mode: Optional[str] = "INTERLEAVE",
+) -> WinLossStats:
+    """
+    ジョイン済みの (ranking, clicked_ids) を勝敗に集計する。
+    mode を指定した場合はそのモードのランキングのみ対象とする (None で全件)。
+    """
+    stats = WinLossStats()
+    for ranking, clicked_ids in joined:
+        if mode is not None and ranking.get("mode") != mode:
+            continue
+        credit_a, credit_b, clicks = compute_credit(ranking.get("items", []), clicked_ids, weighting)
+        stats.add(RankingOutcome(ranking["ranking_id"], credit_a, credit_b, clicks))
+    return stats
+
+def evaluate_multileave(
+    joined: Iterable[Tuple[Dict[str, Any], Set[str]]],
+    weighting: str = WEIGHTING_AUTO,
+    mode: Optional[str] = "MULTILEAVE",
+) -> MultileaveStats:
+    """
+    ジョイン済みの (ranking, clicked_ids) を、チームの組ごとの勝敗に集計する。
+    チームはログの rankers (無い場合は items の source_ranker) から取る。
+    """
+    stats = MultileaveStats()
+    for ranking, clicked_ids in joined:
+        if mode is not None and ranking.get("mode") != mode:
+            continue
+        items = ranking.get("items", [])
+        teams = ranking.get("rankers") or [item.get("source_ranker") for item in items if item.get("source_ranker")]
+        credits, clicks = compute_team_credit(items, clicked_ids, weighting)
+        stats.add(ranking["ranking_id"], teams, credits, clicks)
+    return stats
+
+def evaluate_files(
+    ranking_path: str,
+    click_path: str,
+    weighting: str = WEIGHTING_AUTO,
+    sorted_input: bool = True,
+) -> WinLossStats:
+    """1シャード分のランキングログ (JSON Lines またはバイナリ形式) / クリックログ (JSON Lines) を集計する"""
+    join = join_sorted if sorted_input else join_in_memory
+    return evaluate(join(iter_log_events(ranking_path), iter_jsonl(click_path)), weighting)
+
+def evaluate_shards(
+    shards: Sequence[Tuple[str, str]],
+    weighting: str = WEIGHTING_AUTO,
+    sorted_input: bool = True,
+    max_workers: Optional[int] = None,
+) -> WinLossStats:
+    """
+    (ranking_path, click_path) のシャード列をプロセスプールで並列に集計し、結果をマージする。
+    シャードは ranking_id で分割されている (同じ ranking_id が複数シャードに跨らない) 前提とする。
+    """
+    total = WinLossStats()
+    with concurrent.futures.ProcessPoolExecutor(max_workers=max_workers) as executor:
+        futures = [
+            executor.submit(evaluate_files, ranking_path, click_path, weighting, sorted_input)
+            for ranking_path, click_path in shards
+        ]
+        for future in futures:
+            total = total.merge(future.result())
+    return total
@@ -0,0 +1,406 @@
+
+import concurrent.futures
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Hashable, Iterable, List, Mapping, Optional, Sequence, Set, Tuple
+
+import numpy as np
+
+from src.interleaving.batch import PAD, SOURCE_A, SOURCE_B, interleave_batch, pad_id_lists
+from src.interleaving.optimized import DEFAULT_DEPTH
+
+# 比較する Interleaving 手法: 名前 -> interleave_batch のキーワード引数
+DEFAULT_METHODS: Dict[str, Dict[str, Any]] = {
+    "team_draft": {"method": "team_draft"},
+    "optimized": {"method": "optimized", "tau": 1.0},
+}
+DEFAULT_SAMPLE_SIZES = (100, 200, 500, 1000, 2000, 5000, 10000)
+
+@dataclass
+class ReplayQuery:
+    """
+    シミュレーションの1クエリ分の入力。relevance はアイテム ID -> 関連度 (0.0 - 1.0) で、
+    含まれないアイテムは 0.0 とする。
+    """
+    list_a: Sequence[Hashable]
+    list_b: Sequence[Hashable]
+    relevance: Mapping[Hashable, float] = field(default_factory=dict)
+
+class ClickModel:
+    """
+    クリックモデルの基底クラス。関連度 rel を魅力度 (クリック確率) click_probs[0] + (click_probs[1] - click_probs[0]) * rel
+    に変換し、各モデルの閲覧行動に従ってクリックを生成する。
+    配列はすべて (行数, 順位) で、パディング部分の魅力度は 0 とする。
+    """
+    name = "base"
+
+    def __init__(self, click_probs: Tuple[float, float] = (0.05, 0.95)):
+        self.click_probs = click_probs
+
+    def attractiveness(self, relevance: np.ndarray) -> np.ndarray:
+        low, high = self.click_probs
+        return low + (high - low) * np.clip(relevance, 0.0, 1.0)
+
+    def click_probabilities(self, attr: np.ndarray) -> np.ndarray:
+        """各順位がクリックされる周辺確率 (行ごとの和が期待クリック数)"""
+        raise NotImplementedError
+
+    def sample(self, attr: np.ndarray, rng: np.random.Generator) -> np.ndarray:
+        """クリックの有無 (bool の配列)"""
+        raise NotImplementedError
+
+class PositionBasedModel(ClickModel):
+    """
+    Position-Based Model: 順位 r (1始まり) は確率 examination[r-1] (省略時は 1 / r^eta) で閲覧され、
+    閲覧されたアイテムは魅力度の確率でクリックされる。各順位のクリックは独立。
+    """
+    name = "pbm"
+
+    def __init__(
+        self,
+        examination: Optional[Sequence[float]] = None,
+        eta: float = 1.0,
+        click_probs: Tuple[float, float] = (0.05, 0.95),
+    ):
+        super().__init__(click_probs)
+        self.examination = examination
+        self.eta = eta
+
+    def _examination(self, width: int) -> np.ndarray:
+        if self.examination is not None:
+            exam = np.zeros(width)
+            values = np.asarray(self.examination[:width], dtype=np.float64)
+            exam[:len(values)] = values
+            return exam
+        return 1.0 / np.arange(1, width + 1, dtype=np.float64) ** self.eta
+
+    def click_probabilities(self, attr: np.ndarray) -> np.ndarray:
+        return attr * self._examination(attr.shape[1])
+
+    def sample(self, attr: np.ndarray, rng: np.random.Generator) -> np.ndarray:
+        return rng.random(attr.shape) < self.click_probabilities(attr)
+
+class CascadeModel(ClickModel):
+    """Cascade Model: 上から順に閲覧し、魅力度の確率でクリックしたら閲覧を終える (クリックは高々1件)"""
+    name = "cascade"
+
+    def click_probabilities(self, attr: np.ndarray) -> np.ndarray:
+        # 順位 r が閲覧される確率は、それより上がすべてクリックされない確率
+        reach = np.cumprod(1.0 - attr, axis=1)
+        reach = np.concatenate([np.ones((attr.shape[0], 1)), reach[:, :-1]], axis=1)
+        return reach * attr
+
+    def sample(self, attr: np.ndarray, rng: np.random.Generator) -> np.ndarray:
+        hits = rng.random(attr.shape) < attr
+        first = hits & (np.cumsum(hits, axis=1) == 1)
+        return first
+
+class DependentClickModel(ClickModel):
+    """
+    Dependent Click Model: 上から順に閲覧し、魅力度の確率でクリックする。クリックした後は
+    確率 continuation[r-1] (省略時は continuation_default) で閲覧を続け、クリックしなければ必ず次に進む。
+    """
+    name = "dcm"
+
+    def __init__(
+        self,
+        continuation: Optional[Sequence[float]] = None,
+        continuation_default: float = 0.5,
+        click_probs: Tuple[float, float] = (0.05, 0.95),
+    ):
+        super().__init__(click_probs)
+        self.continuation = continuation
+        self.continuation_default = continuation_default
+
+    def _continuation(self, width: int) -> np.ndarray:
+        lam = np.full(width, self.continuation_default, dtype=np.float64)
+        if self.continuation is not None:
+            values = np.asarray(self.continuation[:width], dtype=np.float64)
+            lam[:len(values)] = values
+        return lam
+
+    def click_probabilities(self, attr: np.ndarray) -> np.ndarray:
+        lam = self._continuation(attr.shape[1])
+        # 順位 r で閲覧を続ける確率: クリックして続ける + クリックしない
+        keep = attr * lam + (1.0 - attr)
+        reach = np.cumprod(keep, axis=1)
+        reach = np.concatenate([np.ones((attr.shape[0], 1)), reach[:, :-1]], axis=1)
+        return reach * attr
+
+    def sample(self, attr: np.ndarray, rng: np.random.Generator) -> np.ndarray:
+        lam = self._continuation(attr.shape[1])
+        clicks = np.zeros(attr.shape, dtype=bool)
+        examining = np.ones(attr.shape[0], dtype=bool)
+        # 行方向にベクトル化し、順位 (≒ k) についてのみループする
+        for r in range(attr.shape[1]):
+            clicked = examining & (rng.random(attr.shape[0]) < attr[:, r])
+            clicks[:, r] = clicked
+            examining &= ~clicked | (rng.random(attr.shape[0]) < lam[r])
+        return clicks
+
+class RandomClickModel(PositionBasedModel):
+    """
+    関連度に依存しないクリックモデル (各順位を確率 p で独立にクリックする)。
+    A / B に真の差が無いため、このモデルでの選好 Δ の期待値が手法のバイアスとなる。
+    """
+    name = "random"
+
+    def __init__(self, p: float = 0.2):
+        super().__init__(examination=None, eta=0.0, click_probs=(p, p))
+
+@dataclass
+class SensitivityReport:
+    """
+    手法 x クリックモデルごとの感度。
+    accuracy はサンプル数 (インプレッション数) -> 選好 Δ の符号が真の差と一致した seed の割合、
+    samples_needed はそれ以上のサンプル数で常に accuracy >= target_accuracy となる最小のサンプル数
+    (sample_sizes の範囲で達しなければ None)。
+    """
+    method: str
+    click_model: str
+    true_gap: float  # クエリ平均の期待クリック数の差 (A - B、上位 k 件)
+    accuracy: Dict[int, float]
+    samples_needed: Optional[int]
+    mean_preference: float  # 最大サンプル数での Δ の seed 平均
+
+@dataclass
+class BiasReport:
+    """
+    関連度に依存しないクリック (bias_model) での、最大サンプル数における Δ の seed 平均と標準誤差、
+    およびインプレッションあたりのクレジットの差 (credit_a - credit_b) の seed 平均と標準誤差。
+    Optimized Interleaving が保証するのはクレジットの期待値が 0 になることで、Δ (勝敗の割合) は
+    リストの重複構造によっては 0 からずれる。
+    """
+    method: str
+    click_model: str
+    mean_preference: float
+    stderr: float
+    mean_credit: float
+    credit_stderr: float
+
+@dataclass
+class ReplayResult:
+    sensitivity: List[SensitivityReport]
+    bias: List[BiasReport]
+
+def queries_from_logs(
+    joined: Iterable[Tuple[Dict[str, Any], Set[str]]],
+    rerank_b: Optional[Callable[[Dict[str, Any]], Sequence[Hashable]]] = None,
+    mode: Optional[str] = None,
+) -> List[ReplayQuery]:
+    """
+    ジョイン済みの (ranking, clicked_ids) (src/evaluation/credit.py の join_sorted / join_in_memory) から
+    ReplayQuery を作る。クリックされたアイテムの関連度を 1.0、それ以外を 0.0 とする。
+
+    - rerank_b を指定した場合は、ログのランキングを A、rerank_b(ranking) の結果 (ID のリスト) を B とする
+      (A モードの本番ログに対して、新しいランカーをオフラインで評価する場合)。
+    - 省略した場合は、ログのアイテムを source_ranker で分け、表示順に A / B のリストとする
+      (source_ranker の無いアイテムは A とみなす)。INTERLEAVE のログからはそれぞれのランカーの
+      完全なリストは復元できない (相手側が配置した共通アイテムが欠ける) ため、近似となる。
+    - A / B のいずれかが空になるランキングは除外する。
+    """
+    queries = []
+    for ranking, clicked_ids in joined:
+        if mode is not None and ranking.get("mode") != mode:
+            continue
+        items = ranking.get("items", [])
+        if rerank_b is not None:
+            list_a = [item["id"] for item in items]
+            list_b = list(rerank_b(ranking))
+        else:
+            list_a = [item["id"] for item in items if item.get("source_ranker") in ("A", None)]
+            list_b = [item["id"] for item in items if item.get("source_ranker") == "B"]
+        if not list_a or not list_b:
+            continue
+        queries.append(ReplayQuery(list_a, list_b, {item_id: 1.0 for item_id in clicked_ids}))
+    return queries
+
+@dataclass
+class _EncodedQueries:
+    """クエリを (クエリ番号, アイテム ID) 単位の整数 ID に変換した padded 配列と、ID ごとの関連度"""
+    ids_a: np.ndarray
+    ids_b: np.ndarray
+    relevance: np.ndarray
+
+def _encode(queries: Sequence[ReplayQuery], k: int) -> _EncodedQueries:
+    # interleave_batch は先頭 2k 件より後ろを参照しないため、それ以降は変換しない
+    depth = 2 * k
+    vocab: Dict[Hashable, int] = {}
+    ids_a, vocab = pad_id_lists([[(q, item_id) for item_id in query.list_a[:depth]] for q, query in enumerate(queries)], vocab)
+    ids_b, vocab = pad_id_lists([[(q, item_id) for item_id in query.list_b[:depth]] for q, query in enumerate(queries)], vocab)
+    relevance = np.fromiter(
+        (queries[q].relevance.get(item_id, 0.0) for q, item_id in vocab),
+        dtype=np.float64, count=len(vocab),
+    )
+    return _EncodedQueries(ids_a, ids_b, relevance)
+
+def _attractiveness(data: _EncodedQueries, ids: np.ndarray, model: ClickModel) -> np.ndarray:
+    # PAD (-1) の位置は関連度の参照結果を捨てて魅力度 0 にする
+    return np.where(ids != PAD, model.attractiveness(data.relevance[ids]), 0.0)
+
+def expected_click_gap(data: _EncodedQueries, model: ClickModel, k: int) -> float:
+    """クエリを一様に選んだときの、A / B の上位 k 件の期待クリック数の差 (A - B)"""
+    clicks_a = model.click_probabilities(_attractiveness(data, data.ids_a[:, :k], model)).sum(axis=1)
+    clicks_b = model.click_probabilities(_attractiveness(data, data.ids_b[:, :k], model)).sum(axis=1)
+    return float((clicks_a - clicks_b).mean())
+
+def _rank_in_prefix(ids: np.ndarray, prefix: np.ndarray) -> np.ndarray:
+    """ids (B, K) の各 ID の prefix (B, L) 内の順位 (1始まり)。prefix に無ければ prefix の件数 + 1"""
+    match = (ids[:, :, None] == prefix[:, None, :]) & (prefix[:, None, :] != PAD)
+    missing = (prefix != PAD).sum(axis=1)[:, None] + 1
+    return np.where(match.any(axis=2), match.argmax(axis=2) + 1, missing)
+
+def _delta_credit(data: _EncodedQueries, rows: np.ndarray, ids: np.ndarray, size: int, tau: float) -> np.ndarray:
+    """
+    Optimized Interleaving のクレジット δ = 1 / rank_A^tau - 1 / rank_B^tau (正なら A、負なら B の得点)。
+    順位は OptimizedInterleaver が確率分布を解く各リストの先頭 size (= min(k, depth)) 件の中で数える。
+    """
+    rank_a = _rank_in_prefix(ids, data.ids_a[rows, :size])
+    rank_b = _rank_in_prefix(ids, data.ids_b[rows, :size])
+    return rank_a ** -float(tau) - rank_b ** -float(tau)
+
+def _simulate(
+    data: _EncodedQueries,
+    spec: Mapping[str, Any],
+    model: ClickModel,
+    seed: int,
+    sample_sizes: Sequence[int],
+    k: int,
+) -> np.ndarray:
+    """
+    max(sample_sizes) 回のインプレッション (クエリを一様に復元抽出) を Interleave してクリックを生成し、
+    各サンプル数の時点での選好 Δ (WinLossStats.preference と同じ定義) と、インプレッションあたりの
+    クレジットの差 (credit_a - credit_b) の平均を (2, len(sample_sizes)) の配列で返す。
+    クレジットは compute_credit と同じく、Team Draft はクリック1件 = 1、Optimized は
+    クリックされたアイテムの δ (_delta_credit) の合計の符号で勝敗を決める。
+    """
+    n = max(sample_sizes)
+    rng = np.random.default_rng(seed)
+    rows = rng.integers(len(data.ids_a), size=n)
+    row_seeds = rng.integers(0, 2 ** 31 - 1, size=n)
+    batch = interleave_batch(data.ids_a[rows], data.ids_b[rows], row_seeds.tolist(), k=k, **spec)
+
+    clicks = model.sample(_attractiveness(data, batch.ids, model), rng)
+    if spec.get("method") == "optimized":
+        # Optimized は表示したリストの確率分布で不偏性を保証するため、チームではなく
+        # 各アイテムの A / B での順位の差 δ でクレジットを付ける
+        size = min(k, spec.get("depth", DEFAULT_DEPTH))
+        delta = np.where(clicks, _delta_credit(data, rows, batch.ids, size, spec.get("tau", 1.0)), 0.0)
+        credit_a = np.maximum(delta, 0.0).sum(axis=1)
+        credit_b = np.maximum(-delta, 0.0).sum(axis=1)
+    else:
+        credit_a = (clicks & (batch.sources == SOURCE_A)).sum(axis=1)
+        credit_b = (clicks & (batch.sources == SOURCE_B)).sum(axis=1)
+
+    decided = clicks.any(axis=1)
+    wins_a = np.cumsum(credit_a > credit_b)
+    ties = np.cumsum(decided & (credit_a == credit_b))
+    decided = np.cumsum(decided)
+    at = np.asarray(sample_sizes) - 1
+    with np.errstate(divide='ignore', invalid='ignore'):
+        preference = (wins_a[at] + 0.5 * ties[at]) / decided[at] - 0.5
+    mean_credit = np.cumsum(credit_a - credit_b)[at] / np.asarray(sample_sizes)
+    return np.stack([np.where(decided[at] > 0, preference, 0.0), mean_credit])
+
+_worker_data: Optional[_EncodedQueries] = None
+
+def _init_worker(data: _EncodedQueries) -> None:
+    # クエリの配列はタスクごとではなくワーカーごとに1度だけ送る
+    global _worker_data
+    _worker_data = data
+
+def _simulate_in_worker(spec, model, seed, sample_sizes, k) -> np.ndarray:
+    return _simulate(_worker_data, spec, model, seed, sample_sizes, k)
+
+def replay(
+    queries: Sequence[ReplayQuery],
+    methods: Optional[Mapping[str, Mapping[str, Any]]] = None,
+    click_models: Optional[Sequence[ClickModel]] = None,
+    seeds: Sequence[int] = range(50),
+    sample_sizes: Sequence[int] = DEFAULT_SAMPLE_SIZES,
+    k: int = 10,
+    target_accuracy: float = 0.95,
+    bias_model: Optional[ClickModel] = None,
+    max_workers: Optional[int] = None,
+) -> ReplayResult:
+    """
+    ログ (または任意の A / B のリストと関連度) に対してクリックモデルでクリックをシミュレーションし、
+    Interleaving 手法ごとの感度とバイアスを求める。
+
+    Args:
+        queries: ReplayQuery のリスト (queries_from_logs で作れる)
+        methods: 名前 -> interleave_batch のキーワード引数 (例: {"optimized_tau3": {"method": "optimized", "tau": 3.0}})。
+            省略時は DEFAULT_METHODS
+        click_models: 感度を測るクリックモデル。省略時は PBM / Cascade / DCM
+        seeds: 1つの手法 x クリックモデルあたりの試行ごとの乱数シード
+        sample_sizes: 選好を評価するサンプル数 (インプレッション数)
+        k: 1インプレッションあたりの表示件数
+        target_accuracy: samples_needed の基準とする符号の一致率
+        bias_model: バイアスを測る関連度に依存しないクリックモデル。省略時は RandomClickModel()
+        max_workers: 試行を並列に実行するプロセス数 (1 の場合はこのプロセス内で実行する)
+    """
+    if not queries:
+        raise ValueError("queries must not be empty")
+    methods = dict(methods) if methods is not None else DEFAULT_METHODS
+    click_models = list(click_models) if click_models is not None else [
+        PositionBasedModel(), CascadeModel(), DependentClickModel(),
+    ]
+    bias_model = bias_model if bias_model is not None else RandomClickModel()
+    sample_sizes = sorted(set(int(n) for n in sample_sizes))
+    seeds = [int(seed) for seed in seeds]
+    data = _encode(queries, k)
+
+    models = click_models + [bias_model]
+    tasks = [(name, index, seed) for name in methods for index in range(len(models)) for seed in seeds]
+    if max_workers == 1:
+        outcomes = [_simulate(data, methods[name], models[index], seed, sample_sizes, k) for name, index, seed in tasks]
+    else:
+        with concurrent.futures.ProcessPoolExecutor(
+            max_workers=max_workers, initializer=_init_worker, initargs=(data,),
+        ) as executor:
+            futures = [
+                executor.submit(_simulate_in_worker, methods[name], models[index], seed, sample_sizes, k)
+                for name, index, seed in tasks
+            ]
+            outcomes = [future.result() for future in futures]
+
+    preferences: Dict[Tuple[str, int], List[np.ndarray]] = {}
+    for (name, index, _), outcome in zip(tasks, outcomes):
+        preferences.setdefault((name, index), []).append(outcome)
+
+    result = ReplayResult(sensitivity=[], bias=[])
+    gaps = [expected_click_gap(data, model, k) for model in click_models]
+    for name in methods:
+        for index, model in enumerate(click_models):
+            runs = np.array(preferences[(name, index)])[:, 0]
+            result.sensitivity.append(_sensitivity(name, model.name, gaps[index], runs, sample_sizes, target_accuracy))
+        runs = np.array(preferences[(name, len(click_models))])
+        final, credit = runs[:, 0, -1], runs[:, 1, -1]
+        result.bias.append(BiasReport(
+            name, bias_model.name, float(final.mean()), _stderr(final), float(credit.mean()), _stderr(credit),
+        ))
+    return result
+
+def _stderr(values: np.ndarray) -> float:
+    return float(values.std(ddof=1) / np.sqrt(len(values))) if len(values) > 1 else 0.0
+
+def _sensitivity(
+    method: str,
+    click_model: str,
+    gap: float,
+    runs: np.ndarray,
+    sample_sizes: Sequence[int],
+    target_accuracy: float,
+) -> SensitivityReport:
+    # 真の差が無い場合は符号の一致率を定義できないため空にする
+    accuracy: Dict[int, float] = {}
+    samples_needed = None
+    if gap != 0.0:
+        accuracy = {
+            n: float((np.sign(runs[:, i]) == np.sign(gap)).mean())
+            for i, n in enumerate(sample_sizes)
+        }
+        for n in reversed(sample_sizes):
+            if accuracy[n] < target_accuracy:
+                break
+            samples_needed = n
+    return SensitivityReport(method, click_model, gap, accuracy, samples_needed, float(runs[:, -1].mean()))
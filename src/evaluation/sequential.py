@@ -0,0 +1,134 @@
+
+import math
+from dataclasses import dataclass
+from typing import Optional
+from src.evaluation.credit import RankingOutcome, WinLossStats
+
+# decision の値
+DECISION_CONTINUE = "CONTINUE"
+DECISION_A = "A"
+DECISION_B = "B"
+DECISION_NO_DIFFERENCE = "NO_DIFFERENCE"
+
+# 正確な二項検定を行う試行数の上限 (これを超えると正規近似)
+_EXACT_BINOMIAL_LIMIT = 5000
+
+@dataclass
+class StopDecision:
+    decision: str  # CONTINUE / A / B / NO_DIFFERENCE
+    p_value: float  # always-valid p 値
+    samples: int  # 勝敗の付いたランキング数 (引き分けを除く)
+
+    @property
+    def stop(self) -> bool:
+        return self.decision != DECISION_CONTINUE
+
+@dataclass
+class SequentialTest:
+    """
+    クエリ (ランキング) ごとの選好 (A 勝ち / B 勝ち / 引き分け) を逐次的に検定する。
+
+    - 状態は勝敗のカウントのみで、update は O(1)。別ワーカーで集計した状態は merge で足し合わせられる。
+    - 停止判定には mixture SPRT (mSPRT) の always-valid p 値を使う。
+      H0: P(A 勝ち | 引き分け以外) = 0.5 に対し、Beta(mixture, mixture) 事前分布で混合した尤度比
+          LR_n = B(x + a, n - x + a) / B(a, a) * 2^n
+      は H0 の下でマルチンゲールとなるため、任意の時点で p = min(1, 1 / LR_n) を見て止めても
+      第一種の過誤は alpha 以下に保たれる (途中で何度覗いてもよい)。
+    - 参考値として固定サンプルの符号検定 (両側二項検定) の p 値も返す (途中で覗く用途には使えない)。
+    """
+    alpha: float = 0.05
+    mixture: float = 1.0
+    min_samples: int = 100
+    max_samples: Optional[int] = None
+    wins_a: int = 0
+    wins_b: int = 0
+    ties: int = 0
+
+    def update(self, preference: int) -> None:
+        """preference: 正なら A 勝ち、負なら B 勝ち、0 なら引き分け"""
+        if preference > 0:
+            self.wins_a += 1
+        elif preference < 0:
+            self.wins_b += 1
+        else:
+            self.ties += 1
+
+    def update_outcome(self, outcome: RankingOutcome) -> None:
+        """クレジット集計結果 (クリックの無いランキングは無視) で更新する"""
+        if outcome.clicks == 0:
+            return
+        winner = outcome.winner
+        self.update(1 if winner == "A" else -1 if winner == "B" else 0)
+
+    def update_stats(self, stats: WinLossStats) -> None:
+        self.wins_a += stats.wins_a
+        self.wins_b += stats.wins_b
+        self.ties += stats.ties
+
+    def merge(self, other: "SequentialTest") -> "SequentialTest":
+        return SequentialTest(
+            alpha=self.alpha,
+            mixture=self.mixture,
+            min_samples=self.min_samples,
+            max_samples=self.max_samples,
+            wins_a=self.wins_a + other.wins_a,
+            wins_b=self.wins_b + other.wins_b,
+            ties=self.ties + other.ties,
+        )
+
+    @property
+    def samples(self) -> int:
+        return self.wins_a + self.wins_b
+
+    def log_likelihood_ratio(self) -> float:
+        n = self.samples
+        a = self.mixture
+        return _log_beta(self.wins_a + a, self.wins_b + a) - _log_beta(a, a) + n * math.log(2.0)
+
+    def always_valid_p_value(self) -> float:
+        return min(1.0, math.exp(-self.log_likelihood_ratio()))
+
+    def sign_test_p_value(self) -> float:
+        """固定サンプルの両側符号検定の p 値 (引き分けは除外)"""
+        return _binomial_two_sided(self.wins_a, self.samples)
+
+    def decision(self) -> StopDecision:
+        n = self.samples
+        p_value = self.always_valid_p_value()
+        if n >= self.min_samples and p_value <= self.alpha:
+            winner = DECISION_A if self.wins_a > self.wins_b else DECISION_B
+            return StopDecision(winner, p_value, n)
+        if self.max_samples is not None and n >= self.max_samples:
+            return StopDecision(DECISION_NO_DIFFERENCE, p_value, n)
+        return StopDecision(DECISION_CONTINUE, p_value, n)
+
+    def recommended_mode(self) -> Optional[str]:
+        """
+        /reco/exp/mode に書き戻すべき値。勝者が決まれば "A" / "B"、差が無いと判断されれば
+        ベースラインの "A"、継続中なら None (Interleaving を続ける)。
+        """
+        decision = self.decision().decision
+        if decision == DECISION_CONTINUE:
+            return None
+        if decision == DECISION_B:
+            return "B"
+        return "A"
+
+def _log_beta(a: float, b: float) -> float:
+    return math.lgamma(a) + math.lgamma(b) - math.lgamma(a + b)
+
+def _binomial_two_sided(k: int, n: int) -> float:
+    if n == 0:
+        return 1.0
+    tail = min(k, n - k)
+    if n > _EXACT_BINOMIAL_LIMIT:
+        # 連続性補正付きの正規近似
+        z = (n / 2.0 - tail - 0.5) / math.sqrt(n / 4.0)
+        return min(1.0, math.erfc(max(z, 0.0) / math.sqrt(2.0)))
+    log_half_n = n * math.log(0.5)
+    log_n_fact = math.lgamma(n + 1)
+    p = sum(
+        math.exp(log_n_fact - math.lgamma(i + 1) - math.lgamma(n - i + 1) + log_half_n)
+        for i in range(tail + 1)
+    )
+    return min(1.0, 2.0 * p)
@@ -0,0 +1,240 @@
+
+import asyncio
+import inspect
+import time
+from dataclasses import dataclass
+from typing import Any, List, Optional, Sequence, Tuple, Union
+from src.config import ExperimentConfig
+from src.context import Context, Item
+from src.execution.executor import ABResult, ChallengerSaturated, MultiResult, acquire_challenger_slot, get_shared_pool
+from src.interleaving.api import Interleaver, get_interleaver
+from src.interleaving.rng import RandomSource
+from src.observability.logging import log_ranker_degraded
+from src.observability.tracing import current_trace
+from src.ranker.base import AsyncRanker, Ranker
+
+AnyRanker = Union[AsyncRanker, Ranker]
+
+@dataclass
+class InterleaveOutcome:
+    mode: str  # "INTERLEAVE"、B が縮退した場合は "A"
+    items: List[Item]
+    ab_result: ABResult
+
+async def _rank(ranker: AnyRanker, context: Context, stage: str, challenger: bool = False) -> List[Item]:
+    """
+    AsyncRanker は await し、同期の Ranker は共有スレッドプールで実行する
+    (同期ランカーのスレッドはキャンセルしても完了まで止まらない)。
+    challenger (B) の同期ランカーは ABExecutor と共通の実行枠を取ってから実行し、
+    空きが無ければ ChallengerSaturated を送出する。
+    """
+    trace = current_trace()
+    started_at = time.perf_counter()
+    try:
+        if inspect.iscoroutinefunction(ranker.rank):
+            return await ranker.rank(context)
+        if not challenger:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(get_shared_pool(), ranker.rank, context)
+        release = acquire_challenger_slot()
+        try:
+            future = get_shared_pool().submit(ranker.rank, context)
+        except BaseException:
+            release()
+            raise
+        # タスクをキャンセルしてもスレッドは止まらないため、枠はスレッドでの実行が終わった時点で返す
+        future.add_done_callback(lambda _: release())
+        return await asyncio.wrap_future(future)
+    finally:
+        if trace is not None:
+            trace.record_since(stage, started_at)
+
+class AsyncABExecutor:
+    """
+    ABExecutor の asyncio 版。ランカーは AsyncRanker (推奨) と同期の Ranker のどちらでもよい。
+
+    - config.parallel_enabled が True (または config 省略時) は asyncio.gather で A / B を同時に実行し、
+      False の場合は A → B の順に await する。期限 (timeout_a / timeout_b) はどちらの場合も適用する。
+    - 期限切れのランカーはタスクをキャンセルする (スレッドと違い、実行中の I/O もその場で止まる)。
+      A の例外・期限切れ・呼び出し元からのキャンセル時は B もキャンセルし、例外をそのまま送出する。
+    - cover_grace を指定した場合、A が k 件以上返した (A だけでページを埋められる) 時点から
+      B を最大 cover_grace 秒だけ待ち、それを過ぎたら B をキャンセルして A のみで応答する (reason="covered")。
+    - B が期限切れ・例外・covered の場合は ABExecutor と同様に A のみの結果に縮退し、縮退をログに出力する。
+      同期の B ランカーは ABExecutor と共通の実行枠を使い、枠が埋まっていれば実行せずに縮退する (reason="saturated")。
+    """
+    def __init__(
+        self,
+        timeout_a: Optional[float] = None,
+        timeout_b: Optional[float] = None,
+        cover_grace: Optional[float] = None,
+    ):
+        self.timeout_a = timeout_a
+        self.timeout_b = timeout_b
+        self.cover_grace = cover_grace
+
+    async def run(
+        self,
+        ranker_a: AnyRanker,
+        ranker_b: AnyRanker,
+        context: Context,
+        config: Optional[ExperimentConfig] = None,
+        k: Optional[int] = None,
+    ) -> ABResult:
+        trace = current_trace()
+        started_at = time.perf_counter()
+        try:
+            if config is not None and not config.parallel_enabled:
+                return await self._run_sequential(ranker_a, ranker_b, context)
+            return await self._run_parallel(ranker_a, ranker_b, context, k)
+        finally:
+            if trace is not None:
+                trace.fields["parallel"] = config is None or config.parallel_enabled
+                trace.record_fanout("rank", started_at, ("ranker_a", "ranker_b"))
+
+    async def _run_sequential(self, ranker_a: AnyRanker, ranker_b: AnyRanker, context: Context) -> ABResult:
+        list_a = await asyncio.wait_for(_rank(ranker_a, context, "ranker_a"), self.timeout_a)
+        started_at = time.monotonic()
+        try:
+            list_b = await asyncio.wait_for(_rank(ranker_b, context, "ranker_b", challenger=True), self.timeout_b)
+        except asyncio.TimeoutError:
+            return self._degrade(context, "timeout", started_at, list_a)
+        except ChallengerSaturated:
+            return self._degrade(context, "saturated", started_at, list_a)
+        except Exception:
+            return self._degrade(context, "error", started_at, list_a)
+        return ABResult(list_a=list_a, list_b=list_b)
+
+    async def _run_parallel(self, ranker_a: AnyRanker, ranker_b: AnyRanker, context: Context, k: Optional[int]) -> ABResult:
+        started_at = time.monotonic()
+        task_b = asyncio.ensure_future(_rank(ranker_b, context, "ranker_b", challenger=True))
+        covered = False
+
+        async def wait_a() -> List[Item]:
+            try:
+                list_a = await asyncio.wait_for(_rank(ranker_a, context, "ranker_a"), self.timeout_a)
+            except BaseException:
+                task_b.cancel()
+                raise
+            if self.cover_grace is not None and k is not None and len(list_a) >= k and not task_b.done():
+                # A だけでページを埋められるため、B は猶予の間だけ待つ
+                def cut() -> None:
+                    nonlocal covered
+                    if not task_b.done():
+                        covered = True
+                        task_b.cancel()
+                asyncio.get_running_loop().call_later(self.cover_grace, cut)
+            return list_a
+
+        async def wait_b() -> Tuple[Optional[List[Item]], Optional[str]]:
+            try:
+                return await asyncio.wait_for(task_b, self.timeout_b), None
+            except asyncio.TimeoutError:
+                return None, "timeout"
+            except asyncio.CancelledError:
+                if covered:
+                    return None, "covered"
+                raise
+            except ChallengerSaturated:
+                return None, "saturated"
+            except Exception:
+                return None, "error"
+
+        try:
+            list_a, (list_b, reason) = await asyncio.gather(wait_a(), wait_b())
+        except BaseException:
+            task_b.cancel()
+            raise
+        if reason is not None:
+            return self._degrade(context, reason, started_at, list_a)
+        return ABResult(list_a=list_a, list_b=list_b)
+
+    async def run_many(
+        self,
+        rankers: Sequence[AnyRanker],
+        names: Sequence[str],
+        context: Context,
+        config: Optional[ExperimentConfig] = None,
+    ) -> MultiResult:
+        """
+        N 個のランカー (MULTILEAVE) を asyncio.gather で同時に実行する。先頭がベースライン (timeout_a、
+        例外・期限切れは送出し、他のランカーはキャンセル)、それ以外は timeout_b を期限とし、
+        期限切れ・例外のランカーは結果から除外する。
+        config は ABExecutor.run_many と引数を揃えるためのもので、parallel_enabled に関わらず同時に実行する
+        (コルーチンの同時実行はスレッドを消費しないため)。
+        """
+        if len(rankers) != len(names):
+            raise ValueError("rankers and names must have the same length")
+        trace = current_trace()
+        stages = [f"ranker_{name}" for name in names]
+        started_at = time.monotonic()
+        perf_started_at = time.perf_counter()
+        tasks = [
+            asyncio.ensure_future(_rank(ranker, context, stage, challenger=index > 0))
+            for index, (ranker, stage) in enumerate(zip(rankers, stages))
+        ]
+
+        async def wait(index: int) -> Any:
+            timeout = self.timeout_a if index == 0 else self.timeout_b
+            try:
+                return await asyncio.wait_for(tasks[index], timeout)
+            except asyncio.TimeoutError:
+                if index == 0:
+                    raise
+                return "timeout"
+            except ChallengerSaturated:
+                return "saturated"
+            except Exception:
+                if index == 0:
+                    raise
+                return "error"
+
+        try:
+            outcomes = await asyncio.gather(*(wait(index) for index in range(len(tasks))))
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            raise
+        finally:
+            if trace is not None:
+                trace.fields["parallel"] = True
+                trace.record_fanout("rank", perf_started_at, stages)
+
+        result = MultiResult(lists={names[0]: outcomes[0]}, degraded={})
+        for name, outcome in zip(names[1:], outcomes[1:]):
+            if isinstance(outcome, str):
+                elapsed_ms = (time.monotonic() - started_at) * 1000.0
+                log_ranker_degraded(context, ranker=name, reason=outcome, elapsed_ms=elapsed_ms)
+                result.degraded[name] = outcome
+            else:
+                result.lists[name] = outcome
+        return result
+
+    def _degrade(self, context: Context, reason: str, started_at: float, list_a: List[Item]) -> ABResult:
+        elapsed_ms = (time.monotonic() - started_at) * 1000.0
+        log_ranker_degraded(context, ranker="B", reason=reason, elapsed_ms=elapsed_ms)
+        return ABResult(list_a=list_a, list_b=None, degraded=True, reason=reason)
+
+async def interleave_async(
+    ranker_a: AnyRanker,
+    ranker_b: AnyRanker,
+    context: Context,
+    config: ExperimentConfig,
+    k: Optional[int] = None,
+    interleaver: Optional[Interleaver] = None,
+    executor: Optional[AsyncABExecutor] = None,
+    rng: Optional[RandomSource] = None,
+) -> InterleaveOutcome:
+    """
+    asyncio 版のエントリーポイント。A / B を AsyncABExecutor で実行し、既存の Interleaver で合成する。
+    B が縮退した場合は A の先頭 k 件をそのまま返す (mode="A")。
+    interleaver を省略した場合は get_interleaver(config.interleave_method, tau=config.tau) を使う。
+    rng はリクエストごとの乱数源 (Interleaver.interleave にそのまま渡す)。
+    """
+    executor = executor or AsyncABExecutor()
+    result = await executor.run(ranker_a, ranker_b, context, config, k=k)
+    if result.degraded:
+        items = result.list_a if k is None else result.list_a[:k]
+        return InterleaveOutcome(mode="A", items=items, ab_result=result)
+    interleaver = interleaver or get_interleaver(config.interleave_method, tau=config.tau)
+    items = interleaver.interleave(result.list_a, result.list_b, k=k, rng=rng)
+    return InterleaveOutcome(mode="INTERLEAVE", items=items, ab_result=result)
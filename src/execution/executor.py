@@ -0,0 +1,312 @@
+
+import concurrent.futures
+import threading
+import time
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional, Sequence
+from src.config import ExperimentConfig
+from src.context import Context, Item
+from src.observability.logging import log_ranker_degraded
+from src.observability.tracing import Trace, current_trace, traced_call
+from src.ranker.base import Ranker
+
+# ウォームな Lambda 実行環境ではモジュールが再利用されるため、
+# スレッドプールはモジュールレベルで1つだけ作り、呼び出しを跨いで使い回す
+_pool_lock = threading.Lock()
+_shared_pool: Optional[concurrent.futures.ThreadPoolExecutor] = None
+
+# MULTILEAVE では1リクエストで N 本のランカーを並行実行するため、4 ランカー分に余裕を持たせる
+DEFAULT_MAX_WORKERS = 8
+
+# B (MULTILEAVE ではベースライン以外) のランカーが同時に実行中でいられる数。
+# 期限切れのランカーのスレッドは完了まで占有され続けるため、応答しない B が共有プールを埋め尽くして
+# A (ベースライン) まで期限切れになることがないよう、ベースライン用のワーカーを残しておく
+DEFAULT_CHALLENGER_SLOTS = DEFAULT_MAX_WORKERS - 2
+_challenger_slots = threading.BoundedSemaphore(DEFAULT_CHALLENGER_SLOTS)
+
+class ChallengerSaturated(RuntimeError):
+    """B の実行枠がすべて使用中 (期限切れ後も完了していない B が残っている)"""
+
+def acquire_challenger_slot() -> Callable[[], None]:
+    """
+    B の実行枠を1つ取り、枠を返す関数を返す (ランカーの実行が実際に終わった時点で1回だけ呼ぶ)。
+    空きが無い場合は待たずに ChallengerSaturated を送出する (呼び出し側は B を実行せず A のみに縮退する)。
+    """
+    if not _challenger_slots.acquire(blocking=False):
+        raise ChallengerSaturated(f"all {DEFAULT_CHALLENGER_SLOTS} challenger slots are in use")
+    return _challenger_slots.release
+
+def get_shared_pool(max_workers: int = DEFAULT_MAX_WORKERS) -> concurrent.futures.ThreadPoolExecutor:
+    """
+    プロセス内で共有するスレッドプールを返す (初回呼び出し時に生成)。
+    タイムアウトしたランカーのスレッドは完了まで占有され続けるため、
+    1リクエストで実行するランカー数に加えて余裕を持たせたワーカー数にしておく。
+    """
+    global _shared_pool
+    if _shared_pool is None:
+        with _pool_lock:
+            if _shared_pool is None:
+                _shared_pool = concurrent.futures.ThreadPoolExecutor(
+                    max_workers=max_workers,
+                    thread_name_prefix="interleaving",
+                )
+    return _shared_pool
+
+@dataclass
+class ABResult:
+    list_a: List[Item]
+    list_b: Optional[List[Item]]
+    degraded: bool = False
+    reason: Optional[str] = None  # "timeout" / "error" / "saturated" (degraded のときのみ)
+
+@dataclass
+class MultiResult:
+    lists: Dict[str, List[Item]]  # 結果を返したランカー名 -> 結果 (rankers の順序を保つ)
+    degraded: Dict[str, str]  # 除外したランカー名 -> "timeout" / "error" / "saturated"
+
+# ランカーを実行して List[Item] の Future を返す関数 (スレッド / プロセスの切り替え用)。
+# 3つ目の引数はランカーの実行が実際に終わった時点 (期限切れで結果を捨てた後も含む) で呼ばれる関数 (None 可)
+Submit = Callable[[Ranker, Context, Optional[Callable[[], None]]], "concurrent.futures.Future[List[Item]]"]
+
+class _TracedRanker:
+    """rank() の所要時間を trace に記録するラッパー (ワーカースレッドからも記録できる)"""
+    __slots__ = ("rank", "ranker", "trace", "stage")
+
+    def __init__(self, ranker: Ranker, trace: Trace, stage: str):
+        self.rank = traced_call(ranker.rank, trace, stage)
+        self.ranker = ranker
+        self.trace = trace
+        self.stage = stage
+
+def _submit_challenger(submit: Submit, ranker: Ranker, context: Context) -> "Optional[concurrent.futures.Future[List[Item]]]":
+    """B の実行枠を取って submit する。枠に空きが無ければ実行せずに None を返す"""
+    try:
+        release = acquire_challenger_slot()
+    except ChallengerSaturated:
+        return None
+    try:
+        return submit(ranker, context, release)
+    except BaseException:
+        release()
+        raise
+
+class ABExecutor:
+    """
+    Ranker A / B を実行する。
+    
+    - config.parallel_enabled が True の場合は共有プールで並行実行し、ランカーごとの期限を適用する。
+    - False の場合は呼び出しスレッドで A → B の順に逐次実行する (期限は適用されない)。
+    
+    B が期限切れ・例外の場合は A のみの結果に縮退し (list_b=None)、縮退をログに出力する。
+    A はベースラインのため、A の例外・期限切れは呼び出し元にそのまま送出する。
+    並行実行では、期限切れ後も完了していない B が DEFAULT_CHALLENGER_SLOTS 本に達している場合、
+    B を実行せずに A のみに縮退する (reason="saturated")。応答しない B がプールを埋めて A を妨げないため。
+    
+    run_many は N 個のランカー (MULTILEAVE) を同じ方針で実行する。先頭がベースライン (timeout_a)、
+    それ以外は timeout_b を期限とし、期限切れ・例外のランカーは結果から除外する。
+    
+    process_meta はプロセスプールで実行したランカーの結果に Item.meta を含めるか。既定では含め、
+    スレッドで実行した場合と同じ Item を返す (execution_backend の切り替えで結果が変わらないように)。
+    meta を使わない場合は False にすると pickle のコストを省ける (復元した Item の meta は空になる)。
+    """
+    def __init__(
+        self,
+        timeout_a: Optional[float] = None,
+        timeout_b: Optional[float] = None,
+        pool: Optional[concurrent.futures.Executor] = None,
+        process_meta: bool = True,
+    ):
+        self.timeout_a = timeout_a
+        self.timeout_b = timeout_b
+        self._pool = pool
+        self.process_meta = process_meta
+
+    def run(self, ranker_a: Ranker, ranker_b: Ranker, context: Context, config: ExperimentConfig) -> ABResult:
+        trace = current_trace()
+        if trace is not None:
+            # 計測中はランカーごとの所要時間 (ranker_a / ranker_b) と全体 (rank) を記録する
+            started_at = time.perf_counter()
+            try:
+                return self._run(_TracedRanker(ranker_a, trace, "ranker_a"), _TracedRanker(ranker_b, trace, "ranker_b"),
+                                 context, config)
+            finally:
+                trace.fields["parallel"] = config.parallel_enabled
+                trace.record_fanout("rank", started_at, ("ranker_a", "ranker_b"))
+        return self._run(ranker_a, ranker_b, context, config)
+
+    def _run(self, ranker_a: Ranker, ranker_b: Ranker, context: Context, config: ExperimentConfig) -> ABResult:
+        if config.parallel_enabled:
+            return self._run_parallel(ranker_a, ranker_b, context, self._submitter(config))
+        return self._run_sequential(ranker_a, ranker_b, context)
+
+    def _submitter(self, config: ExperimentConfig) -> Submit:
+        """
+        config.execution_backend に応じたランカーの実行方法を返す。
+        "process" でも vCPU が1つしか無い場合はプロセスに分けても速くならないため、スレッドで実行する。
+        pickle できない (lambda などをラップした) ランカーも、そのランカーのみスレッドで実行する。
+        プロセスプールを作れない環境 (/dev/shm や sem_open が無いなど) でもスレッドで実行する
+        (警告は初回のみ出力され、以降はプールの生成を試みない)。
+        """
+        pool = self._pool or get_shared_pool()
+        
+        def submit_thread(
+            ranker: Ranker, context: Context, on_done: Optional[Callable[[], None]] = None,
+        ) -> "concurrent.futures.Future[List[Item]]":
+            future = pool.submit(ranker.rank, context)
+            if on_done is not None:
+                # 実行中の Future は cancel できないため、完了 (または開始前の取り消し) の時点で呼ばれる
+                future.add_done_callback(lambda _: on_done())
+            return future
+        
+        if config.execution_backend != "process":
+            return submit_thread
+        # multiprocessing の import はコールドスタート時間に効くため、プロセス実行を使う場合のみ読み込む
+        from src.execution import process
+        if process.available_cpus() <= 1:
+            return submit_thread
+        try:
+            process_pool = process.get_process_pool()
+        except process.ProcessPoolUnavailable:
+            return submit_thread
+        
+        def submit_process(
+            ranker: Ranker, context: Context, on_done: Optional[Callable[[], None]] = None,
+        ) -> "concurrent.futures.Future[List[Item]]":
+            # 区間計測のラッパーは pickle できないため、元のランカーを送り、所要時間は完了時に記録する
+            traced = ranker if isinstance(ranker, _TracedRanker) else None
+            target = traced.ranker if traced is not None else ranker
+            if not process.is_picklable(target):
+                return submit_thread(ranker, context, on_done)
+            callbacks = [] if on_done is None else [on_done]
+            if traced is not None:
+                started_at = time.perf_counter()
+                callbacks.insert(0, lambda: traced.trace.record_since(traced.stage, started_at))
+            # submit_rank の on_done はワーカーでの実行が終わった時点で呼ばれる (結果の Future の取り消し時ではない)
+            return process.submit_rank(
+                process_pool, target, context, with_meta=self.process_meta,
+                on_done=(lambda: [callback() for callback in callbacks]) if callbacks else None,
+            )
+        
+        return submit_process
+
+    def run_many(
+        self,
+        rankers: Sequence[Ranker],
+        names: Sequence[str],
+        context: Context,
+        config: ExperimentConfig,
+    ) -> MultiResult:
+        if len(rankers) != len(names):
+            raise ValueError("rankers and names must have the same length")
+        trace = current_trace()
+        if trace is not None:
+            stages = [f"ranker_{name}" for name in names]
+            started_at = time.perf_counter()
+            try:
+                traced = [_TracedRanker(ranker, trace, stage) for ranker, stage in zip(rankers, stages)]
+                return self._run_many(traced, names, context, config)
+            finally:
+                trace.fields["parallel"] = config.parallel_enabled
+                trace.record_fanout("rank", started_at, stages)
+        return self._run_many(rankers, names, context, config)
+
+    def _run_many(
+        self,
+        rankers: Sequence[Ranker],
+        names: Sequence[str],
+        context: Context,
+        config: ExperimentConfig,
+    ) -> MultiResult:
+        if config.parallel_enabled:
+            return self._run_many_parallel(rankers, names, context, self._submitter(config))
+        return self._run_many_sequential(rankers, names, context)
+
+    def _run_sequential(self, ranker_a: Ranker, ranker_b: Ranker, context: Context) -> ABResult:
+        list_a = ranker_a.rank(context)
+        started_at = time.monotonic()
+        try:
+            list_b = ranker_b.rank(context)
+        except Exception:
+            return self._degrade(context, "error", started_at, list_a)
+        return ABResult(list_a=list_a, list_b=list_b)
+
+    def _run_parallel(self, ranker_a: Ranker, ranker_b: Ranker, context: Context, submit: Submit) -> ABResult:
+        started_at = time.monotonic()
+        future_a = submit(ranker_a, context, None)
+        future_b = _submit_challenger(submit, ranker_b, context)
+        
+        try:
+            list_a = future_a.result(timeout=self.timeout_a)
+        except BaseException:
+            if future_b is not None:
+                future_b.cancel()
+            raise
+        if future_b is None:
+            return self._degrade(context, "saturated", started_at, list_a)
+        
+        # B の期限は A と同じ起点から数える (A の待ち時間を二重に与えない)
+        remaining_b = None
+        if self.timeout_b is not None:
+            remaining_b = max(0.0, self.timeout_b - (time.monotonic() - started_at))
+        
+        try:
+            list_b = future_b.result(timeout=remaining_b)
+        except concurrent.futures.TimeoutError:
+            # 実行中のスレッドは止められないが、結果は待たずに捨てる
+            future_b.cancel()
+            return self._degrade(context, "timeout", started_at, list_a)
+        except Exception:
+            return self._degrade(context, "error", started_at, list_a)
+        
+        return ABResult(list_a=list_a, list_b=list_b)
+
+    def _run_many_sequential(self, rankers: Sequence[Ranker], names: Sequence[str], context: Context) -> MultiResult:
+        result = MultiResult(lists={names[0]: rankers[0].rank(context)}, degraded={})
+        for name, ranker in zip(names[1:], rankers[1:]):
+            started_at = time.monotonic()
+            try:
+                result.lists[name] = ranker.rank(context)
+            except Exception:
+                self._exclude(result, context, name, "error", started_at)
+        return result
+
+    def _run_many_parallel(self, rankers: Sequence[Ranker], names: Sequence[str], context: Context, submit: Submit) -> MultiResult:
+        started_at = time.monotonic()
+        futures = [submit(rankers[0], context, None)]
+        futures.extend(_submit_challenger(submit, ranker, context) for ranker in rankers[1:])
+        
+        try:
+            baseline = futures[0].result(timeout=self.timeout_a)
+        except BaseException:
+            for future in futures[1:]:
+                if future is not None:
+                    future.cancel()
+            raise
+        
+        result = MultiResult(lists={names[0]: baseline}, degraded={})
+        for name, future in zip(names[1:], futures[1:]):
+            if future is None:
+                self._exclude(result, context, name, "saturated", started_at)
+                continue
+            # 期限はすべてのランカーで同じ起点から数える
+            remaining = None
+            if self.timeout_b is not None:
+                remaining = max(0.0, self.timeout_b - (time.monotonic() - started_at))
+            try:
+                result.lists[name] = future.result(timeout=remaining)
+            except concurrent.futures.TimeoutError:
+                future.cancel()
+                self._exclude(result, context, name, "timeout", started_at)
+            except Exception:
+                self._exclude(result, context, name, "error", started_at)
+        return result
+
+    def _exclude(self, result: MultiResult, context: Context, name: str, reason: str, started_at: float) -> None:
+        elapsed_ms = (time.monotonic() - started_at) * 1000.0
+        log_ranker_degraded(context, ranker=name, reason=reason, elapsed_ms=elapsed_ms)
+        result.degraded[name] = reason
+
+    def _degrade(self, context: Context, reason: str, started_at: float, list_a: List[Item]) -> ABResult:
+        elapsed_ms = (time.monotonic() - started_at) * 1000.0
+        log_ranker_degraded(context, ranker="B", reason=reason, elapsed_ms=elapsed_ms)
+        return ABResult(list_a=list_a, list_b=None, degraded=True, reason=reason)
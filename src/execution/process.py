@@ -0,0 +1,261 @@
+
+import array
+import concurrent.futures
+import multiprocessing
+import os
+import pickle
+import threading
+import time
+import weakref
+from multiprocessing import shared_memory
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+from src.context import Context, Item
+from src.observability.logging import log_process_pool_unavailable
+from src.ranker.base import Ranker
+
+# プロセスプールもスレッドプールと同様にモジュールレベルで1つだけ作り、
+# ウォームな実行環境では呼び出しを跨いで使い回す (ワーカーの起動コストは初回のみ)
+_pool_lock = threading.Lock()
+_process_pool: Optional[concurrent.futures.ProcessPoolExecutor] = None
+# プロセスプールを作れなかった理由 (作れない環境では以降の呼び出しで再試行しない)
+_pool_error: Optional[str] = None
+
+# is_picklable の結果 (ランカーのインスタンスごと。id -> (weakref, 結果))
+_picklable_lock = threading.Lock()
+_picklable: Dict[int, Tuple[Any, bool]] = {}
+
+# 共有メモリのヘッダー: アイテム数 (int64)
+_HEADER = array.array('q', [0]).itemsize
+# 共有メモリ上で None を表す値 (original_rank / prob と credit)
+_NO_RANK = -(1 << 63)
+_NAN = float('nan')
+
+def available_cpus() -> int:
+    """このプロセスが使える vCPU 数 (affinity を考慮する)"""
+    if hasattr(os, 'sched_getaffinity'):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+def _mp_context() -> Any:
+    # fork はスレッド (共有スレッドプール・非同期ログ) を持つプロセスから行うとロックを
+    # 引き継いでデッドロックし得るため、forkserver (無ければ spawn) を使う
+    methods = multiprocessing.get_all_start_methods()
+    return multiprocessing.get_context('forkserver' if 'forkserver' in methods else 'spawn')
+
+def _worker_pid() -> int:
+    time.sleep(0.05)
+    return os.getpid()
+
+class ProcessPoolUnavailable(RuntimeError):
+    """この実行環境ではプロセスプールを使えない (/dev/shm や sem_open が無い Lambda など)"""
+
+def _create_process_pool(workers: int) -> concurrent.futures.ProcessPoolExecutor:
+    # 結果の受け渡しに使う共有メモリを先に確かめる (/dev/shm が無い環境ではここで失敗する)
+    probe = shared_memory.SharedMemory(create=True, size=1)
+    probe.close()
+    probe.unlink()
+    # ProcessPoolExecutor はキューのロックに sem_open を使うため、使えない環境では生成時に失敗する
+    pool = concurrent.futures.ProcessPoolExecutor(max_workers=workers, mp_context=_mp_context())
+    try:
+        # ワーカーはタスクの投入時に起動されるため、ワーカー数分のタスクを同時に投入して全て起動しておく
+        for future in [pool.submit(_worker_pid) for _ in range(workers)]:
+            future.result()
+    except BaseException:
+        pool.shutdown(wait=False, cancel_futures=True)
+        raise
+    return pool
+
+def get_process_pool(max_workers: Optional[int] = None) -> concurrent.futures.ProcessPoolExecutor:
+    """
+    プロセス内で共有するプロセスプールを返す (初回呼び出し時に生成し、ワーカーを起動しておく)。
+    max_workers の既定値は利用可能な vCPU 数。
+    生成に失敗した場合は警告を1回だけログに出力して ProcessPoolUnavailable を送出し、
+    失敗を覚えておいて以降の呼び出しでは生成を試みずに同じ例外を送出する。
+    """
+    global _process_pool, _pool_error
+    if _process_pool is None:
+        with _pool_lock:
+            if _pool_error is not None:
+                raise ProcessPoolUnavailable(_pool_error)
+            if _process_pool is None:
+                try:
+                    _process_pool = _create_process_pool(max_workers or available_cpus())
+                except Exception as e:
+                    _pool_error = repr(e)
+                    log_process_pool_unavailable(e)
+                    raise ProcessPoolUnavailable(_pool_error) from e
+    return _process_pool
+
+def shutdown_process_pool() -> None:
+    """共有プロセスプールを停止する (生成に失敗した記録も消し、次の get_process_pool で再び生成を試みる)"""
+    global _process_pool, _pool_error
+    with _pool_lock:
+        _pool_error = None
+        if _process_pool is not None:
+            _process_pool.shutdown(wait=True)
+            _process_pool = None
+
+def is_picklable(ranker: Ranker) -> bool:
+    """
+    ランカーをワーカープロセスに送れるか (モジュールレベルの関数をラップしたものなど)。
+    lambda やクロージャをラップしたランカーは送れない。
+    pickle を試すのはインスタンスごとに初回のみで、結果はインスタンスが破棄されるまで覚えておく
+    (弱参照を作れないランカーは毎回試す)。
+    """
+    key = id(ranker)
+    cached = _picklable.get(key)
+    if cached is not None and cached[0]() is ranker:
+        return cached[1]
+    try:
+        pickle.dumps(ranker)
+        picklable = True
+    except Exception:
+        picklable = False
+    try:
+        ref = weakref.ref(ranker, lambda _, key=key: _forget_picklable(key))
+    except TypeError:
+        return picklable
+    with _picklable_lock:
+        _picklable[key] = (ref, picklable)
+    return picklable
+
+def _forget_picklable(key: int) -> None:
+    with _picklable_lock:
+        entry = _picklable.get(key)
+        # 同じ id が新しいインスタンスに再利用されて登録し直されている場合は消さない
+        if entry is not None and entry[0]() is None:
+            del _picklable[key]
+
+def encode_items(items: Sequence[Item], with_meta: bool = True) -> Tuple[str, int, Optional[List[Dict[str, Any]]]]:
+    """
+    ランキング結果を共有メモリに書き込み、(共有メモリ名, サイズ, meta のリスト) を返す。
+    レイアウト: [件数 int64][score float64 x n][original_rank int64 x n][prob float64 x n][credit float64 x n]
+    [id のバイト長 int32 x n][source_ranker のバイト長 int32 x n][id (UTF-8) を連結][source_ranker (UTF-8) を連結]
+    (None は original_rank が _NO_RANK、prob / credit が NaN、source_ranker がバイト長 -1)。
+    meta は共有メモリに載せられないため pickle で送る。with_meta=False の場合は送らず、
+    復元した Item の meta は空になる (meta を使わないランカーで pickle のコストを省く場合)。
+    共有メモリはここでは unlink せず、decode_items 側で解放する。
+    """
+    encoded_ids = [item.id.encode('utf-8') for item in items]
+    encoded_sources = [
+        item.source_ranker.encode('utf-8') if item.source_ranker is not None else None
+        for item in items
+    ]
+    columns = [
+        array.array('d', [item.score for item in items]),
+        array.array('q', [_NO_RANK if item.original_rank is None else item.original_rank for item in items]),
+        array.array('d', [_NAN if item.prob is None else item.prob for item in items]),
+        array.array('d', [_NAN if item.credit is None else item.credit for item in items]),
+        array.array('i', [len(item_id) for item_id in encoded_ids]),
+        array.array('i', [-1 if source is None else len(source) for source in encoded_sources]),
+    ]
+    header = array.array('q', [len(items)]).tobytes()
+    payload = [header, *(column.tobytes() for column in columns),
+               b''.join(encoded_ids), b''.join(source for source in encoded_sources if source)]
+    size = sum(len(part) for part in payload)
+
+    block = shared_memory.SharedMemory(create=True, size=max(size, 1))
+    try:
+        offset = 0
+        for part in payload:
+            block.buf[offset:offset + len(part)] = part
+            offset += len(part)
+    finally:
+        block.close()
+    metas = [dict(item.meta) for item in items] if with_meta else None
+    return block.name, size, metas
+
+def decode_items(name: str, size: int, metas: Optional[List[Dict[str, Any]]]) -> List[Item]:
+    """encode_items の結果から Item のリストを復元し、共有メモリを解放する"""
+    block = shared_memory.SharedMemory(name=name)
+    try:
+        data = bytes(block.buf[:size])
+    finally:
+        block.close()
+        block.unlink()
+    n = array.array('q', data[:_HEADER])[0]
+    offset = _HEADER
+    columns = []
+    for typecode in ('d', 'q', 'd', 'd', 'i', 'i'):
+        column = array.array(typecode)
+        column.frombytes(data[offset:offset + n * column.itemsize])
+        offset += n * column.itemsize
+        columns.append(column)
+    scores, ranks, probs, credits, id_lengths, source_lengths = columns
+
+    ids = []
+    for length in id_lengths:
+        ids.append(data[offset:offset + length].decode('utf-8'))
+        offset += length
+    items = []
+    for index in range(n):
+        length = source_lengths[index]
+        source = None
+        if length >= 0:
+            source = data[offset:offset + length].decode('utf-8')
+            offset += length
+        rank, prob, credit = ranks[index], probs[index], credits[index]
+        items.append(Item(
+            id=ids[index],
+            score=scores[index],
+            source_ranker=source,
+            original_rank=None if rank == _NO_RANK else rank,
+            prob=None if prob != prob else prob,
+            meta=metas[index] if metas is not None else {},
+            credit=None if credit != credit else credit,
+        ))
+    return items
+
+def _rank_in_worker(ranker: Ranker, context: Context, with_meta: bool) -> Tuple[str, int, Optional[List[Dict[str, Any]]]]:
+    return encode_items(ranker.rank(context), with_meta)
+
+def submit_rank(
+    pool: concurrent.futures.ProcessPoolExecutor,
+    ranker: Ranker,
+    context: Context,
+    with_meta: bool = True,
+    on_done: Optional[Callable[[], None]] = None,
+) -> "concurrent.futures.Future[List[Item]]":
+    """
+    ranker.rank(context) をワーカープロセスで実行し、結果を List[Item] として返す Future を返す。
+    結果は共有メモリ経由で受け取る (Item のリストそのものは pickle しない)。
+    meta は pickle で受け取る (with_meta=False の場合は受け取らず、復元した Item の meta は空になる)。
+    呼び出し側が結果を待たずに捨てた場合 (期限切れ) も、完了時に共有メモリを解放する。
+    on_done は完了時 (結果の復元後) に呼ばれる。
+    """
+    result: "concurrent.futures.Future[List[Item]]" = concurrent.futures.Future()
+    worker_future = pool.submit(_rank_in_worker, ranker, context, with_meta)
+    # 呼び出し側が cancel した場合、まだ開始していなければワーカーのタスクも取り消す
+    result.add_done_callback(lambda f: worker_future.cancel() if f.cancelled() else None)
+
+    def done(future: concurrent.futures.Future) -> None:
+        try:
+            if future.cancelled():
+                result.cancel()
+                return
+            error = future.exception()
+            if error is not None:
+                _set(result, exception=error)
+                return
+            try:
+                items = decode_items(*future.result())
+            except Exception as e:
+                _set(result, exception=e)
+                return
+            _set(result, items=items)
+        finally:
+            if on_done is not None:
+                on_done()
+
+    worker_future.add_done_callback(done)
+    return result
+
+def _set(future: concurrent.futures.Future, items: Optional[List[Item]] = None, exception: Optional[BaseException] = None) -> None:
+    # 呼び出し側で既に期限切れとして扱われていても、結果の設定の失敗は無視する
+    try:
+        if exception is not None:
+            future.set_exception(exception)
+        else:
+            future.set_result(items)
+    except concurrent.futures.InvalidStateError:
+        pass
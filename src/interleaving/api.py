@@ -1,25 +1,92 @@
 
-from typing import List, Protocol, Optional, Any
+import functools
+from typing import Iterable, List, Protocol, Optional, Any, Sequence
 from src.context import Item
 from src.interleaving.method import TeamDraftInterleaver, OptimizedInterleaver
+from src.interleaving.multileave import TeamDraftMultileaver, ProbabilisticMultileaver
+from src.interleaving.rng import RandomSource
 
 class Interleaver(Protocol):
-    def interleave(self, list_a: List[Item], list_b: List[Item]) -> List[Item]:
+    def interleave(
+        self,
+        list_a: Iterable[Item],
+        list_b: Iterable[Item],
+        k: Optional[int] = None,
+        rng: Optional[RandomSource] = None,
+    ) -> List[Item]:
+        """
+        list_a / list_b はリストまたはイテレータ (Ranker.rank_stream)。
+        k を指定した場合は先頭 k 件で打ち切り、入力は必要な分だけ消費する。
+        rng を指定した場合はインスタンスの乱数源の代わりにそれを使う (リクエスト単位の再現性)。
+        """
         ...
 
-def get_interleaver(method: str, seed: Optional[int] = None) -> Interleaver:
+class Multileaver(Protocol):
+    def multileave(
+        self,
+        lists: Sequence[Iterable[Item]],
+        k: Optional[int] = None,
+        names: Optional[Sequence[str]] = None,
+        rng: Optional[RandomSource] = None,
+    ) -> List[Item]:
+        """
+        N 個のランカーの結果を合成する。各アイテムの source_ranker にはチーム名
+        (names、省略時は "A", "B", "C", ...) が付与される。rng は Interleaver.interleave と同じ。
+        """
+        ...
+
+def get_interleaver(method: str, seed: Optional[int] = None, tau: float = 1.0) -> Interleaver:
     """
     Factory function to get the appropriate Interleaver instance.
     
     Args:
         method (str): "team_draft" or "optimized"
         seed (Optional[int]): Random seed for reproducibility
+        tau (float): Optimized Interleaving のクレジットの順位割引の指数
+            (src/evaluation/replay.py のシミュレーションで選んだ値を渡す)
         
     Returns:
         Interleaver: An instance of a class implementing interleave method.
+        seed が None の場合は (method, tau) ごとに共有のインスタンスを返す
+        (リクエストごとの乱数は interleave(..., rng=request_random(...)) で渡す)。
     """
+    if seed is None:
+        return _shared_interleaver(method, tau)
+    return _new_interleaver(method, seed, tau)
+
+def _new_interleaver(method: str, seed: Optional[int], tau: float) -> Interleaver:
     if method == "optimized":
-        return OptimizedInterleaver(seed=seed)
+        return OptimizedInterleaver(tau=tau, seed=seed)
     else:
         # Default or "team_draft"
         return TeamDraftInterleaver(seed=seed)
+
+@functools.lru_cache(maxsize=None)
+def _shared_interleaver(method: str, tau: float) -> Interleaver:
+    return _new_interleaver(method, None, tau)
+
+def get_multileaver(method: str, seed: Optional[int] = None, tau: Optional[float] = None) -> Multileaver:
+    """
+    Factory function to get the appropriate Multileaver instance.
+    
+    Args:
+        method (str): "team_draft" or "probabilistic"
+        seed (Optional[int]): Random seed for reproducibility
+            (None の場合は get_interleaver と同じく (method, tau) ごとに共有のインスタンスを返す)
+        tau (Optional[float]): Probabilistic Multileaving の順位の重み 1 / rank^tau の指数
+            (ExperimentConfig.tau を渡す。None の場合は ProbabilisticMultileaver の既定値)
+    """
+    if seed is None:
+        return _shared_multileaver(method, tau)
+    return _new_multileaver(method, seed, tau)
+
+def _new_multileaver(method: str, seed: Optional[int], tau: Optional[float]) -> Multileaver:
+    if method == "probabilistic":
+        return ProbabilisticMultileaver(seed=seed) if tau is None else ProbabilisticMultileaver(tau=tau, seed=seed)
+    else:
+        # Default or "team_draft"
+        return TeamDraftMultileaver(seed=seed)
+
+@functools.lru_cache(maxsize=None)
+def _shared_multileaver(method: str, tau: Optional[float]) -> Multileaver:
+    return _new_multileaver(method, None, tau)
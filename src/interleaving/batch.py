@@ -0,0 +1,514 @@
+
+import _random
+import functools
+import random
+from dataclasses import dataclass
+from typing import Any, Dict, Hashable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from src.interleaving.optimized import CACHE_SIZE, DEFAULT_DEPTH, allocation_table
+from src.interleaving.rng import CounterRandom, counter_uniforms
+
+# パディング用の ID (padded 配列の末尾を埋める値)
+PAD = -1
+
+# sources 配列の値
+SOURCE_A = 0
+SOURCE_B = 1
+
+# 重複構造の行のハッシュに使う乗数の乱数シード
+_HASH_SEED = 0x5eed
+
+# 1チャンクあたりの作業領域 (乱数バッファ等) の目安。チャンク行数はリスト長から決める
+# (各ステップの配列演算が CPU のキャッシュに収まる大きさにする。ただし行数が少ないとステップごとの
+#  Python のオーバーヘッドが目立つため、長いリストの全件マージでも MIN_CHUNK_ROWS 行は1度に処理する)
+CHUNK_BUDGET_BYTES = 2 * 1024 * 1024
+MIN_CHUNK_ROWS = 1024
+MAX_CHUNK_ROWS = 4096
+
+@dataclass
+class BatchResult:
+    """
+    interleave_batch の結果。各行が1リクエストに対応し、lengths[i] 以降は PAD で埋められる。
+
+    ids: (B, K) int64 配置されたアイテムの ID (入力と同じ ID 空間)
+    sources: (B, K) int8 SOURCE_A / SOURCE_B (パディング部分は -1)
+    probs: (B, K) float64 選択確率 (Team Draft は NaN、パディング部分も NaN)
+    lengths: (B,) int64 各行の配置件数
+    vocab: 入力を ID のリストで与えた場合の ID -> 元の値 の対応 (ndarray 入力時は None)
+    """
+    ids: np.ndarray
+    sources: np.ndarray
+    probs: np.ndarray
+    lengths: np.ndarray
+    vocab: Optional[List[Hashable]] = None
+
+    def id_lists(self) -> List[List[Hashable]]:
+        """行ごとの配置済み ID のリスト (vocab があれば元の値に戻す)"""
+        rows = []
+        for row, length in zip(self.ids.tolist(), self.lengths.tolist()):
+            row = row[:length]
+            if self.vocab is not None:
+                row = [self.vocab[i] for i in row]
+            rows.append(row)
+        return rows
+
+    def source_lists(self) -> List[List[str]]:
+        """行ごとの source_ranker ("A" / "B") のリスト"""
+        return [
+            ["A" if s == SOURCE_A else "B" for s in row[:length]]
+            for row, length in zip(self.sources.tolist(), self.lengths.tolist())
+        ]
+
+def pad_id_lists(
+    lists: Sequence[Sequence[Hashable]],
+    vocab: Optional[Dict[Hashable, int]] = None,
+) -> Tuple[np.ndarray, Dict[Hashable, int]]:
+    """
+    ID (文字列など) のリストのリストを、整数 ID の padded 配列 (B, L) に変換する。
+    vocab を共有すれば A / B で同じ ID が同じ整数になる。
+    """
+    if vocab is None:
+        vocab = {}
+    width = max((len(ids) for ids in lists), default=0)
+    out = np.full((len(lists), max(width, 1)), PAD, dtype=np.int64)
+    for row, ids in enumerate(lists):
+        codes = [vocab.setdefault(item_id, len(vocab)) for item_id in ids]
+        out[row, :len(codes)] = codes
+    return out, vocab
+
+def interleave_batch(
+    lists_a: Any,
+    lists_b: Any,
+    seeds: Sequence[int],
+    method: str = "team_draft",
+    k: Optional[int] = None,
+    tau: float = 1.0,
+    depth: int = DEFAULT_DEPTH,
+    chunk_size: Optional[int] = None,
+    counter_rng: bool = True,
+) -> BatchResult:
+    """
+    多数のリクエストをまとめて Interleave する (オフラインのリプレイ・シミュレーション用)。
+
+    リクエスト単位の TeamDraftInterleaver / OptimizedInterleaver(tau, depth=depth) に
+    rng=CounterRandom(seed) を渡した場合 (本番の request_random と同じ乱数源) とビット単位で同一の結果を返す。
+    Team Draft / Optimized ともにアルゴリズムの各ステップがバッチ方向にベクトル化され、
+    Python のループはステップ数 (≒ k) と、Optimized の重複構造ごとの確率分布の参照のみとなる。
+
+    Args:
+        lists_a: (B, La) の整数 ID 配列 (末尾 PAD 埋め)、または ID のリストのリスト
+        lists_b: (B, Lb) の整数 ID 配列、または ID のリストのリスト
+        seeds: リクエストごとの乱数シード (int)
+        method: "team_draft" or "optimized" (get_interleaver と同じく未知の値は team_draft)
+        k: 各行の最大配置件数 (None = 全件マージ)
+        tau: Optimized Interleaving のクレジットの順位割引の指数
+        depth: Optimized Interleaving で確率分布を解く (不偏性の制約を課す) 先頭の件数
+        chunk_size: 1回のベクトル演算で処理する行数 (None = リスト長から自動決定)
+        counter_rng: True (既定) の場合、seeds を src/interleaving/rng.py の鍵 (request_key) とみなし、
+            interleave(..., rng=CounterRandom(seed)) と同一の結果を返す。False の場合は
+            TeamDraftInterleaver(seed=s) / OptimizedInterleaver(tau, seed=s, depth) (random.Random(seed)) と
+            同一の結果を返すが、シードごとに Mersenne Twister の初期化が要るため遅い
+
+    各リストの中で ID は重複しない前提とする。
+    """
+    vocab = None
+    if not isinstance(lists_a, np.ndarray) or not isinstance(lists_b, np.ndarray):
+        codes: Dict[Hashable, int] = {}
+        lists_a, codes = pad_id_lists(lists_a, codes)
+        lists_b, codes = pad_id_lists(lists_b, codes)
+        vocab = list(codes)
+
+    ids_a = _as_padded(lists_a)
+    ids_b = _as_padded(lists_b)
+    if k is not None:
+        # 1ステップで各側から高々1件しか消費せず、ステップ数は 2k 以下のため、
+        # 各リストの先頭 2k 件より後ろは参照されない
+        ids_a = ids_a[:, :max(2 * k, 1)]
+        ids_b = ids_b[:, :max(2 * k, 1)]
+    seeds = [int(s) for s in seeds]
+    if not (len(ids_a) == len(ids_b) == len(seeds)):
+        raise ValueError("lists_a, lists_b and seeds must have the same number of rows")
+
+    width = ids_a.shape[1] + ids_b.shape[1] if k is None else k
+    result = BatchResult(
+        ids=np.full((len(seeds), width), PAD, dtype=np.int64),
+        sources=np.full((len(seeds), width), -1, dtype=np.int8),
+        probs=np.full((len(seeds), width), np.nan, dtype=np.float64),
+        lengths=np.zeros(len(seeds), dtype=np.int64),
+        vocab=vocab,
+    )
+
+    if chunk_size is None:
+        # 行あたり (La + Lb) 個程度の float64 を保持する前提で、作業領域が予算に収まる行数にする
+        row_bytes = 8 * (ids_a.shape[1] + ids_b.shape[1])
+        chunk_size = max(MIN_CHUNK_ROWS, min(MAX_CHUNK_ROWS, CHUNK_BUDGET_BYTES // row_bytes))
+
+    uniforms = counter_uniforms if counter_rng else _mt_uniforms
+    space = _StateSpace(depth if k is None else min(depth, k), tau, ids_a.shape[1] + 1)
+    for start in range(0, len(seeds), chunk_size):
+        stop = min(start + chunk_size, len(seeds))
+        if method == "optimized":
+            _optimized_chunk(ids_a[start:stop], ids_b[start:stop], seeds[start:stop], k, space, width, result, start, uniforms)
+        else:
+            _team_draft_chunk(ids_a[start:stop], ids_b[start:stop], seeds[start:stop], width, result, start, uniforms)
+
+    return result
+
+def _as_padded(ids: np.ndarray) -> np.ndarray:
+    ids = np.asarray(ids, dtype=np.int64)
+    if ids.ndim != 2:
+        raise ValueError("padded id arrays must be 2-dimensional")
+    if ids.shape[1] == 0:
+        # 幅0の配列はインデックス参照できないため、PAD 1列に広げる
+        ids = np.full((ids.shape[0], 1), PAD, dtype=np.int64)
+    return ids
+
+def _mt_uniforms(seeds: Sequence[int], n: int) -> np.ndarray:
+    """
+    random.Random(seed).random() を n 回呼んだのと同じ値を (len(seeds), n) の配列で返す。
+
+    random() は 32bit 出力2語 (a, b) から (a >> 5) * 2^26 + (b >> 6) を 2^53 で割った値を作る。
+    getrandbits(64 * n) は同じ 32bit 出力列を下位語から順に詰めた整数を返すため、
+    1回の C 呼び出しで n 回分の出力を取り出してからまとめて変換する。
+    """
+    n = max(n, 1)
+    rng = random.Random()
+    # int シードに対する random.Random.seed は C 実装の seed をそのまま呼ぶため、
+    # Python 側のラッパーを経由せずに直接呼ぶ (シード1件あたりのオーバーヘッド削減)
+    seed = _random.Random.seed
+    getrandbits = rng.getrandbits
+    nbits = 64 * n
+    nbytes = 8 * n
+    chunks = []
+    # 同じシード (例: user_hash をシードにしている場合の同一ユーザー) は1度だけ生成する
+    cache: Dict[int, bytes] = {}
+    for value in seeds:
+        chunk = cache.get(value)
+        if chunk is None:
+            seed(rng, value)
+            chunk = cache[value] = getrandbits(nbits).to_bytes(nbytes, 'little')
+        chunks.append(chunk)
+    words = np.frombuffer(b''.join(chunks), dtype='<u4').reshape(len(seeds), 2 * n)
+    hi = (words[:, 0::2] >> 5).astype(np.float64)
+    lo = (words[:, 1::2] >> 6).astype(np.float64)
+    return (hi * 67108864.0 + lo) * (1.0 / 9007199254740992.0)
+
+def _twin_positions(ids_a: np.ndarray, ids_b: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    行ごとに、A の各位置と同じ ID が B の何番目にあるか (twin_b)、B の各位置と同じ ID が
+    A の何番目にあるか (twin_a) を返す。相手側に無い場合は十分大きな値を入れる。
+
+    各リストの中で ID が重複しなければ、A[i] が既に配置済みであることは
+    「B のカーソルが twin_b[i] を通過済み (twin_b[i] < idx_b)」と同値になる
+    (B が通過した要素は B が配置したか、A が配置済みで読み飛ばしたもののいずれかで、
+    後者は A[i] 自身が未消費であることと矛盾する)。このため used 集合を持たずに判定できる。
+    """
+    n_rows, width_a = ids_a.shape
+    width_b = ids_b.shape[1]
+    width = width_a + width_b
+    missing = width + 1
+    combined = np.concatenate([ids_a, ids_b], axis=1)
+    shift = width.bit_length()
+    limit = max(-int(combined.min(initial=0)), int(combined.max(initial=0)) + 1)
+    if limit < 1 << (62 - shift):
+        # ID と列を1つの整数 ((ID << shift) | 列) に詰めてソートする (argsort の安定ソートより数倍速い)。
+        # 同じ ID は A 側の列が先に並び、各リストの中で ID は重複しないため、隣り合う同じ ID は A / B のペアになる
+        dtype = np.int32 if limit < 1 << (30 - shift) else np.int64
+        packed = np.sort((combined.astype(dtype) << shift) | np.arange(width, dtype=dtype), axis=1)
+        sorted_ids = packed >> shift
+        rows, cols = np.nonzero((sorted_ids[:, :-1] == sorted_ids[:, 1:]) & (sorted_ids[:, 1:] != PAD))
+        mask = (1 << shift) - 1
+        pos_a = packed[rows, cols] & mask
+        pos_b = (packed[rows, cols + 1] & mask) - width_a
+    else:
+        order = np.argsort(combined, axis=1, kind='stable')
+        sorted_ids = np.take_along_axis(combined, order, axis=1)
+        pair = (sorted_ids[:, :-1] == sorted_ids[:, 1:]) & (sorted_ids[:, :-1] != PAD)
+        pair &= (order[:, :-1] < width_a) & (order[:, 1:] >= width_a)
+        rows, cols = np.nonzero(pair)
+        pos_a = order[rows, cols]
+        pos_b = order[rows, cols + 1] - width_a
+
+    twin_b = np.full((n_rows, width_a), missing, dtype=np.int64)
+    twin_a = np.full((n_rows, width_b), missing, dtype=np.int64)
+    twin_b[rows, pos_a] = pos_b
+    twin_a[rows, pos_b] = pos_a
+    return twin_b, twin_a
+
+def _cursor_arrays(ids_a: np.ndarray, ids_b: np.ndarray, twin_b: np.ndarray, twin_a: np.ndarray) -> Tuple[np.ndarray, np.ndarray, int]:
+    """
+    A / B のカーソルで参照する配列を作る。各行を [A, 番兵, B, 番兵] と連結した ID と、
+    同じ位置の「相手側での位置」(_twin_positions) を1次元に平らにして返す (B の先頭の列も返す)。
+    番兵 (ID は PAD、相手側の位置は十分大きな値) によって、カーソルがリストの末尾に達しても範囲内で参照でき、
+    2次元の添字参照 (a[rows, cols]) より速い1次元の参照で A / B のどちらも引ける。
+    """
+    sentinel = np.full((len(ids_a), 1), PAD, dtype=np.int64)
+    missing = np.full((len(ids_a), 1), twin_b.shape[1] + twin_a.shape[1] + 1, dtype=np.int64)
+    ids = np.concatenate([ids_a, sentinel, ids_b, sentinel], axis=1)
+    twins = np.concatenate([twin_b, missing, twin_a, missing], axis=1)
+    return ids.ravel(), twins.ravel(), ids_a.shape[1] + 1
+
+def _team_draft_chunk(ids_a, ids_b, seeds, width, result, offset, uniforms=counter_uniforms):
+    n_rows = len(seeds)
+    len_a = (ids_a != PAD).sum(axis=1)
+    len_b = (ids_b != PAD).sum(axis=1)
+    ids, twins, column_b = _cursor_arrays(ids_a, ids_b, *_twin_positions(ids_a, ids_b))
+
+    # 1ステップで消費する乱数は高々1つ。重複で手番を消費するステップは配置済み件数以下のため、
+    # ステップ数は min(La + Lb, 2k) で抑えられる
+    max_steps = int((len_a + len_b).max(initial=0))
+    max_steps = min(max_steps, 2 * width)
+    draws = uniforms(seeds, max_steps)
+
+    rows = np.arange(n_rows)
+    base = rows * (ids.size // max(n_rows, 1))
+    # i ステップ目に参照する乱数は高々 i 番目のため、範囲外にはならない
+    next_draw = rows * draws.shape[1]
+    draws = draws.ravel()
+    # 配置したアイテムは _cursor_arrays の行の中での位置で記録し (ID と A / B は最後にまとめて引く)、
+    # 配置しなかった行も末尾の作業用の列に書き込むことで、行の選択 (ブールの添字) を省く
+    out_positions = np.full((n_rows, width + 1), -1, dtype=np.int64)
+    out_base = rows * (width + 1)
+
+    idx_a = np.zeros(n_rows, dtype=np.int64)
+    idx_b = np.zeros(n_rows, dtype=np.int64)
+    count_a = np.zeros(n_rows, dtype=np.int64)
+    out_len = np.zeros(n_rows, dtype=np.int64)
+
+    for _ in range(max_steps):
+        has_a = idx_a < len_a
+        has_b = idx_b < len_b
+        active = (out_len < width) & (has_a | has_b)
+        if not active.any():
+            break
+
+        # 手番の決定 (同数のときだけコイントスで乱数を1つ消費する)。B の配置件数は out_len - count_a
+        lead = 2 * count_a - out_len
+        tie = lead == 0
+        pick_a = np.where(tie, draws[next_draw] < 0.5, lead < 0)
+        next_draw += tie & active
+
+        # 選ばれたチームが尽きていれば相手チームから取る
+        pick_a = (pick_a & has_a) | ~has_b
+
+        position = np.where(pick_a, idx_a, idx_b + column_b)
+        duplicate = twins[base + position] < np.where(pick_a, idx_b, idx_a)
+        step_a = active & pick_a
+        idx_a += step_a
+        idx_b += active ^ step_a
+
+        placed = active & ~duplicate
+        out_positions.ravel()[out_base + out_len] = np.where(placed, position, -1)
+        count_a += placed & pick_a
+        out_len += placed
+
+    positions = out_positions[:, :width]
+    filled = positions >= 0
+    result.ids[offset:offset + n_rows] = np.where(filled, ids[base[:, None] + np.maximum(positions, 0)], PAD)
+    result.sources[offset:offset + n_rows] = np.where(filled, np.where(positions < column_b, SOURCE_A, SOURCE_B), -1)
+    result.lengths[offset:offset + n_rows] = out_len
+
+@dataclass(frozen=True)
+class _TableArrays:
+    """
+    AllocationTable を配列にしたもの (バッチの抽選で状態をまとめて進めるため)。
+    選択肢の配列は状態 s の選択肢 c (0 / 1) を 2s + c 番目に持つ。
+    終端の状態は選択肢が1つで自分自身に留まる (ステップ数の異なる行をまとめて進めるため)。
+    """
+    first: np.ndarray  # (S,) 選択肢0 を取る確率
+    two: np.ndarray  # (S,) 選択肢が2つあるか
+    position: np.ndarray  # (2S,) 選んだ側のリストでの位置
+    side: np.ndarray  # (2S,) 0=A / 1=B
+    next: np.ndarray  # (2S,) 次の状態
+    prob: np.ndarray  # (2S,) 条件付き選択確率
+    cursor_a: np.ndarray  # (S,) 状態のカーソル ia
+    cursor_b: np.ndarray  # (S,) 状態のカーソル ib
+    length: int
+
+@functools.lru_cache(maxsize=CACHE_SIZE)
+def _table_arrays(size: int, len_a: int, len_b: int, twins: Tuple[int, ...], tau: float) -> _TableArrays:
+    table = allocation_table(size, len_a, len_b, twins, tau)
+    first, two, options = [], [], []
+    for state, (p, option0, option1) in enumerate(table.states):
+        first.append(p)
+        two.append(option1 is not None)
+        option0 = option0 or (0, 0, state, 1.0)
+        options.append(option0)
+        options.append(option1 or option0)
+    index, side, next_state, prob = (np.array(column) for column in zip(*options))
+    cursor_a, cursor_b = (np.array(column, dtype=np.int64) for column in zip(*table.cursors))
+    return _TableArrays(
+        first=np.array(first, dtype=np.float64),
+        two=np.array(two, dtype=bool),
+        # 選択肢の位置は A の候補 + B の候補 を連結した列でのものなので、B は A の候補数を引く
+        position=(index - side * len_a).astype(np.int64),
+        side=side.astype(np.int8),
+        next=next_state.astype(np.int64),
+        prob=prob.astype(np.float64),
+        cursor_a=cursor_a,
+        cursor_b=cursor_b,
+        length=table.length,
+    )
+
+class _StateSpace:
+    """
+    行ごとの確率分布のテーブル (_table_arrays) を1つの状態空間に連結したもの。
+    状態の番号はテーブルの先頭位置だけずらす。1回の interleave_batch の中でチャンクを跨いで使い回し、
+    新しい重複構造が現れた場合のみ連結し直す。
+
+    offset は選んだアイテムの、_cursor_arrays の行の中での位置 (B は column_b だけずらす)。
+    """
+    def __init__(self, size: int, tau: float, column_b: int):
+        self.size = size
+        self.tau = tau
+        self.column_b = column_b
+        self._starts: Dict[Tuple[int, ...], Tuple[int, int]] = {}
+        self._tables: List[_TableArrays] = []
+        self._n_states = 0
+
+    def lookup(self, structures: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """各構造 (_structures の行) のテーブルの (先頭の状態, ステップ数) を返す"""
+        starts, lengths = [], []
+        added = False
+        for key in map(tuple, structures.tolist()):
+            entry = self._starts.get(key)
+            if entry is None:
+                window_a, window_b = key[0], key[1]
+                table = _table_arrays(self.size, window_a, window_b, key[2:2 + window_b], self.tau)
+                entry = self._starts[key] = (self._n_states, table.length)
+                self._n_states += len(table.first)
+                self._tables.append(table)
+                added = True
+            starts.append(entry[0])
+            lengths.append(entry[1])
+        if added:
+            self._concatenate()
+        return np.array(starts, dtype=np.int64), np.array(lengths, dtype=np.int64)
+
+    def _concatenate(self) -> None:
+        tables = self._tables
+        sizes = np.array([len(table.first) for table in tables])
+        starts = np.cumsum(sizes) - sizes
+        self.first = np.concatenate([table.first for table in tables])
+        self.two = np.concatenate([table.two for table in tables])
+        self.side = np.concatenate([table.side for table in tables])
+        self.offset = np.concatenate([table.position for table in tables]) + self.side.astype(np.int64) * self.column_b
+        self.next = np.concatenate([table.next for table in tables]) + np.repeat(starts, 2 * sizes)
+        self.prob = np.concatenate([table.prob for table in tables])
+        self.cursor_a = np.concatenate([table.cursor_a for table in tables])
+        self.cursor_b = np.concatenate([table.cursor_b for table in tables])
+
+def _structures(len_a: np.ndarray, len_b: np.ndarray, twin_a: np.ndarray, size: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    各行の先頭 size 件の重複構造 (allocation_table のキー) を (len_a, len_b, twins...) の行にし、
+    重複を除いた構造と、各行がどの構造か (添字) を返す。
+    """
+    window_a = np.minimum(len_a, size)
+    window_b = np.minimum(len_b, size)
+    twins = twin_a[:, :size]
+    if twins.shape[1] < size:
+        twins = np.pad(twins, ((0, 0), (0, size - twins.shape[1])), constant_values=-2)
+    # A の先頭 size 件に無ければ -1、B の先頭 size 件より後ろはキーに含めない (-2)
+    twins = np.where(twins < window_a[:, None], twins, -1)
+    twins = np.where(np.arange(size) < window_b[:, None], twins, -2)
+    keys = np.concatenate([window_a[:, None], window_b[:, None], twins], axis=1)
+    # 行単位の np.unique (axis=0) は遅いため、行のハッシュ (2^64 を法とする、奇数の乗数との内積) で
+    # 1次元の unique を取り、衝突が無いことを確かめる
+    multipliers = np.random.default_rng(_HASH_SEED).integers(1, 2 ** 63, size=keys.shape[1], dtype=np.uint64) | np.uint64(1)
+    with np.errstate(over='ignore'):
+        hashes = (keys.astype(np.uint64) * multipliers).sum(axis=1, dtype=np.uint64)
+    _, first, inverse = np.unique(hashes, return_index=True, return_inverse=True)
+    if not (keys == keys[first][inverse]).all():
+        unique, inverse = np.unique(keys, axis=0, return_inverse=True)
+        return unique, inverse.ravel()
+    return keys[first], inverse.ravel()
+
+def _optimized_chunk(ids_a, ids_b, seeds, k, space, width, result, offset, uniforms=counter_uniforms):
+    """
+    Optimized Interleaving をバッチ方向にベクトル化して行う (interleave_placements と同じ結果)。
+
+    先頭 min(k, depth) 件は行ごとに重複構造から確率分布のテーブルを引き (同じ構造の行は1回だけ)、
+    連結した状態空間 (_StateSpace) の上で各ステップに全行の状態をまとめて進める。
+    depth 件より後ろは Team Draft と同じく相手側のカーソルで配置済みを判定しながら、
+    未配置の先頭を確率 1/2 ずつで選ぶ。
+    """
+    n_rows = len(seeds)
+    len_a = (ids_a != PAD).sum(axis=1)
+    len_b = (ids_b != PAD).sum(axis=1)
+    twin_b, twin_a = _twin_positions(ids_a, ids_b)
+    ids, twins, column_b = _cursor_arrays(ids_a, ids_b, twin_b, twin_a)
+    structures, inverse = _structures(len_a, len_b, twin_a, space.size)
+    starts, lengths = space.lookup(structures)
+    state, lengths = starts[inverse], lengths[inverse]
+
+    # 乱数は1件の配置につき高々1つ。配置を終えた行も1つ先を参照するため、1列余分に作る
+    draws = uniforms(seeds, min(int((len_a + len_b).max(initial=0)), width) + 1)
+    rows = np.arange(n_rows)
+    next_draw = rows * draws.shape[1]
+    draws = draws.ravel()
+    base_a = rows * (ids.size // max(n_rows, 1))
+    base_b = base_a + column_b
+    # 配置しなかった行も末尾の作業用の列に書き込むことで、行の選択 (ブールの添字) を省く
+    out_ids = np.full((n_rows, width + 1), PAD, dtype=np.int64)
+    out_sources = np.full((n_rows, width + 1), -1, dtype=np.int8)
+    out_probs = np.full((n_rows, width + 1), np.nan, dtype=np.float64)
+
+    # 先頭 size 件: 状態ごとの条件付き確率に従って選ぶ (選択肢が1つのステップでは乱数を消費しない)。
+    # 終端の状態は自分自身に留まるため、全行を同じステップ数だけ進め、各行のステップ数より後ろは後で消す
+    steps = int(lengths.max(initial=0))
+    for step in range(steps):
+        branch = space.two[state]
+        option = 2 * state + (branch & (draws[next_draw] >= space.first[state]))
+        next_draw += branch
+        out_ids[:, step] = ids[base_a + space.offset[option]]
+        out_sources[:, step] = space.side[option]
+        out_probs[:, step] = space.prob[option]
+        state = space.next[option]
+    unused = np.arange(steps) >= lengths[:, None]
+    out_ids[:, :steps][unused] = PAD
+    out_sources[:, :steps][unused] = -1
+    out_probs[:, :steps][unused] = np.nan
+    out_len = lengths
+
+    if k is None or k > space.size:
+        # depth 件より後ろ: 未配置の先頭を確率 1/2 ずつで選ぶ。配置済みのアイテムは A[:ia] ∪ B[:ib] と一致する
+        idx_a = space.cursor_a[state]
+        idx_b = space.cursor_b[state]
+        out_base = rows * (width + 1)
+        while True:
+            # 相手側が配置済みのアイテムを読み飛ばす
+            while True:
+                skip_a = (idx_a < len_a) & (twins[base_a + idx_a] < idx_b)
+                skip_b = (idx_b < len_b) & (twins[base_b + idx_b] < idx_a)
+                if not (skip_a.any() or skip_b.any()):
+                    break
+                idx_a += skip_a
+                idx_b += skip_b
+
+            has_a = idx_a < len_a
+            has_b = idx_b < len_b
+            active = (out_len < width) & (has_a | has_b)
+            if not active.any():
+                break
+            head_a = ids[base_a + idx_a]
+            head_b = ids[base_b + idx_b]
+            same = has_a & has_b & (head_a == head_b)
+            both = has_a & has_b & ~same
+            pick_a = np.where(both, draws[next_draw] < 0.5, has_a)
+            next_draw += both & active
+
+            slots = out_base + out_len
+            out_ids.ravel()[slots] = np.where(active, np.where(pick_a, head_a, head_b), PAD)
+            out_sources.ravel()[slots] = np.where(active, np.where(pick_a, SOURCE_A, SOURCE_B), -1)
+            out_probs.ravel()[slots] = np.where(active, np.where(both, 0.5, 1.0), np.nan)
+            # 配置したアイテムが相手側の先頭にもあれば、両側を進める
+            idx_a += active & (pick_a | same)
+            idx_b += active & (~pick_a | same)
+            out_len = out_len + active
+
+    result.ids[offset:offset + n_rows] = out_ids[:, :width]
+    result.sources[offset:offset + n_rows] = out_sources[:, :width]
+    result.probs[offset:offset + n_rows] = out_probs[:, :width]
+    result.lengths[offset:offset + n_rows] = out_len
@@ -1,19 +1,173 @@
 
+from typing import Any, Union
+import mmh3
 from src.config import ExperimentConfig
+from src.observability.tracing import timed
+
+# バケット数 (0.01% 単位)
+NUM_BUCKETS = 10000
+
+# 一括判定で1度に処理する件数 (作業領域を抑えるため)
+DEFAULT_CHUNK_SIZE = 1_000_000
+
+def salt_seed(salt: str) -> int:
+    """実験ごとの salt 文字列を murmur3 の seed に変換する (salt が空なら 0)"""
+    return mmh3.hash(salt, signed=False) if salt else 0
+
+def hash_user_id(user_id: Union[str, bytes]) -> int:
+    """ユーザー ID の murmur3 (32bit, 符号なし)。Context.user_hash として使う値"""
+    return mmh3.hash(user_id, signed=False)
+
+def salted_hash(user_hash: int, salt: str) -> int:
+    """
+    user_hash を実験ごとの salt で再ハッシュする。
+    user_hash の下位 32bit (リトルエンディアン 4 バイト) を seed=salt_seed(salt) の murmur3 にかける。
+    """
+    return mmh3.hash((user_hash % (1 << 32)).to_bytes(4, 'little'), salt_seed(salt), signed=False)
 
 class Bucketer:
+    @timed("bucket")
     def determine_mode(self, user_hash: int, config: ExperimentConfig) -> str:
         """
         user_hash (int) をもとにサンプリング判定を行い、
-        Interleaving対象であれば config.mode ("INTERLEAVE") を返す。
-        そうでなければデフォルトの "A" を返す（現在はA固定）。
-        
+        Interleaving対象であれば config.mode ("INTERLEAVE" / "MULTILEAVE") を返す。
+        そうでなければベースライン (config.rankers の先頭、デフォルトは "A") を返す。
+
         ハッシュ値の正規化には 10000 の剰余を利用する (0.01%単位)。
+        config.salt が設定されている場合は salted_hash で再ハッシュしてから判定する
+        (実験ごとにバケットが独立になる)。
         """
-        normalized_hash = (user_hash % 10000) / 10000.0
-        
+        if config.salt:
+            user_hash = salted_hash(user_hash, config.salt)
+        normalized_hash = (user_hash % NUM_BUCKETS) / float(NUM_BUCKETS)
+
         if normalized_hash < config.sampling_rate:
             return config.mode
-            
-        # Target out, fallback to A (Baseline)
-        return "A"
+
+        # Target out, fallback to the baseline ranker
+        return config.baseline
+
+    def in_sample(self, users: Any, config: ExperimentConfig, chunk_size: int = DEFAULT_CHUNK_SIZE) -> Any:
+        """
+        ユーザーをまとめてサンプリング判定し、対象なら True の bool 配列を返す (オフライン分析用)。
+
+        Args:
+            users: 以下のいずれか
+                - 整数の ndarray / リスト: 計算済みの user_hash
+                - bytes の ndarray (dtype 'S'): ユーザー ID。murmur3 を NumPy でベクトル化して計算する
+                - 文字列のリスト / ndarray: ユーザー ID。1件ずつ mmh3 で計算する
+            config: ExperimentConfig (sampling_rate / salt を参照)
+            chunk_size: 1度に処理する件数
+
+        各要素の判定は determine_mode(hash_user_id(user_id), config) と一致する。
+        """
+        import numpy as np
+
+        out = np.empty(len(users), dtype=bool)
+        seed = salt_seed(config.salt)
+        for start in range(0, len(users), chunk_size):
+            hashes = _user_hashes(users[start:start + chunk_size])
+            if config.salt:
+                hashes = _salted_hashes(hashes, seed)
+            out[start:start + len(hashes)] = (hashes % NUM_BUCKETS) / float(NUM_BUCKETS) < config.sampling_rate
+        return out
+
+    def determine_modes(self, users: Any, config: ExperimentConfig, chunk_size: int = DEFAULT_CHUNK_SIZE) -> Any:
+        """
+        determine_mode の一括版。各ユーザーのモード (config.mode / config.baseline) の配列を返す。
+        件数が多い場合は文字列配列のメモリが大きくなるため、in_sample の bool 配列を使うこと。
+        """
+        import numpy as np
+
+        return np.where(self.in_sample(users, config, chunk_size), config.mode, config.baseline)
+
+def _user_hashes(users: Any) -> Any:
+    """users (in_sample の引数の一部) から user_hash の配列を作る"""
+    import numpy as np
+
+    if isinstance(users, np.ndarray):
+        if users.dtype.kind in 'iu':
+            return users
+        if users.dtype.kind == 'S':
+            data = users.view(np.uint8).reshape(len(users), users.dtype.itemsize)
+            return _murmur3_32(data, np.char.str_len(users), 0)
+    elif len(users) and not isinstance(users[0], (str, bytes)):
+        return np.asarray(users)
+    return np.fromiter((mmh3.hash(user_id, signed=False) for user_id in users), dtype=np.uint32, count=len(users))
+
+def _salted_hashes(hashes: Any, seed: Any) -> Any:
+    """
+    salted_hash のベクトル化版。
+    入力は常に 4 バイト (1 ブロック、末尾なし) のため、_murmur3_32 を展開して計算する。
+    seed は int のほか、hashes とブロードキャストできる配列でもよい (行ごとに seed が異なる場合)。
+    """
+    import numpy as np
+
+    words = hashes.astype(np.uint32)
+    with np.errstate(over='ignore'):
+        k = _rotl(words * np.uint32(0xcc9e2d51), 15) * np.uint32(0x1b873593)
+        h = _rotl(k ^ np.asarray(seed, dtype=np.uint32), 13) * np.uint32(5) + np.uint32(0xe6546b64)
+        h ^= np.uint32(4)
+        return _fmix32(h)
+
+def _rotl(x: Any, r: int) -> Any:
+    import numpy as np
+
+    return (x << np.uint32(r)) | (x >> np.uint32(32 - r))
+
+def _murmur3_32(data: Any, lengths: Any, seed: int) -> Any:
+    """
+    MurmurHash3 (x86_32) を行方向にベクトル化したもの。mmh3.hash(bytes, seed, signed=False) と一致する。
+
+    Args:
+        data: (N, W) uint8 各行のバイト列 (lengths 以降は無視される)
+        lengths: (N,) 各行のバイト長
+        seed: murmur3 の seed
+    """
+    import numpy as np
+
+    c1 = np.uint32(0xcc9e2d51)
+    c2 = np.uint32(0x1b873593)
+    n, width = data.shape
+    if width % 4:
+        data = np.concatenate([data, np.zeros((n, 4 - width % 4), dtype=np.uint8)], axis=1)
+        width = data.shape[1]
+    words = np.ascontiguousarray(data).view('<u4')
+    lengths = np.asarray(lengths, dtype=np.int64)
+    nblocks = lengths // 4
+    h = np.full(n, seed, dtype=np.uint32)
+
+    with np.errstate(over='ignore'):
+        # 4 バイトブロック (行ごとに長さが違うため、ブロック数を超えた行は更新しない)
+        for block in range(int(nblocks.max(initial=0))):
+            k = _rotl(words[:, block] * c1, 15) * c2
+            mixed = _rotl(h ^ k, 13) * np.uint32(5) + np.uint32(0xe6546b64)
+            h = np.where(block < nblocks, mixed, h)
+
+        # 末尾の 1〜3 バイト
+        remainder = lengths & 3
+        tail_start = nblocks * 4
+        flat = data.reshape(-1)
+        row_offsets = np.arange(n, dtype=np.int64) * width
+        k1 = np.zeros(n, dtype=np.uint32)
+        for i in (2, 1, 0):
+            column = np.minimum(tail_start + i, width - 1)
+            byte = flat[row_offsets + column].astype(np.uint32) << np.uint32(8 * i)
+            k1 ^= np.where(remainder > i, byte, np.uint32(0))
+        k1 = _rotl(k1 * c1, 15) * c2
+        h = np.where(remainder > 0, h ^ k1, h)
+
+        h ^= lengths.astype(np.uint32)
+        return _fmix32(h)
+
+def _fmix32(h: Any) -> Any:
+    """murmur3 の finalization (h は uint32 配列、その場で更新する)"""
+    import numpy as np
+
+    with np.errstate(over='ignore'):
+        h ^= h >> np.uint32(16)
+        h *= np.uint32(0x85ebca6b)
+        h ^= h >> np.uint32(13)
+        h *= np.uint32(0xc2b2ae35)
+        h ^= h >> np.uint32(16)
+    return h
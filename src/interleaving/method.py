@@ -1,202 +1,150 @@
 
+import operator
 import random
-from typing import List, Optional, Set
+from typing import Iterable, List, Optional, Set
 from src.context import Item
+from src.interleaving.optimized import DEFAULT_DEPTH, interleave_placements
+from src.interleaving.rng import RandomSource
+from src.observability.tracing import timed
+
+_item_id = operator.attrgetter("id")
+_SOURCES = ("A", "B")
 
 class TeamDraftInterleaver:
     def __init__(self, seed: Optional[int] = None):
         self.rng = random.Random(seed)
 
-    def interleave(self, list_a: List[Item], list_b: List[Item]) -> List[Item]:
+    @timed("merge")
+    def interleave(
+        self,
+        list_a: Iterable[Item],
+        list_b: Iterable[Item],
+        k: Optional[int] = None,
+        rng: Optional[RandomSource] = None,
+    ) -> List[Item]:
         """
         Team Draft Interleaving:
         2つのランキングリストから、Team Draft法を用いて新たなランキングを生成する。
         重複アイテムは除外される。
         
+        入力はリストに限らずイテレータ (Ranker.rank_stream の戻り値など) も受け付け、
+        各チームの次のアイテムは必要になった時点で1件ずつ取り出す (先読みは各側1件まで)。
+        計算量は O(消費したアイテム数)。
+        k を指定した場合は k 件配置した時点で打ち切る（結果は全件マージ時の先頭 k 件と一致する）。
+        
         Args:
-            list_a: Team A produced items
-            list_b: Team B produced items
+            list_a: Team A produced items (list or iterator, in rank order)
+            list_b: Team B produced items (list or iterator, in rank order)
+            k: Maximum number of items to return (None = merge everything)
+            rng: このリクエストで使う乱数源 (src/interleaving/rng.py の request_random など)。
+                None の場合はインスタンスの self.rng を使う (スレッド間で共有すると再現性は無い)
             
         Returns:
             Interleaved items with `source_ranker` attributed.
+            入力の Item は変更せず、属性付与済みのコピー (with_attribution) を返す。
         """
         result: List[Item] = []
         used_ids: Set[str] = set()
         
-        # Make copies to pop from
-        # (Assuming shallow copy is enough as we don't mutate items much)
-        # Note: We need to pop from calculation perspective, but list usage with index is better to avoid list mutation issues
-        # Or simple queue approach.
-        
-        queue_a = list(list_a)
-        queue_b = list(list_b)
+        iter_a = iter(list_a)
+        iter_b = iter(list_b)
+        head_a = next(iter_a, None)
+        head_b = next(iter_b, None)
         
         # Team counts (how many items each team successfully placed)
         count_a = 0
         count_b = 0
         
-        while queue_a or queue_b:
-            if not queue_a and not queue_b:
-                break
-                
-            # Determine which team drafts next
-            # If Team A has placed fewer items, it *might* be its turn, 
-            # but Team Draft usually implies balancing the opportunity to pick.
-            # Simplified Team Draft:
+        # Bind hot-path lookups to locals
+        coin = (rng or self.rng).random
+        append = result.append
+        add_used = used_ids.add
+        
+        while (k is None or len(result) < k) and (head_a is not None or head_b is not None):
+            # Determine which team drafts next:
             # - If count_a < count_b: Team A picks
             # - If count_b < count_a: Team B picks
-            # - If equal: Randomly decide who picks next (coin flip)
-            
-            next_team = None
-            
+            # - If equal: coin flip
+            # 重複で手番を消費した場合もカウントは増えないため、同じ手番判定が再度行われる
+            # (同数時は再度コイントスする。シードに対する出力互換のためこの順序を維持する)
             if count_a < count_b:
-                next_team = "A"
+                pick_a = True
             elif count_b < count_a:
-                next_team = "B"
+                pick_a = False
             else:
-                # Equal counts, coin flip
-                if self.rng.random() < 0.5:
-                    next_team = "A"
-                else:
-                    next_team = "B"
+                pick_a = coin() < 0.5
             
-            # Try to pick from the chosen team
-            picked_item = None
-            source = None
+            # Fallback to the other team if the chosen one is exhausted
+            if pick_a and head_a is None:
+                pick_a = False
+            elif not pick_a and head_b is None:
+                pick_a = True
             
-            if next_team == "A":
-                if queue_a:
-                    picked_item = queue_a.pop(0)
-                    source = "A"
-                elif queue_b:
-                    # Fallback to B if A is empty
-                    picked_item = queue_b.pop(0)
-                    source = "B"
-            else: # next_team == "B"
-                if queue_b:
-                    picked_item = queue_b.pop(0)
-                    source = "B"
-                elif queue_a:
-                    # Fallback to A if B is empty
-                    picked_item = queue_a.pop(0)
-                    source = "A"
+            if pick_a:
+                picked_item = head_a
+                head_a = next(iter_a, None)
+            else:
+                picked_item = head_b
+                head_b = next(iter_b, None)
             
-            if picked_item:
-                if picked_item.id not in used_ids:
-                    # New item, add to result
-                    picked_item.source_ranker = source
-                    result.append(picked_item)
-                    used_ids.add(picked_item.id)
-                    
-                    if source == "A":
-                        count_a += 1
-                    else:
-                        count_b += 1
-                else:
-                    # Already used (duplicate), just discard and don't increment team count
-                    # Because checking "if picked_item.id in used_ids" means this item was already placed by the OTHER team
-                    # (or same team earlier if duplicates inside single list, but assuming unique inside single list)
-                    # If duplicate, we just consume it. The team technically "used its turn" to pick a duplicate,
-                    # but usually in Team Draft, if the top item is already picked, 
-                    # the team effectively "skips" that item and picks the next one available?
-                    #
-                    # Wait, standard implementation:
-                    # "If the top item of the team is already in the list, discard it and consider the next item."
-                    # We continue the loop.
-                    
-                    # But if we just 'continue', we need to make sure we don't re-flip the coin if the team hasn't successfully placed an item yet?
-                    # Actually, if we discard, `count_a` doesn't increment. So the loop logic `if count_a < count_b` handles it.
-                    # It will try to let A pick again.
-                    pass
-                    
+            if picked_item.id in used_ids:
+                # Already placed by the other team: discard it and let the same team pick again
+                continue
+            
+            add_used(picked_item.id)
+            if pick_a:
+                append(picked_item.with_attribution("A", picked_item.prob))
+                count_a += 1
+            else:
+                append(picked_item.with_attribution("B", picked_item.prob))
+                count_b += 1
 
         return result
 
 class OptimizedInterleaver:
-    def __init__(self, tau: float = 3.0, seed: Optional[int] = None):
+    def __init__(
+        self,
+        tau: float = 1.0,
+        seed: Optional[int] = None,
+        depth: int = DEFAULT_DEPTH,
+        background: bool = True,
+    ):
         self.tau = tau
+        self.depth = depth
+        self.background = background
         self.rng = random.Random(seed)
 
-    def interleave(self, list_a: List[Item], list_b: List[Item]) -> List[Item]:
-        """
-        Optimized Interleaving (Softmax-based):
-        Uses softmax function on rank-based scores to probabilistically select
-        from list A or list B.
-        
-        Score = 1 / (rank + 1)^tau
-        P(A) = exp(Score_A) / (exp(Score_A) + exp(Score_B))
+    @timed("merge")
+    def interleave(
+        self,
+        list_a: Iterable[Item],
+        list_b: Iterable[Item],
+        k: Optional[int] = None,
+        rng: Optional[RandomSource] = None,
+    ) -> List[Item]:
         """
-        import math
+        Optimized Interleaving (Radlinski & Craswell, 2013):
+        A / B の先頭から作れるランキングのうち、ランダムなクリックに対して
+        どちらにも偏らない (各順位までのクレジット δ(d) = 1/rank_A(d)^tau - 1/rank_B(d)^tau の期待値が 0)
+        確率分布を解き、そこから1つ抽選する。
         
-        result: List[Item] = []
-        used_ids: Set[str] = set()
+        分布は A / B の先頭 min(k, depth) 件の重複構造 (長さと共通アイテムの位置) をキーとして
+        キャッシュされるため、リクエスト時の処理はテーブル参照と、状態ごとの条件付き確率に従った抽選のみとなる
+        (詳細は src/interleaving/optimized.py)。depth 件より後ろは不偏性の制約の対象外で、
+        未配置の先頭を確率 1/2 ずつで選ぶ。
+        background=True (既定) の場合、キャッシュに無い重複構造の分布はバックグラウンドで解き、
+        解き終えるまでのリクエストは先頭も確率 1/2 ずつで選ぶ (区間計測の allocation_cache が "miss" になる)。
+        False の場合はリクエストのスレッドで解く (バッチ・オフライン評価と結果を一致させる場合)。
         
-        idx_a = 0
-        idx_b = 0
-        
-        len_a = len(list_a)
-        len_b = len(list_b)
-        
-        while idx_a < len_a or idx_b < len_b:
-            # Advance pointers to find next available items
-            while idx_a < len_a and list_a[idx_a].id in used_ids:
-                idx_a += 1
-            
-            while idx_b < len_b and list_b[idx_b].id in used_ids:
-                idx_b += 1
-            
-            cand_a = list_a[idx_a] if idx_a < len_a else None
-            cand_b = list_b[idx_b] if idx_b < len_b else None
-            
-            if cand_a is None and cand_b is None:
-                break
-            
-            selected_item = None
-            prob_a = 0.0
-            source = ""
-            
-            if cand_a and cand_b:
-                # Both available, use Softmax
-                score_a = 1.0 / ((idx_a + 1) ** self.tau)
-                score_b = 1.0 / ((idx_b + 1) ** self.tau)
-                
-                denom = math.exp(score_a) + math.exp(score_b)
-                prob_a = math.exp(score_a) / denom
-                
-                if self.rng.random() < prob_a:
-                    selected_item = cand_a
-                    source = "A"
-                    # item probability is P(A)
-                    selected_item.prob = prob_a
-                else:
-                    selected_item = cand_b
-                    source = "B"
-                    # item probability is P(B) = 1 - P(A)
-                    selected_item.prob = 1.0 - prob_a
-                    
-            elif cand_a:
-                # Only A available
-                selected_item = cand_a
-                source = "A"
-                selected_item.prob = 1.0
-            else:
-                # Only B available
-                selected_item = cand_b
-                source = "B"
-                selected_item.prob = 1.0
-            
-            if selected_item:
-                selected_item.source_ranker = source
-                result.append(selected_item)
-                used_ids.add(selected_item.id)
-                # Note: We don't manually increment index here because the loop structure 
-                # will skip used IDs in the next iteration's "Advance pointers" phase.
-                # BUT, if we don't increment, we will check the same ID again as "in used_ids".
-                # It's better to increment the one we picked to save one check, but not strictly required.
-                # However, for clarity and avoiding infinite loop if logic is wrong:
-                if source == "A":
-                    idx_a += 1
-                else:
-                    idx_b += 1
-        
-        return result
+        各アイテムの prob には、そのアイテムを選んだステップの条件付き確率を記録する
+        (ランキング全体の確率ではない)。評価に使うのは credit (クリックされた場合のクレジット δ) で、
+        src/evaluation/credit.py はクリックされたアイテムの credit の合計の符号で勝敗を決める。
+        TeamDraftInterleaver と同様、入力はイテレータでもよい (先読みは各側 depth 件まで)。
+        k を指定した場合は k 件配置した時点で打ち切る。入力の Item は変更しない。
+        rng は TeamDraftInterleaver.interleave と同じ (None の場合は self.rng)。
+        """
+        placed = interleave_placements(
+            list_a, list_b, (rng or self.rng).random, k=k, depth=self.depth, tau=self.tau, key=_item_id,
+            background=self.background,
+        )
+        return [item.with_attribution(_SOURCES[side], prob, credit) for item, side, prob, credit in placed]
@@ -0,0 +1,231 @@
+
+import functools
+import itertools
+import random
+import string
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple, Union
+from src.context import Item
+from src.interleaving.rng import RandomSource
+from src.observability.tracing import timed
+
+def default_team_names(n: int) -> List[str]:
+    """N 個のランカーの既定のチーム名 ("A", "B", "C", ...)"""
+    if n > len(string.ascii_uppercase):
+        raise ValueError(f"team names must be given explicitly for more than {len(string.ascii_uppercase)} rankers")
+    return list(string.ascii_uppercase[:n])
+
+def _resolve_names(n: int, names: Optional[Sequence[str]]) -> List[str]:
+    if names is None:
+        return default_team_names(n)
+    if len(names) != n:
+        raise ValueError(f"expected {n} team names, got {len(names)}")
+    return list(names)
+
+class TeamDraftMultileaver:
+    def __init__(self, seed: Optional[int] = None):
+        self.rng = random.Random(seed)
+
+    @timed("merge")
+    def multileave(
+        self,
+        lists: Sequence[Iterable[Item]],
+        k: Optional[int] = None,
+        names: Optional[Sequence[str]] = None,
+        rng: Optional[RandomSource] = None,
+    ) -> List[Item]:
+        """
+        Team Draft Multileaving (Schuth et al., 2014):
+        N 個のランキングリストから、配置件数が最も少ないチーム (同数ならランダム) が
+        自チームの未配置アイテムのうち最上位のものを1件ずつ配置する。
+
+        TeamDraftInterleaver と同様、入力はイテレータでもよく、先読みは各チーム1件まで。
+        k を指定した場合は k 件配置した時点で打ち切る。入力の Item は変更しない。
+
+        Args:
+            lists: 各ランカーの結果 (順位順)
+            k: Maximum number of items to return (None = merge everything)
+            names: 各リストのチーム名 (None の場合は "A", "B", "C", ...)
+            rng: このリクエストで使う乱数源 (None の場合は self.rng。TeamDraftInterleaver と同じ)
+
+        Returns:
+            source_ranker にチーム名を付与したコピーのリスト
+        """
+        names = _resolve_names(len(lists), names)
+        iters = [iter(items) for items in lists]
+        heads = [next(it, None) for it in iters]
+        counts = [0] * len(lists)
+        used_ids = set()
+        result: List[Item] = []
+        choice = (rng or self.rng).choice
+
+        while k is None or len(result) < k:
+            # 他チームが配置済みのアイテムを読み飛ばす
+            for team, it in enumerate(iters):
+                head = heads[team]
+                while head is not None and head.id in used_ids:
+                    head = next(it, None)
+                heads[team] = head
+
+            available = [team for team, head in enumerate(heads) if head is not None]
+            if not available:
+                break
+            fewest = min(counts[team] for team in available)
+            candidates = [team for team in available if counts[team] == fewest]
+            team = candidates[0] if len(candidates) == 1 else choice(candidates)
+
+            picked = heads[team]
+            heads[team] = next(iters[team], None)
+            used_ids.add(picked.id)
+            counts[team] += 1
+            result.append(picked.with_attribution(names[team], picked.prob))
+
+        return result
+
+@functools.lru_cache(maxsize=256)
+def _rank_weights(tau: float, size: int) -> Tuple[float, ...]:
+    """順位ごとの重み 1 / rank^tau (先頭 size 件)"""
+    return tuple(1.0 / ((rank + 1) ** tau) for rank in range(size))
+
+@functools.lru_cache(maxsize=256)
+def _initial_tree(tau: float, size: int) -> Tuple[float, ...]:
+    """_rank_weights(tau, size) の Fenwick 木の配列 (先頭は番兵)。リクエストごとにコピーして使う"""
+    tree = [0.0] + list(_rank_weights(tau, size))
+    for i in range(1, size + 1):
+        parent = i + (i & -i)
+        if parent <= size:
+            tree[parent] += tree[i]
+    return tuple(tree)
+
+class _WeightTree:
+    """
+    1チーム分の順位ごとの重みを持つ Fenwick 木。重みの更新 (配置済みのアイテムを 0 にする) と、
+    累積重みが閾値を超える最初の位置の探索をいずれも O(log L) で行う。
+    """
+    __slots__ = ('tree', 'size', 'top')
+
+    def __init__(self, tree: List[float]):
+        self.tree = tree
+        self.size = len(tree) - 1
+        self.top = 1 << max(self.size.bit_length() - 1, 0)
+
+    def total(self) -> float:
+        tree = self.tree
+        i = self.size
+        total = 0.0
+        while i > 0:
+            total += tree[i]
+            i -= i & -i
+        return total
+
+    def subtract(self, position: int, weight: float) -> None:
+        tree = self.tree
+        i = position + 1
+        while i <= self.size:
+            tree[i] -= weight
+            i += i & -i
+
+    def search(self, threshold: float) -> int:
+        """累積重み (位置 0 から) が threshold を超える最初の位置"""
+        tree = self.tree
+        position = 0
+        step = self.top
+        while step:
+            next_position = position + step
+            if next_position <= self.size and tree[next_position] <= threshold:
+                position = next_position
+                threshold -= tree[next_position]
+            step >>= 1
+        return position
+
+class ProbabilisticMultileaver:
+    def __init__(self, tau: float = 3.0, seed: Optional[int] = None):
+        self.tau = tau
+        self.rng = random.Random(seed)
+
+    @timed("merge")
+    def multileave(
+        self,
+        lists: Sequence[Iterable[Item]],
+        k: Optional[int] = None,
+        names: Optional[Sequence[str]] = None,
+        rng: Optional[RandomSource] = None,
+    ) -> List[Item]:
+        """
+        Probabilistic Multileaving (Schuth et al., 2015):
+        各ランカーのリストを順位に基づく分布 P(d | r) ∝ 1 / rank(d)^tau とみなし、
+        配置件数が最も少ないチーム (同数ならランダム) が自チームの分布から未配置のアイテムを1件抽選する。
+
+        抽選には各リストの全件が必要なため、イテレータの入力は最初にリスト化する。
+        各アイテムの prob には、そのチームの分布から (未配置のアイテムに正規化して) 抽選された確率を記録する。
+        k を指定した場合は k 件配置した時点で打ち切る。入力の Item は変更しない。
+        rng は TeamDraftMultileaver.multileave と同じ (None の場合は self.rng)。
+        """
+        names = _resolve_names(len(lists), names)
+        lists = [list(items) for items in lists]
+        tau = self.tau
+        # 順位ごとの重み (全リストで共通。リスト長ごとにキャッシュする)
+        max_len = max((len(items) for items in lists), default=0)
+        weights = _rank_weights(tau, max_len)
+        # チームごとの ID -> 順位 と未配置アイテムの重みの木。
+        # アイテムを配置するたびに、それを含むチームの木からその重みを差し引く (ステップごとに全件を数え直さない)
+        positions = [_positions(items) for items in lists]
+        trees = [_WeightTree(list(_initial_tree(tau, len(items)))) for items in lists]
+        remaining = [len(by_id) for by_id in positions]
+        counts = [0] * len(lists)
+        used_ids = set()
+        result: List[Item] = []
+        rng = rng or self.rng
+        uniform = rng.random
+        choice = rng.choice
+
+        while k is None or len(result) < k:
+            available = [team for team, n in enumerate(remaining) if n > 0]
+            if not available:
+                break
+            fewest = min(counts[team] for team in available)
+            candidates = [team for team in available if counts[team] == fewest]
+            team = candidates[0] if len(candidates) == 1 else choice(candidates)
+
+            items = lists[team]
+            tree = trees[team]
+            total = tree.total()
+            rank = tree.search(uniform() * total)
+            if rank >= len(items) or items[rank].id in used_ids:
+                # 丸め誤差で配置済み (重み 0) の位置や末尾を指した場合は、最も近い未配置のアイテムにする
+                rank = _nearest_unplaced(items, min(rank, len(items) - 1), used_ids)
+            picked = items[rank]
+
+            used_ids.add(picked.id)
+            for other, by_id in enumerate(positions):
+                ranks = by_id.get(picked.id)
+                if ranks is not None:
+                    if ranks.__class__ is int:
+                        trees[other].subtract(ranks, weights[ranks])
+                    else:
+                        for placed_rank in ranks:
+                            trees[other].subtract(placed_rank, weights[placed_rank])
+                    remaining[other] -= 1
+            counts[team] += 1
+            result.append(picked.with_attribution(names[team], weights[rank] / total))
+
+        return result
+
+def _positions(items: List[Item]) -> Dict[str, Union[int, List[int]]]:
+    """ID -> 順位。リスト内で同じ ID が複数回現れる場合のみ、その ID の値を順位のリストにする"""
+    ids = [item.id for item in items]
+    positions: Dict[str, Union[int, List[int]]] = dict(zip(ids, range(len(ids))))
+    if len(positions) < len(ids):
+        for rank, item_id in enumerate(ids):
+            ranks = positions[item_id]
+            if ranks.__class__ is int:
+                if ranks != rank:
+                    positions[item_id] = [rank, ranks] if rank < ranks else [ranks, rank]
+            elif rank not in ranks:
+                ranks.append(rank)
+    return positions
+
+def _nearest_unplaced(items: List[Item], rank: int, used_ids: set) -> int:
+    for candidate in itertools.chain(range(rank, -1, -1), range(rank + 1, len(items))):
+        if items[candidate].id not in used_ids:
+            return candidate
+    raise ValueError("no unplaced item left")
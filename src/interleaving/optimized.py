@@ -0,0 +1,469 @@
+
+import concurrent.futures
+import functools
+import itertools
+import threading
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Hashable, Iterable, Iterator, List, Optional, Tuple
+from src.observability.tracing import annotate
+
+# 確率分布を解く (不偏性の制約を課す) 先頭の件数。k がこれより小さい場合は k 件。
+# 重複構造 (キャッシュのキー) の種類は depth で急増する (4 で 499、5 で 3395、6 で 27474 通り) ため、
+# すべてがキャッシュに収まる 5 とする (20 では実際のトラフィックでほぼ毎回キャッシュミスになる)
+DEFAULT_DEPTH = 5
+
+# 解いた確率分布のキャッシュ件数
+CACHE_SIZE = 4096
+
+# 確率分布の求解 (Newton 法) の収束判定と反復回数の上限
+_SOLVER_TOL = 1e-9
+_SOLVER_MAX_ITER = 100
+
+_END = object()
+_NO_HEAD = (_END, None)
+
+# 選択肢: (A の候補 + B の候補 を連結した列での位置, 0=A / 1=B, 次の状態, 条件付き選択確率)
+Option = Tuple[int, int, int, float]
+
+@dataclass(frozen=True)
+class AllocationTable:
+    """
+    先頭 length 件の候補ランキングの確率分布。
+
+    候補ランキングは各ステップで A / B の未配置の先頭アイテムを取って作られ、途中の状態は
+    (A のカーソル, B のカーソル) で決まる (配置済みのアイテムは A[:ia] ∪ B[:ib] と一致する)。
+    エントロピー最大の解は p_L ∝ Π_j exp(μ_j δ(L_j)) と順位ごとの積に分解できるため、
+    分布全体を状態ごとの条件付き選択確率 (マルコフ連鎖) として保持する。
+
+    states[s]: 状態 s の (選択肢0 を取る確率, 選択肢0, 選択肢1)。選択肢が1つの場合は選択肢1 が None、
+        終端 (length 件配置済み) の状態は選択肢0 も None。状態 0 が先頭。
+    cursors[s]: 状態 s の (ia, ib)
+    credits[i]: 連結した列の i 番目の候補がクリックされた場合のクレジット δ (正なら A、負なら B)
+    bias: 解の不偏性制約の残差 (max_i |E[Σ_{j≤i} δ(L_j)]|)。制約を満たす分布が無い場合のみ 0 より大きくなる
+        (制約は A / B の両方に候補がある順位までに課す)
+    """
+    states: Tuple[Tuple[float, Optional[Option], Optional[Option]], ...]
+    cursors: Tuple[Tuple[int, int], ...]
+    length: int
+    credits: Tuple[float, ...] = ()
+    bias: float = 0.0
+
+    def sample(self, random: Callable[[], float]) -> Tuple[List[Option], Tuple[int, int]]:
+        """
+        候補ランキングを1つ抽選し、各ステップで選んだ選択肢と終了時のカーソル (ia, ib) を返す。
+        選択肢が1つのステップでは乱数を消費しない。
+        """
+        states = self.states
+        path: List[Option] = []
+        append = path.append
+        s = 0
+        for _ in range(self.length):
+            p, first, second = states[s]
+            option = first if second is None or random() < p else second
+            append(option)
+            s = option[2]
+        return path, self.cursors[s]
+
+@functools.lru_cache(maxsize=CACHE_SIZE)
+def allocation_table(
+    depth: int,
+    len_a: int,
+    len_b: int,
+    twins: Tuple[int, ...],
+    tau: float = 1.0,
+) -> AllocationTable:
+    """
+    重複構造ごとの Optimized Interleaving の確率分布を解き、キャッシュして返す。
+
+    Radlinski & Craswell (2013) の Optimized Interleaving に従い、A / B の先頭 depth 件について
+    - 候補: 各ステップで A / B のうち未配置の先頭アイテムを取って作れるランキング (depth 件)
+    - 制約: ランダムなクリックに対してクレジットの期待値が 0 (各順位 i までの累積で)
+        Σ_L p_L Σ_{j≤i} δ(L_j) = 0,  δ(d) = 1 / rank_A(d)^tau - 1 / rank_B(d)^tau
+      (順位は先頭 depth 件の中での順位。含まれないアイテムの順位は len + 1)
+    を満たす分布のうち、エントロピー最大のもの (一様分布に最も近いもの) を求める。
+    解は p_L ∝ exp(Σ_j μ_j δ(L_j)) の形になるため、双対問題 (log Σ exp(...) の最小化) を Newton 法で解く。
+    候補ランキングは列挙せず、カーソルの状態 (高々 (depth + 1)^2 個) 上の前向き・後ろ向きの計算で
+    勾配とヘッセ行列を求める。
+
+    アイテムの ID 自体には依存せず、リストの重複構造のみで決まるため、
+    (depth, len_a, len_b, twins) をキーにキャッシュする。
+
+    Args:
+        depth: 配置する件数
+        len_a: A の候補数 (先頭 depth 件まで)
+        len_b: B の候補数
+        twins: B の各候補が A の何番目の候補と同じアイテムか (A に無ければ -1)
+        tau: クレジットの順位割引の指数 (1.0 で論文の inverse rank)
+    """
+    layers, cursors, credits = _build_layers(depth, len_a, len_b, twins, tau)
+    n_constraints = min(len_a, len_b)
+    if any(two for layer in layers for two in layer[4]):
+        choice_probs, bias = _max_entropy(layers, n_constraints)
+    else:
+        choice_probs, bias = [[1.0] * len(layer[0]) for layer in layers], 0.0
+
+    states = []
+    offset = 0
+    for layer, probs in zip(layers, choice_probs):
+        next_offset = offset + len(layer[0])
+        for t0, t1, _, _, two, (index0, side0), (index1, side1), p in zip(*layer, probs):
+            p = p if two else 1.0
+            states.append((
+                p,
+                (index0, side0, next_offset + t0, p),
+                (index1, side1, next_offset + t1, 1.0 - p) if two else None,
+            ))
+        offset = next_offset
+    # 終端の状態
+    states.extend((1.0, None, None) for _ in range(len(cursors) - len(states)))
+
+    return AllocationTable(
+        states=tuple(states), cursors=tuple(cursors), length=len(layers), credits=tuple(credits), bias=bias,
+    )
+
+# リクエスト時に引くテーブル (バックグラウンドで解き終えたもののみ)。キーは allocation_table の引数
+TableKey = Tuple[int, int, int, Tuple[int, ...], float]
+_ready: Dict[TableKey, AllocationTable] = {}
+_pending: Dict[TableKey, "concurrent.futures.Future[None]"] = {}
+_solver_lock = threading.Lock()
+_solver_pool: Optional[concurrent.futures.ThreadPoolExecutor] = None
+
+def lookup_table(
+    depth: int,
+    len_a: int,
+    len_b: int,
+    twins: Tuple[int, ...],
+    tau: float = 1.0,
+) -> Optional[AllocationTable]:
+    """
+    リクエスト時用の allocation_table。解き終えたテーブルがあれば返し、無ければ求解を
+    バックグラウンドのスレッドに予約して None を返す (リクエストのスレッドでは Newton 法を解かない)。
+    """
+    key = (depth, len_a, len_b, twins, tau)
+    table = _ready.get(key)
+    if table is None:
+        _schedule_solve(key)
+    return table
+
+def wait_for_tables(timeout: Optional[float] = None) -> bool:
+    """予約済みの求解がすべて終わるまで待つ (テスト・ウォームアップ用)。timeout 内に終われば True"""
+    with _solver_lock:
+        futures = list(_pending.values())
+    _, not_done = concurrent.futures.wait(futures, timeout)
+    return not not_done
+
+def clear_tables() -> None:
+    """解いたテーブルのキャッシュを空にする (ベンチマーク・テスト用。求解中のものはそのまま続く)"""
+    allocation_table.cache_clear()
+    _ready.clear()
+
+def _schedule_solve(key: TableKey) -> None:
+    global _solver_pool
+    with _solver_lock:
+        if key in _pending or key in _ready:
+            return
+        if _solver_pool is None:
+            # 求解は CPU を使うため1本のスレッドで順に解く (リクエストのスレッドと CPU を取り合わないように)
+            _solver_pool = concurrent.futures.ThreadPoolExecutor(
+                max_workers=1,
+                thread_name_prefix="interleaving-optimized-solver",
+            )
+        _pending[key] = _solver_pool.submit(_solve, key)
+
+def _solve(key: TableKey) -> None:
+    try:
+        table = allocation_table(*key)
+        if len(_ready) >= CACHE_SIZE:
+            # 書き込みはこのスレッドのみのため、最も古いものを捨てて上限を保つ
+            _ready.pop(next(iter(_ready), None), None)
+        _ready[key] = table
+    finally:
+        with _solver_lock:
+            _pending.pop(key, None)
+
+def _build_layers(depth: int, len_a: int, len_b: int, twins: Tuple[int, ...], tau: float):
+    """
+    カーソルの状態を配置済みの件数ごとの層に分けて列挙する。
+
+    layers[j]: 層 j の各状態から層 j+1 への遷移 (t0, t1, δ0, δ1, 選択肢が2つあるか, 選択肢0, 選択肢1)。
+        t0 / t1 は層 j+1 の中での次の状態の番号、選択肢は (連結した列での位置, 0=A / 1=B)。
+    cursors: 全状態の (ia, ib) (層の順に連結)
+    credits: A の候補 + B の候補 を連結した列での各候補のクレジット δ
+    """
+    # A の各候補の B での位置、B の各候補の A での位置 (相手側に無ければカーソルが届かない値)
+    twin_b = [len_b] * len_a
+    twin_a = [len_a] * len_b
+    for j, t in enumerate(twins):
+        if t >= 0:
+            twin_b[t] = j
+            twin_a[j] = t
+    credit_a = [(i + 1) ** -tau - (twin_b[i] + 1) ** -tau for i in range(len_a)]
+    credit_b = [(twin_a[j] + 1) ** -tau - (j + 1) ** -tau for j in range(len_b)]
+    length = min(depth, len_a + len_b - sum(1 for t in twins if t >= 0))
+
+    def advance(ia: int, ib: int) -> Tuple[int, int]:
+        # 相手側が配置済みのアイテムを読み飛ばす
+        while True:
+            if ia < len_a and twin_b[ia] < ib:
+                ia += 1
+            elif ib < len_b and twin_a[ib] < ia:
+                ib += 1
+            else:
+                return ia, ib
+
+    layers = []
+    cursors: List[Tuple[int, int]] = []
+    current = [(0, 0)]
+    for _ in range(length):
+        cursors.extend(current)
+        index: Dict[Tuple[int, int], int] = {}
+        t0s, t1s, d0s, d1s, twos, options0, options1 = [], [], [], [], [], [], []
+
+        def successor(cursor: Tuple[int, int]) -> int:
+            return index.setdefault(cursor, len(index))
+
+        for ia, ib in current:
+            if ia < len_a and ib < len_b and twin_a[ib] == ia:
+                # A / B の先頭が同じアイテムの場合は1通り (順位の高い側、同順位なら A の手番として扱う)
+                t = successor(advance(ia + 1, ib + 1))
+                option = (ia, 0) if ia <= ib else (len_a + ib, 1)
+                row = (t, t, credit_a[ia], credit_a[ia], False, option, option)
+            elif ia < len_a and ib < len_b:
+                row = (
+                    successor(advance(ia + 1, ib)), successor(advance(ia, ib + 1)),
+                    credit_a[ia], credit_b[ib], True, (ia, 0), (len_a + ib, 1),
+                )
+            elif ia < len_a:
+                t = successor(advance(ia + 1, ib))
+                row = (t, t, credit_a[ia], credit_a[ia], False, (ia, 0), (ia, 0))
+            else:
+                t = successor(advance(ia, ib + 1))
+                row = (t, t, credit_b[ib], credit_b[ib], False, (len_a + ib, 1), (len_a + ib, 1))
+            for column, value in zip((t0s, t1s, d0s, d1s, twos, options0, options1), row):
+                column.append(value)
+        layers.append((t0s, t1s, d0s, d1s, twos, options0, options1))
+        current = sorted(index, key=index.get)
+    cursors.extend(current)
+    return layers, cursors, credit_a + credit_b
+
+def _max_entropy(layers, n_constraints: int) -> Tuple[List[List[float]], float]:
+    """
+    制約 E_p[δ(L_j)] = 0 (j ≤ n_constraints。累積クレジットの制約と同値) の下で
+    エントロピー最大の分布を求め、各状態で選択肢0 を取る条件付き確率と残差を返す。
+    制約を満たす分布が無い場合は双対問題が下に有界でなくなるため、反復上限で打ち切った
+    (残差が最小の方向に寄せた) 分布を返す。
+    """
+    import numpy as np
+
+    arrays = []
+    for t0, t1, d0, d1, two, _, _ in layers:
+        t0 = np.array(t0, dtype=np.int64)
+        t1 = np.array(t1, dtype=np.int64)
+        width = int(max(t0.max(), t1.max())) + 1
+        # 次の層への遷移を one-hot 行列で持つ (前向き計算で使う)
+        to0 = np.zeros((len(t0), width))
+        to0[np.arange(len(t0)), t0] = 1.0
+        to1 = np.zeros((len(t1), width))
+        to1[np.arange(len(t1)), t1] = 1.0
+        arrays.append((t0, t1, np.array(d0), np.array(d1), np.array(two, dtype=bool), to0, to1))
+    n = n_constraints
+
+    def backward(mu):
+        # 後ろ向きに log β (各状態以降の重みの和) を求め、条件付き確率と log Z を返す
+        log_beta = np.zeros(arrays[-1][5].shape[1])
+        probs = [None] * len(arrays)
+        for j in reversed(range(len(arrays))):
+            t0, t1, d0, d1, two, _, _ = arrays[j]
+            m = mu[j] if j < n else 0.0
+            l0 = m * d0 + log_beta[t0]
+            l1 = np.where(two, m * d1 + log_beta[t1], -np.inf)
+            log_beta = np.logaddexp(l0, l1)
+            probs[j] = np.exp(l0 - log_beta)
+        return probs, float(log_beta[0])
+
+    def moments(probs):
+        # 前向きに状態の確率を伝搬し、順位ごとのクレジットの期待値 g と 2次モーメントを求める
+        visit = np.ones(1)
+        carried = np.zeros((1, n))  # carried[s, i] = E[δ_i; 状態 s を通る]
+        g = np.zeros(n)
+        second = np.zeros((n, n))
+        for j, (t0, t1, d0, d1, two, to0, to1) in enumerate(arrays):
+            p0 = probs[j]
+            p1 = 1.0 - p0
+            w0 = visit * p0
+            w1 = visit * p1
+            if j < n:
+                expected = p0 * d0 + p1 * d1
+                g[j] = visit @ expected
+                second[j, j] = visit @ (p0 * d0 * d0 + p1 * d1 * d1)
+                cross = carried[:, :j].T @ expected
+                second[:j, j] = cross
+                second[j, :j] = cross
+            carried = to0.T @ (carried * p0[:, None]) + to1.T @ (carried * p1[:, None])
+            if j < n:
+                carried[:, j] = (w0 * d0) @ to0 + (w1 * d1) @ to1
+            visit = w0 @ to0 + w1 @ to1
+        return g, second - np.outer(g, g)
+
+    mu = np.zeros(n)
+    for _ in range(_SOLVER_MAX_ITER):
+        probs, log_z = backward(mu)
+        g, hessian = moments(probs)
+        if np.abs(g).max() < _SOLVER_TOL:
+            break
+        step = np.linalg.lstsq(hessian, g, rcond=None)[0]
+        # バックトラッキング直線探索 (Armijo 条件)
+        decrease = float(g @ step)
+        t = 1.0
+        while t > 1e-12 and backward(mu - t * step)[1] > log_z - 1e-4 * t * decrease:
+            t *= 0.5
+        if t <= 1e-12:
+            # 丸め誤差の範囲まで収束した (冗長な制約でヘッセ行列が特異な場合など)
+            break
+        mu = mu - t * step
+    else:
+        probs, _ = backward(mu)
+        g, _ = moments(probs)
+
+    bias = float(np.abs(np.cumsum(g)).max())
+    return [p.tolist() for p in probs], bias
+
+def interleave_sequences(
+    seq_a: Iterable[Any],
+    seq_b: Iterable[Any],
+    random: Callable[[], float],
+    k: Optional[int] = None,
+    depth: int = DEFAULT_DEPTH,
+    tau: float = 1.0,
+    key: Optional[Callable[[Any], Hashable]] = None,
+    background: bool = False,
+) -> Tuple[List[Any], List[int], List[float]]:
+    """
+    Optimized Interleaving で配置する要素と、その 0=A / 1=B、選択確率を並べたリストで返す。
+
+    A / B の先頭 min(k, depth) 件の重複構造から allocation_table を引き (キャッシュ済みなら辞書参照のみ)、
+    状態ごとの条件付き確率に従って1件ずつ選ぶ (選択肢が1つのステップでは乱数を消費しない)。
+    depth 件より後ろ (k が depth より大きい場合や全件マージ) は不偏性の制約の対象外で、
+    未配置の先頭を確率 1/2 ずつで選ぶ。
+    入力はイテレータでもよく、先読みは各側 depth 件まで。
+
+    Args:
+        seq_a, seq_b: 各ランカーの結果 (順位順、イテレータ可)
+        random: [0, 1) の一様乱数を返す関数 (random.Random.random など)
+        k: 最大配置件数 (None = 全件)
+        key: 要素から ID を取り出す関数 (None の場合は要素自体を ID とする)
+        background: True の場合、キャッシュに無い確率分布はその場で解かずにバックグラウンドで解き、
+            解き終えるまでは先頭 min(k, depth) 件も depth 件より後ろと同じく確率 1/2 ずつで選ぶ
+            (リクエスト時の処理を常にテーブル参照と抽選のみにするため。OptimizedInterleaver の既定)
+    """
+    placed = interleave_placements(seq_a, seq_b, random, k, depth, tau, key, background)
+    return [p[0] for p in placed], [p[1] for p in placed], [p[2] for p in placed]
+
+def interleave_placements(
+    seq_a: Iterable[Any],
+    seq_b: Iterable[Any],
+    random: Callable[[], float],
+    k: Optional[int] = None,
+    depth: int = DEFAULT_DEPTH,
+    tau: float = 1.0,
+    key: Optional[Callable[[Any], Hashable]] = None,
+    background: bool = False,
+) -> List[Tuple[Any, int, float, float]]:
+    """
+    interleave_sequences と同じ結果を (要素, 0=A / 1=B, 選択確率, クレジット δ) のリストで返す。
+    background は interleave_sequences と同じ。
+    δ = 1 / rank_A^tau - 1 / rank_B^tau は先頭 min(k, depth) 件の中での順位 (含まれなければ件数 + 1) で、
+    クリックされたアイテムの δ の合計の符号が勝敗になる (src/evaluation/credit.py)。
+    """
+    get_id = key if key is not None else _identity
+    size = depth if k is None else min(depth, k)
+    pos_a, elements_a, rest_a = _take(seq_a, size, get_id)
+    pos_b, elements_b, rest_b = _take(seq_b, size, get_id)
+    twins = tuple(map(pos_a.get, pos_b, itertools.repeat(-1)))
+
+    if background:
+        table = lookup_table(size, len(elements_a), len(elements_b), twins, tau)
+        # 計測中はテーブルの有無を残す ("miss" のランキングは不偏性の制約を満たさない)
+        annotate("allocation_cache", "miss" if table is None else "hit")
+    else:
+        table = allocation_table(size, len(elements_a), len(elements_b), twins, tau)
+    if table is not None:
+        path, (ia, ib) = table.sample(random)
+        window = elements_a + elements_b
+        credits = table.credits
+        placed = [(window[index], side, prob, credits[index]) for index, side, _, prob in path]
+        if k is not None and len(placed) >= k:
+            return placed
+    else:
+        # 求解待ち: 先頭から depth 件より後ろと同じ方法で選ぶ (クレジット δ は同じ値になる)
+        placed, ia, ib = [], 0, 0
+
+    # depth 件より後ろ: 未配置の先頭を確率 1/2 ずつで選ぶ
+    used = {get_id(p[0]) for p in placed}
+    heads_a = _unplaced(rest_a(ia), used, get_id)
+    heads_b = _unplaced(rest_b(ib), used, get_id)
+    id_a, head_a = next(heads_a, _NO_HEAD)
+    id_b, head_b = next(heads_b, _NO_HEAD)
+    missing_a, missing_b = (len(elements_a) + 1) ** -tau, (len(elements_b) + 1) ** -tau
+    while (k is None or len(placed) < k) and (id_a is not _END or id_b is not _END):
+        if id_a is not _END and id_b is not _END and id_a != id_b:
+            pick_a = random() < 0.5
+            prob = 0.5
+        else:
+            pick_a = id_a is not _END
+            prob = 1.0
+        item_id = id_a if pick_a else id_b
+        used.add(item_id)
+        rank_a, rank_b = pos_a.get(item_id), pos_b.get(item_id)
+        credit = (
+            (missing_a if rank_a is None else (rank_a + 1) ** -tau)
+            - (missing_b if rank_b is None else (rank_b + 1) ** -tau)
+        )
+        placed.append((head_a, 0, prob, credit) if pick_a else (head_b, 1, prob, credit))
+        # 配置したアイテムが相手側の先頭にもあれば、両側を進める
+        if id_a == item_id:
+            id_a, head_a = next(heads_a, _NO_HEAD)
+        if id_b == item_id:
+            id_b, head_b = next(heads_b, _NO_HEAD)
+
+    return placed
+
+def _identity(x: Any) -> Any:
+    return x
+
+def _take(
+    seq: Iterable[Any],
+    size: int,
+    get_id: Callable[[Any], Hashable],
+) -> Tuple[Dict[Hashable, int], List[Any], Callable[[int], Iterator[Any]]]:
+    """
+    seq の先頭から ID が重複しない要素を size 件まで取り出し、(ID -> 位置, 要素, rest) を返す。
+    rest(i) は取り出した要素の i 番目以降と、seq のまだ取り出していない要素を順に返すイテレータを作る。
+    """
+    if isinstance(seq, (list, tuple)):
+        elements = list(seq[:size])
+        positions = dict(zip(map(get_id, elements), range(len(elements))))
+        if len(positions) == len(elements):
+            # 先頭に重複が無ければスライスのまま使う (残りは添字で続きから読む)
+            return positions, elements, lambda i: itertools.islice(seq, i, None)
+
+    it = iter(seq)
+    positions = {}
+    elements = []
+    while len(elements) < size:
+        element = next(it, _END)
+        if element is _END:
+            break
+        item_id = get_id(element)
+        if item_id in positions:
+            continue
+        positions[item_id] = len(elements)
+        elements.append(element)
+    return positions, elements, lambda i: itertools.chain(elements[i:], it)
+
+def _unplaced(it: Iterator[Any], used: set, get_id: Callable[[Any], Hashable]) -> Iterator[Tuple[Hashable, Any]]:
+    """it のうち未配置 (used に無い) の要素を (ID, 要素) で返す"""
+    for element in it:
+        item_id = get_id(element)
+        if item_id not in used:
+            yield item_id, element
@@ -0,0 +1,165 @@
+
+import array
+import base64
+import sys
+from dataclasses import dataclass
+from typing import List, Optional, Sequence, Set
+import mmh3
+from src.context import Item
+from src.interleaving.rng import CounterRandom, request_key
+from src.varint import read_varints, write_varints
+
+# ページングトークンの形式のバージョン (先頭1バイト。2 で配置済みのハッシュを 64bit にした)
+TOKEN_VERSION = 2
+
+def _id_hash(item_id: str) -> int:
+    # 32bit では数万件で衝突し得る (衝突した別のアイテムを配置済みとみなして落とす) ため 64bit を使う
+    return mmh3.hash64(item_id, signed=False)[0]
+
+@dataclass
+class TeamDraftState:
+    """
+    Team Draft の途中状態 (ページングで続きから合成するためのもの)。
+
+    - pos_a / pos_b: A / B のリストから取り出した件数 (次に見る位置)
+    - count_a / count_b: 各チームが配置した件数
+    - rng_key / rng_counter: CounterRandom の鍵とカウンタ (乱数の状態はこの2つの整数のみ)
+    - used: 配置済みアイテムの id のハッシュ (murmur3 64bit、mmh3.hash64 の1語目)。None の場合は次のページの合成時に
+      A / B の先頭 pos_a / pos_b 件から復元する (ランキングがページ間で変わらない場合のみ正しい)
+    """
+    pos_a: int = 0
+    pos_b: int = 0
+    count_a: int = 0
+    count_b: int = 0
+    rng_key: int = 0
+    rng_counter: int = 0
+    used: Optional[Set[int]] = None
+
+    @classmethod
+    def start(cls, user_hash: int, ranking_id: str, salt: str = "") -> "TeamDraftState":
+        """1ページ目の状態。乱数は request_random(user_hash, ranking_id, salt) と同じ列を使う"""
+        return cls(rng_key=request_key(user_hash, ranking_id, salt), used=set())
+
+    @property
+    def placed(self) -> int:
+        """これまでに配置した件数"""
+        return self.count_a + self.count_b
+
+    def to_token(self, include_used: bool = True) -> str:
+        """
+        URL に載せられる文字列 (base64url、パディングなし) に符号化する。
+        include_used=False の場合は配置済みのハッシュを省き、位置・件数・乱数の状態だけの
+        十数バイトのトークンにする (ランキングがページ間で変わらない場合に使う)。
+        トークンは署名しないため、改ざんされても影響はそのユーザーの合成結果に留まるが、
+        信頼できない入力として from_token の ValueError を扱うこと。
+        """
+        used = self.used if include_used else None
+        header = write_varints((
+            TOKEN_VERSION, self.pos_a, self.pos_b, self.count_a, self.count_b,
+            self.rng_key, self.rng_counter, 0 if used is None else len(used) + 1,
+        ))
+        body = b''
+        if used:
+            hashes = array.array('Q', sorted(used))
+            if sys.byteorder != "little":
+                hashes.byteswap()
+            body = hashes.tobytes()
+        return base64.urlsafe_b64encode(header + body).rstrip(b'=').decode('ascii')
+
+    @classmethod
+    def from_token(cls, token: str) -> "TeamDraftState":
+        """to_token の逆変換。形式が不正な場合は ValueError"""
+        try:
+            data = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        except (ValueError, TypeError) as e:
+            raise ValueError("invalid pagination token") from e
+        try:
+            values, offset = read_varints(data, 8)
+        except ValueError as e:
+            raise ValueError("invalid pagination token") from e
+        if values[0] != TOKEN_VERSION:
+            raise ValueError(f"unsupported pagination token version: {values[0]}")
+        pos_a, pos_b, count_a, count_b, rng_key, rng_counter, n_used = values[1:]
+        used = None
+        if n_used:
+            body = data[offset:]
+            if len(body) != 8 * (n_used - 1):
+                raise ValueError("invalid pagination token")
+            hashes = array.array('Q')
+            hashes.frombytes(body)
+            if sys.byteorder != "little":
+                hashes.byteswap()
+            used = set(hashes)
+        elif offset != len(data):
+            raise ValueError("invalid pagination token")
+        if count_a + count_b > pos_a + pos_b or rng_key >= 1 << 32:
+            raise ValueError("invalid pagination token")
+        return cls(pos_a, pos_b, count_a, count_b, rng_key, rng_counter, used)
+
+def interleave_page(
+    list_a: Sequence[Item],
+    list_b: Sequence[Item],
+    page_size: int,
+    state: TeamDraftState,
+) -> List[Item]:
+    """
+    Team Draft の続きを page_size 件だけ合成し、state をその分進める (state は呼び出し側で
+    トークン等に保存する)。処理量は O(page_size + 読み飛ばした重複) で、前のページは合成し直さない。
+
+    TeamDraftState.start(user_hash, ranking_id, salt) から始めて各ページを順に呼ぶと、連結した結果は
+    TeamDraftInterleaver().interleave(list_a, list_b, rng=request_random(user_hash, ranking_id, salt)) と一致する。
+    ランキングがページ間で変わった場合も、配置済みのアイテム (state.used) は再び配置しない。
+
+    list_a / list_b は各ページのリクエストで再実行 (またはキャッシュ) したランキング全体
+    (少なくとも先頭 pos + page_size 件) で、添字でアクセスできるものとする。
+    """
+    if state.used is None:
+        # 配置済みのアイテムは、重複で読み飛ばしたものも含めて A / B の先頭 pos 件のいずれかに含まれる
+        state.used = {_id_hash(item.id) for item in list_a[:state.pos_a]}
+        state.used.update(_id_hash(item.id) for item in list_b[:state.pos_b])
+
+    rng = CounterRandom(state.rng_key)
+    rng.counter = state.rng_counter
+    coin = rng.random
+    used = state.used
+    pos_a, pos_b = state.pos_a, state.pos_b
+    count_a, count_b = state.count_a, state.count_b
+    len_a, len_b = len(list_a), len(list_b)
+    page: List[Item] = []
+
+    # TeamDraftInterleaver.interleave と同じ手番・乱数の消費順で進める
+    while len(page) < page_size and (pos_a < len_a or pos_b < len_b):
+        if count_a < count_b:
+            pick_a = True
+        elif count_b < count_a:
+            pick_a = False
+        else:
+            pick_a = coin() < 0.5
+
+        if pick_a and pos_a >= len_a:
+            pick_a = False
+        elif not pick_a and pos_b >= len_b:
+            pick_a = True
+
+        if pick_a:
+            item = list_a[pos_a]
+            pos_a += 1
+        else:
+            item = list_b[pos_b]
+            pos_b += 1
+
+        key = _id_hash(item.id)
+        if key in used:
+            continue
+        used.add(key)
+        if pick_a:
+            page.append(item.with_attribution("A", item.prob))
+            count_a += 1
+        else:
+            page.append(item.with_attribution("B", item.prob))
+            count_b += 1
+
+    state.pos_a, state.pos_b = pos_a, pos_b
+    state.count_a, state.count_b = count_a, count_b
+    state.rng_counter = rng.counter
+    return page
@@ -0,0 +1,82 @@
+
+from typing import Any, Protocol, Sequence, TypeVar
+import mmh3
+from src.interleaving.bucketer import salted_hash
+
+T = TypeVar("T")
+
+_INV_2_53 = 1.0 / 9007199254740992.0
+
+# よく使うカウンタ値のバイト列を先に作っておく (1リクエストで引く乱数は高々数十個)
+_COUNTER_BYTES = [i.to_bytes(4, 'little') for i in range(256)]
+
+class RandomSource(Protocol):
+    """Interleaver / Multileaver が使う乱数源 (random.Random と CounterRandom のどちらでもよい)"""
+    def random(self) -> float:
+        ...
+
+    def choice(self, seq: Sequence[T]) -> T:
+        ...
+
+def request_key(user_hash: int, ranking_id: str, salt: str = "") -> int:
+    """
+    (実験の salt, user_hash, ranking_id) から乱数列の鍵 (32bit) を作る。
+    鍵は ranking_id の murmur3 を、salted_hash(user_hash, salt) を seed として計算する
+    (同じユーザーでもリクエスト (ranking_id) ごとに異なり、同じリクエストに対しては常に同じになる)。
+    """
+    return mmh3.hash(ranking_id, salted_hash(user_hash, salt), signed=False)
+
+class CounterRandom:
+    """
+    カウンタベースの乱数源。i 番目の乱数は鍵とカウンタのハッシュ (murmur3) のみで決まるため、
+    random.Random(seed) のような初期化 (Mersenne Twister の状態の生成) が要らず、生成のコストはほぼ無い。
+
+    random() は murmur3(カウンタ 2i, seed=鍵) と murmur3(カウンタ 2i+1, seed=鍵) の上位ビットから
+    53bit の一様乱数を作る (random.Random.random と同じ組み立て方)。
+    インスタンスは1リクエスト内で使い捨てる (スレッド間で共有しない)。
+    """
+    __slots__ = ("key", "counter")
+
+    def __init__(self, key: int):
+        self.key = key % (1 << 32)
+        self.counter = 0
+
+    def random(self) -> float:
+        counter = self.counter
+        self.counter = counter + 2
+        key = self.key
+        if counter < 255:
+            high = mmh3.hash(_COUNTER_BYTES[counter], key, signed=False)
+            low = mmh3.hash(_COUNTER_BYTES[counter + 1], key, signed=False)
+        else:
+            high = mmh3.hash((counter % (1 << 32)).to_bytes(4, 'little'), key, signed=False)
+            low = mmh3.hash(((counter + 1) % (1 << 32)).to_bytes(4, 'little'), key, signed=False)
+        return ((high >> 5) * 67108864.0 + (low >> 6)) * _INV_2_53
+
+    def choice(self, seq: Sequence[T]) -> T:
+        if not seq:
+            raise IndexError("cannot choose from an empty sequence")
+        return seq[int(self.random() * len(seq))]
+
+def request_random(user_hash: int, ranking_id: str, salt: str = "") -> CounterRandom:
+    """
+    リクエストごとの乱数源。Interleaver.interleave(..., rng=request_random(...)) のように渡すと、
+    Interleaver のインスタンスは使い回したまま、リクエストごとに再現可能な乱数で合成できる。
+    """
+    return CounterRandom(request_key(user_hash, ranking_id, salt))
+
+def counter_uniforms(keys: Sequence[int], n: int) -> Any:
+    """
+    CounterRandom(key).random() を n 回呼んだのと同じ値を (len(keys), n) の配列で返す (バッチ処理用)。
+    murmur3 は bucketer の salted_hash のベクトル化版 (4 バイト1ブロック) をそのまま使う。
+    """
+    import numpy as np
+    from src.interleaving.bucketer import _salted_hashes
+
+    n = max(n, 1)
+    keys = np.asarray(keys, dtype=np.int64) % (1 << 32)
+    counters = np.arange(2 * n, dtype=np.uint32)
+    hashes = _salted_hashes(counters[None, :], keys.astype(np.uint32)[:, None])
+    high = (hashes[:, 0::2] >> 5).astype(np.float64)
+    low = (hashes[:, 1::2] >> 6).astype(np.float64)
+    return (high * 67108864.0 + low) * _INV_2_53
@@ -0,0 +1,426 @@
+
+import array
+import base64
+import math
+import sys
+import zlib
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterable, Iterator, List, NamedTuple, Optional, Sequence, Tuple
+from src.context import Item
+from src.varint import write_varints
+
+# バイナリ形式のログ行の先頭。JSON の行 ("{" で始まる) と区別する
+BINARY_PREFIX = "RL1:"
+
+# CloudWatch Logs の1イベントの上限 (256 KB) に余裕を持たせた1行の上限
+MAX_LINE_CHARS = 200 * 1024
+
+_FLAG_ZLIB = 1
+_FLAG_CREDIT = 2
+_LITTLE_ENDIAN = sys.byteorder == "little"
+
+class RankingRecord(NamedTuple):
+    """バイナリ形式で出力する ranking_generated イベント1件分 (log_ranking_result が作る)"""
+    ranking_id: str
+    mode: str
+    user_id: str
+    user_hash: int
+    items: Sequence[Item]
+    rankers: Optional[Sequence[str]] = None
+    item_count: Optional[int] = None  # max_items で切り詰める前の件数 (切り詰めていなければ None)
+
+# user_hash の列は int64 で復元するため、その範囲の値のみ受け付ける
+_INT64_MIN = -(1 << 63)
+_INT64_MAX = (1 << 63) - 1
+
+def _zigzag(value: int) -> int:
+    return value * 2 if value >= 0 else -value * 2 - 1
+
+def _unzigzag(value: int) -> int:
+    return value >> 1 if not value & 1 else -((value + 1) >> 1)
+
+def _little_endian(values: array.array) -> bytes:
+    if not _LITTLE_ENDIAN:
+        values = array.array(values.typecode, values)
+        values.byteswap()
+    return values.tobytes()
+
+def encode_records(records: Sequence[RankingRecord], compress: bool = True) -> str:
+    """
+    ranking_generated イベントをまとめて1行 (BINARY_PREFIX + base64) に符号化する。
+
+    レイアウト (varint は LEB128、整数はすべて非負):
+      - 文字列表: 件数, (バイト長, UTF-8) x 件数。ranking_id / mode / user_id / チーム名 / item id を1度だけ格納する
+      - イベント数 n
+      - イベントの列 (各 n 個の varint): ranking_id, mode, user_id (文字列表の番号), zigzag(user_hash),
+        アイテム数, 切り詰め前の件数, rankers の数 + 1 (0 は rankers なし), チーム数
+      - rankers とチーム名 (文字列表の番号、全イベント分を連結)
+      - アイテムの列 (全イベント分を連結した N 件): id (文字列表の番号), source (1バイト: 0 は None、
+        t + 1 はそのイベントの t 番目のチーム), original_rank (0 は None、r + 1), score (float32), prob (float64、None は NaN)
+      - credit (float64、None は NaN): いずれかのアイテムに credit がある場合のみ
+    順位 (rank) はイベント内の並び順から復元するため格納しない。
+    user_hash は int64 の範囲のみ (範囲外は ValueError。zigzag 後は uint64 に収まる)。
+    compress=True の場合は全体を zlib で圧縮する。圧縮の有無と credit の列の有無は先頭1バイトのフラグで区別する。
+    """
+    strings: Dict[str, int] = {}
+    intern = strings.setdefault
+
+    ranking_ids, modes, user_ids, user_hashes = [], [], [], []
+    n_items, item_counts, n_rankers, n_teams = [], [], [], []
+    names: List[int] = []
+    ids: List[int] = []
+    sources = bytearray()
+    ranks: List[int] = []
+    scores = array.array('f')
+    probs = array.array('d')
+    credits = array.array('d')
+    has_credit = False
+    nan = math.nan
+
+    for record in records:
+        ranking_ids.append(intern(record.ranking_id, len(strings)))
+        modes.append(intern(record.mode, len(strings)))
+        user_ids.append(intern(record.user_id, len(strings)))
+        user_hash = record.user_hash
+        if not _INT64_MIN <= user_hash <= _INT64_MAX:
+            raise ValueError(f"user_hash must fit in int64 for the binary log format: {user_hash}")
+        user_hashes.append(_zigzag(user_hash))
+        n_items.append(len(record.items))
+        item_counts.append(len(record.items) if record.item_count is None else record.item_count)
+        if record.rankers is None:
+            n_rankers.append(0)
+        else:
+            n_rankers.append(len(record.rankers) + 1)
+            names.extend(intern(name, len(strings)) for name in record.rankers)
+
+        teams: Dict[str, int] = {}
+        for item in record.items:
+            source = item.source_ranker
+            if source is None:
+                sources.append(0)
+            else:
+                team = teams.get(source)
+                if team is None:
+                    team = teams[source] = len(teams)
+                    if team > 254:
+                        raise ValueError("at most 255 teams per ranking are supported")
+                sources.append(team + 1)
+            ids.append(intern(item.id, len(strings)))
+            rank = item.original_rank
+            ranks.append(0 if rank is None else rank + 1)
+            scores.append(item.score)
+            prob = item.prob
+            probs.append(nan if prob is None else prob)
+            credit = item.credit
+            if credit is None:
+                credits.append(nan)
+            else:
+                credits.append(credit)
+                has_credit = True
+        n_teams.append(len(teams))
+        names.extend(intern(name, len(strings)) for name in teams)
+
+    table = [name.encode("utf-8") for name in strings]
+    parts = [
+        write_varints([len(table)]),
+        write_varints(len(data) for data in table),
+        b"".join(table),
+        write_varints([len(ranking_ids)]),
+        write_varints(ranking_ids), write_varints(modes), write_varints(user_ids), write_varints(user_hashes),
+        write_varints(n_items), write_varints(item_counts), write_varints(n_rankers), write_varints(n_teams),
+        write_varints(names),
+        write_varints(ids),
+        bytes(sources),
+        write_varints(ranks),
+        _little_endian(scores),
+        _little_endian(probs),
+    ]
+    flags = 0
+    if has_credit:
+        parts.append(_little_endian(credits))
+        flags |= _FLAG_CREDIT
+    payload = b"".join(parts)
+    if compress:
+        payload = bytes([flags | _FLAG_ZLIB]) + zlib.compress(payload, 1)
+    else:
+        payload = bytes([flags]) + payload
+    return BINARY_PREFIX + base64.b64encode(payload).decode("ascii")
+
+def encode_lines(records: Sequence[RankingRecord], compress: bool = True, max_chars: int = MAX_LINE_CHARS) -> List[str]:
+    """
+    encode_records と同じだが、1行が max_chars を超える場合はイベントを分割して複数行にする
+    (CloudWatch Logs の1イベントの上限を超えないようにする)。
+    """
+    if not records:
+        return []
+    line = encode_records(records, compress)
+    if len(line) <= max_chars or len(records) == 1:
+        return [line]
+    middle = len(records) // 2
+    return encode_lines(records[:middle], compress, max_chars) + encode_lines(records[middle:], compress, max_chars)
+
+@dataclass
+class RankingColumns:
+    """
+    バイナリ形式のログを列ごとの配列に展開したもの (評価側で使う)。
+    文字列は vocab に1度だけ格納し、item_ids / sources はその番号 (sources の -1 は None) で持つ。
+    i 番目のイベントのアイテムは offsets[i]:offsets[i + 1] の範囲。
+    """
+    ranking_ids: List[str]
+    modes: List[str]
+    user_ids: List[str]
+    user_hashes: Any  # (n,) int64
+    item_counts: Any  # (n,) int64 切り詰め前の件数
+    rankers: List[Optional[List[str]]]
+    offsets: Any  # (n + 1,) int64
+    item_ids: Any  # (N,) int64
+    sources: Any  # (N,) int64
+    original_ranks: Any  # (N,) int64 (0 は None)
+    scores: Any  # (N,) float32
+    probs: Any  # (N,) float64 (NaN は None)
+    vocab: List[str] = field(default_factory=list)
+    credits: Any = None  # (N,) float64 (NaN は None)。None の場合はすべてのアイテムで None
+
+    def __len__(self) -> int:
+        return len(self.ranking_ids)
+
+    def events(self) -> Iterator[Dict[str, Any]]:
+        """
+        各イベントを JSON 形式のログと同じ dict (ranking_generated) として返す
+        (src/evaluation/credit.py の集計関数にそのまま渡せる)。score は float32 に丸められている。
+        """
+        vocab = self.vocab
+        offsets = self.offsets.tolist()
+        item_ids = self.item_ids.tolist()
+        sources = self.sources.tolist()
+        scores = self.scores.tolist()
+        probs = self.probs.tolist()
+        credits = self.credits.tolist() if self.credits is not None else None
+        for index, ranking_id in enumerate(self.ranking_ids):
+            start, stop = offsets[index], offsets[index + 1]
+            event: Dict[str, Any] = {
+                "event": "ranking_generated",
+                "ranking_id": ranking_id,
+                "mode": self.modes[index],
+                "user_id": self.user_ids[index],
+                "user_hash": int(self.user_hashes[index]),
+                "items": [
+                    {
+                        "id": vocab[item_ids[position]],
+                        "score": scores[position],
+                        "rank": position - start + 1,
+                        "source_ranker": vocab[sources[position]] if sources[position] >= 0 else None,
+                        "prob": None if probs[position] != probs[position] else probs[position],
+                    }
+                    for position in range(start, stop)
+                ],
+            }
+            if credits is not None:
+                # JSON 形式と同じく、credit はあるアイテムにのみ付与する
+                for position, item in zip(range(start, stop), event["items"]):
+                    if credits[position] == credits[position]:
+                        item["credit"] = credits[position]
+            if self.rankers[index] is not None:
+                event["rankers"] = self.rankers[index]
+            if self.item_counts[index] != stop - start:
+                event["item_count"] = int(self.item_counts[index])
+            yield event
+
+class _Reader:
+    """1行分のペイロードを先頭から読む (varint の列は NumPy でまとめて復元する)"""
+
+    def __init__(self, payload: bytes):
+        import numpy as np
+
+        self.np = np
+        self.payload = payload
+        self.data = np.frombuffer(payload, dtype=np.uint8)
+        self.offset = 0
+
+    def varints(self, n: int, unsigned: bool = False) -> Any:
+        """n 個の varint を int64 の配列で返す (unsigned=True の場合は uint64 のまま返す)"""
+        np = self.np
+        if n == 0:
+            return np.zeros(0, dtype=np.uint64 if unsigned else np.int64)
+        # varint は最大10バイト。終端バイト (最上位ビットが 0) の位置から各値の範囲を求める
+        chunk = self.data[self.offset:self.offset + 10 * n]
+        ends = np.flatnonzero(chunk < 0x80)[:n]
+        if len(ends) < n:
+            raise ValueError("truncated binary log record")
+        end = int(ends[-1]) + 1
+        chunk = chunk[:end].astype(np.uint64)
+        starts = np.empty(n, dtype=np.int64)
+        starts[0] = 0
+        starts[1:] = ends[:-1] + 1
+        shifts = (np.arange(end) - np.repeat(starts, ends - starts + 1)) * 7
+        values = np.bitwise_or.reduceat((chunk & 0x7F) << shifts.astype(np.uint64), starts)
+        self.offset += end
+        return values if unsigned else values.astype(np.int64)
+
+    def varint(self) -> int:
+        return int(self.varints(1)[0])
+
+    def raw(self, size: int) -> bytes:
+        if self.offset + size > len(self.payload):
+            raise ValueError("truncated binary log record")
+        data = self.payload[self.offset:self.offset + size]
+        self.offset += size
+        return data
+
+    def array(self, dtype: str, n: int) -> Any:
+        size = self.np.dtype(dtype).itemsize * n
+        return self.np.frombuffer(self.raw(size), dtype=dtype)
+
+def _payload(line: str) -> Tuple[int, bytes]:
+    line = line.strip()
+    if not line.startswith(BINARY_PREFIX):
+        raise ValueError("not a binary ranking log line")
+    data = base64.b64decode(line[len(BINARY_PREFIX):])
+    if not data:
+        raise ValueError("empty binary ranking log line")
+    return data[0], zlib.decompress(data[1:]) if data[0] & _FLAG_ZLIB else data[1:]
+
+class Vocabulary:
+    """文字列 -> 番号 の対応。行を跨いで共有し、新しい文字列は末尾に追記する"""
+
+    def __init__(self):
+        self.codes: Dict[str, int] = {}
+        self.names: List[str] = []
+
+    def code(self, name: str) -> int:
+        code = self.codes.get(name)
+        if code is None:
+            code = self.codes[name] = len(self.names)
+            self.names.append(name)
+        return code
+
+def decode_line(line: str, vocab: Optional[Vocabulary] = None) -> RankingColumns:
+    """
+    encode_records の1行を RankingColumns に復元する。
+    vocab を渡すと行を跨いで同じ番号を使う (RankingColumns.vocab は vocab.names そのもの)。
+    """
+    flags, payload = _payload(line)
+    reader = _Reader(payload)
+    np = reader.np
+    vocab = Vocabulary() if vocab is None else vocab
+
+    n_strings = reader.varint()
+    lengths = reader.varints(n_strings).tolist()
+    table_bytes = reader.raw(sum(lengths))
+    table: List[str] = []
+    position = 0
+    for length in lengths:
+        table.append(table_bytes[position:position + length].decode("utf-8"))
+        position += length
+    codes = np.array([vocab.code(name) for name in table], dtype=np.int64)
+
+    n = reader.varint()
+    ranking_ids = [table[i] for i in reader.varints(n).tolist()]
+    modes = [table[i] for i in reader.varints(n).tolist()]
+    user_ids = [table[i] for i in reader.varints(n).tolist()]
+    # zigzag した user_hash は 2^63 以上になり得るため、uint64 のまま Python の int に戻してから復元する
+    user_hashes = np.array([_unzigzag(v) for v in reader.varints(n, unsigned=True).tolist()], dtype=np.int64)
+    n_items = reader.varints(n)
+    item_counts = reader.varints(n)
+    n_rankers = reader.varints(n)
+    n_teams = reader.varints(n)
+
+    # rankers とチーム名はイベントごとに [rankers..., teams...] の順で連結されている
+    names = reader.varints(int(np.maximum(n_rankers - 1, 0).sum() + n_teams.sum())).tolist()
+    rankers: List[Optional[List[str]]] = []
+    team_starts = np.zeros(n, dtype=np.int64)
+    position = 0
+    for index in range(n):
+        count = int(n_rankers[index])
+        if count == 0:
+            rankers.append(None)
+        else:
+            rankers.append([table[i] for i in names[position:position + count - 1]])
+            position += count - 1
+        team_starts[index] = position
+        position += int(n_teams[index])
+    names = np.array(names + [0], dtype=np.int64)
+
+    total = int(n_items.sum())
+    item_ids = codes[reader.varints(total)] if total else np.zeros(0, dtype=np.int64)
+    source_flags = reader.array('u1', total).astype(np.int64)
+    original_ranks = reader.varints(total)
+    original_ranks = np.where(original_ranks > 0, original_ranks - 1, 0)
+    scores = reader.array('<f4', total).astype(np.float32)
+    probs = reader.array('<f8', total).astype(np.float64)
+    credits = reader.array('<f8', total).astype(np.float64) if flags & _FLAG_CREDIT else None
+
+    # source のバイトを、イベントごとのチーム表を経由して vocab の番号に変換する
+    owner = np.repeat(np.arange(n), n_items)
+    team_index = team_starts[owner] + np.maximum(source_flags - 1, 0)
+    sources = np.where(source_flags > 0, codes[names[team_index]] if len(codes) else -1, -1)
+
+    offsets = np.zeros(n + 1, dtype=np.int64)
+    np.cumsum(n_items, out=offsets[1:])
+    return RankingColumns(
+        ranking_ids=ranking_ids,
+        modes=modes,
+        user_ids=user_ids,
+        user_hashes=user_hashes,
+        item_counts=item_counts,
+        rankers=rankers,
+        offsets=offsets,
+        item_ids=item_ids,
+        sources=sources.astype(np.int64),
+        original_ranks=original_ranks,
+        scores=scores,
+        probs=probs,
+        vocab=vocab.names,
+        credits=credits,
+    )
+
+def iter_columns(lines: Iterable[str]) -> Iterator[RankingColumns]:
+    """
+    ログの行からバイナリ形式の行だけを1行ずつ RankingColumns に復元する (JSON などの他の行は読み飛ばす)。
+    vocab は行を跨いで共有するため、item_ids / sources の番号はストリーム全体で一貫する。
+    """
+    vocab = Vocabulary()
+    for line in lines:
+        if line.lstrip().startswith(BINARY_PREFIX):
+            yield decode_line(line, vocab)
+
+def decode_columns(lines: Iterable[str]) -> RankingColumns:
+    """iter_columns の結果を1つの RankingColumns に連結する"""
+    import numpy as np
+
+    blocks = list(iter_columns(lines))
+    if not blocks:
+        empty = np.zeros(0, dtype=np.int64)
+        return RankingColumns([], [], [], empty, empty, [], np.zeros(1, dtype=np.int64), empty, empty, empty,
+                              np.zeros(0, dtype=np.float32), np.zeros(0, dtype=np.float64))
+    offsets = [np.zeros(1, dtype=np.int64)]
+    base = 0
+    for block in blocks:
+        offsets.append(block.offsets[1:] + base)
+        base += int(block.offsets[-1])
+    return RankingColumns(
+        ranking_ids=[value for block in blocks for value in block.ranking_ids],
+        modes=[value for block in blocks for value in block.modes],
+        user_ids=[value for block in blocks for value in block.user_ids],
+        user_hashes=np.concatenate([block.user_hashes for block in blocks]),
+        item_counts=np.concatenate([block.item_counts for block in blocks]),
+        rankers=[value for block in blocks for value in block.rankers],
+        offsets=np.concatenate(offsets),
+        item_ids=np.concatenate([block.item_ids for block in blocks]),
+        sources=np.concatenate([block.sources for block in blocks]),
+        original_ranks=np.concatenate([block.original_ranks for block in blocks]),
+        scores=np.concatenate([block.scores for block in blocks]),
+        probs=np.concatenate([block.probs for block in blocks]),
+        # 最後のブロックの vocab は共有した vocab 全体を含む
+        vocab=blocks[-1].vocab,
+        credits=None if all(block.credits is None for block in blocks) else np.concatenate([
+            block.credits if block.credits is not None else np.full(len(block.probs), np.nan)
+            for block in blocks
+        ]),
+    )
+
+def iter_events(lines: Iterable[str]) -> Iterator[Dict[str, Any]]:
+    """バイナリ形式の行を JSON 形式と同じ ranking_generated の dict として1件ずつ返す"""
+    for line in lines:
+        if line.lstrip().startswith(BINARY_PREFIX):
+            yield from decode_line(line).events()
@@ -1,37 +1,415 @@
 
+import atexit
 import json
 import logging
-from typing import List, Any
+import queue
+import sys
+import threading
+import time
+import zlib
+from typing import IO, Any, Dict, List, NamedTuple, Optional, Sequence
 from src.context import Context, Item
+from src.observability.binary_log import RankingRecord, encode_lines, encode_records
+from src.observability.tracing import current_trace
+
+try:
+    # orjson があれば高速なシリアライザを使う (任意の依存)
+    import orjson
+except ImportError:  # pragma: no cover - depends on environment
+    orjson = None
 
 logger = logging.getLogger("interleaving")
 logger.setLevel(logging.INFO)
 # Handler設定はLambda環境等に依存するため、ここでは標準出力への出力のみを想定
-handler = logging.StreamHandler()
-handler.setFormatter(logging.Formatter('%(message)s'))
-logger.addHandler(handler)
+# (非同期出力 (AsyncLogWriter) の既定の出力先と揃える。StreamHandler の既定は標準エラー)
+# (モジュールが再読み込みされてもハンドラーが重複しないよう、付与済みかを確認する)
+if not any(getattr(h, "_interleaving_handler", False) for h in logger.handlers):
+    handler = logging.StreamHandler(sys.stdout)
+    handler.setFormatter(logging.Formatter('%(message)s'))
+    handler._interleaving_handler = True
+    logger.addHandler(handler)
+
+_json_encoder = json.JSONEncoder(separators=(",", ":"))
+
+def _dumps(data: Any) -> str:
+    if orjson is not None:
+        return orjson.dumps(data).decode("utf-8")
+    return _json_encoder.encode(data)
+
+class _JsonRanking(NamedTuple):
+    """
+    JSON 形式で出力する ranking_generated イベント1件分 (log_ranking_result が作る)。
+    リクエスト内ではアイテムの列と区間計測の値を取り出すだけにし、dict の組み立てと
+    シリアライズは _ranking_line で行う (非同期出力ではバックグラウンドスレッドで行う)。
+    """
+    ranking_id: str
+    mode: str
+    user_id: str
+    user_hash: int
+    ids: Sequence[str]
+    scores: Sequence[float]
+    sources: Sequence[Optional[str]]
+    probs: Sequence[Optional[float]]
+    credits: Sequence[Optional[float]]
+    rankers: Optional[Sequence[str]] = None
+    item_count: Optional[int] = None  # max_items で切り詰める前の件数 (切り詰めていなければ None)
+    trace_fields: Optional[Dict[str, Any]] = None  # timings_ms などの区間計測の付加情報
+
+def _ranking_line(record: _JsonRanking) -> str:
+    items = []
+    for rank, (item_id, score, source, prob, credit) in enumerate(
+        zip(record.ids, record.scores, record.sources, record.probs, record.credits), 1
+    ):
+        entry = {"id": item_id, "score": score, "rank": rank, "source_ranker": source, "prob": prob}
+        # Optimized Interleaving のクレジット δ は付与されている場合のみ出力する
+        if credit is not None:
+            entry["credit"] = credit
+        items.append(entry)
+    log_data = {
+        "event": "ranking_generated",
+        "ranking_id": record.ranking_id,
+        "mode": record.mode,
+        "user_id": record.user_id,
+        "user_hash": record.user_hash,
+        "items": items,
+    }
+    if record.rankers is not None:
+        log_data["rankers"] = list(record.rankers)
+    if record.item_count is not None:
+        log_data["item_count"] = record.item_count
+    if record.trace_fields is not None:
+        log_data.update(record.trace_fields)
+    return _dumps(log_data)
+
+class AsyncLogWriter:
+    """
+    ログ行を有界キューに積み、バックグラウンドスレッドでまとめて (改行区切りで) 書き出す。
+    
+    - キューが満杯の場合はリクエストをブロックせずに行を捨て、dropped に数える。
+    - flush() はそれまでに積まれた行の書き出し完了を待つ (Lambda の呼び出し終了時に呼ぶ)。
+    """
+    def __init__(
+        self,
+        stream: Optional[IO[str]] = None,
+        max_queue: int = 10000,
+        batch_size: int = 256,
+        flush_interval: float = 0.05,
+    ):
+        self.stream = stream
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.dropped = 0
+        self._queue: "queue.Queue[Any]" = queue.Queue(maxsize=max_queue)
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="interleaving-log-writer", daemon=True)
+        self._thread.start()
+
+    def write(self, line: Any) -> bool:
+        """line は出力する行 (str) か、書き出し時にシリアライズする ranking_generated イベント (_JsonRanking / RankingRecord)"""
+        try:
+            self._queue.put_nowait(line)
+            return True
+        except queue.Full:
+            self.dropped += 1
+            return False
+
+    def flush(self, timeout: Optional[float] = 1.0) -> bool:
+        """積まれている行をすべて書き出すまで待つ。timeout 内に終われば True"""
+        if self._closed:
+            return True
+        done = threading.Event()
+        try:
+            self._queue.put(done, timeout=timeout)
+        except queue.Full:
+            return False
+        return done.wait(timeout)
+
+    def close(self, timeout: Optional[float] = 1.0) -> None:
+        self.flush(timeout)
+        self._closed = True
+        try:
+            self._queue.put(None, timeout=timeout)
+        except queue.Full:
+            pass
+        self._thread.join(timeout)
+
+    def _run(self) -> None:
+        while True:
+            try:
+                entry = self._queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                continue
+            batch: List[Any] = []
+            markers: List[threading.Event] = []
+            stop = False
+            while True:
+                if entry is None:
+                    stop = True
+                elif isinstance(entry, threading.Event):
+                    markers.append(entry)
+                else:
+                    batch.append(entry)
+                if stop or len(batch) >= self.batch_size:
+                    break
+                try:
+                    entry = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+            if batch:
+                self._write_batch(batch)
+            for marker in markers:
+                marker.set()
+            if stop:
+                return
+
+    def _write_batch(self, batch: List[Any]) -> None:
+        stream = self.stream or sys.stdout
+        lines: List[str] = []
+        records: List[RankingRecord] = []
+        for entry in batch:
+            if entry.__class__ is str:
+                lines.append(entry)
+            elif entry.__class__ is _JsonRanking:
+                # シリアライズできないイベントは、そのイベントのみ捨てる (同じバッチの他のリクエストは出力する)
+                try:
+                    lines.append(_ranking_line(entry))
+                except Exception as e:
+                    self._discard(entry, e)
+            else:
+                records.append(entry)
+        if records:
+            lines.extend(self._encode_records(records))
+        if not lines:
+            return
+        try:
+            stream.write("\n".join(lines) + "\n")
+            stream.flush()
+        except Exception:
+            # ログ出力の失敗でワーカースレッドを止めない
+            self.dropped += len(lines)
+
+    def _encode_records(self, records: List[RankingRecord]) -> List[str]:
+        # バイナリ形式のイベントはまとめて符号化する (文字列表をバッチ内で共有するため小さくなる)
+        try:
+            return encode_lines(records)
+        except Exception:
+            pass
+        # 符号化できないイベントが含まれる場合は1件ずつ符号化し、失敗したもののみ捨てる
+        lines: List[str] = []
+        for record in records:
+            try:
+                lines.extend(encode_lines([record]))
+            except Exception as e:
+                self._discard(record, e)
+        return lines
+
+    def _discard(self, entry: Any, error: Exception) -> None:
+        self.dropped += 1
+        log_event_dropped(getattr(entry, "ranking_id", None), error)
+
+# ranking_generated イベントの出力形式
+LOG_FORMAT_JSON = "json"
+LOG_FORMAT_BINARY = "binary"
+
+class _LoggingOptions:
+    def __init__(self):
+        self.sample_rate = 1.0
+        self.max_items: Optional[int] = None
+        self.writer: Optional[AsyncLogWriter] = None
+        self.log_format = LOG_FORMAT_JSON
+
+_options = _LoggingOptions()
+
+def configure_logging(
+    asynchronous: bool = False,
+    sample_rate: float = 1.0,
+    max_items: Optional[int] = None,
+    stream: Optional[IO[str]] = None,
+    max_queue: int = 10000,
+    batch_size: int = 256,
+    log_format: str = LOG_FORMAT_JSON,
+) -> None:
+    """
+    ランキングログの出力方法を設定する (モジュールの初期化時に1度呼ぶ想定)。
+    
+    Args:
+        asynchronous: True の場合、ランキングログはバックグラウンドスレッドでまとめて stream
+            (デフォルトは標準出力) に書き出す。呼び出しの終了時に flush_logs() を呼ぶこと。
+            False (デフォルト) の場合はリクエスト内で logger 経由で同期的に出力する。
+        sample_rate: ランキングログを出力する割合。ranking_id のハッシュで決まるため、
+            同じ ranking_id に対する判定は常に同じになる (クリックログ側でも同じ条件で間引ける)。
+        max_items: 1ランキングあたりに出力するアイテム数の上限 (None で無制限)
+        log_format: ranking_generated イベントの形式。"json" (デフォルト) または "binary"
+            (src/observability/binary_log.py の base64 の行。asynchronous=True の場合はバッチ単位で
+            1行にまとめ、item id などの文字列をバッチ内で1度だけ出力する)。他のイベントは常に JSON
+    """
+    if log_format not in (LOG_FORMAT_JSON, LOG_FORMAT_BINARY):
+        raise ValueError(f"unknown log_format: {log_format!r}")
+    previous = _options.writer
+    _options.sample_rate = sample_rate
+    _options.max_items = max_items
+    _options.log_format = log_format
+    _options.writer = AsyncLogWriter(stream, max_queue=max_queue, batch_size=batch_size) if asynchronous else None
+    if previous is not None:
+        previous.close()
+
+def flush_logs(timeout: Optional[float] = 1.0) -> bool:
+    """
+    非同期出力が有効な場合、積まれているログの書き出し完了を待つ。
+    Lambda ではハンドラーの return 前に呼ぶ (実行環境のフリーズ中はスレッドが動かないため)。
+    """
+    writer = _options.writer
+    if writer is None:
+        return True
+    return writer.flush(timeout)
+
+atexit.register(flush_logs)
+
+def is_sampled(ranking_id: str, sample_rate: float) -> bool:
+    """ranking_id のハッシュ (CRC32) によるサンプリング判定"""
+    if sample_rate >= 1.0:
+        return True
+    if sample_rate <= 0.0:
+        return False
+    return zlib.crc32(ranking_id.encode("utf-8")) < sample_rate * 4294967296.0
 
-def log_ranking_result(ranking_id: str, mode: str, context: Context, items: List[Item]):
+# ranking_generated イベントに付与する区間計測の付加情報
+_TRACE_FIELDS = ("config_cache", "parallel", "parallel_speedup", "allocation_cache")
+
+def log_ranking_result(
+    ranking_id: str,
+    mode: str,
+    context: Context,
+    items: List[Item],
+    rankers: Optional[Sequence[str]] = None,
+):
     """
     ランキング結果を構造化ログ(JSON)として出力する。
+    出力方法・サンプリング・アイテム数の上限は configure_logging で設定する。
+    
+    rankers には MULTILEAVE で合成したチーム名を渡す (アイテムを1件も配置しなかったチームも
+    勝敗集計の対象に含めるため、ログに残す)。
+    
+    区間計測 (src/observability/tracing.py) の実行中は、それまでの区間ごとの所要時間 (timings_ms)、
+    設定キャッシュの状態 (config_cache)、並行実行の有無と効果 (parallel / parallel_speedup)、
+    Optimized Interleaving の確率分布のキャッシュの状態 (allocation_cache) を付与する。
+    このログ出力自体の所要時間は "logging" 区間として記録され (サンプリングで間引いた場合も記録する)、
+    EMF のメトリクスにのみ含まれる。非同期出力の場合、リクエスト内ではアイテムの値を取り出して積むだけにし、
+    JSON への変換はバックグラウンドスレッドで行う。
+    
+    configure_logging(log_format="binary") の場合はバイナリ形式 (src/observability/binary_log.py) で出力する。
+    バイナリ形式には区間計測の付加情報は含めない (EMF で出力すること)。
+    """
+    options = _options
+    trace = current_trace()
+    if trace is not None:
+        started_at = time.perf_counter()
+        trace.fields["mode"] = mode
+    if not is_sampled(ranking_id, options.sample_rate):
+        # 間引いた場合も "logging" 区間は記録する (EMF で区間が欠けないようにする)
+        if trace is not None:
+            trace.record_since("logging", started_at)
+        return
+    
+    logged_items = items
+    if options.max_items is not None and len(items) > options.max_items:
+        logged_items = items[:options.max_items]
+    
+    if options.log_format == LOG_FORMAT_BINARY:
+        record = RankingRecord(
+            ranking_id, mode, context.user_id, context.user_hash, tuple(logged_items),
+            tuple(rankers) if rankers is not None else None,
+            len(items) if logged_items is not items else None,
+        )
+        writer = options.writer
+        if writer is not None:
+            # 符号化はバックグラウンドスレッドでバッチ単位に行う
+            writer.write(record)
+        else:
+            logger.info(encode_records([record]))
+        if trace is not None:
+            trace.record_since("logging", started_at)
+        return
+    
+    trace_fields = None
+    if trace is not None:
+        trace_fields = {"timings_ms": trace.timings()}
+        for key in _TRACE_FIELDS:
+            if key in trace.fields:
+                trace_fields[key] = trace.fields[key]
+    ranking = _JsonRanking(
+        ranking_id, mode, context.user_id, context.user_hash,
+        [item.id for item in logged_items],
+        [item.score for item in logged_items],
+        [item.source_ranker for item in logged_items],
+        [item.prob for item in logged_items],
+        [item.credit for item in logged_items],
+        tuple(rankers) if rankers is not None else None,
+        len(items) if logged_items is not items else None,
+        trace_fields,
+    )
+    writer = options.writer
+    if writer is not None:
+        # dict の組み立てとシリアライズはバックグラウンドスレッドでバッチ単位に行う
+        writer.write(ranking)
+    else:
+        logger.info(_ranking_line(ranking))
+    if trace is not None:
+        trace.record_since("logging", started_at)
+
+def log_ranker_degraded(context: Context, ranker: str, reason: str, elapsed_ms: float):
+    """
+    ランカーの期限切れ・例外により片側のみの結果に縮退したことを構造化ログとして出力する。
     """
     
     log_data = {
-        "event": "ranking_generated",
-        "ranking_id": ranking_id,
-        "mode": mode,
+        "event": "ranker_degraded",
+        "ranker": ranker,
+        "reason": reason,
+        "elapsed_ms": round(elapsed_ms, 3),
         "user_id": context.user_id,
         "user_hash": context.user_hash,
-        "items": [
-            {
-                "id": item.id,
-                "score": item.score,
-                "rank": i + 1,
-                "source_ranker": item.source_ranker
-            }
-            for i, item in enumerate(items)
-        ]
     }
     
-    logger.info(json.dumps(log_data))
+    logger.warning(_dumps(log_data))
 
+def log_config_refresh_failed(error: Exception, consecutive_failures: int, retry_in_seconds: float):
+    """
+    設定の取得失敗を構造化ログとして出力する (直前に取得できた設定は引き続き利用される)。
+    """
+    
+    log_data = {
+        "event": "config_refresh_failed",
+        "error": repr(error),
+        "consecutive_failures": consecutive_failures,
+        "retry_in_seconds": round(retry_in_seconds, 3),
+    }
+    
+    logger.warning(_dumps(log_data))
+
+def log_process_pool_unavailable(error: Exception):
+    """
+    プロセスプールを作れなかったことを構造化ログとして出力する (以降はスレッドで実行される)。
+    """
+    
+    log_data = {
+        "event": "process_pool_unavailable",
+        "error": repr(error),
+        "fallback": "thread",
+    }
+    
+    logger.warning(_dumps(log_data))
+
+def log_event_dropped(ranking_id: Optional[str], error: Exception):
+    """
+    非同期出力でシリアライズ・符号化できなかった ranking_generated イベントを捨てたことを
+    構造化ログとして出力する (同期出力ではリクエスト内で例外になる)。
+    """
+    
+    log_data = {
+        "event": "ranking_log_dropped",
+        "ranking_id": ranking_id,
+        "error": repr(error),
+    }
+    
+    logger.warning(_dumps(log_data))
@@ -0,0 +1,173 @@
+
+import contextvars
+import functools
+import json
+import sys
+import time
+from typing import IO, Any, Callable, Dict, Optional, Sequence, TypeVar
+
+F = TypeVar("F", bound=Callable[..., Any])
+
+class Trace:
+    """
+    1リクエスト分の区間計測の結果。stages は区間名 -> 所要時間 (ms、同じ区間は合算)、
+    fields はログに付与する付加情報 (config_cache / parallel_speedup など)。
+    時間は単調増加クロック (time.perf_counter) で測る。
+    """
+    __slots__ = ("started_at", "stages", "fields")
+
+    def __init__(self):
+        self.started_at = time.perf_counter()
+        self.stages: Dict[str, float] = {}
+        self.fields: Dict[str, Any] = {}
+
+    def record(self, stage: str, elapsed_ms: float) -> None:
+        stages = self.stages
+        stages[stage] = stages.get(stage, 0.0) + elapsed_ms
+
+    def record_since(self, stage: str, started_at: float) -> None:
+        self.record(stage, (time.perf_counter() - started_at) * 1000.0)
+
+    def record_fanout(self, stage: str, started_at: float, children: Sequence[str]) -> None:
+        """
+        ランカーの並行実行の区間を記録し、実際に得られた並行化の効果
+        (各ランカーの所要時間の合計 / 全体の所要時間) を parallel_speedup として残す。
+        """
+        elapsed_ms = (time.perf_counter() - started_at) * 1000.0
+        self.record(stage, elapsed_ms)
+        total = sum(self.stages.get(child, 0.0) for child in children)
+        if elapsed_ms > 0.0:
+            self.fields["parallel_speedup"] = round(total / elapsed_ms, 3)
+
+    def elapsed_ms(self) -> float:
+        return (time.perf_counter() - self.started_at) * 1000.0
+
+    def timings(self) -> Dict[str, float]:
+        """ログ出力用の区間ごとの所要時間 (ms、"total" は開始からの経過時間)"""
+        timings = {stage: round(ms, 3) for stage, ms in self.stages.items()}
+        timings["total"] = round(self.elapsed_ms(), 3)
+        return timings
+
+_current: contextvars.ContextVar[Optional[Trace]] = contextvars.ContextVar("interleaving_trace", default=None)
+
+class _TracingOptions:
+    def __init__(self):
+        self.enabled = False
+        self.emf = False
+        self.namespace = "Interleaving"
+        self.stream: Optional[IO[str]] = None
+
+_options = _TracingOptions()
+
+def configure_tracing(
+    enabled: bool = True,
+    emf: bool = False,
+    namespace: str = "Interleaving",
+    stream: Optional[IO[str]] = None,
+) -> None:
+    """
+    区間計測を設定する (モジュールの初期化時に1度呼ぶ想定。デフォルトは無効)。
+
+    Args:
+        enabled: False の場合 start_trace は何もせず、各区間の計測はほぼコストなしで素通りする
+        emf: True の場合、finish_trace で CloudWatch Embedded Metric Format の行を stream に出力する
+        namespace: EMF のメトリクスの名前空間
+        stream: EMF の出力先 (デフォルトは標準出力)
+    """
+    _options.enabled = enabled
+    _options.emf = emf
+    _options.namespace = namespace
+    _options.stream = stream
+
+def start_trace() -> Optional[Trace]:
+    """リクエストの開始時に呼ぶ。計測が無効なら None を返す"""
+    if not _options.enabled:
+        return None
+    trace = Trace()
+    _current.set(trace)
+    return trace
+
+def current_trace() -> Optional[Trace]:
+    return _current.get()
+
+def annotate(key: str, value: Any) -> None:
+    trace = _current.get()
+    if trace is not None:
+        trace.fields[key] = value
+
+def finish_trace() -> Optional[Trace]:
+    """
+    リクエストの終了時 (ログ出力の後) に呼ぶ。計測を終了し、有効なら EMF の行を出力する。
+    """
+    trace = _current.get()
+    if trace is None:
+        return None
+    _current.set(None)
+    if _options.emf:
+        stream = _options.stream or sys.stdout
+        stream.write(format_emf(trace, _options.namespace) + "\n")
+    return trace
+
+def format_emf(trace: Trace, namespace: str) -> str:
+    """
+    CloudWatch Embedded Metric Format の1行。区間ごとの所要時間を "<区間>_ms" のメトリクス、
+    mode (ログ出力時に付与) をディメンションとする。
+    """
+    metrics = {f"{stage}_ms": value for stage, value in trace.timings().items()}
+    if "parallel_speedup" in trace.fields:
+        metrics["parallel_speedup"] = trace.fields["parallel_speedup"]
+    definitions = [
+        {"Name": name, "Unit": "None" if name == "parallel_speedup" else "Milliseconds"}
+        for name in metrics
+    ]
+    document: Dict[str, Any] = {
+        "_aws": {
+            "Timestamp": int(time.time() * 1000),
+            "CloudWatchMetrics": [{
+                "Namespace": namespace,
+                "Dimensions": [["mode"]],
+                "Metrics": definitions,
+            }],
+        },
+        "mode": trace.fields.get("mode", "UNKNOWN"),
+    }
+    document.update(metrics)
+    if "config_cache" in trace.fields:
+        document["config_cache"] = trace.fields["config_cache"]
+    return json.dumps(document, separators=(",", ":"))
+
+def timed(stage: str) -> Callable[[F], F]:
+    """
+    関数の呼び出しを stage の区間として計測するデコレーター。
+    計測中でなければ元の関数をそのまま呼ぶ (コストは ContextVar の参照1回)。
+    """
+    def decorator(func: F) -> F:
+        @functools.wraps(func)
+        def wrapper(*args: Any, **kwargs: Any) -> Any:
+            trace = _current.get()
+            if trace is None:
+                return func(*args, **kwargs)
+            started_at = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                trace.record_since(stage, started_at)
+        return wrapper  # type: ignore[return-value]
+    return decorator
+
+def traced_call(func: Callable[..., Any], trace: Optional[Trace], stage: str) -> Callable[..., Any]:
+    """
+    func を stage として計測する呼び出し可能オブジェクトを返す (trace が None なら func そのもの)。
+    ContextVar はスレッドプールのワーカーに引き継がれないため、ワーカーで実行する関数は
+    呼び出し側で取得した trace を明示的に渡してこれで包む。
+    """
+    if trace is None:
+        return func
+
+    def call(*args: Any, **kwargs: Any) -> Any:
+        started_at = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            trace.record_since(stage, started_at)
+    return call
@@ -1,37 +1,87 @@
 
-from typing import List, Callable, Dict, Any
-from src.context import Context, Item
-from src.ranker.base import Ranker
+from typing import Any, AsyncIterable, Awaitable, Callable, Dict, Iterable, Iterator, List, Union
+from src.context import CompactItem, Context, Item
+from src.ranker.base import AsyncRanker, Ranker
+
+def _context_dict(context: Context) -> Dict[str, Any]:
+    # Context -> Dict変換 (既存ロジックはdictを受け取ると仮定)
+    return {
+        'user_id': context.user_id,
+        'user_hash': context.user_hash,
+        **context.params
+    }
+
+def _to_items(raw_results: Iterable[Dict[str, Any]]) -> Iterator[Item]:
+    # Raw Dict -> Item変換 (1件ずつ)
+    for raw in raw_results:
+        # 必須フィールドの抽出
+        item_id = raw.get('id')
+        score = raw.get('score', 0.0)
+        
+        # その他のパラメーターはmetaに入れる
+        meta = {k: v for k, v in raw.items() if k not in ['id', 'score']}
+        
+        yield Item(id=str(item_id), score=float(score), meta=meta)
+
+def _to_compact_items(raw_results: Iterable[Dict[str, Any]]) -> Iterator[CompactItem]:
+    for raw in raw_results:
+        item_id = raw.get('id')
+        score = raw.get('score', 0.0)
+        if item_id.__class__ is not str:
+            item_id = str(item_id)
+        if score.__class__ is not float:
+            score = float(score)
+        yield CompactItem(item_id, score, None, None, None, raw)
 
 class LambdaRankerAdapter(Ranker):
     """
     既存のLambda/関数ベースのランキングロジックをラップし、
     Rankerインターフェースに適合させるアダプター
+    
+    logic_func はリストだけでなく、上位から順に結果を yield するジェネレーターでもよい。
+    その場合 rank_stream() は Interleaver が取り出した分だけ logic_func を進める。
+    
+    lazy_meta=True の場合は raw dict をコピーせず保持する CompactItem を返す
+    (meta は id / score を除いたビューとして参照時に見せる)。id / score も型が既に
+    str / float であれば変換しない。
     """
-    def __init__(self, logic_func: Callable[[Dict[str, Any]], List[Dict[str, Any]]]):
+    def __init__(self, logic_func: Callable[[Dict[str, Any]], Iterable[Dict[str, Any]]], lazy_meta: bool = False):
         self.logic_func = logic_func
+        self.lazy_meta = lazy_meta
 
     def rank(self, context: Context) -> List[Item]:
-        # Context -> Dict変換 (必要なら)
-        # 既存ロジックはdictを受け取ると仮定
-        ctx_dict = {
-            'user_id': context.user_id,
-            'user_hash': context.user_hash,
-            **context.params
-        }
+        return list(self.rank_stream(context))
+
+    def rank_stream(self, context: Context) -> Iterator[Item]:
+        raw_results = self.logic_func(_context_dict(context))
         
-        raw_results = self.logic_func(ctx_dict)
+        if self.lazy_meta:
+            yield from _to_compact_items(raw_results)
+            return
+        
+        yield from _to_items(raw_results)
+
+class AsyncLambdaRankerAdapter(AsyncRanker):
+    """
+    LambdaRankerAdapter の asyncio 版。logic_func はコルーチン関数 (dict のリストを返す) か、
+    結果を1件ずつ yield する非同期ジェネレーター関数とする。
+    dict -> Item の変換と lazy_meta の扱いは LambdaRankerAdapter と同じ。
+    """
+    def __init__(
+        self,
+        logic_func: Callable[[Dict[str, Any]], Union[Awaitable[Iterable[Dict[str, Any]]], AsyncIterable[Dict[str, Any]]]],
+        lazy_meta: bool = False,
+    ):
+        self.logic_func = logic_func
+        self.lazy_meta = lazy_meta
+
+    async def rank(self, context: Context) -> List[Item]:
+        raw_results = self.logic_func(_context_dict(context))
+        if hasattr(raw_results, '__aiter__'):
+            raw_results = [raw async for raw in raw_results]
+        else:
+            raw_results = await raw_results
         
-        # Raw Dict -> Item変換
-        items = []
-        for raw in raw_results:
-            # 必須フィールドの抽出
-            item_id = raw.get('id')
-            score = raw.get('score', 0.0)
-            
-            # その他のパラメーターはmetaに入れる
-            meta = {k: v for k, v in raw.items() if k not in ['id', 'score']}
-            
-            items.append(Item(id=str(item_id), score=float(score), meta=meta))
-            
-        return items
+        if self.lazy_meta:
+            return list(_to_compact_items(raw_results))
+        return list(_to_items(raw_results))
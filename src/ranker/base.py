@@ -1,5 +1,5 @@
 
-from typing import List, Protocol
+from typing import Iterator, List, Protocol
 from src.context import Context, Item
 
 class Ranker(Protocol):
@@ -8,3 +8,31 @@ class Ranker(Protocol):
         Contextを受け取り、ランキング生成（Itemのリスト）を返す
         """
         ...
+
+    def rank_stream(self, context: Context) -> Iterator[Item]:
+        """
+        (Optional) ランキングを上位から順に1件ずつ返すイテレータ。
+        Interleaver は必要になった分だけ取り出すため、遅延評価できるランカーは
+        ページに必要な深さまでしかスコアリングしなくて済む。
+        
+        デフォルト実装は rank() の結果をそのまま返す (full ranking を yield)。
+        """
+        return iter(self.rank(context))
+
+def iter_ranking(ranker: Ranker, context: Context) -> Iterator[Item]:
+    """
+    rank_stream を持つランカーはストリームを、持たないランカー (Protocol を継承せず
+    rank のみ実装したもの) は rank() の結果をイテレータとして返す。
+    """
+    rank_stream = getattr(ranker, "rank_stream", None)
+    if rank_stream is not None:
+        return iter(rank_stream(context))
+    return iter(ranker.rank(context))
+
+class AsyncRanker(Protocol):
+    async def rank(self, context: Context) -> List[Item]:
+        """
+        Ranker の asyncio 版。ネットワーク越しの特徴量ストアやモデルエンドポイントを
+        await するランカーはスレッドを使わずにこちらを実装する (src/execution/aio.py で実行する)。
+        """
+        ...
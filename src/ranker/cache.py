@@ -0,0 +1,167 @@
+
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Hashable, Iterator, List, Optional, Sequence, Tuple
+from src.context import Context, Item
+from src.ranker.base import Ranker
+
+DEFAULT_MAX_ENTRIES = 1024
+DEFAULT_TTL_SECONDS = 30.0
+# key_params=None の場合にキーから外すページングのパラメータ (ページが変わってもランキング結果は同じため)
+PAGING_PARAMS = ("page", "page_token", "offset", "cursor")
+
+@dataclass
+class CacheStats:
+    hits: int = 0
+    misses: int = 0
+    evictions: int = 0  # 容量超過で追い出した件数
+    expirations: int = 0  # TTL 切れで捨てた件数
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+class RankingCache:
+    """
+    ランキング結果の LRU キャッシュ (TTL 付き)。ウォームコンテナ内でモジュールレベルに1つ作り、
+    複数の CachedRanker (A / B / MULTILEAVE の各ランカー) で共有する想定。
+
+    - キーは CachedRanker が作る (ランカー名, user_id, 選択した params) のタプル。
+    - TTL は格納時刻からの経過秒数で判定し、期限切れのエントリは参照時に捨てる。
+    - 容量 (max_entries) を超えたら最も長く参照されていないエントリから追い出す。
+    - 全操作を1つの Lock で保護するため、executor のスレッドから同時に使ってよい。
+      ランカーの実行はロックの外で行う (同じキーの同時ミスはそれぞれ実行され、後勝ちで格納される)。
+    """
+    def __init__(
+        self,
+        max_entries: int = DEFAULT_MAX_ENTRIES,
+        ttl_seconds: float = DEFAULT_TTL_SECONDS,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        if max_entries <= 0:
+            raise ValueError("max_entries must be positive")
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._clock = clock
+        self._entries: "OrderedDict[Hashable, Tuple[float, Tuple[Item, ...]]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = CacheStats()
+
+    def get(self, key: Hashable) -> Optional[Tuple[Item, ...]]:
+        now = self._clock()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                stored_at, items = entry
+                if now - stored_at < self.ttl_seconds:
+                    self._entries.move_to_end(key)
+                    self._stats.hits += 1
+                    return items
+                del self._entries[key]
+                self._stats.expirations += 1
+            self._stats.misses += 1
+            return None
+
+    def put(self, key: Hashable, items: Sequence[Item]) -> None:
+        entry = (self._clock(), tuple(items))
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._stats.evictions += 1
+
+    def invalidate(self, key: Hashable) -> None:
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> CacheStats:
+        """カウンタのスナップショット"""
+        with self._lock:
+            return CacheStats(self._stats.hits, self._stats.misses, self._stats.evictions, self._stats.expirations)
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+def _freeze(value: Any) -> Hashable:
+    """params の値をキーに使える形 (ハッシュ可能) に変換する"""
+    if isinstance(value, dict):
+        return tuple(sorted((key, _freeze(item)) for key, item in value.items()))
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(item) for item in value)
+    if isinstance(value, (set, frozenset)):
+        return frozenset(_freeze(item) for item in value)
+    return value
+
+class CachedRanker(Ranker):
+    """
+    任意の Ranker をラップし、結果を RankingCache に保存するキャッシュ層。
+
+    キーは (name, user_id, key_params で選んだ params の値)。
+    key_params=None の場合は params から exclude_params (既定はページングの PAGING_PARAMS) を除いた全体を使う。
+    key_params を指定する場合は、ページ番号 / offset などランキング結果に影響しないパラメータを含めないこと
+    (含めるとページごとに別のキーになり、ページングのリクエストでキャッシュが効かない)。
+
+    キャッシュ済みの結果はタプルで保持し、rank() は毎回新しいリストを返す
+    (呼び出し側がリストを変更してもキャッシュには影響しない)。
+    rank_stream() もミス時はラップしたランカーの rank() で全件を求めて格納してから返す
+    (Interleaver は k 件で取り出しを打ち切るため、ストリームのまま流すと格納できない)。
+    """
+    def __init__(
+        self,
+        ranker: Ranker,
+        name: str,
+        cache: Optional[RankingCache] = None,
+        key_params: Optional[Sequence[str]] = None,
+        exclude_params: Sequence[str] = PAGING_PARAMS,
+    ):
+        self.ranker = ranker
+        self.name = name
+        self.cache = cache if cache is not None else RankingCache()
+        self.key_params = tuple(key_params) if key_params is not None else None
+        self.exclude_params = frozenset(exclude_params)
+
+    def cache_key(self, context: Context) -> Hashable:
+        params = context.params
+        if self.key_params is None:
+            selected = _freeze({key: value for key, value in params.items() if key not in self.exclude_params})
+        else:
+            selected = tuple(_freeze(params.get(key)) for key in self.key_params)
+        return (self.name, context.user_id, selected)
+
+    def rank(self, context: Context) -> List[Item]:
+        key = self.cache_key(context)
+        cached = self.cache.get(key)
+        if cached is None:
+            cached = self._rank_and_store(key, context)
+        return list(cached)
+
+    def rank_stream(self, context: Context) -> Iterator[Item]:
+        key = self.cache_key(context)
+        cached = self.cache.get(key)
+        if cached is None:
+            cached = self._rank_and_store(key, context)
+        return iter(cached)
+
+    def _rank_and_store(self, key: Hashable, context: Context) -> Tuple[Item, ...]:
+        items = tuple(self.ranker.rank(context))
+        self.cache.put(key, items)
+        return items
+
+def cached_rankers(
+    rankers: Dict[str, Ranker],
+    cache: Optional[RankingCache] = None,
+    key_params: Optional[Sequence[str]] = None,
+    exclude_params: Sequence[str] = PAGING_PARAMS,
+) -> Dict[str, CachedRanker]:
+    """ランカー名 -> Ranker の dict を、1つの RankingCache を共有する CachedRanker に包む"""
+    cache = cache if cache is not None else RankingCache()
+    return {name: CachedRanker(ranker, name, cache, key_params, exclude_params) for name, ranker in rankers.items()}
@@ -0,0 +1,204 @@
+
+import concurrent.futures
+import dataclasses
+import math
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Deque, List, Optional
+from src.config import ExperimentConfig
+from src.context import Context, Item
+from src.ranker.base import Ranker
+
+DEFAULT_WINDOW = 1024
+# パーセンタイルの再計算 (ソート) は record この回数ごとに1回にまとめる
+RECOMPUTE_EVERY = 32
+# ヘッジ用のスレッドプール。1回の rank で primary と hedge の2本を使い、
+# 負けた側は完了まで占有し続けるため、同時リクエスト数に対して余裕を持たせる
+DEFAULT_HEDGE_WORKERS = 8
+
+_pool_lock = threading.Lock()
+_hedge_pool: Optional[concurrent.futures.ThreadPoolExecutor] = None
+
+def get_hedge_pool(max_workers: int = DEFAULT_HEDGE_WORKERS) -> concurrent.futures.ThreadPoolExecutor:
+    """
+    ヘッジ実行用のスレッドプール (初回呼び出し時に生成)。
+    HedgedRanker 自体は ABExecutor の共有プールのスレッドで動くため、同じプールに投入すると
+    プールが埋まった場合にお互いを待ち合わせてしまう。そのため別のプールを使う。
+    """
+    global _hedge_pool
+    if _hedge_pool is None:
+        with _pool_lock:
+            if _hedge_pool is None:
+                _hedge_pool = concurrent.futures.ThreadPoolExecutor(
+                    max_workers=max_workers,
+                    thread_name_prefix="interleaving-hedge",
+                )
+    return _hedge_pool
+
+class LatencyHistogram:
+    """
+    ランカーの直近 window 回の所要時間 (ms) を保持し、パーセンタイルを返す。
+    record はロック内で deque に追加するだけで、ソートは percentile の呼び出し時に
+    RECOMPUTE_EVERY 回に1回まとめて行う (それまでは前回のソート結果を使う)。
+    """
+    def __init__(self, window: int = DEFAULT_WINDOW):
+        if window <= 0:
+            raise ValueError("window must be positive")
+        self._samples: Deque[float] = deque(maxlen=window)
+        self._sorted: List[float] = []
+        self._since_sort = 0
+        self._lock = threading.Lock()
+
+    def record(self, latency_ms: float) -> None:
+        with self._lock:
+            self._samples.append(latency_ms)
+            self._since_sort += 1
+
+    def percentile(self, q: float) -> Optional[float]:
+        """
+        直近の所要時間の q 分位点 (nearest-rank。0 < q <= 1)。記録が無ければ None。
+        件数が少ない間は毎回ソートし直す。
+        """
+        with self._lock:
+            if self._since_sort and (self._since_sort >= RECOMPUTE_EVERY or len(self._sorted) < RECOMPUTE_EVERY):
+                self._sorted = sorted(self._samples)
+                self._since_sort = 0
+            ordered = self._sorted
+        if not ordered:
+            return None
+        return ordered[min(len(ordered) - 1, max(0, math.ceil(q * len(ordered)) - 1))]
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._samples)
+
+@dataclass(frozen=True)
+class HedgePolicy:
+    """
+    ヘッジの方針。
+
+    - enabled: False の場合は呼び出しスレッドでそのまま実行する (所要時間の記録のみ行う)。
+    - delay_ms: 最初の呼び出しからヘッジを起動するまでの待ち時間。None の場合は
+      直近の所要時間の percentile 分位点 (記録が min_samples 件に満たない間は initial_delay_ms)。
+    - min_delay_ms: 自動で決めた待ち時間の下限 (速いランカーで常にヘッジが走るのを防ぐ)。
+    """
+    enabled: bool = True
+    delay_ms: Optional[float] = None
+    percentile: float = 0.95
+    initial_delay_ms: float = 100.0
+    min_samples: int = 50
+    min_delay_ms: float = 5.0
+
+    @classmethod
+    def from_config(cls, config: ExperimentConfig, base: Optional["HedgePolicy"] = None) -> "HedgePolicy":
+        """ExperimentConfig の hedge_* で base (省略時は既定値) を上書きした方針"""
+        return dataclasses.replace(
+            base or cls(),
+            enabled=config.hedge_enabled,
+            delay_ms=config.hedge_delay_ms,
+            percentile=config.hedge_percentile,
+        )
+
+@dataclass
+class HedgeStats:
+    calls: int = 0
+    hedges: int = 0  # ヘッジを起動した回数
+    hedge_wins: int = 0  # ヘッジ側の結果を返した回数
+
+    @property
+    def hedge_rate(self) -> float:
+        return self.hedges / self.calls if self.calls else 0.0
+
+class HedgedRanker(Ranker):
+    """
+    遅いランカー (通常は B) のテールレイテンシを抑えるためのラッパー。
+
+    rank はラップしたランカーの rank をヘッジ用のプールで実行し、HedgePolicy の待ち時間を過ぎても
+    完了しなければ同じ rank をもう1回起動して、先に成功した方の結果を返す。
+    負けた側の呼び出しは止められないため、完了まで実行され、所要時間だけが記録される。
+
+    - 所要時間 (成功した呼び出しのみ) は histogram に記録し、delay_ms=None の場合の待ち時間に使う。
+    - 先に完了した側が例外の場合はもう一方を待つ。両方失敗した場合は先に失敗した方の例外を送出する。
+      ヘッジを起動する前に最初の呼び出しが失敗した場合はそのまま送出する (リトライはしない)。
+    - ヘッジは同じ Context で logic_func をもう1回呼ぶため、副作用の無い (冪等な) ランカーにのみ使うこと。
+    """
+    def __init__(
+        self,
+        ranker: Ranker,
+        name: str = "B",
+        policy: Optional[HedgePolicy] = None,
+        histogram: Optional[LatencyHistogram] = None,
+        pool: Optional[concurrent.futures.Executor] = None,
+    ):
+        self.ranker = ranker
+        self.name = name
+        self.policy = policy or HedgePolicy()
+        self.histogram = histogram if histogram is not None else LatencyHistogram()
+        self._pool = pool
+        self._stats = HedgeStats()
+        self._stats_lock = threading.Lock()
+
+    def configure(self, config: ExperimentConfig) -> None:
+        """
+        リクエストごとに取得した ExperimentConfig の hedge_* を反映する
+        (方針の差し替えは属性の代入1回のため、実行中の rank には影響しない)。
+        """
+        policy = HedgePolicy.from_config(config, self.policy)
+        if policy != self.policy:
+            self.policy = policy
+
+    def hedge_delay_ms(self) -> float:
+        """現在の方針でのヘッジまでの待ち時間 (ms)"""
+        policy = self.policy
+        if policy.delay_ms is not None:
+            return policy.delay_ms
+        if len(self.histogram) < policy.min_samples:
+            return policy.initial_delay_ms
+        return max(policy.min_delay_ms, self.histogram.percentile(policy.percentile))
+
+    def rank(self, context: Context) -> List[Item]:
+        policy = self.policy
+        self._count(calls=1)
+        if not policy.enabled:
+            return self._timed_rank(context)
+
+        pool = self._pool or get_hedge_pool()
+        primary = pool.submit(self._timed_rank, context)
+        try:
+            return primary.result(timeout=self.hedge_delay_ms() / 1000.0)
+        except concurrent.futures.TimeoutError:
+            pass
+
+        hedge = pool.submit(self._timed_rank, context)
+        self._count(hedges=1)
+        pending = {primary, hedge}
+        error: Optional[BaseException] = None
+        while pending:
+            done, pending = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+            # 同時に完了した場合は最初の呼び出しを優先する
+            for future in sorted(done, key=lambda f: f is hedge):
+                if future.exception() is None:
+                    if future is hedge:
+                        self._count(hedge_wins=1)
+                    return future.result()
+                error = error or future.exception()
+        raise error
+
+    def _timed_rank(self, context: Context) -> List[Item]:
+        started_at = time.perf_counter()
+        items = self.ranker.rank(context)
+        self.histogram.record((time.perf_counter() - started_at) * 1000.0)
+        return items
+
+    def _count(self, calls: int = 0, hedges: int = 0, hedge_wins: int = 0) -> None:
+        with self._stats_lock:
+            self._stats.calls += calls
+            self._stats.hedges += hedges
+            self._stats.hedge_wins += hedge_wins
+
+    def stats(self) -> HedgeStats:
+        """カウンタのスナップショット"""
+        with self._stats_lock:
+            return HedgeStats(self._stats.calls, self._stats.hedges, self._stats.hedge_wins)
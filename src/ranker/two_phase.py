@@ -0,0 +1,115 @@
+
+import threading
+import weakref
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, Iterator, List, Mapping, Sequence, Tuple, Union
+from src.context import CandidateBlock, CompactItem, Context, ItemBatch
+from src.ranker.adapter import _context_dict
+from src.ranker.base import Ranker
+
+RetrieveFunc = Callable[[Dict[str, Any]], Union[CandidateBlock, Sequence[Mapping]]]
+ScoreFunc = Callable[[CandidateBlock], Any]
+
+class SharedRetriever:
+    """
+    2段階ランカーの前段 (候補の取得と特徴量の取得)。同じ Context オブジェクトに対する
+    retrieve は1回だけ実行し、A / B のスコアラーで結果 (CandidateBlock) を共有する。
+
+    retrieve_func は既存ロジックと同じく Context を dict にしたものを受け取り、
+    CandidateBlock か dict のリストを返す。dict のリストの場合は features に挙げたキーを
+    特徴量の列とした CandidateBlock に変換する。
+
+    - executor のスレッドから同時に呼ばれた場合、最初の呼び出しが retrieve_func を実行し、
+      残りはその完了を待って同じ結果を受け取る (例外も同じものを送出する)。
+    - 結果は Context オブジェクトが破棄されるまで保持する (リクエストを跨いでは共有しない)。
+      失敗した場合は保持しない (例外のトレースバックが Context を参照し続けて解放されなくなるため)。
+      失敗の後に同じ Context で呼ぶと retrieve_func を再実行する。
+    """
+    def __init__(self, retrieve_func: RetrieveFunc, features: Sequence[str] = ()):
+        self.retrieve_func = retrieve_func
+        self.features = tuple(features)
+        self.calls = 0  # retrieve_func を実行した回数
+        # Context は dataclass (eq=True) でハッシュできないため id() をキーにし、弱参照で同一性を確認する。
+        # 弱参照のコールバックは GC から任意のタイミングで呼ばれ得るため、再入可能なロックを使う
+        self._lock = threading.RLock()
+        self._entries: Dict[int, Tuple["weakref.ref[Context]", "Future[CandidateBlock]"]] = {}
+
+    def retrieve(self, context: Context) -> CandidateBlock:
+        key = id(context)
+        with self._lock:
+            entry = self._entries.get(key)
+            shared = entry[1] if entry is not None and entry[0]() is context else None
+            if shared is None:
+                future: "Future[CandidateBlock]" = Future()
+                ref = weakref.ref(context, lambda ref, key=key: self._discard(key, ref))
+                self._entries[key] = (ref, future)
+                self.calls += 1
+        if shared is not None:
+            # 他のスレッドが実行中 (または実行済み) の結果を待つ
+            return shared.result()
+
+        try:
+            block = self._load(context)
+        except BaseException as e:
+            # 実行中に待ち始めた呼び出しには future で同じ例外を渡し、エントリーは残さない
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry is not None and entry[1] is future:
+                    del self._entries[key]
+            future.set_exception(e)
+            raise
+        future.set_result(block)
+        return block
+
+    def _load(self, context: Context) -> CandidateBlock:
+        result = self.retrieve_func(_context_dict(context))
+        if isinstance(result, CandidateBlock):
+            return result
+        return CandidateBlock.from_records(result, self.features)
+
+    def _discard(self, key: int, ref: "weakref.ref[Context]") -> None:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] is ref:
+                del self._entries[key]
+
+    def __len__(self) -> int:
+        """保持している (Context が生きている) 結果の数"""
+        with self._lock:
+            return len(self._entries)
+
+class ScoringRanker(Ranker):
+    """
+    2段階ランカーの後段。SharedRetriever の CandidateBlock を score_func でスコアリングし、
+    スコア降順に並べたものをランキングとする。
+
+    score_func は CandidateBlock を受け取り、候補ごとのスコア (長さ len(block) の配列) を返す。
+    特徴量の配列は他のスコアラーと共有しているため読み取り専用で、書き換えると ValueError になる。
+    結果は CompactItem で、meta は retrieve が返した dict (dict のリストから作った場合) のビューになる。
+    """
+    def __init__(self, retriever: SharedRetriever, score_func: ScoreFunc):
+        self.retriever = retriever
+        self.score_func = score_func
+
+    def rank(self, context: Context) -> List[CompactItem]:
+        return self._batch(context).to_items()
+
+    def rank_stream(self, context: Context) -> Iterator[CompactItem]:
+        # スコアリングは候補全体に対してまとめて行い、CompactItem の生成だけを遅延させる
+        return iter(self._batch(context))
+
+    def _batch(self, context: Context) -> ItemBatch:
+        block = self.retriever.retrieve(context)
+        return block.to_batch(self.score_func(block))
+
+def two_phase_rankers(
+    retrieve_func: Union[RetrieveFunc, SharedRetriever],
+    scorers: Dict[str, ScoreFunc],
+    features: Sequence[str] = (),
+) -> Dict[str, ScoringRanker]:
+    """
+    1つの retrieve と、ランカー名 -> score_func の dict から、retrieve を共有する ScoringRanker の dict を作る。
+    ABExecutor.run(rankers["A"], rankers["B"], ...) や run_many にそのまま渡せる。
+    """
+    retriever = retrieve_func if isinstance(retrieve_func, SharedRetriever) else SharedRetriever(retrieve_func, features)
+    return {name: ScoringRanker(retriever, score_func) for name, score_func in scorers.items()}
@@ -0,0 +1,37 @@
+from typing import Iterable, List, Tuple
+
+# LEB128 (符号なし) の varint。バイナリ形式のランキングログとページングトークンで共有する
+
+def write_varints(values: Iterable[int]) -> bytes:
+    """非負の整数を順に varint に符号化して連結する"""
+    out = bytearray()
+    append = out.append
+    for value in values:
+        while value >= 0x80:
+            append((value & 0x7F) | 0x80)
+            value >>= 7
+        append(value)
+    return bytes(out)
+
+def read_varints(data: bytes, n: int, offset: int = 0) -> Tuple[List[int], int]:
+    """
+    data の offset から n 個の varint を読み、(値のリスト, 読み終えた位置) を返す。
+    途中で終わっている、または 64bit を超える場合は ValueError。
+    """
+    values = []
+    for _ in range(n):
+        value = 0
+        shift = 0
+        while True:
+            if offset >= len(data):
+                raise ValueError("truncated varint")
+            if shift > 63:
+                raise ValueError("varint exceeds 64 bits")
+            byte = data[offset]
+            offset += 1
+            value |= (byte & 0x7F) << shift
+            shift += 7
+            if byte < 0x80:
+                break
+        values.append(value)
+    return values, offset
@@ -0,0 +1,179 @@
+
+import gzip
+import io
+import json
+import pytest
+from src.evaluation.credit import (
+    RankingOutcome,
+    WinLossStats,
+    compute_credit,
+    compute_team_credit,
+    evaluate,
+    evaluate_multileave,
+    evaluate_files,
+    evaluate_shards,
+    iter_jsonl,
+    iter_record_batches,
+    join_in_memory,
+    join_sorted,
+)
+
+def _ranking(ranking_id: str, items, mode: str = "INTERLEAVE"):
+    return {
+        "event": "ranking_generated",
+        "ranking_id": ranking_id,
+        "mode": mode,
+        "items": [
+            {"id": item_id, "rank": i + 1, "source_ranker": source, "prob": prob}
+            for i, (item_id, source, prob) in enumerate(items)
+        ],
+    }
+
+TEAM_DRAFT_ITEMS = [("a1", "A", None), ("b1", "B", None), ("a2", "A", None)]
+
+def test_team_draft_credit_counts_clicks_per_team():
+    credit = compute_credit(_ranking("r1", TEAM_DRAFT_ITEMS)["items"], {"a1", "a2", "b1"})
+    assert credit == (2.0, 1.0, 3)
+
+def test_probability_weighted_credit_uses_inverse_prob():
+    items = _ranking("r1", [("a1", "A", 0.5), ("b1", "B", 0.25)])["items"]
+    
+    assert compute_credit(items, {"a1", "b1"}, weighting="probability") == (2.0, 4.0, 2)
+    # prob はステップの条件付き確率のため、auto では重み付けに使わない
+    assert compute_credit(items, {"a1", "b1"}) == (1.0, 1.0, 2)
+
+def test_optimized_rankings_use_delta_credit():
+    items = _ranking("r1", [("a1", "A", 0.5), ("b1", "B", 0.5), ("c", "B", 1.0)])["items"]
+    for item, delta in zip(items, [0.5, -0.75, 0.25]):
+        item["credit"] = delta
+    
+    # 表示したチームではなく δ の符号でクレジットを付ける (c は B が配置したが A のクレジット)
+    assert compute_credit(items, {"a1", "c"}) == (0.75, 0.0, 2)
+    assert compute_credit(items, {"a1", "b1"}) == (0.5, 0.75, 2)
+    assert compute_credit(items, {"a1", "b1", "c"}) == (0.75, 0.75, 3)
+    assert compute_credit(items, {"a1", "b1"}, weighting="team_draft") == (1.0, 1.0, 2)
+
+def test_clicks_on_unknown_items_are_ignored():
+    assert compute_credit(_ranking("r1", TEAM_DRAFT_ITEMS)["items"], {"zzz"}) == (0.0, 0.0, 0)
+
+def test_win_loss_stats_add_and_merge():
+    left = WinLossStats()
+    left.add(RankingOutcome("r1", 2.0, 1.0, 3))
+    left.add(RankingOutcome("r2", 0.0, 0.0, 0))
+    right = WinLossStats()
+    right.add(RankingOutcome("r3", 0.0, 1.0, 1))
+    right.add(RankingOutcome("r4", 1.0, 1.0, 2))
+    
+    merged = left.merge(right)
+    
+    assert merged.impressions == 4
+    assert (merged.wins_a, merged.wins_b, merged.ties) == (1, 1, 1)
+    assert merged.decided == 3
+    assert merged.preference == pytest.approx(0.0)
+
+def test_join_sorted_groups_clicks_by_ranking_id():
+    rankings = [_ranking("r1", TEAM_DRAFT_ITEMS), _ranking("r2", TEAM_DRAFT_ITEMS), _ranking("r3", TEAM_DRAFT_ITEMS)]
+    clicks = [
+        {"ranking_id": "r0", "item_id": "a1"},  # 対応するランキングなし
+        {"ranking_id": "r1", "item_id": "a1"},
+        {"ranking_id": "r1", "item_id": "b1"},
+        {"ranking_id": "r3", "item_id": "b1"},
+    ]
+    
+    joined = [(r["ranking_id"], c) for r, c in join_sorted(rankings, clicks)]
+    
+    assert joined == [("r1", {"a1", "b1"}), ("r2", set()), ("r3", {"b1"})]
+
+def test_join_in_memory_matches_sorted_join_on_unsorted_input():
+    rankings = [_ranking("r2", TEAM_DRAFT_ITEMS), _ranking("r1", TEAM_DRAFT_ITEMS)]
+    clicks = [{"ranking_id": "r1", "item_id": "a1"}, {"ranking_id": "r2", "item_id": "b1"}]
+    
+    joined = {r["ranking_id"]: c for r, c in join_in_memory(rankings, clicks)}
+    
+    assert joined == {"r1": {"a1"}, "r2": {"b1"}}
+
+def test_evaluate_only_counts_interleave_mode():
+    rankings = [_ranking("r1", TEAM_DRAFT_ITEMS), _ranking("r2", TEAM_DRAFT_ITEMS, mode="A")]
+    clicks = [{"ranking_id": "r1", "item_id": "a1"}, {"ranking_id": "r2", "item_id": "a1"}]
+    
+    stats = evaluate(join_sorted(rankings, clicks))
+    
+    assert stats.impressions == 1
+    assert stats.wins_a == 1
+
+def test_iter_jsonl_skips_non_json_lines():
+    source = io.StringIO('START RequestId: x\n{"a": 1}\n\n{"a": 2}\n')
+    assert list(iter_jsonl(source)) == [{"a": 1}, {"a": 2}]
+
+def test_iter_record_batches_flattens_batches():
+    class FakeBatch:
+        def __init__(self, rows):
+            self.rows = rows
+        
+        def to_pylist(self):
+            return self.rows
+    
+    rows = list(iter_record_batches([FakeBatch([{"x": 1}]), [{"x": 2}]]))
+    assert rows == [{"x": 1}, {"x": 2}]
+
+def _write_shard(tmp_path, name: str, rankings, clicks):
+    ranking_path = tmp_path / f"{name}_rankings.jsonl.gz"
+    with gzip.open(ranking_path, "wt", encoding="utf-8") as f:
+        for ranking in rankings:
+            f.write(json.dumps(ranking) + "\n")
+    click_path = tmp_path / f"{name}_clicks.jsonl"
+    click_path.write_text("".join(json.dumps(c) + "\n" for c in clicks))
+    return str(ranking_path), str(click_path)
+
+def test_evaluate_shards_merges_results(tmp_path):
+    shard_1 = _write_shard(
+        tmp_path, "s1",
+        [_ranking("r1", TEAM_DRAFT_ITEMS), _ranking("r2", TEAM_DRAFT_ITEMS)],
+        [{"ranking_id": "r1", "item_id": "a1"}, {"ranking_id": "r2", "item_id": "a2"}],
+    )
+    shard_2 = _write_shard(
+        tmp_path, "s2",
+        [_ranking("r3", TEAM_DRAFT_ITEMS)],
+        [{"ranking_id": "r3", "item_id": "b1"}],
+    )
+    
+    assert evaluate_files(*shard_1).wins_a == 2
+    
+    stats = evaluate_shards([shard_1, shard_2], max_workers=2)
+    assert (stats.impressions, stats.wins_a, stats.wins_b, stats.ties) == (3, 2, 1, 0)
+
+def test_team_credit_handles_any_number_of_teams():
+    items = _ranking("r1", [("a1", "A", None), ("c1", "C", None), ("d1", "D", None), ("c2", "C", None)])["items"]
+    
+    assert compute_team_credit(items, {"c1", "c2", "d1"}) == ({"C": 2.0, "D": 1.0}, 3)
+
+def test_evaluate_multileave_counts_pairwise_wins():
+    r1 = _ranking("r1", [("a1", "A", None), ("b1", "B", None), ("c1", "C", None)], mode="MULTILEAVE")
+    r1["rankers"] = ["A", "B", "C", "D"]
+    r2 = _ranking("r2", [("b2", "B", None), ("a2", "A", None)], mode="MULTILEAVE")
+    interleaved = _ranking("r3", TEAM_DRAFT_ITEMS)
+    joined = [(r1, {"b1"}), (r2, {"a2", "b2"}), (interleaved, {"a1"})]
+    
+    stats = evaluate_multileave(joined)
+    
+    # r1: B が A / C / D に勝ち、A-C, A-D, C-D は引き分け
+    assert stats.pairs[("A", "B")].wins_b == 1
+    assert stats.pairs[("B", "D")].wins_a == 1
+    assert stats.pairs[("C", "D")].ties == 1
+    # r2 はログに rankers が無いため items のチーム (A, B) のみ。A-B は引き分け
+    assert stats.pairs[("A", "B")].ties == 1
+    assert stats.pairs[("A", "B")].impressions == 2
+    assert ("A", "D") in stats.pairs and stats.pairs[("A", "D")].impressions == 1
+    
+    assert stats.pair("B", "A").wins_a == 1
+    assert stats.preference_matrix()[("B", "A")] > 0
+
+def test_multileave_stats_merge():
+    r1 = _ranking("r1", [("a1", "A", None), ("b1", "B", None)], mode="MULTILEAVE")
+    left = evaluate_multileave([(r1, {"a1"})])
+    right = evaluate_multileave([(r1, {"b1"})])
+    
+    merged = left.merge(right)
+    
+    assert merged.pairs[("A", "B")].wins_a == 1
+    assert merged.pairs[("A", "B")].wins_b == 1
@@ -0,0 +1,179 @@
+import random
+import numpy as np
+import pytest
+from src.evaluation.credit import compute_credit
+from src.evaluation.replay import (
+    CascadeModel,
+    DependentClickModel,
+    PositionBasedModel,
+    RandomClickModel,
+    ReplayQuery,
+    _encode,
+    _simulate,
+    expected_click_gap,
+    queries_from_logs,
+    replay,
+)
+from src.interleaving.batch import SOURCE_A, interleave_batch
+from src.interleaving.optimized import DEFAULT_DEPTH
+
+def _queries(n: int = 50, seed: int = 0, noise_a: float = 0.5, noise_b: float = 1.5):
+    rng = random.Random(seed)
+    queries = []
+    for _ in range(n):
+        items = [f"d{i}" for i in range(20)]
+        relevance = {item: (1.0 if rng.random() < 0.3 else 0.0) for item in items}
+        list_a = sorted(items, key=lambda item: -relevance[item] + rng.random() * noise_a)
+        list_b = sorted(items, key=lambda item: -relevance[item] + rng.random() * noise_b)
+        queries.append(ReplayQuery(list_a, list_b, relevance))
+    return queries
+
+@pytest.mark.parametrize("model", [PositionBasedModel(), CascadeModel(), DependentClickModel(continuation_default=0.7)])
+def test_click_model_sampling_matches_click_probabilities(model):
+    rng = np.random.default_rng(0)
+    attr = np.tile(np.array([0.9, 0.1, 0.5, 0.05, 0.7]), (20000, 1))
+
+    sampled = model.sample(attr, rng).mean(axis=0)
+
+    np.testing.assert_allclose(sampled, model.click_probabilities(attr)[0], atol=0.015)
+
+def test_cascade_model_clicks_at_most_once():
+    attr = np.full((1000, 10), 0.5)
+    assert CascadeModel().sample(attr, np.random.default_rng(0)).sum(axis=1).max() == 1
+
+def test_padding_is_never_clicked():
+    data = _encode([ReplayQuery(["a"], ["b"], {"a": 1.0, "b": 1.0})], k=3)
+    assert data.ids_a.shape[1] == 1
+    gap = expected_click_gap(data, PositionBasedModel(click_probs=(1.0, 1.0)), k=3)
+    assert gap == 0.0
+
+def _delta(item_id, list_a, list_b, size, tau):
+    # 各リストの先頭 size 件の中での順位 (含まれなければ件数 + 1) の差
+    top_a, top_b = list(list_a[:size]), list(list_b[:size])
+    rank_a = top_a.index(item_id) + 1 if item_id in top_a else len(top_a) + 1
+    rank_b = top_b.index(item_id) + 1 if item_id in top_b else len(top_b) + 1
+    return rank_a ** -tau - rank_b ** -tau
+
+def test_simulated_preference_matches_compute_credit():
+    # ベクトル化したクレジットの集計が、本番の集計 (compute_credit) と一致することを確認する
+    queries = _queries(n=5)
+    data = _encode(queries, k=10)
+    model = PositionBasedModel()
+    for spec in ({"method": "team_draft"}, {"method": "optimized"}):
+        preference, mean_credit = _simulate(data, spec, model, seed=3, sample_sizes=[300], k=10)[:, 0]
+
+        rng = np.random.default_rng(3)
+        rows = rng.integers(len(data.ids_a), size=300)
+        row_seeds = rng.integers(0, 2 ** 31 - 1, size=300)
+        batch = interleave_batch(data.ids_a[rows], data.ids_b[rows], row_seeds.tolist(), k=10, **spec)
+        clicks = model.sample(np.where(batch.ids >= 0, model.attractiveness(data.relevance[batch.ids]), 0.0), rng)
+        wins_a = ties = decided = 0
+        total = 0.0
+        for row in range(300):
+            n = int(batch.lengths[row])
+            items = [
+                {
+                    "id": int(batch.ids[row, i]),
+                    "source_ranker": "A" if batch.sources[row, i] == SOURCE_A else "B",
+                    "prob": None if np.isnan(batch.probs[row, i]) else float(batch.probs[row, i]),
+                }
+                for i in range(n)
+            ]
+            if spec["method"] == "optimized":
+                # 本番のログと同じく、各アイテムに OptimizedInterleaver と同じ δ を付与する
+                list_a, list_b = data.ids_a[rows[row]].tolist(), data.ids_b[rows[row]].tolist()
+                for item in items:
+                    item["credit"] = _delta(item["id"], list_a, list_b, min(10, DEFAULT_DEPTH), 1.0)
+            clicked = {int(batch.ids[row, i]) for i in range(n) if clicks[row, i]}
+            credit_a, credit_b, n_clicks = compute_credit(items, clicked)
+            total += credit_a - credit_b
+            if n_clicks:
+                decided += 1
+                wins_a += credit_a > credit_b
+                ties += credit_a == credit_b
+        assert preference == pytest.approx((wins_a + 0.5 * ties) / decided - 0.5)
+        assert mean_credit == pytest.approx(total / 300)
+
+def test_optimized_credit_is_unbiased_beyond_one_block():
+    # 重複構造が偏ったリスト (B の上位 2 件のみ A と共通) を 12 件まで表示しても、
+    # ランダムなクリックに対するクレジットの差の期待値は 0
+    list_a = [f"a{i}" for i in range(12)]
+    list_b = ["a5", "a3"] + [f"b{i}" for i in range(10)]
+    result = replay(
+        [ReplayQuery(list_a, list_b)], methods={"optimized": {"method": "optimized"}}, click_models=[],
+        seeds=range(10), sample_sizes=(5000,), k=12, max_workers=1,
+    )
+
+    bias = result.bias[0]
+    assert bias.credit_stderr > 0
+    assert abs(bias.mean_credit) < 4 * bias.credit_stderr + 0.002
+
+def test_replay_detects_known_gap_and_reports_bias():
+    result = replay(
+        _queries(), methods={"team_draft": {"method": "team_draft"}}, click_models=[PositionBasedModel()],
+        seeds=range(10), sample_sizes=(50, 3000), max_workers=1,
+    )
+
+    report = result.sensitivity[0]
+    assert (report.method, report.click_model) == ("team_draft", "pbm")
+    assert report.true_gap > 0
+    assert report.accuracy[3000] == 1.0
+    assert report.samples_needed in (50, 3000)
+    assert report.mean_preference > 0
+
+    bias = result.bias[0]
+    assert bias.click_model == "random"
+    assert abs(bias.mean_preference) < 4 * bias.stderr + 0.01
+
+def test_swapping_a_and_b_flips_the_preference():
+    queries = _queries()
+    swapped = [ReplayQuery(q.list_b, q.list_a, q.relevance) for q in queries]
+    kwargs = dict(methods={"td": {"method": "team_draft"}}, click_models=[PositionBasedModel()], seeds=range(5), sample_sizes=(2000,), max_workers=1)
+
+    forward = replay(queries, **kwargs).sensitivity[0]
+    backward = replay(swapped, **kwargs).sensitivity[0]
+
+    assert backward.true_gap == pytest.approx(-forward.true_gap)
+    assert forward.mean_preference > 0 > backward.mean_preference
+
+def test_no_gap_has_no_accuracy():
+    query = ReplayQuery(["a", "b"], ["b", "a"], {"a": 1.0, "b": 1.0})
+    result = replay([query], methods={"td": {"method": "team_draft"}}, click_models=[RandomClickModel()],
+                    seeds=range(2), sample_sizes=(10,), max_workers=1)
+
+    assert result.sensitivity[0].accuracy == {}
+    assert result.sensitivity[0].samples_needed is None
+
+def test_process_pool_matches_inline_run():
+    kwargs = dict(
+        methods={"td": {"method": "team_draft"}, "opt3": {"method": "optimized", "tau": 3.0}},
+        click_models=[DependentClickModel()], seeds=range(3), sample_sizes=(100, 200),
+    )
+    queries = _queries(n=10)
+
+    assert replay(queries, max_workers=2, **kwargs) == replay(queries, max_workers=1, **kwargs)
+
+def test_queries_from_logs():
+    ranking = {
+        "ranking_id": "r1",
+        "mode": "INTERLEAVE",
+        "items": [
+            {"id": "a1", "source_ranker": "A"},
+            {"id": "b1", "source_ranker": "B"},
+            {"id": "a2", "source_ranker": "A"},
+        ],
+    }
+    a_only = {"ranking_id": "r2", "mode": "A", "items": [{"id": "x", "source_ranker": None}]}
+
+    queries = queries_from_logs([(ranking, {"b1"}), (a_only, set())])
+    assert len(queries) == 1
+    assert queries[0].list_a == ["a1", "a2"]
+    assert queries[0].list_b == ["b1"]
+    assert queries[0].relevance == {"b1": 1.0}
+
+    reranked = queries_from_logs([(a_only, {"x"})], rerank_b=lambda r: ["y", "x"])
+    assert (reranked[0].list_a, reranked[0].list_b) == (["x"], ["y", "x"])
+
+def test_replay_rejects_empty_queries():
+    with pytest.raises(ValueError):
+        replay([])
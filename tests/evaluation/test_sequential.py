@@ -0,0 +1,90 @@
+
+import random
+import pytest
+from src.evaluation.credit import RankingOutcome, WinLossStats
+from src.evaluation.sequential import (
+    DECISION_A,
+    DECISION_B,
+    DECISION_CONTINUE,
+    DECISION_NO_DIFFERENCE,
+    SequentialTest,
+)
+
+def _simulate(p_a: float, n: int, seed: int, **kwargs) -> SequentialTest:
+    rng = random.Random(seed)
+    test = SequentialTest(**kwargs)
+    for _ in range(n):
+        test.update(1 if rng.random() < p_a else -1)
+        if test.decision().stop:
+            break
+    return test
+
+def test_update_counts_preferences():
+    test = SequentialTest()
+    for preference in [1, 1, -1, 0]:
+        test.update(preference)
+    
+    assert (test.wins_a, test.wins_b, test.ties) == (2, 1, 1)
+    assert test.samples == 3
+
+def test_update_outcome_ignores_rankings_without_clicks():
+    test = SequentialTest()
+    test.update_outcome(RankingOutcome("r1", 1.0, 0.0, 1))
+    test.update_outcome(RankingOutcome("r2", 0.0, 0.0, 0))
+    test.update_outcome(RankingOutcome("r3", 1.0, 1.0, 2))
+    
+    assert (test.wins_a, test.wins_b, test.ties) == (1, 0, 1)
+
+def test_merge_equals_sequential_updates():
+    left = SequentialTest(wins_a=10, wins_b=4, ties=2)
+    right = SequentialTest(wins_a=3, wins_b=7, ties=1)
+    merged = left.merge(right)
+    
+    combined = SequentialTest(wins_a=13, wins_b=11, ties=3)
+    assert merged.log_likelihood_ratio() == pytest.approx(combined.log_likelihood_ratio())
+    
+    from_stats = SequentialTest()
+    from_stats.update_stats(WinLossStats(wins_a=13, wins_b=11, ties=3))
+    assert (from_stats.wins_a, from_stats.wins_b, from_stats.ties) == (13, 11, 3)
+
+def test_stops_with_a_when_a_is_better():
+    test = _simulate(p_a=0.6, n=20000, seed=1)
+    decision = test.decision()
+    
+    assert decision.decision == DECISION_A
+    assert decision.p_value <= 0.05
+    assert test.recommended_mode() == "A"
+
+def test_stops_with_b_when_b_is_better():
+    test = _simulate(p_a=0.4, n=20000, seed=2)
+    assert test.decision().decision == DECISION_B
+    assert test.recommended_mode() == "B"
+
+def test_continues_before_min_samples():
+    test = SequentialTest(min_samples=100, wins_a=50, wins_b=0)
+    assert test.decision().decision == DECISION_CONTINUE
+    assert test.recommended_mode() is None
+
+def test_max_samples_gives_no_difference():
+    test = SequentialTest(max_samples=1000, wins_a=500, wins_b=500)
+    assert test.decision().decision == DECISION_NO_DIFFERENCE
+    assert test.recommended_mode() == "A"
+
+def test_false_positive_rate_under_null_is_controlled():
+    # 毎回覗いて止めても、差が無い場合に止まる割合は alpha 以下に収まること
+    runs = 200
+    false_stops = sum(_simulate(p_a=0.5, n=2000, seed=seed).decision().stop for seed in range(runs))
+    assert false_stops / runs <= 0.05
+
+@pytest.mark.parametrize("wins_a, samples, expected", [
+    (5, 10, 1.0),
+    (9, 10, 0.021484375),
+    (0, 0, 1.0),
+])
+def test_sign_test_p_value(wins_a, samples, expected):
+    test = SequentialTest(wins_a=wins_a, wins_b=samples - wins_a)
+    assert test.sign_test_p_value() == pytest.approx(expected)
+
+def test_sign_test_normal_approximation_for_large_samples():
+    test = SequentialTest(wins_a=5100, wins_b=4900)
+    assert test.sign_test_p_value() == pytest.approx(0.0466, abs=1e-3)
@@ -0,0 +1,189 @@
+import asyncio
+import json
+import logging
+import threading
+import time
+import pytest
+from src.config import ExperimentConfig
+from src.context import Context, Item
+from src.execution.aio import AsyncABExecutor, interleave_async
+from src.execution.executor import DEFAULT_CHALLENGER_SLOTS
+from src.ranker.adapter import AsyncLambdaRankerAdapter
+
+class AsyncStubRanker:
+    def __init__(self, prefix: str, delay: float = 0.0, error: bool = False, count: int = 1):
+        self.prefix = prefix
+        self.delay = delay
+        self.error = error
+        self.count = count
+        self.cancelled = False
+        self.finished = False
+
+    async def rank(self, context: Context):
+        try:
+            await asyncio.sleep(self.delay)
+        except asyncio.CancelledError:
+            self.cancelled = True
+            raise
+        if self.error:
+            raise RuntimeError("ranker failed")
+        self.finished = True
+        return [Item(id=f"{self.prefix}{i}", score=1.0) for i in range(self.count)]
+
+class SyncStubRanker:
+    def rank(self, context: Context):
+        time.sleep(0.01)
+        return [Item(id="S1", score=1.0)]
+
+@pytest.fixture
+def ctx():
+    return Context(user_id="user1", user_hash=1)
+
+@pytest.fixture
+def parallel_config():
+    return ExperimentConfig(mode="INTERLEAVE", sampling_rate=1.0, parallel_enabled=True)
+
+def test_runs_a_and_b_concurrently(ctx, parallel_config):
+    executor = AsyncABExecutor()
+    started = time.perf_counter()
+
+    result = asyncio.run(executor.run(AsyncStubRanker("A", 0.05), AsyncStubRanker("B", 0.05), ctx, parallel_config))
+
+    assert time.perf_counter() - started < 0.09
+    assert [item.id for item in result.list_a] == ["A0"]
+    assert [item.id for item in result.list_b] == ["B0"]
+    assert not result.degraded
+
+def test_sequential_when_parallel_disabled(ctx):
+    config = ExperimentConfig(mode="INTERLEAVE", sampling_rate=1.0, parallel_enabled=False)
+    started = time.perf_counter()
+
+    result = asyncio.run(AsyncABExecutor().run(AsyncStubRanker("A", 0.03), AsyncStubRanker("B", 0.03), ctx, config))
+
+    assert time.perf_counter() - started >= 0.06
+    assert result.list_b is not None
+
+def test_b_timeout_cancels_b_and_degrades(ctx, parallel_config, caplog):
+    ranker_b = AsyncStubRanker("B", delay=1.0)
+    executor = AsyncABExecutor(timeout_b=0.05)
+
+    with caplog.at_level(logging.WARNING, logger="interleaving"):
+        result = asyncio.run(executor.run(AsyncStubRanker("A"), ranker_b, ctx, parallel_config))
+
+    assert result.degraded and result.reason == "timeout"
+    assert result.list_b is None
+    assert ranker_b.cancelled
+    event = json.loads(caplog.records[-1].getMessage())
+    assert event["event"] == "ranker_degraded" and event["reason"] == "timeout"
+
+def test_b_error_degrades(ctx, parallel_config):
+    result = asyncio.run(AsyncABExecutor().run(AsyncStubRanker("A"), AsyncStubRanker("B", error=True), ctx, parallel_config))
+
+    assert result.degraded and result.reason == "error"
+
+def test_a_error_cancels_b_and_is_raised(ctx, parallel_config):
+    ranker_b = AsyncStubRanker("B", delay=1.0)
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(AsyncABExecutor().run(AsyncStubRanker("A", error=True), ranker_b, ctx, parallel_config))
+
+    assert ranker_b.cancelled
+
+def test_a_timeout_is_raised(ctx, parallel_config):
+    with pytest.raises(asyncio.TimeoutError):
+        asyncio.run(AsyncABExecutor(timeout_a=0.01).run(AsyncStubRanker("A", delay=1.0), AsyncStubRanker("B"), ctx, parallel_config))
+
+def test_caller_cancellation_cancels_both(ctx, parallel_config):
+    ranker_a = AsyncStubRanker("A", delay=1.0)
+    ranker_b = AsyncStubRanker("B", delay=1.0)
+
+    async def main():
+        task = asyncio.ensure_future(AsyncABExecutor().run(ranker_a, ranker_b, ctx, parallel_config))
+        await asyncio.sleep(0.01)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(main())
+    assert ranker_a.cancelled and ranker_b.cancelled
+
+def test_slower_side_is_cancelled_when_a_covers_the_page(ctx, parallel_config):
+    ranker_b = AsyncStubRanker("B", delay=1.0)
+    executor = AsyncABExecutor(cover_grace=0.02)
+    started = time.perf_counter()
+
+    result = asyncio.run(executor.run(AsyncStubRanker("A", count=10), ranker_b, ctx, parallel_config, k=10))
+
+    assert time.perf_counter() - started < 0.5
+    assert result.degraded and result.reason == "covered"
+    assert ranker_b.cancelled
+
+def test_b_is_awaited_when_a_does_not_cover_the_page(ctx, parallel_config):
+    executor = AsyncABExecutor(cover_grace=0.01)
+
+    result = asyncio.run(executor.run(AsyncStubRanker("A", count=3), AsyncStubRanker("B", delay=0.05), ctx, parallel_config, k=10))
+
+    assert not result.degraded
+
+def test_sync_rankers_run_in_shared_pool(ctx, parallel_config):
+    result = asyncio.run(AsyncABExecutor().run(SyncStubRanker(), AsyncStubRanker("B"), ctx, parallel_config))
+
+    assert [item.id for item in result.list_a] == ["S1"]
+
+def test_hanging_sync_b_is_bounded_by_challenger_slots(ctx, parallel_config):
+    release = threading.Event()
+
+    class HangingRanker:
+        def rank(self, context: Context):
+            release.wait(5.0)
+            return [Item(id="B1", score=1.0)]
+
+    executor = AsyncABExecutor(timeout_a=1.0, timeout_b=0.01)
+    try:
+        reasons = [
+            asyncio.run(executor.run(SyncStubRanker(), HangingRanker(), ctx, parallel_config)).reason
+            for _ in range(DEFAULT_CHALLENGER_SLOTS + 2)
+        ]
+    finally:
+        release.set()
+
+    assert set(reasons) == {"timeout", "saturated"}
+    assert reasons[DEFAULT_CHALLENGER_SLOTS:] == ["saturated"] * 2
+
+def test_run_many_excludes_slow_and_failing_rankers(ctx, parallel_config):
+    slow = AsyncStubRanker("C", delay=1.0)
+    rankers = [AsyncStubRanker("A"), AsyncStubRanker("B", error=True), slow, AsyncStubRanker("D")]
+    executor = AsyncABExecutor(timeout_b=0.05)
+
+    result = asyncio.run(executor.run_many(rankers, ["A", "B", "C", "D"], ctx, parallel_config))
+
+    assert list(result.lists) == ["A", "D"]
+    assert result.degraded == {"B": "error", "C": "timeout"}
+    assert slow.cancelled
+
+def test_interleave_async_feeds_existing_interleaver(ctx, parallel_config):
+    async def logic_a(ctx_dict):
+        await asyncio.sleep(0)
+        return [{"id": f"a{i}", "score": 10 - i} for i in range(5)]
+
+    async def logic_b(ctx_dict):
+        for i in range(5):
+            await asyncio.sleep(0)
+            yield {"id": f"b{i}", "score": 10 - i, "extra": ctx_dict["user_id"]}
+
+    outcome = asyncio.run(interleave_async(
+        AsyncLambdaRankerAdapter(logic_a), AsyncLambdaRankerAdapter(logic_b), ctx, parallel_config, k=6,
+    ))
+
+    assert outcome.mode == "INTERLEAVE"
+    assert len(outcome.items) == 6
+    assert {item.source_ranker for item in outcome.items} == {"A", "B"}
+    assert outcome.ab_result.list_b[0].meta == {"extra": "user1"}
+
+def test_interleave_async_serves_a_when_b_degrades(ctx, parallel_config):
+    outcome = asyncio.run(interleave_async(
+        AsyncStubRanker("A", count=5), AsyncStubRanker("B", error=True), ctx, parallel_config, k=3,
+    ))
+
+    assert outcome.mode == "A"
+    assert [item.id for item in outcome.items] == ["A0", "A1", "A2"]
@@ -0,0 +1,160 @@
+
+import json
+import logging
+import threading
+import time
+import pytest
+from src.config import ExperimentConfig
+from src.context import Context, Item
+from src.execution.executor import DEFAULT_CHALLENGER_SLOTS, ABExecutor, get_shared_pool
+
+class StubRanker:
+    def __init__(self, prefix: str, delay: float = 0.0, error: bool = False):
+        self.prefix = prefix
+        self.delay = delay
+        self.error = error
+        self.thread_names = []
+
+    def rank(self, context: Context):
+        self.thread_names.append(threading.current_thread().name)
+        if self.delay:
+            time.sleep(self.delay)
+        if self.error:
+            raise RuntimeError("ranker failed")
+        return [Item(id=f"{self.prefix}1", score=1.0)]
+
+@pytest.fixture
+def ctx():
+    return Context(user_id="user1", user_hash=1)
+
+@pytest.fixture
+def parallel_config():
+    return ExperimentConfig(mode="INTERLEAVE", sampling_rate=1.0, parallel_enabled=True)
+
+@pytest.fixture
+def sequential_config():
+    return ExperimentConfig(mode="INTERLEAVE", sampling_rate=1.0, parallel_enabled=False)
+
+def test_parallel_returns_both_lists(ctx, parallel_config):
+    result = ABExecutor().run(StubRanker("a"), StubRanker("b"), ctx, parallel_config)
+    
+    assert [i.id for i in result.list_a] == ["a1"]
+    assert [i.id for i in result.list_b] == ["b1"]
+    assert result.degraded is False
+
+def test_parallel_uses_shared_pool_across_calls(ctx, parallel_config):
+    ranker_a = StubRanker("a")
+    ABExecutor().run(ranker_a, StubRanker("b"), ctx, parallel_config)
+    ABExecutor().run(ranker_a, StubRanker("b"), ctx, parallel_config)
+    
+    assert get_shared_pool() is get_shared_pool()
+    assert all(name.startswith("interleaving") for name in ranker_a.thread_names)
+
+def test_sequential_runs_in_calling_thread(ctx, sequential_config):
+    ranker_a = StubRanker("a")
+    ranker_b = StubRanker("b")
+    result = ABExecutor().run(ranker_a, ranker_b, ctx, sequential_config)
+    
+    current = threading.current_thread().name
+    assert ranker_a.thread_names == [current]
+    assert ranker_b.thread_names == [current]
+    assert result.list_b is not None
+
+def test_b_timeout_degrades_to_a_only(ctx, parallel_config, caplog):
+    executor = ABExecutor(timeout_b=0.05)
+    
+    started = time.monotonic()
+    with caplog.at_level(logging.WARNING, logger="interleaving"):
+        result = executor.run(StubRanker("a"), StubRanker("b", delay=0.5), ctx, parallel_config)
+    elapsed = time.monotonic() - started
+    
+    assert elapsed < 0.4
+    assert result.degraded is True
+    assert result.reason == "timeout"
+    assert result.list_b is None
+    assert [i.id for i in result.list_a] == ["a1"]
+    
+    events = [json.loads(r.getMessage()) for r in caplog.records]
+    assert events[-1]["event"] == "ranker_degraded"
+    assert events[-1]["ranker"] == "B"
+    assert events[-1]["reason"] == "timeout"
+
+@pytest.mark.parametrize("config_name", ["parallel_config", "sequential_config"])
+def test_b_error_degrades_to_a_only(ctx, config_name, request):
+    config = request.getfixturevalue(config_name)
+    result = ABExecutor().run(StubRanker("a"), StubRanker("b", error=True), ctx, config)
+    
+    assert result.degraded is True
+    assert result.reason == "error"
+    assert result.list_b is None
+
+class HangingRanker:
+    def __init__(self, release: threading.Event):
+        self.release = release
+
+    def rank(self, context: Context):
+        self.release.wait(5.0)
+        return [Item(id="b1", score=1.0)]
+
+def test_hanging_b_cannot_starve_a(ctx, parallel_config):
+    release = threading.Event()
+    executor = ABExecutor(timeout_a=1.0, timeout_b=0.01)
+    try:
+        results = [
+            executor.run(StubRanker("a"), HangingRanker(release), ctx, parallel_config)
+            for _ in range(DEFAULT_CHALLENGER_SLOTS + 4)
+        ]
+        
+        assert all([i.id for i in r.list_a] == ["a1"] for r in results)
+        # 他のテストの遅い B がまだ枠を持っている場合があるため、先頭の "timeout" の数は固定しない
+        assert {r.reason for r in results} == {"timeout", "saturated"}
+        assert [r.reason for r in results[DEFAULT_CHALLENGER_SLOTS:]] == ["saturated"] * 4
+        
+        result = executor.run_many([StubRanker("a"), StubRanker("b")], ["A", "B"], ctx, parallel_config)
+        assert result.degraded == {"B": "saturated"}
+    finally:
+        release.set()
+    
+    deadline = time.monotonic() + 5.0
+    while True:
+        result = executor.run(StubRanker("a"), StubRanker("b"), ctx, parallel_config)
+        if not result.degraded or time.monotonic() > deadline:
+            break
+        time.sleep(0.01)
+    assert result.degraded is False
+
+def test_a_error_is_raised(ctx, parallel_config):
+    with pytest.raises(RuntimeError):
+        ABExecutor().run(StubRanker("a", error=True), StubRanker("b"), ctx, parallel_config)
+
+@pytest.mark.parametrize("config_name", ["parallel_config", "sequential_config"])
+def test_run_many_returns_lists_in_ranker_order(ctx, config_name, request):
+    config = request.getfixturevalue(config_name)
+    rankers = [StubRanker(prefix) for prefix in "abcd"]
+    
+    result = ABExecutor().run_many(rankers, ["A", "B", "C", "D"], ctx, config)
+    
+    assert list(result.lists) == ["A", "B", "C", "D"]
+    assert [items[0].id for items in result.lists.values()] == ["a1", "b1", "c1", "d1"]
+    assert result.degraded == {}
+
+def test_run_many_excludes_slow_and_failing_rankers(ctx, parallel_config, caplog):
+    rankers = [StubRanker("a"), StubRanker("b", delay=0.5), StubRanker("c", error=True), StubRanker("d")]
+    
+    started = time.monotonic()
+    with caplog.at_level(logging.WARNING, logger="interleaving"):
+        result = ABExecutor(timeout_b=0.05).run_many(rankers, ["A", "B", "C", "D"], ctx, parallel_config)
+    
+    assert time.monotonic() - started < 0.4
+    assert list(result.lists) == ["A", "D"]
+    assert result.degraded == {"B": "timeout", "C": "error"}
+    events = [json.loads(r.getMessage()) for r in caplog.records]
+    assert {(e["ranker"], e["reason"]) for e in events if e["event"] == "ranker_degraded"} == {("B", "timeout"), ("C", "error")}
+
+def test_run_many_raises_baseline_error(ctx, parallel_config):
+    with pytest.raises(RuntimeError):
+        ABExecutor().run_many([StubRanker("a", error=True), StubRanker("b")], ["A", "B"], ctx, parallel_config)
+
+def test_run_many_rejects_mismatched_names(ctx, parallel_config):
+    with pytest.raises(ValueError):
+        ABExecutor().run_many([StubRanker("a")], ["A", "B"], ctx, parallel_config)
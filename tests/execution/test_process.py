@@ -0,0 +1,157 @@
+import os
+import time
+import pytest
+from src.config import ExperimentConfig
+from src.context import Context, Item
+from src.execution import process
+from src.execution.executor import ABExecutor
+from src.observability.tracing import configure_tracing, finish_trace, start_trace
+from src.ranker.adapter import LambdaRankerAdapter
+
+# ワーカープロセスに送るロジックはモジュールレベルの関数にする (pickle できる必要がある)
+def logic_a(ctx):
+    return [{'id': f'a{i}', 'score': 100.0 - i, 'pid': os.getpid()} for i in range(50)]
+
+def logic_b(ctx):
+    return [{'id': f'ü{i}', 'score': 50.0 - i, 'pid': os.getpid()} for i in range(30)]
+
+def slow_logic(ctx):
+    time.sleep(1.0)
+    return []
+
+def failing_logic(ctx):
+    raise RuntimeError("ranker failed")
+
+@pytest.fixture(scope="module", autouse=True)
+def process_pool():
+    yield
+    process.shutdown_process_pool()
+
+@pytest.fixture
+def multi_cpu(monkeypatch):
+    monkeypatch.setattr(process, "available_cpus", lambda: 2)
+
+@pytest.fixture
+def ctx():
+    return Context(user_id="user1", user_hash=1)
+
+@pytest.fixture
+def process_config():
+    return ExperimentConfig(mode="INTERLEAVE", sampling_rate=1.0, parallel_enabled=True, execution_backend="process")
+
+def test_encode_decode_round_trip_through_shared_memory():
+    items = [
+        Item(id="a", score=1.5, meta={"x": 1}, original_rank=1, prob=0.25, source_ranker="A", credit=-0.5),
+        Item(id="日本語", score=-2.0, source_ranker="ランカー"),
+        Item(id="", score=0.0, original_rank=0),
+    ]
+
+    decoded = process.decode_items(*process.encode_items(items))
+
+    assert decoded == items
+    assert process.decode_items(*process.encode_items([])) == []
+
+def test_meta_can_be_dropped_explicitly():
+    name, size, metas = process.encode_items([Item(id="a", score=1.0, original_rank=3, meta={"x": 1})], with_meta=False)
+
+    assert metas is None
+    decoded = process.decode_items(name, size, metas)[0]
+    assert decoded.meta == {}
+    assert decoded.original_rank == 3
+
+def test_process_backend_runs_rankers_in_worker_processes(ctx, process_config, multi_cpu):
+    result = ABExecutor().run(LambdaRankerAdapter(logic_a), LambdaRankerAdapter(logic_b), ctx, process_config)
+
+    assert [item.id for item in result.list_a] == [f"a{i}" for i in range(50)]
+    assert [item.id for item in result.list_b] == [f"ü{i}" for i in range(30)]
+    assert result.list_b[0].score == 50.0
+    pids = {result.list_a[0].meta["pid"], result.list_b[0].meta["pid"]}
+    assert os.getpid() not in pids
+    # ワーカーは呼び出しを跨いで使い回される
+    again = ABExecutor().run(LambdaRankerAdapter(logic_a), LambdaRankerAdapter(logic_b), ctx, process_config)
+    assert {again.list_a[0].meta["pid"], again.list_b[0].meta["pid"]} <= set(pid for pid in _worker_pids())
+
+def _worker_pids():
+    return [p.pid for p in process.get_process_pool()._processes.values()]
+
+def test_process_backend_degrades_on_b_error_and_timeout(ctx, process_config, multi_cpu):
+    result = ABExecutor().run(LambdaRankerAdapter(logic_a), LambdaRankerAdapter(failing_logic), ctx, process_config)
+    assert result.degraded and result.reason == "error"
+
+    result = ABExecutor(timeout_b=0.1).run(LambdaRankerAdapter(logic_a), LambdaRankerAdapter(slow_logic), ctx, process_config)
+    assert result.degraded and result.reason == "timeout"
+
+def test_unpicklable_ranker_falls_back_to_thread(ctx, process_config, multi_cpu):
+    ranker_b = LambdaRankerAdapter(lambda c: [{'id': 'b', 'score': 1.0, 'pid': os.getpid()}])
+
+    result = ABExecutor().run(LambdaRankerAdapter(logic_a), ranker_b, ctx, process_config)
+
+    assert result.list_b[0].meta["pid"] == os.getpid()
+    assert result.list_a[0].meta["pid"] != os.getpid()
+
+def test_process_backend_drops_meta_only_when_opted_out(ctx, process_config, multi_cpu):
+    result = ABExecutor(process_meta=False).run(LambdaRankerAdapter(logic_a), LambdaRankerAdapter(logic_b), ctx, process_config)
+
+    assert [item.id for item in result.list_a] == [f"a{i}" for i in range(50)]
+    assert result.list_a[0].meta == {} and result.list_b[0].meta == {}
+
+def test_picklability_is_checked_once_per_ranker(monkeypatch):
+    calls = []
+    dumps = process.pickle.dumps
+    monkeypatch.setattr(process.pickle, "dumps", lambda obj: calls.append(type(obj)) or dumps(obj))
+    ranker = LambdaRankerAdapter(logic_a)
+    unpicklable = LambdaRankerAdapter(lambda c: [])
+
+    assert all(process.is_picklable(ranker) for _ in range(3))
+    assert not any(process.is_picklable(unpicklable) for _ in range(3))
+    assert len(calls) == 2
+    # 破棄されたランカーの結果は残らない
+    key = id(ranker)
+    del ranker
+    assert key not in process._picklable
+
+def test_unavailable_process_pool_falls_back_to_threads(ctx, process_config, multi_cpu, monkeypatch, caplog):
+    process.shutdown_process_pool()
+    attempts = []
+
+    def fail(workers):
+        attempts.append(workers)
+        raise OSError(38, "Function not implemented")
+
+    monkeypatch.setattr(process, "_create_process_pool", fail)
+    try:
+        with caplog.at_level("WARNING"):
+            for _ in range(3):
+                result = ABExecutor().run(LambdaRankerAdapter(logic_a), LambdaRankerAdapter(logic_b), ctx, process_config)
+                assert result.list_a[0].meta["pid"] == os.getpid()
+                assert not result.degraded
+        # 失敗は覚えておき、生成の再試行も警告も1回だけ
+        assert len(attempts) == 1
+        assert len([r for r in caplog.records if "process_pool_unavailable" in r.getMessage()]) == 1
+    finally:
+        process.shutdown_process_pool()
+
+def test_single_cpu_falls_back_to_threads(ctx, process_config, monkeypatch):
+    monkeypatch.setattr(process, "available_cpus", lambda: 1)
+
+    result = ABExecutor().run(LambdaRankerAdapter(logic_a), LambdaRankerAdapter(logic_b), ctx, process_config)
+
+    assert result.list_a[0].meta["pid"] == os.getpid()
+
+def test_process_backend_records_ranker_timings(ctx, process_config, multi_cpu):
+    configure_tracing()
+    try:
+        trace = start_trace()
+        ABExecutor().run(LambdaRankerAdapter(logic_a), LambdaRankerAdapter(logic_b), ctx, process_config)
+        assert {"ranker_a", "ranker_b", "rank"} <= set(trace.stages)
+    finally:
+        finish_trace()
+        configure_tracing(enabled=False)
+
+def test_run_many_uses_process_backend(ctx, process_config, multi_cpu):
+    rankers = [LambdaRankerAdapter(logic_a), LambdaRankerAdapter(logic_b), LambdaRankerAdapter(failing_logic)]
+
+    result = ABExecutor().run_many(rankers, ["A", "B", "C"], ctx, process_config)
+
+    assert list(result.lists) == ["A", "B"]
+    assert result.degraded == {"C": "error"}
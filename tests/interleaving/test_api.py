@@ -1,7 +1,8 @@
 
 import pytest
-from src.interleaving.api import get_interleaver
+from src.interleaving.api import get_interleaver, get_multileaver
 from src.interleaving.method import TeamDraftInterleaver, OptimizedInterleaver
+from src.interleaving.multileave import ProbabilisticMultileaver, TeamDraftMultileaver
 
 def test_get_team_draft():
     interleaver = get_interleaver("team_draft")
@@ -11,6 +12,10 @@ def test_get_optimized():
     interleaver = get_interleaver("optimized")
     assert isinstance(interleaver, OptimizedInterleaver)
 
+def test_get_optimized_with_tau():
+    interleaver = get_interleaver("optimized", tau=3.0)
+    assert interleaver.tau == 3.0
+
 def test_get_default():
     # Unknown method should result in default (Team Draft)
     interleaver = get_interleaver("unknown_method")
@@ -20,3 +25,20 @@ def test_get_interleaver_with_seed():
     interleaver = get_interleaver("team_draft", seed=123)
     assert interleaver.rng.randint(0, 100) == 6  # Deterministic check depends on impl, but at least object exists
     assert isinstance(interleaver, TeamDraftInterleaver)
+
+@pytest.mark.parametrize("method, expected_cls", [
+    ("team_draft", TeamDraftMultileaver),
+    ("probabilistic", ProbabilisticMultileaver),
+    ("unknown_method", TeamDraftMultileaver),
+])
+def test_get_multileaver(method, expected_cls):
+    assert isinstance(get_multileaver(method, seed=1), expected_cls)
+
+def test_get_interleaver_without_seed_is_shared():
+    # seed を省略した場合はインスタンスを使い回す (乱数はリクエストごとに rng で渡す)
+    assert get_interleaver("team_draft") is get_interleaver("team_draft")
+    assert get_interleaver("optimized", tau=2.0) is not get_interleaver("optimized", tau=1.0)
+    assert get_interleaver("team_draft", seed=1) is not get_interleaver("team_draft", seed=1)
+    assert get_multileaver("probabilistic") is get_multileaver("probabilistic")
+    assert get_multileaver("probabilistic", tau=1.0) is not get_multileaver("probabilistic", tau=3.0)
+    assert get_multileaver("probabilistic", tau=2.0).tau == 2.0
@@ -0,0 +1,136 @@
+
+import random
+import numpy as np
+import pytest
+from src.context import Item
+from src.interleaving.batch import PAD, SOURCE_A, SOURCE_B, interleave_batch, pad_id_lists
+from src.interleaving.method import TeamDraftInterleaver, OptimizedInterleaver
+from src.interleaving.rng import CounterRandom, request_key
+
+def _random_requests(n: int, seed: int = 0):
+    rng = random.Random(seed)
+    lists_a, lists_b, seeds = [], [], []
+    for _ in range(n):
+        pool = [f"i{j}" for j in range(rng.randint(0, 25))]
+        lists_a.append(rng.sample(pool, rng.randint(0, len(pool))))
+        lists_b.append(rng.sample(pool, rng.randint(0, len(pool))))
+        seeds.append(rng.randint(-10**9, 10**9))
+    return lists_a, lists_b, seeds
+
+def _solving_optimized(**kwargs):
+    # 確率分布をリクエストのスレッドで解く (バックグラウンドの求解の進み具合によらず結果を比べられるように)
+    return OptimizedInterleaver(background=False, **kwargs)
+
+@pytest.mark.parametrize("method, interleaver_cls", [
+    ("team_draft", TeamDraftInterleaver),
+    ("optimized", _solving_optimized),
+])
+@pytest.mark.parametrize("k", [None, 1, 5])
+def test_batch_matches_per_request_path(method, interleaver_cls, k):
+    # 同じシードに対してリクエスト単位の実装とビット単位で同じ結果になること
+    lists_a, lists_b, seeds = _random_requests(300)
+    
+    result = interleave_batch(lists_a, lists_b, seeds, method=method, k=k, chunk_size=64, counter_rng=False)
+    
+    for row, (ids_a, ids_b, seed) in enumerate(zip(lists_a, lists_b, seeds)):
+        expected = interleaver_cls(seed=seed).interleave(
+            [Item(id=i, score=0.0) for i in ids_a],
+            [Item(id=i, score=0.0) for i in ids_b],
+            k=k,
+        )
+        assert result.id_lists()[row] == [item.id for item in expected]
+        assert result.source_lists()[row] == [item.source_ranker for item in expected]
+        if method == "optimized":
+            assert result.probs[row, :result.lengths[row]].tolist() == [item.prob for item in expected]
+
+def test_batch_accepts_padded_arrays():
+    ids_a = np.array([[1, 2, 3], [7, PAD, PAD]])
+    ids_b = np.array([[3, 4, PAD], [8, 9, 7]])
+    
+    result = interleave_batch(ids_a, ids_b, seeds=[0, 1])
+    
+    assert result.vocab is None
+    assert result.lengths.tolist() == [4, 3]
+    assert sorted(result.id_lists()[0]) == [1, 2, 3, 4]
+    assert sorted(result.id_lists()[1]) == [7, 8, 9]
+    assert set(result.sources[0, :4].tolist()) <= {SOURCE_A, SOURCE_B}
+    assert result.sources[1, 3] == -1
+    # Team Draft は確率を持たない
+    assert np.isnan(result.probs).all()
+
+def test_batch_handles_empty_lists():
+    result = interleave_batch([[], ["a"]], [[], []], seeds=[0, 0])
+    assert result.id_lists() == [[], ["a"]]
+
+def test_batch_rejects_mismatched_rows():
+    with pytest.raises(ValueError):
+        interleave_batch([["a"]], [["b"]], seeds=[0, 1])
+
+def test_pad_id_lists_shares_vocab():
+    padded_a, vocab = pad_id_lists([["x", "y"], ["y"]])
+    padded_b, vocab = pad_id_lists([["y", "z"]], vocab)
+    
+    assert padded_a.tolist() == [[0, 1], [1, PAD]]
+    assert padded_b.tolist() == [[1, 2]]
+    assert list(vocab) == ["x", "y", "z"]
+
+@pytest.mark.parametrize("method, interleaver_cls", [
+    ("team_draft", TeamDraftInterleaver),
+    ("optimized", _solving_optimized),
+])
+def test_batch_matches_counter_rng(method, interleaver_cls):
+    # counter_rng=True の場合、seeds を鍵とした CounterRandom を渡したリクエスト単位の結果と一致すること
+    lists_a, lists_b, _ = _random_requests(200, seed=1)
+    keys = [request_key(row, f"ranking-{row}", "exp") for row in range(len(lists_a))]
+
+    result = interleave_batch(lists_a, lists_b, keys, method=method, k=5, chunk_size=64, counter_rng=True)
+
+    interleaver = interleaver_cls()
+    for row, (ids_a, ids_b, key) in enumerate(zip(lists_a, lists_b, keys)):
+        expected = interleaver.interleave(
+            [Item(id=i, score=0.0) for i in ids_a],
+            [Item(id=i, score=0.0) for i in ids_b],
+            k=5,
+            rng=CounterRandom(key),
+        )
+        assert result.id_lists()[row] == [item.id for item in expected]
+        assert result.source_lists()[row] == [item.source_ranker for item in expected]
+
+@pytest.mark.parametrize("k", [None, 3, 12])
+def test_optimized_batch_matches_beyond_depth(k):
+    # depth 件より後ろ (確率 1/2 ずつで選ぶ部分) も含めてリクエスト単位の結果と一致すること (既定は counter_rng)
+    lists_a, lists_b, _ = _random_requests(300, seed=2)
+    keys = [request_key(row, f"ranking-{row}") for row in range(len(lists_a))]
+
+    result = interleave_batch(lists_a, lists_b, keys, method="optimized", k=k, tau=2.0, depth=4, chunk_size=64)
+
+    interleaver = _solving_optimized(tau=2.0, depth=4)
+    for row, (ids_a, ids_b, key) in enumerate(zip(lists_a, lists_b, keys)):
+        expected = interleaver.interleave(
+            [Item(id=i, score=0.0) for i in ids_a],
+            [Item(id=i, score=0.0) for i in ids_b],
+            k=k,
+            rng=CounterRandom(key),
+        )
+        assert result.id_lists()[row] == [item.id for item in expected]
+        assert result.source_lists()[row] == [item.source_ranker for item in expected]
+        assert result.probs[row, :result.lengths[row]].tolist() == [item.prob for item in expected]
+
+
+@pytest.mark.parametrize("method", ["team_draft", "optimized"])
+@pytest.mark.parametrize("scale", [2 ** 40, 2 ** 62])
+def test_batch_handles_large_integer_ids(method, scale):
+    # ID が大きく (行, ID, 列) を詰められない場合も、小さい ID に置き換えた場合と同じ結果になること
+    lists_a, lists_b, seeds = _random_requests(100, seed=3)
+    small = interleave_batch(lists_a, lists_b, seeds, method=method, k=8)
+    codes = np.array(random.Random(3).sample(range(scale - 10 ** 6, scale), len(small.vocab)), dtype=np.int64)
+    vocab = {item_id: i for i, item_id in enumerate(small.vocab)}
+    padded_a = pad_id_lists(lists_a, vocab)[0]
+    padded_b = pad_id_lists(lists_b, vocab)[0]
+    padded_a, padded_b = (np.where(padded == PAD, PAD, codes[padded]) for padded in (padded_a, padded_b))
+
+    large = interleave_batch(padded_a, padded_b, seeds, method=method, k=8)
+
+    assert large.lengths.tolist() == small.lengths.tolist()
+    assert np.array_equal(large.sources, small.sources)
+    assert np.array_equal(np.where(small.ids == PAD, PAD, codes[small.ids]), large.ids)
@@ -1,3 +1,4 @@
+import dataclasses
 
 import pytest
 from src.config import ExperimentConfig
@@ -26,7 +27,7 @@ def test_bucketer_determines_mode_out_sample(config_interleave):
     assert bucketer.determine_mode(user_hash=6000, config=config_interleave) == "A"
 
 def test_bucketer_handles_config_mode_off(config_interleave):
-    config_interleave.mode = "A" # Even if sampling rate is high
+    config_interleave = dataclasses.replace(config_interleave, mode="A") # Even if sampling rate is high
     bucketer = Bucketer()
     assert bucketer.determine_mode(user_hash=1, config=config_interleave) == "A"
 
@@ -39,3 +40,73 @@ def test_bucketer_handles_full_sampling():
     config = ExperimentConfig(mode="INTERLEAVE", sampling_rate=1.0, parallel_enabled=True)
     bucketer = Bucketer()
     assert bucketer.determine_mode(user_hash=9999, config=config) == "INTERLEAVE"
+
+def test_bucketer_returns_multileave_mode_and_baseline_fallback():
+    config = ExperimentConfig(
+        mode="MULTILEAVE",
+        sampling_rate=0.5,
+        parallel_enabled=True,
+        rankers=("prod", "m1", "m2", "m3"),
+    )
+    bucketer = Bucketer()
+    
+    assert bucketer.determine_mode(user_hash=1, config=config) == "MULTILEAVE"
+    # サンプリング対象外はベースライン (rankers の先頭)
+    assert bucketer.determine_mode(user_hash=6000, config=config) == "prod"
+
+def test_vectorized_murmur3_matches_mmh3():
+    import mmh3
+    import numpy as np
+    from src.interleaving.bucketer import _murmur3_32
+
+    rng = np.random.default_rng(0)
+    values = [bytes(rng.integers(0, 256, size=n, dtype=np.uint8)) for n in range(18) for _ in range(20)]
+    arr = np.array(values, dtype="S17")
+    data = arr.view(np.uint8).reshape(len(arr), 17)
+    lengths = np.array([len(value) for value in values])
+
+    for seed in (0, 42, 2**32 - 1):
+        expected = [mmh3.hash(value, seed, signed=False) for value in values]
+        assert _murmur3_32(data, lengths, seed).tolist() == expected
+
+def test_in_sample_hashes_user_ids_like_single_request_path():
+    import numpy as np
+    from src.interleaving.bucketer import hash_user_id
+
+    user_ids = [f"user-{i}" for i in range(3000)]
+    bucketer = Bucketer()
+    for salt in ("", "exp-2026-10"):
+        config = ExperimentConfig(mode="INTERLEAVE", sampling_rate=0.3, parallel_enabled=True, salt=salt)
+        expected = [bucketer.determine_mode(hash_user_id(user_id), config) == "INTERLEAVE" for user_id in user_ids]
+
+        # 文字列のリスト / bytes の ndarray / 計算済みハッシュのいずれでも同じ結果になる
+        assert bucketer.in_sample(user_ids, config, chunk_size=700).tolist() == expected
+        as_bytes = np.array([user_id.encode() for user_id in user_ids])
+        assert bucketer.in_sample(as_bytes, config, chunk_size=700).tolist() == expected
+        hashes = np.array([hash_user_id(user_id) for user_id in user_ids], dtype=np.uint32)
+        assert bucketer.in_sample(hashes, config).tolist() == expected
+
+def test_determine_modes_matches_determine_mode_for_hashes():
+    import numpy as np
+
+    config = ExperimentConfig(mode="MULTILEAVE", sampling_rate=0.25, parallel_enabled=True,
+                              rankers=("prod", "m1", "m2"), salt="s")
+    hashes = np.array([0, 1, 2499, 2500, 9999, 123456789, 2**32 - 1, -7], dtype=np.int64)
+    bucketer = Bucketer()
+
+    modes = bucketer.determine_modes(hashes, config)
+
+    assert modes.tolist() == [bucketer.determine_mode(int(h), config) for h in hashes]
+
+def test_different_salts_give_independent_buckets():
+    import numpy as np
+
+    hashes = np.arange(200_000, dtype=np.uint32)
+    bucketer = Bucketer()
+    first = bucketer.in_sample(hashes, ExperimentConfig("INTERLEAVE", 0.5, True, salt="exp-1"))
+    second = bucketer.in_sample(hashes, ExperimentConfig("INTERLEAVE", 0.5, True, salt="exp-2"))
+
+    assert abs(first.mean() - 0.5) < 0.01
+    assert abs(second.mean() - 0.5) < 0.01
+    # 独立なら両方に入るのは約 25%
+    assert abs((first & second).mean() - 0.25) < 0.01
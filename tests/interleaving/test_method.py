@@ -1,8 +1,9 @@
 
 import pytest
 from typing import List
-from src.context import Item
+from src.context import CompactItem, Item, ItemBatch
 from src.interleaving.method import TeamDraftInterleaver, OptimizedInterleaver
+from src.interleaving.optimized import DEFAULT_DEPTH
 
 @pytest.fixture
 def items_a():
@@ -63,6 +64,41 @@ def test_team_draft_deterministic_with_seed(items_a, items_b):
     
     assert ids1 == ids2
 
+@pytest.fixture
+def overlapping_lists():
+    list_a = [Item(id=x, score=1.0) for x in ["a1", "c1", "a2", "c2", "a3", "a4"]]
+    list_b = [Item(id=x, score=1.0) for x in ["c2", "b1", "c1", "b2", "b3"]]
+    return list_a, list_b
+
+@pytest.mark.parametrize("seed, expected", [
+    (0, [("c2", "B"), ("a1", "A"), ("b1", "B"), ("c1", "A"), ("a2", "A"), ("b2", "B"), ("b3", "B"), ("a3", "A"), ("a4", "A")]),
+    (1, [("a1", "A"), ("c2", "B"), ("b1", "B"), ("c1", "A"), ("a2", "A"), ("b2", "B"), ("a3", "A"), ("b3", "B"), ("a4", "A")]),
+    (42, [("c2", "B"), ("a1", "A"), ("c1", "A"), ("b1", "B"), ("a2", "A"), ("b2", "B"), ("b3", "B"), ("a3", "A"), ("a4", "A")]),
+])
+def test_team_draft_output_is_stable_for_seed(overlapping_lists, seed, expected):
+    # 実装変更後もシードに対する出力が変わらないこと (旧 pop(0) 実装の出力を固定値として保持)
+    list_a, list_b = overlapping_lists
+    result = TeamDraftInterleaver(seed=seed).interleave(list_a, list_b)
+    assert [(item.id, item.source_ranker) for item in result] == expected
+
+def test_team_draft_top_k_is_prefix_of_full_merge(overlapping_lists):
+    list_a, list_b = overlapping_lists
+    full = TeamDraftInterleaver(seed=7).interleave(list_a, list_b)
+    
+    for k in range(len(full) + 2):
+        top_k = TeamDraftInterleaver(seed=7).interleave(list_a, list_b, k=k)
+        assert [(i.id, i.source_ranker) for i in top_k] == [(i.id, i.source_ranker) for i in full[:k]]
+
+def test_team_draft_does_not_mutate_input_items(overlapping_lists):
+    list_a, list_b = overlapping_lists
+    result = TeamDraftInterleaver(seed=0).interleave(list_a, list_b)
+    
+    assert all(item.source_ranker is None for item in list_a + list_b)
+    assert len(list_a) == 6 and len(list_b) == 5
+    # 結果はコピーだが、id/score/meta は引き継がれる
+    assert result[0] is not list_b[0]
+    assert result[0].meta is list_b[0].meta
+
 def test_handling_empty_lists():
     items_a = [Item(id="a1", score=10)]
     items_b = []
@@ -111,3 +147,71 @@ def test_optimized_interleaving_deduplication():
     ids = [item.id for item in result]
     assert ids.count("common") == 1
 
+
+def test_optimized_interleaving_records_rank_difference_credit():
+    items_a = [Item(id="common", score=10), Item(id="a2", score=9)]
+    items_b = [Item(id="b1", score=10), Item(id="common", score=9)]
+
+    result = OptimizedInterleaver(tau=1.0, seed=0).interleave(items_a, items_b)
+
+    credits = {item.id: item.credit for item in result}
+    # 順位は各リストの先頭 depth 件の中で数え、含まれない場合は件数 + 1
+    assert credits["common"] == pytest.approx(1 / 1 - 1 / 2)
+    assert credits["a2"] == pytest.approx(1 / 2 - 1 / 3)
+    assert credits["b1"] == pytest.approx(1 / 3 - 1 / 1)
+
+
+class _CountingStream:
+    """何件取り出されたかを記録するイテレータ"""
+    def __init__(self, prefix: str, n: int):
+        self.prefix = prefix
+        self.n = n
+        self.pulled = 0
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self.pulled >= self.n:
+            raise StopIteration
+        self.pulled += 1
+        return Item(id=f"{self.prefix}{self.pulled}", score=0.0)
+
+@pytest.mark.parametrize("interleaver, lookahead", [
+    (TeamDraftInterleaver(seed=0), 1),
+    (OptimizedInterleaver(seed=0), DEFAULT_DEPTH),
+])
+def test_streams_are_pulled_only_as_deep_as_needed(interleaver, lookahead):
+    stream_a = _CountingStream("a", 1000)
+    stream_b = _CountingStream("b", 1000)
+    
+    result = interleaver.interleave(stream_a, stream_b, k=20)
+    
+    assert len(result) == 20
+    # 配置した件数 + 各側の先読み (Team Draft は1件、Optimized は1ブロック分) まで
+    assert stream_a.pulled + stream_b.pulled <= 20 + 2 * lookahead
+
+@pytest.mark.parametrize("interleaver_cls", [TeamDraftInterleaver, OptimizedInterleaver])
+def test_streams_and_lists_give_same_result(interleaver_cls, overlapping_lists):
+    list_a, list_b = overlapping_lists
+    kwargs = {"background": False} if interleaver_cls is OptimizedInterleaver else {}
+    from_lists = interleaver_cls(seed=3, **kwargs).interleave(list_a, list_b)
+    from_streams = interleaver_cls(seed=3, **kwargs).interleave(iter(list_a), (item for item in list_b))
+    
+    assert [(i.id, i.source_ranker, i.prob) for i in from_lists] == [(i.id, i.source_ranker, i.prob) for i in from_streams]
+
+def test_optimized_does_not_mutate_input_items(items_a, items_b):
+    OptimizedInterleaver(seed=0).interleave(items_a, items_b)
+    assert all(item.source_ranker is None and item.prob is None for item in items_a + items_b)
+
+@pytest.mark.parametrize("interleaver_cls", [TeamDraftInterleaver, OptimizedInterleaver])
+def test_interleavers_accept_item_batches(interleaver_cls):
+    batch_a = ItemBatch(["a1", "common", "a2"], [3.0, 2.0, 1.0])
+    batch_b = ItemBatch(["common", "b1"], [2.0, 1.0])
+    
+    result = interleaver_cls(seed=0).interleave(batch_a, batch_b, k=3)
+    
+    assert len(result) == 3
+    assert all(isinstance(item, CompactItem) for item in result)
+    assert all(item.source_ranker in ("A", "B") for item in result)
+    assert len({item.id for item in result}) == 3
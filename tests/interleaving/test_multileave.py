@@ -0,0 +1,119 @@
+
+import pytest
+from src.context import Item
+from src.interleaving.multileave import ProbabilisticMultileaver, TeamDraftMultileaver, default_team_names
+
+def _items(*ids):
+    return [Item(id=x, score=1.0) for x in ids]
+
+@pytest.fixture
+def four_lists():
+    return [
+        _items("a1", "c1", "a2", "a3"),
+        _items("b1", "b2", "c1", "b3"),
+        _items("c1", "d1", "d2"),
+        _items("e1", "a1", "e2", "e3"),
+    ]
+
+@pytest.mark.parametrize("multileaver_cls", [TeamDraftMultileaver, ProbabilisticMultileaver])
+def test_multileave_places_every_item_once_and_credits_its_team(multileaver_cls, four_lists):
+    result = multileaver_cls(seed=0).multileave(four_lists)
+    
+    ids = [item.id for item in result]
+    assert len(ids) == len(set(ids))
+    assert set(ids) == {item.id for items in four_lists for item in items}
+    for item in result:
+        team = "ABCD".index(item.source_ranker)
+        assert item.id in {x.id for x in four_lists[team]}
+
+def test_team_draft_multileave_keeps_team_counts_balanced(four_lists):
+    for seed in range(50):
+        result = TeamDraftMultileaver(seed=seed).multileave(four_lists, k=8)
+        counts = {name: 0 for name in "ABCD"}
+        for item in result:
+            counts[item.source_ranker] += 1
+        
+        assert max(counts.values()) - min(counts.values()) <= 1
+
+def test_team_draft_multileave_picks_each_teams_top_item(four_lists):
+    result = TeamDraftMultileaver(seed=3).multileave(four_lists)
+    
+    # 各チームは自チームの未配置アイテムのうち最上位のものを配置する
+    placed = set()
+    for item in result:
+        team = "ABCD".index(item.source_ranker)
+        assert item.id == next(x.id for x in four_lists[team] if x.id not in placed)
+        placed.add(item.id)
+
+@pytest.mark.parametrize("multileaver_cls", [TeamDraftMultileaver, ProbabilisticMultileaver])
+def test_multileave_is_deterministic_with_seed(multileaver_cls, four_lists):
+    first = multileaver_cls(seed=42).multileave(four_lists)
+    second = multileaver_cls(seed=42).multileave(four_lists)
+    
+    assert [(i.id, i.source_ranker, i.prob) for i in first] == [(i.id, i.source_ranker, i.prob) for i in second]
+
+@pytest.mark.parametrize("multileaver_cls", [TeamDraftMultileaver, ProbabilisticMultileaver])
+def test_multileave_uses_given_names_and_does_not_mutate_input(multileaver_cls, four_lists):
+    result = multileaver_cls(seed=1).multileave(four_lists, k=5, names=["prod", "m1", "m2", "m3"])
+    
+    assert len(result) == 5
+    assert {item.source_ranker for item in result} <= {"prod", "m1", "m2", "m3"}
+    assert all(item.source_ranker is None for items in four_lists for item in items)
+
+def test_multileave_rejects_mismatched_names(four_lists):
+    with pytest.raises(ValueError):
+        TeamDraftMultileaver().multileave(four_lists, names=["A", "B"])
+
+def test_default_team_names():
+    assert default_team_names(4) == ["A", "B", "C", "D"]
+    with pytest.raises(ValueError):
+        default_team_names(27)
+
+def test_team_draft_multileave_pulls_streams_lazily():
+    pulled = []
+    def stream(prefix):
+        for i in range(1000):
+            pulled.append(prefix)
+            yield Item(id=f"{prefix}{i}", score=0.0)
+    
+    result = TeamDraftMultileaver(seed=0).multileave([stream("a"), stream("b"), stream("c")], k=9)
+    
+    assert len(result) == 9
+    # 配置した件数 + 各チームの先読み1件まで
+    assert len(pulled) <= 9 + 3
+
+def test_probabilistic_multileave_records_draw_probability():
+    lists = [_items("a1", "a2"), _items("b1", "b2")]
+    result = ProbabilisticMultileaver(tau=1.0, seed=0).multileave(lists, k=2)
+    
+    # 最初の2件はそれぞれのチームの分布 (1, 1/2 を正規化) から抽選される
+    for item in result:
+        expected = 1.0 / (1.0 + 0.5) if item.id.endswith("1") else 0.5 / (1.0 + 0.5)
+        assert item.prob == pytest.approx(expected)
+
+def test_probabilistic_multileave_probabilities_match_remaining_weights():
+    # 重みを差し引きで更新しても、記録される確率は毎ステップ数え直した場合と一致する
+    lists = [
+        _items(*[f"d{i}" for i in range(30)]),
+        _items(*[f"d{i}" for i in range(29, -1, -1)]),
+        _items(*[f"d{i}" for i in range(0, 40, 2)]),
+    ]
+    tau = 3.0
+    result = ProbabilisticMultileaver(tau=tau, seed=1).multileave(lists)
+
+    names = ["A", "B", "C"]
+    used = set()
+    for item in result:
+        team = lists[names.index(item.source_ranker)]
+        total = sum(1.0 / (rank + 1) ** tau for rank, other in enumerate(team) if other.id not in used)
+        rank = [other.id for other in team].index(item.id)
+        assert item.prob == pytest.approx(1.0 / (rank + 1) ** tau / total)
+        used.add(item.id)
+    assert sorted(item.id for item in result) == sorted({f"d{i}" for i in range(40) if i < 30 or i % 2 == 0})
+
+def test_probabilistic_multileave_prefers_top_ranks():
+    lists = [_items(*[f"a{i}" for i in range(10)]), _items(*[f"b{i}" for i in range(10)])]
+    firsts = [ProbabilisticMultileaver(seed=seed).multileave(lists, k=1)[0].id for seed in range(500)]
+    
+    top = sum(1 for x in firsts if x in ("a0", "b0"))
+    assert top > 400
@@ -0,0 +1,184 @@
+
+import random
+import pytest
+from src.context import Item
+from src.interleaving.method import OptimizedInterleaver
+from src.interleaving.optimized import (
+    _ready,
+    allocation_table,
+    interleave_placements,
+    interleave_sequences,
+    wait_for_tables,
+)
+
+# 不偏性を確かめる先頭の件数 (既定の DEFAULT_DEPTH より長い prefix でも解けること)
+DEPTH = 20
+
+def _rankings(table):
+    """テーブルの状態を辿って候補ランキングを総当たりで展開し、(選択肢の列, 確率) を返す"""
+    rankings = []
+    def walk(s, path, p):
+        if len(path) == table.length:
+            rankings.append((path, p))
+            return
+        q, first, second = table.states[s]
+        walk(first[2], path + [first], p * first[3])
+        if second is not None:
+            walk(second[2], path + [second], p * second[3])
+    walk(0, [], 1.0)
+    return rankings
+
+def _expected_cumulative_credit(ids_a, ids_b, k=None, tau=1.0):
+    """
+    順位ごとの累積クレジットの期待値を返す。
+    クレジットは評価側と同じく先頭 k 件の中での順位で計算する (含まれなければ len + 1)
+    """
+    size = min(k or len(ids_a) + len(ids_b), DEPTH)
+    top_a, top_b = ids_a[:size], ids_b[:size]
+    table = allocation_table(size, len(top_a), len(top_b), _twins(top_a, top_b), tau)
+    window = top_a + top_b
+    rank_a = {item_id: i + 1 for i, item_id in enumerate(top_a)}
+    rank_b = {item_id: i + 1 for i, item_id in enumerate(top_b)}
+    expected = [0.0] * table.length
+    for path, p in _rankings(table):
+        total = 0.0
+        for i, option in enumerate(path):
+            d = window[option[0]]
+            total += rank_a.get(d, len(top_a) + 1) ** -tau - rank_b.get(d, len(top_b) + 1) ** -tau
+            expected[i] += p * total
+    return expected
+
+def _twins(ids_a, ids_b):
+    return tuple(ids_a.index(x) if x in ids_a else -1 for x in ids_b)
+
+@pytest.mark.parametrize("ids_a, ids_b, k", [
+    (["a1", "a2", "a3"], ["b1", "b2", "b3"], None),
+    (["a1", "c1", "a2", "c2"], ["c2", "b1", "c1", "b2"], None),
+    (["c1", "a1", "a2"], ["c1", "b1", "a1"], None),
+    # 旧実装のブロック (6 件) を跨ぐ長さ: 先頭 k 件全体で不偏になること
+    ([f"a{i}" for i in range(12)], ["a5", "a3"] + [f"b{i}" for i in range(10)], 12),
+    ([f"c{i}" for i in range(14)], [f"c{i}" for i in (3, 0, 9, 1, 13, 5, 2, 11, 4, 7, 6, 8, 12, 10)], 14),
+    ([f"a{i}" for i in range(30)], ["a7", "b0", "a0", "b1", "a20"] + [f"b{i}" for i in range(2, 27)], 13),
+])
+def test_allocation_is_unbiased_under_random_clicks(ids_a, ids_b, k):
+    expected = _expected_cumulative_credit(ids_a, ids_b, k)
+    
+    # 両方のリストに候補がある順位までは、ランダムなクリックに対するクレジットの期待値が 0
+    size = min(k or len(ids_a) + len(ids_b), DEPTH)
+    for value in expected[:min(len(ids_a[:size]), len(ids_b[:size]))]:
+        assert value == pytest.approx(0.0, abs=1e-9)
+
+def test_sampled_rankings_are_unbiased_across_the_prefix():
+    # 抽選した結果 (interleave_sequences) で、ランダムなクリックのクレジットの平均が 0 に近いこと
+    ids_a = [f"a{i}" for i in range(12)]
+    ids_b = ["a5", "a3"] + [f"b{i}" for i in range(10)]
+    rank_a = {x: i + 1 for i, x in enumerate(ids_a)}
+    rank_b = {x: i + 1 for i, x in enumerate(ids_b)}
+    n = 20000
+    totals = [0.0] * 12
+    rng = random.Random(0)
+    for _ in range(n):
+        elements, _, _ = interleave_sequences(ids_a, ids_b, rng.random, k=12, depth=DEPTH)
+        total = 0.0
+        for i, d in enumerate(elements):
+            total += rank_a.get(d, 13) ** -1.0 - rank_b.get(d, 13) ** -1.0
+            totals[i] += total
+    for value in totals:
+        assert value / n == pytest.approx(0.0, abs=0.01)
+
+def test_allocation_probabilities_form_a_distribution():
+    table = allocation_table(6, 6, 6, (-1, 3, -1, 0, -1, -1), 1.0)
+    rankings = _rankings(table)
+    
+    assert sum(p for _, p in rankings) == pytest.approx(1.0)
+    assert all(p > 0.0 for _, p in rankings)
+    assert table.bias < 1e-9
+    # 候補ランキングは重複しない
+    assert len({tuple(option[0] for option in path) for path, _ in rankings}) == len(rankings)
+
+def test_allocation_is_cached_by_overlap_structure():
+    allocation_table.cache_clear()
+    rng = random.Random(0)
+    interleave_sequences(["a1", "a2", "c"], ["c", "b1", "b2"], rng.random)
+    interleave_sequences(["x1", "x2", "z"], ["z", "y1", "y2"], rng.random)
+    
+    info = allocation_table.cache_info()
+    # ID が違っても重複構造が同じなら同じテーブルを使う
+    assert info.misses == 1
+    assert info.hits == 1
+
+def test_background_mode_falls_back_to_even_coin_flips_until_solved():
+    ids_a = ["q1", "c", "q2", "q3"]
+    ids_b = ["c", "r1", "q3", "r2"]
+    twins = (1, -1, 3, -1)
+    _ready.pop((4, 4, 4, twins, 1.0), None)
+    rng = random.Random(0)
+
+    pending = interleave_placements(ids_a, ids_b, rng.random, k=4, depth=4, background=True)
+    # 求解待ちの間は先頭も確率 1/2 ずつ (リクエストのスレッドでは解かない)。δ は解いた場合と同じ
+    assert {prob for _, _, prob, _ in pending} <= {0.5, 1.0}
+    credits = allocation_table(4, 4, 4, twins, 1.0).credits
+    window = ids_a + ids_b
+    assert all(credit == pytest.approx(credits[window.index(element)]) for element, _, _, credit in pending)
+
+    assert wait_for_tables(timeout=5.0)
+    # 解き終えた後はリクエストのスレッドで解いた場合と同じ結果になる
+    blocking = interleave_placements(ids_a, ids_b, random.Random(1).random, k=4, depth=4)
+    again = interleave_placements(ids_a, ids_b, random.Random(1).random, k=4, depth=4, background=True)
+    assert again == blocking
+
+def test_first_pick_frequency_matches_logged_probability():
+    ids_a = ["c1", "a1", "a2", "a3"]
+    ids_b = ["b1", "c1", "b2"]
+    counts = {"A": 0, "B": 0}
+    probs = {}
+    n = 4000
+    for seed in range(n):
+        result = OptimizedInterleaver(seed=seed, background=False).interleave(
+            [Item(id=x, score=0.0) for x in ids_a],
+            [Item(id=x, score=0.0) for x in ids_b],
+        )
+        counts[result[0].source_ranker] += 1
+        probs[result[0].source_ranker] = result[0].prob
+    
+    for side in ("A", "B"):
+        assert counts[side] / n == pytest.approx(probs[side], abs=0.03)
+
+def test_single_candidate_blocks_do_not_consume_randomness():
+    calls = []
+    def rng():
+        calls.append(1)
+        return 0.5
+    
+    elements, sides, probs = interleave_sequences(["a1", "a2"], [], rng)
+    
+    assert elements == ["a1", "a2"]
+    assert sides == [0, 0]
+    assert probs == [1.0, 1.0]
+    assert not calls
+
+@pytest.mark.parametrize("k", [None, 1, 3, 7, 13])
+def test_interleave_sequences_places_each_item_once(k):
+    rng = random.Random(1)
+    pool = [f"i{j}" for j in range(30)]
+    for seed in range(50):
+        ids_a = rng.sample(pool, rng.randint(0, 20))
+        ids_b = rng.sample(pool, rng.randint(0, 20))
+        elements, sides, probs = interleave_sequences(ids_a, ids_b, random.Random(seed).random, k=k)
+        
+        total = len({*ids_a, *ids_b})
+        assert len(elements) == (total if k is None else min(k, total))
+        assert len(set(elements)) == len(elements)
+        for element, side in zip(elements, sides):
+            assert element in (ids_a if side == 0 else ids_b)
+        assert all(0.0 < p <= 1.0 for p in probs)
+
+def test_positions_beyond_depth_are_filled_with_even_coin_flips():
+    ids_a = [f"a{i}" for i in range(10)]
+    ids_b = [f"b{i}" for i in range(10)]
+    elements, sides, probs = interleave_sequences(ids_a, ids_b, random.Random(0).random, depth=4)
+    
+    assert sorted(elements) == sorted(ids_a + ids_b)
+    # 先頭 depth 件は解いた分布、それより後ろは両側に候補があれば 1/2
+    assert set(probs[4:]) <= {0.5, 1.0}
+    assert 0.5 in probs[4:]
@@ -0,0 +1,88 @@
+import random
+import mmh3
+import pytest
+from src.context import Item
+from src.interleaving.method import TeamDraftInterleaver
+from src.interleaving.pagination import TeamDraftState, interleave_page
+from src.interleaving.rng import request_random
+
+def _items(ids):
+    return [Item(id=i, score=0.0) for i in ids]
+
+def _random_lists(seed):
+    rng = random.Random(seed)
+    pool = [f"i{j}" for j in range(60)]
+    return _items(rng.sample(pool, rng.randint(0, 40))), _items(rng.sample(pool, rng.randint(0, 40)))
+
+@pytest.mark.parametrize("seed", range(20))
+@pytest.mark.parametrize("page_size", [1, 7, 10])
+def test_pages_match_full_interleave(seed, page_size):
+    list_a, list_b = _random_lists(seed)
+    full = TeamDraftInterleaver().interleave(list_a, list_b, rng=request_random(seed, f"r{seed}", "exp"))
+
+    state = TeamDraftState.start(seed, f"r{seed}", "exp")
+    pages = []
+    while True:
+        page = interleave_page(list_a, list_b, page_size, state)
+        if not page:
+            break
+        assert len(page) <= page_size
+        pages.extend(page)
+        # ページごとにトークンを経由して続きから合成する
+        state = TeamDraftState.from_token(state.to_token())
+
+    assert [(i.id, i.source_ranker) for i in pages] == [(i.id, i.source_ranker) for i in full]
+
+def test_compact_token_rebuilds_used_ids_from_prefixes():
+    list_a, list_b = _random_lists(3)
+    state = TeamDraftState.start(1, "r")
+    first = interleave_page(list_a, list_b, 10, state)
+
+    token = state.to_token(include_used=False)
+    assert len(token) < 24
+    resumed = TeamDraftState.from_token(token)
+    assert resumed.used is None
+    second = interleave_page(list_a, list_b, 10, resumed)
+
+    expected = interleave_page(list_a, list_b, 10, state)
+    assert [(i.id, i.source_ranker) for i in second] == [(i.id, i.source_ranker) for i in expected]
+    assert not {i.id for i in first} & {i.id for i in second}
+
+def test_changed_ranking_does_not_repeat_shown_items():
+    state = TeamDraftState.start(5, "r")
+    first = interleave_page(_items(["a1", "a2", "a3"]), _items(["b1", "b2", "b3"]), 4, state)
+    # 2ページ目のリクエストでランキングが変わっても、表示済みのアイテムは出さない
+    new_a = _items(["a1", "b1", "a2", "a3", "a4", "a5"])
+    new_b = _items(["a1", "b1", "b2", "b3", "b4", "b5"])
+    second = interleave_page(new_a, new_b, 4, TeamDraftState.from_token(state.to_token()))
+
+    shown = [i.id for i in first]
+    assert not set(shown) & {i.id for i in second}
+    assert len(second) == 4
+
+def test_ids_with_colliding_32bit_hashes_are_both_placed():
+    # mmh3.hash (32bit) が衝突する id の組。配置済みの判定で取り違えると片方が落ちる
+    assert mmh3.hash("item25204", signed=False) == mmh3.hash("item110652", signed=False)
+    list_a = _items(["item25204", "a1", "a2"])
+    list_b = _items(["b1", "item110652", "b2"])
+    state = TeamDraftState.start(2, "r")
+    pages = []
+    for _ in range(3):
+        pages.extend(interleave_page(list_a, list_b, 2, state))
+        state = TeamDraftState.from_token(state.to_token())
+
+    assert sorted(i.id for i in pages) == sorted(i.id for i in list_a + list_b)
+
+def test_team_balance_is_kept_across_pages():
+    list_a = _items([f"a{i}" for i in range(30)])
+    list_b = _items([f"b{i}" for i in range(30)])
+    state = TeamDraftState.start(9, "r")
+    for _ in range(5):
+        interleave_page(list_a, list_b, 5, state)
+        assert abs(state.count_a - state.count_b) <= 1
+    assert state.placed == 25
+
+@pytest.mark.parametrize("token", ["", "!!!", "AQ", TeamDraftState().to_token() + "AAAA"])
+def test_invalid_token_raises_value_error(token):
+    with pytest.raises(ValueError):
+        TeamDraftState.from_token(token)
@@ -0,0 +1,86 @@
+import threading
+import numpy as np
+import pytest
+from src.context import Item
+from src.interleaving.method import OptimizedInterleaver, TeamDraftInterleaver
+from src.interleaving.multileave import ProbabilisticMultileaver, TeamDraftMultileaver
+from src.interleaving.rng import CounterRandom, counter_uniforms, request_key, request_random
+
+def _items(prefix, n):
+    return [Item(id=f"{prefix}{i}", score=float(n - i)) for i in range(n)]
+
+def test_counter_random_is_deterministic_and_uniform():
+    a = CounterRandom(42)
+    b = CounterRandom(42)
+    values = [a.random() for _ in range(2000)]
+    assert values == [b.random() for _ in range(2000)]
+    assert all(0.0 <= v < 1.0 for v in values)
+    assert abs(np.mean(values) - 0.5) < 0.03
+    assert values[:10] != [CounterRandom(43).random() for _ in range(10)]
+
+def test_counter_random_choice():
+    rng = CounterRandom(7)
+    picks = [rng.choice("abc") for _ in range(300)]
+    assert set(picks) == {"a", "b", "c"}
+    with pytest.raises(IndexError):
+        rng.choice([])
+
+def test_request_key_depends_on_salt_user_and_ranking_id():
+    key = request_key(123, "r1", "exp1")
+    assert key == request_key(123, "r1", "exp1")
+    assert key != request_key(123, "r2", "exp1")
+    assert key != request_key(124, "r1", "exp1")
+    assert key != request_key(123, "r1", "exp2")
+    assert 0 <= key < 2 ** 32
+
+def test_counter_uniforms_matches_scalar():
+    keys = [0, 1, 2 ** 32 - 1, request_key(5, "x")]
+    # 事前計算したカウンタのバイト列を超える範囲も含めて一致すること
+    draws = counter_uniforms(keys, 200)
+    assert draws.shape == (4, 200)
+    for row, key in enumerate(keys):
+        rng = CounterRandom(key)
+        assert draws[row].tolist() == [rng.random() for _ in range(200)]
+
+@pytest.mark.parametrize("interleaver", [TeamDraftInterleaver(seed=1), OptimizedInterleaver(seed=1, background=False)])
+def test_shared_interleaver_is_reproducible_per_request(interleaver):
+    list_a, list_b = _items("a", 10), _items("b", 10)
+
+    def run(ranking_id):
+        items = interleaver.interleave(list_a, list_b, rng=request_random(99, ranking_id, "exp"))
+        return [(item.id, item.source_ranker) for item in items]
+
+    results = {ranking_id: run(ranking_id) for ranking_id in ("r0", "r1", "r2", "r3")}
+    # インスタンスの状態 (self.rng) に依存せず、同じリクエストには同じ結果を返す
+    assert all(run(ranking_id) == expected for ranking_id, expected in results.items())
+    assert len({tuple(result) for result in results.values()}) > 1
+
+@pytest.mark.parametrize("multileaver", [TeamDraftMultileaver(), ProbabilisticMultileaver()])
+def test_multileaver_accepts_request_rng(multileaver):
+    lists = [_items("a", 5), _items("b", 5), _items("c", 5)]
+    first = multileaver.multileave(lists, rng=request_random(1, "r"))
+    second = multileaver.multileave(lists, rng=request_random(1, "r"))
+    assert [(i.id, i.source_ranker) for i in first] == [(i.id, i.source_ranker) for i in second]
+
+def test_shared_interleaver_across_threads():
+    interleaver = TeamDraftInterleaver()
+    list_a, list_b = _items("a", 20), _items("b", 20)
+    ranking_ids = [f"r{i}" for i in range(200)]
+    expected = {
+        ranking_id: [item.source_ranker for item in interleaver.interleave(list_a, list_b, rng=request_random(3, ranking_id))]
+        for ranking_id in ranking_ids
+    }
+    mismatches = []
+
+    def worker(offset):
+        for ranking_id in ranking_ids[offset:] + ranking_ids[:offset]:
+            items = interleaver.interleave(list_a, list_b, rng=request_random(3, ranking_id))
+            if [item.source_ranker for item in items] != expected[ranking_id]:
+                mismatches.append(ranking_id)
+
+    threads = [threading.Thread(target=worker, args=(i * 50,)) for i in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert mismatches == []
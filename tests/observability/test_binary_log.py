@@ -0,0 +1,176 @@
+import io
+import json
+import math
+import numpy as np
+import pytest
+from src.context import CompactItem, Context, Item
+from src.evaluation.credit import evaluate_files, iter_log_events
+from src.observability.binary_log import (
+    BINARY_PREFIX,
+    RankingRecord,
+    decode_columns,
+    decode_line,
+    encode_lines,
+    encode_records,
+    iter_columns,
+    iter_events,
+)
+from src.observability.logging import configure_logging, flush_logs, log_ranking_result
+
+@pytest.fixture(autouse=True)
+def reset_logging():
+    yield
+    configure_logging()
+
+def _records():
+    return [
+        RankingRecord("r1", "INTERLEAVE", "u1", 12345, [
+            Item(id="a1", score=3.0, source_ranker="A", original_rank=0),
+            Item(id="共通", score=2.5, source_ranker="B", prob=0.25),
+            Item(id="a2", score=1.0, source_ranker="A", original_rank=1),
+        ]),
+        RankingRecord("r2", "MULTILEAVE", "u2", -7, [
+            CompactItem("c1", 1.0, "C", None, 0.5),
+            CompactItem("a1", 0.5, "A"),
+        ], rankers=["A", "B", "C"], item_count=10),
+        RankingRecord("r3", "A", "u3", 2 ** 40, [Item(id="x", score=0.0)]),
+        RankingRecord("r4", "INTERLEAVE", "u4", 0, []),
+    ]
+
+@pytest.mark.parametrize("compress", [True, False])
+def test_round_trip_matches_json_events(compress):
+    line = encode_records(_records(), compress=compress)
+    assert line.startswith(BINARY_PREFIX)
+
+    events = list(iter_events([line]))
+
+    assert [e["ranking_id"] for e in events] == ["r1", "r2", "r3", "r4"]
+    assert events[0]["user_hash"] == 12345 and events[1]["user_hash"] == -7 and events[2]["user_hash"] == 2 ** 40
+    assert events[0]["items"][1] == {"id": "共通", "score": 2.5, "rank": 2, "source_ranker": "B", "prob": 0.25}
+    assert events[0]["items"][0]["prob"] is None
+    assert "rankers" not in events[0] and "item_count" not in events[0]
+    assert events[1]["rankers"] == ["A", "B", "C"]
+    assert events[1]["item_count"] == 10
+    assert [i["source_ranker"] for i in events[1]["items"]] == ["C", "A"]
+    assert events[2]["items"][0]["source_ranker"] is None
+    assert events[3]["items"] == []
+
+def test_user_hash_round_trips_across_the_int64_range():
+    hashes = [2 ** 62 - 1, 2 ** 62, -(2 ** 62), -(2 ** 62) - 1, 2 ** 63 - 1, -(2 ** 63), 2 ** 32 + 5]
+    records = [RankingRecord(f"r{i}", "A", "u", h, []) for i, h in enumerate(hashes)]
+
+    line = encode_records(records)
+
+    assert [e["user_hash"] for e in iter_events([line])] == hashes
+    assert decode_line(line).user_hashes.tolist() == hashes
+
+@pytest.mark.parametrize("user_hash", [2 ** 63, -(2 ** 63) - 1, 2 ** 63 + 5])
+def test_user_hash_outside_int64_is_rejected(user_hash):
+    with pytest.raises(ValueError):
+        encode_records([RankingRecord("r", "A", "u", user_hash, [])])
+
+def test_columns_share_vocab_across_lines():
+    lines = [encode_records(_records()[:2]), "{\"event\": \"ranker_degraded\"}", encode_records(_records()[2:] + _records()[:1])]
+
+    columns = decode_columns(lines)
+
+    assert len(columns) == 5
+    assert columns.offsets.tolist() == [0, 3, 5, 6, 6, 9]
+    ids = [columns.vocab[i] for i in columns.item_ids.tolist()]
+    assert ids == ["a1", "共通", "a2", "c1", "a1", "x", "a1", "共通", "a2"]
+    assert columns.item_ids[0] == columns.item_ids[4] == columns.item_ids[6]
+    assert columns.sources.tolist()[:3] == [columns.vocab.index("A"), columns.vocab.index("B"), columns.vocab.index("A")]
+    assert columns.sources[5] == -1
+    assert columns.original_ranks.tolist()[:3] == [0, 0, 1]
+    assert columns.scores.dtype == np.float32
+    assert math.isnan(columns.probs[0]) and columns.probs[1] == 0.25
+    assert len(list(iter_columns(lines))) == 2
+
+def test_credit_column_is_written_only_when_present():
+    plain = decode_line(encode_records(_records()))
+    assert plain.credits is None
+    assert all("credit" not in item for event in plain.events() for item in event["items"])
+
+    records = _records()
+    records[0] = records[0]._replace(items=[item.with_attribution(item.source_ranker, item.prob, 0.5) for item in records[0].items[:2]])
+    lines = [encode_records(records), encode_records(_records()[:1])]
+
+    events = list(iter_events(lines[:1]))
+    assert [item["credit"] for item in events[0]["items"]] == [0.5, 0.5]
+    assert "credit" not in events[1]["items"][0]
+    columns = decode_columns(lines)
+    assert columns.credits[:2].tolist() == [0.5, 0.5]
+    assert np.isnan(columns.credits[2:]).all()
+
+def test_empty_input():
+    assert len(decode_columns([])) == 0
+    assert list(decode_line(encode_records([])).events()) == []
+
+def test_large_batches_are_split_into_multiple_lines():
+    records = [
+        RankingRecord(f"r{i}", "INTERLEAVE", f"u{i}", i, [Item(id=f"item-{i}-{j}", score=float(j)) for j in range(50)])
+        for i in range(40)
+    ]
+
+    lines = encode_lines(records, compress=False, max_chars=8000)
+
+    assert len(lines) > 1
+    assert [e["ranking_id"] for e in iter_events(lines)] == [f"r{i}" for i in range(40)]
+
+def test_binary_is_smaller_than_json():
+    records = [
+        RankingRecord(f"ranking-{i:08d}", "INTERLEAVE", f"user-{i}", i, [
+            Item(id=f"product-{(i * 7 + j) % 300}", score=1.0 / (j + 1), source_ranker="AB"[j % 2]) for j in range(20)
+        ])
+        for i in range(100)
+    ]
+    stream = io.StringIO()
+    configure_logging(asynchronous=True, stream=stream)
+    for record in records:
+        log_ranking_result(record.ranking_id, record.mode, Context(record.user_id, record.user_hash), list(record.items))
+    assert flush_logs(timeout=2.0)
+
+    assert len(encode_records(records)) * 4 < len(stream.getvalue())
+
+def test_async_binary_logging_batches_records():
+    stream = io.StringIO()
+    configure_logging(asynchronous=True, stream=stream, log_format="binary", max_items=2)
+    items = [Item(id=f"I{i}", score=float(3 - i), source_ranker="AB"[i % 2]) for i in range(3)]
+    for i in range(5):
+        log_ranking_result(f"r{i}", "INTERLEAVE", Context("u1", 1), items)
+    assert flush_logs(timeout=2.0)
+
+    lines = stream.getvalue().splitlines()
+    assert len(lines) < 5
+    events = list(iter_log_events(io.StringIO(stream.getvalue())))
+    assert [e["ranking_id"] for e in events] == [f"r{i}" for i in range(5)]
+    assert [i["id"] for i in events[0]["items"]] == ["I0", "I1"]
+    assert events[0]["item_count"] == 3
+
+def test_sync_binary_logging_uses_logger(caplog):
+    configure_logging(log_format="binary")
+    with caplog.at_level("INFO", logger="interleaving"):
+        log_ranking_result("r1", "A", Context("u1", 1), [Item(id="x", score=1.0)])
+
+    message = caplog.records[-1].getMessage()
+    assert message.startswith(BINARY_PREFIX)
+    assert next(iter_events([message]))["ranking_id"] == "r1"
+
+def test_unknown_log_format_is_rejected():
+    with pytest.raises(ValueError):
+        configure_logging(log_format="xml")
+
+def test_evaluate_files_reads_binary_rankings(tmp_path):
+    rankings = tmp_path / "rankings.log"
+    clicks = tmp_path / "clicks.jsonl"
+    rankings.write_text(encode_records(_records()[:1]) + "\n")
+    clicks.write_text(json.dumps({"ranking_id": "r1", "item_id": "a1"}) + "\n")
+
+    stats = evaluate_files(str(rankings), str(clicks))
+
+    assert (stats.wins_a, stats.wins_b) == (1, 0)
+
+def test_corrupt_line_raises():
+    line = encode_records(_records(), compress=False)
+    with pytest.raises(ValueError):
+        decode_line(line[:len(line) // 2 - (len(line) // 2) % 4])
@@ -0,0 +1,184 @@
+
+import importlib
+import io
+import json
+import sys
+import threading
+import pytest
+from src.context import Context, Item
+import src.observability.logging as obs_logging
+from src.observability.logging import (
+    AsyncLogWriter,
+    configure_logging,
+    flush_logs,
+    is_sampled,
+    log_ranking_result,
+)
+
+@pytest.fixture(autouse=True)
+def reset_logging():
+    yield
+    configure_logging()
+
+def _items(n: int):
+    return [Item(id=f"I{i}", score=float(n - i), source_ranker="A" if i % 2 == 0 else "B") for i in range(n)]
+
+def _context():
+    return Context(user_id="u1", user_hash=1234)
+
+def _lines(stream: io.StringIO):
+    return [json.loads(line) for line in stream.getvalue().splitlines()]
+
+def test_reload_does_not_duplicate_handlers():
+    before = len(obs_logging.logger.handlers)
+    importlib.reload(obs_logging)
+    
+    assert len(obs_logging.logger.handlers) == before
+
+def test_async_logging_writes_batched_lines_after_flush():
+    stream = io.StringIO()
+    configure_logging(asynchronous=True, stream=stream)
+    for i in range(5):
+        log_ranking_result(f"r{i}", "INTERLEAVE", _context(), _items(3))
+    
+    assert flush_logs(timeout=2.0)
+    records = _lines(stream)
+    assert [r["ranking_id"] for r in records] == [f"r{i}" for i in range(5)]
+    assert records[0]["items"][0] == {"id": "I0", "score": 3.0, "rank": 1, "source_ranker": "A", "prob": None}
+
+def test_optimized_credit_is_logged_only_when_present():
+    stream = io.StringIO()
+    configure_logging(asynchronous=True, stream=stream)
+    items = _items(2)
+    items[1] = items[1].with_attribution("B", 0.5, -0.25)
+    log_ranking_result("r1", "INTERLEAVE", _context(), items)
+
+    assert flush_logs(timeout=2.0)
+    logged = _lines(stream)[0]["items"]
+    assert "credit" not in logged[0]
+    assert logged[1]["credit"] == -0.25
+
+def test_async_logging_serializes_on_writer_thread(monkeypatch):
+    stream = io.StringIO()
+    configure_logging(asynchronous=True, stream=stream)
+    queued = []
+    writer = obs_logging._options.writer
+    original = writer.write
+    monkeypatch.setattr(writer, "write", lambda entry: queued.append(entry) or original(entry))
+    items = _items(2)
+    log_ranking_result("r1", "INTERLEAVE", _context(), items)
+    # 積んだ後にアイテムが変更されても、積んだ時点の値が出力される
+    items[0].score = -1.0
+
+    assert flush_logs(timeout=2.0)
+    assert not isinstance(queued[0], str)
+    assert _lines(stream)[0]["items"][0]["score"] == 2.0
+
+def test_unserializable_event_drops_only_itself(caplog):
+    stream = io.StringIO()
+    configure_logging(asynchronous=True, stream=stream)
+    broken = _items(2)
+    broken[1].score = object()
+    log_ranking_result("r0", "INTERLEAVE", _context(), _items(2))
+    with caplog.at_level("WARNING"):
+        log_ranking_result("r1", "INTERLEAVE", _context(), broken)
+        log_ranking_result("r2", "INTERLEAVE", _context(), _items(2))
+        assert flush_logs(timeout=2.0)
+
+    # 同じバッチの他のリクエストのイベントは出力され、捨てたのは1件のみ
+    assert [r["ranking_id"] for r in _lines(stream)] == ["r0", "r2"]
+    assert obs_logging._options.writer.dropped == 1
+    warnings = [json.loads(r.getMessage()) for r in caplog.records if "ranking_log_dropped" in r.getMessage()]
+    assert [w["ranking_id"] for w in warnings] == ["r1"]
+
+def test_sync_and_async_logs_share_stdout(monkeypatch):
+    handlers = [h for h in obs_logging.logger.handlers if getattr(h, "_interleaving_handler", False)]
+    stdout = io.StringIO()
+    monkeypatch.setattr(sys, "stdout", stdout)
+    for handler in handlers:
+        obs_logging.logger.removeHandler(handler)
+    try:
+        # ハンドラーはモジュールの読み込み時に作られるため、差し替えた標準出力で作り直す
+        importlib.reload(obs_logging)
+        log_ranking_result("sync", "INTERLEAVE", _context(), _items(1))
+        configure_logging(asynchronous=True)
+        log_ranking_result("async", "INTERLEAVE", _context(), _items(1))
+        assert flush_logs(timeout=2.0)
+    finally:
+        configure_logging()
+        for handler in [h for h in obs_logging.logger.handlers if getattr(h, "_interleaving_handler", False)]:
+            obs_logging.logger.removeHandler(handler)
+        for handler in handlers:
+            obs_logging.logger.addHandler(handler)
+
+    assert [r["ranking_id"] for r in _lines(stdout)] == ["sync", "async"]
+
+def test_sync_logging_uses_logger(caplog):
+    with caplog.at_level("INFO", logger="interleaving"):
+        log_ranking_result("r1", "A", _context(), _items(2))
+    
+    record = json.loads(caplog.records[-1].getMessage())
+    assert record["event"] == "ranking_generated"
+    assert len(record["items"]) == 2
+
+def test_sampling_is_deterministic_per_ranking_id():
+    ids = [f"ranking-{i}" for i in range(2000)]
+    sampled = [rid for rid in ids if is_sampled(rid, 0.25)]
+    
+    assert sampled == [rid for rid in ids if is_sampled(rid, 0.25)]
+    assert 400 < len(sampled) < 600
+    assert all(is_sampled(rid, 1.0) for rid in ids)
+    assert not any(is_sampled(rid, 0.0) for rid in ids)
+
+def test_sampled_out_rankings_are_not_logged():
+    stream = io.StringIO()
+    configure_logging(asynchronous=True, stream=stream, sample_rate=0.5)
+    ids = [f"ranking-{i}" for i in range(100)]
+    for rid in ids:
+        log_ranking_result(rid, "INTERLEAVE", _context(), _items(1))
+    flush_logs(timeout=2.0)
+    
+    assert [r["ranking_id"] for r in _lines(stream)] == [rid for rid in ids if is_sampled(rid, 0.5)]
+
+def test_max_items_caps_logged_items():
+    stream = io.StringIO()
+    configure_logging(asynchronous=True, stream=stream, max_items=2)
+    log_ranking_result("r1", "INTERLEAVE", _context(), _items(5))
+    log_ranking_result("r2", "INTERLEAVE", _context(), _items(2))
+    flush_logs(timeout=2.0)
+    
+    truncated, full = _lines(stream)
+    assert [item["id"] for item in truncated["items"]] == ["I0", "I1"]
+    assert truncated["item_count"] == 5
+    assert "item_count" not in full
+
+class _BlockingStream(io.StringIO):
+    def __init__(self):
+        super().__init__()
+        self.release = threading.Event()
+
+    def write(self, s):
+        self.release.wait(2.0)
+        return super().write(s)
+
+def test_full_queue_drops_lines_without_blocking():
+    stream = _BlockingStream()
+    writer = AsyncLogWriter(stream, max_queue=2, batch_size=1)
+    results = [writer.write(f"line{i}") for i in range(10)]
+    
+    assert not all(results)
+    assert writer.dropped == results.count(False)
+    stream.release.set()
+    writer.close(timeout=2.0)
+    assert len(stream.getvalue().splitlines()) == results.count(True)
+
+def test_multileave_rankers_are_logged():
+    stream = io.StringIO()
+    configure_logging(asynchronous=True, stream=stream)
+    log_ranking_result("r1", "MULTILEAVE", _context(), _items(2), rankers=["A", "B", "C", "D"])
+    log_ranking_result("r2", "INTERLEAVE", _context(), _items(2))
+    flush_logs(timeout=2.0)
+    
+    multileaved, interleaved = _lines(stream)
+    assert multileaved["rankers"] == ["A", "B", "C", "D"]
+    assert "rankers" not in interleaved
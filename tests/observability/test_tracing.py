@@ -0,0 +1,165 @@
+import io
+import json
+import time
+import pytest
+from src.config import ConfigManager, ExperimentConfig
+from src.context import Context, Item
+from src.execution.executor import ABExecutor
+from src.interleaving.bucketer import Bucketer
+from src.interleaving.method import OptimizedInterleaver, TeamDraftInterleaver
+from src.interleaving.optimized import wait_for_tables
+from src.observability.logging import configure_logging, flush_logs, log_ranking_result
+from src.observability.tracing import (
+    annotate,
+    configure_tracing,
+    current_trace,
+    finish_trace,
+    format_emf,
+    start_trace,
+    timed,
+)
+
+@pytest.fixture(autouse=True)
+def reset_tracing():
+    yield
+    finish_trace()
+    configure_tracing(enabled=False)
+    configure_logging()
+
+class SleepingRanker:
+    def __init__(self, prefix: str, latency: float):
+        self.prefix = prefix
+        self.latency = latency
+
+    def rank(self, context):
+        time.sleep(self.latency)
+        return [Item(id=f"{self.prefix}{i}", score=10.0 - i) for i in range(5)]
+
+def _logged(stream: io.StringIO):
+    flush_logs()
+    return [json.loads(line) for line in stream.getvalue().splitlines()]
+
+def test_tracing_is_disabled_by_default():
+    stream = io.StringIO()
+    configure_logging(asynchronous=True, stream=stream)
+
+    assert start_trace() is None
+    annotate("config_cache", "hit")
+    TeamDraftInterleaver(seed=0).interleave([Item("a", 1.0)], [Item("b", 1.0)])
+    log_ranking_result("r1", "INTERLEAVE", Context(user_id="u1", user_hash=1), [])
+
+    assert current_trace() is None
+    assert "timings_ms" not in _logged(stream)[0]
+
+def test_timed_accumulates_repeated_stages():
+    configure_tracing()
+    trace = start_trace()
+
+    @timed("work")
+    def work():
+        time.sleep(0.002)
+
+    work()
+    work()
+
+    assert trace.stages["work"] >= 4.0
+
+def test_request_stages_are_added_to_ranking_log(monkeypatch):
+    monkeypatch.setenv("INTERLEAVING_MODE", "INTERLEAVE")
+    monkeypatch.setenv("INTERLEAVING_SAMPLING_RATE", "1.0")
+    monkeypatch.setenv("INTERLEAVING_PARALLEL_ENABLED", "true")
+    stream = io.StringIO()
+    emf = io.StringIO()
+    configure_logging(asynchronous=True, stream=stream)
+    configure_tracing(emf=True, namespace="InterleavingTest", stream=emf)
+    manager = ConfigManager(source="env", ttl_seconds=3600.0)
+    ctx = Context(user_id="u1", user_hash=1)
+
+    for expected_cache in ("miss", "hit"):
+        start_trace()
+        config = manager.get_config()
+        mode = Bucketer().determine_mode(ctx.user_hash, config)
+        result = ABExecutor().run(SleepingRanker("a", 0.03), SleepingRanker("b", 0.03), ctx, config)
+        items = TeamDraftInterleaver(seed=0).interleave(result.list_a, result.list_b)
+        log_ranking_result("r1", mode, ctx, items)
+        trace = finish_trace()
+
+        event = _logged(stream)[-1]
+        assert event["config_cache"] == expected_cache
+        assert event["parallel"] is True
+        # A / B を並行実行しているので、合計は全体の約2倍になる
+        assert event["parallel_speedup"] > 1.5
+        timings = event["timings_ms"]
+        assert set(timings) == {"config", "bucket", "ranker_a", "ranker_b", "rank", "merge", "total"}
+        assert timings["ranker_a"] >= 30.0 and timings["rank"] < timings["ranker_a"] + timings["ranker_b"]
+        assert timings["total"] >= timings["rank"]
+        assert "logging" in trace.stages
+
+    lines = [json.loads(line) for line in emf.getvalue().splitlines()]
+    assert len(lines) == 2
+    metrics = lines[-1]["_aws"]["CloudWatchMetrics"][0]
+    assert metrics["Namespace"] == "InterleavingTest"
+    assert metrics["Dimensions"] == [["mode"]]
+    names = {metric["Name"] for metric in metrics["Metrics"]}
+    assert {"rank_ms", "logging_ms", "total_ms", "parallel_speedup"} <= names
+    assert lines[-1]["mode"] == "INTERLEAVE"
+    assert lines[-1]["rank_ms"] > 0.0
+
+def test_sequential_execution_records_speedup_near_one():
+    configure_tracing()
+    trace = start_trace()
+    config = ExperimentConfig(mode="INTERLEAVE", sampling_rate=1.0, parallel_enabled=False)
+
+    ABExecutor().run(SleepingRanker("a", 0.01), SleepingRanker("b", 0.01), Context("u1", 1), config)
+
+    assert trace.fields["parallel"] is False
+    assert 0.8 < trace.fields["parallel_speedup"] <= 1.0
+
+def test_run_many_records_each_ranker():
+    configure_tracing()
+    trace = start_trace()
+    config = ExperimentConfig(mode="MULTILEAVE", sampling_rate=1.0, parallel_enabled=True)
+    rankers = [SleepingRanker(name, 0.01) for name in ("a", "b", "c")]
+
+    ABExecutor().run_many(rankers, ["A", "B", "C"], Context("u1", 1), config)
+
+    assert {"ranker_A", "ranker_B", "ranker_C", "rank"} <= set(trace.stages)
+
+def test_format_emf_without_mode_uses_unknown_dimension():
+    configure_tracing()
+    trace = start_trace()
+    trace.record("config", 1.5)
+
+    document = json.loads(format_emf(trace, "ns"))
+
+    assert document["mode"] == "UNKNOWN"
+    assert document["config_ms"] == 1.5
+
+def test_sampled_out_ranking_still_records_logging_stage():
+    stream = io.StringIO()
+    configure_logging(asynchronous=True, stream=stream, sample_rate=0.0)
+    configure_tracing()
+    trace = start_trace()
+    log_ranking_result("r1", "INTERLEAVE", Context(user_id="u1", user_hash=1), [Item("a", 1.0)])
+
+    assert _logged(stream) == []
+    assert "logging" in trace.stages
+    assert trace.fields["mode"] == "INTERLEAVE"
+
+def test_optimized_allocation_cache_state_is_logged():
+    stream = io.StringIO()
+    configure_logging(asynchronous=True, stream=stream)
+    configure_tracing()
+    ctx = Context(user_id="u1", user_hash=1)
+    lists = ([Item("t1", 1.0), Item("t2", 1.0), Item("tc", 1.0)], [Item("tc", 1.0), Item("u1", 1.0)])
+
+    states = []
+    for _ in range(2):
+        start_trace()
+        items = OptimizedInterleaver(seed=0).interleave(*lists)
+        log_ranking_result("r1", "INTERLEAVE", ctx, items)
+        finish_trace()
+        states.append(_logged(stream)[-1]["allocation_cache"])
+        wait_for_tables(timeout=5.0)
+
+    assert states[-1] == "hit"
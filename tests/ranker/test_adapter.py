@@ -1,7 +1,7 @@
 
 import pytest
 from typing import List, Dict, Any
-from src.context import Context, Item
+from src.context import CompactItem, Context, Item
 from src.ranker.adapter import LambdaRankerAdapter
 
 # Mock existing logic function
@@ -29,3 +29,76 @@ def test_adapter_converts_context_and_result():
     assert items[0].meta == {'meta_data': 'foo'}
     
     assert items[1].id == 'item2'
+
+def test_adapter_rank_stream_is_lazy_for_generator_logic():
+    pulled = []
+    
+    def generator_logic(context: Dict[str, Any]):
+        for i in range(1000):
+            pulled.append(i)
+            yield {'id': f'item{i}', 'score': 1000 - i}
+    
+    adapter = LambdaRankerAdapter(logic_func=generator_logic)
+    stream = adapter.rank_stream(Context(user_id="user1", user_hash=123))
+    
+    # ジェネレーターは取り出した分だけ進む
+    assert pulled == []
+    first = next(stream)
+    assert first.id == 'item0'
+    assert first.score == 1000.0
+    assert pulled == [0]
+
+def test_adapter_rank_accepts_generator_logic():
+    def generator_logic(context: Dict[str, Any]):
+        yield {'id': 1, 'score': '0.5', 'extra': True}
+    
+    adapter = LambdaRankerAdapter(logic_func=generator_logic)
+    items = adapter.rank(Context(user_id="user1", user_hash=123))
+    
+    assert len(items) == 1
+    assert items[0].id == '1'
+    assert items[0].score == 0.5
+    assert items[0].meta == {'extra': True}
+
+def test_adapter_lazy_meta_keeps_raw_dict():
+    raw_rows = [
+        {'id': 'item1', 'score': 0.9, 'meta_data': 'foo'},
+        {'id': 2, 'score': 1},
+    ]
+    adapter = LambdaRankerAdapter(logic_func=lambda ctx: raw_rows, lazy_meta=True)
+    
+    items = adapter.rank(Context(user_id="user1", user_hash=123))
+    
+    assert isinstance(items[0], CompactItem)
+    assert items[0].raw is raw_rows[0]
+    assert items[0].meta == {'meta_data': 'foo'}
+    assert items[1].id == '2'
+    assert items[1].score == 1.0
+    assert type(items[1].score) is float
+
+def test_async_adapter_awaits_coroutine_logic():
+    import asyncio
+    from src.ranker.adapter import AsyncLambdaRankerAdapter
+
+    async def logic(context: Dict[str, Any]):
+        await asyncio.sleep(0)
+        return mock_logic_func(context)
+
+    items = asyncio.run(AsyncLambdaRankerAdapter(logic).rank(Context(user_id="user1", user_hash=123)))
+
+    assert [item.id for item in items] == ['item1', 'item2']
+    assert items[0].meta == {'meta_data': 'foo'}
+
+def test_async_adapter_collects_async_generator_with_lazy_meta():
+    import asyncio
+    from src.ranker.adapter import AsyncLambdaRankerAdapter
+
+    async def logic(context: Dict[str, Any]):
+        for i in range(3):
+            yield {'id': i, 'score': 3 - i, 'user': context['user_id']}
+
+    items = asyncio.run(AsyncLambdaRankerAdapter(logic, lazy_meta=True).rank(Context(user_id="user1", user_hash=123)))
+
+    assert all(isinstance(item, CompactItem) for item in items)
+    assert [item.id for item in items] == ['0', '1', '2']
+    assert items[0].meta == {'user': 'user1'}
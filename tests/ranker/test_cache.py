@@ -0,0 +1,160 @@
+import concurrent.futures
+import pytest
+from src.context import Context, Item
+from src.ranker.cache import CachedRanker, RankingCache, cached_rankers
+
+class CountingRanker:
+    def __init__(self, prefix: str = "item"):
+        self.prefix = prefix
+        self.calls = 0
+
+    def rank(self, context):
+        self.calls += 1
+        return [Item(id=f"{self.prefix}{i}", score=10.0 - i) for i in range(5)]
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+def test_cached_ranker_returns_cached_result_and_counts_hits():
+    ranker = CountingRanker()
+    cached = CachedRanker(ranker, "A", RankingCache())
+    ctx = Context(user_id="u1", user_hash=1, params={"q": "shoes"})
+
+    first = cached.rank(ctx)
+    second = cached.rank(ctx)
+
+    assert ranker.calls == 1
+    assert [item.id for item in second] == [item.id for item in first]
+    stats = cached.cache.stats()
+    assert (stats.hits, stats.misses) == (1, 1)
+    assert stats.hit_rate == 0.5
+
+def test_returned_list_can_be_modified_without_affecting_cache():
+    cached = CachedRanker(CountingRanker(), "A")
+    ctx = Context(user_id="u1", user_hash=1)
+
+    cached.rank(ctx).clear()
+
+    assert len(cached.rank(ctx)) == 5
+
+def test_key_params_select_fields_so_pagination_hits_cache():
+    ranker = CountingRanker()
+    cached = CachedRanker(ranker, "A", key_params=["q"])
+
+    cached.rank(Context(user_id="u1", user_hash=1, params={"q": "shoes", "page": 1}))
+    cached.rank(Context(user_id="u1", user_hash=1, params={"q": "shoes", "page": 2}))
+    assert ranker.calls == 1
+
+    cached.rank(Context(user_id="u1", user_hash=1, params={"q": "bags", "page": 1}))
+    cached.rank(Context(user_id="u2", user_hash=2, params={"q": "shoes", "page": 1}))
+    assert ranker.calls == 3
+
+def test_unhashable_params_are_frozen_into_key():
+    ranker = CountingRanker()
+    cached = CachedRanker(ranker, "A")
+
+    cached.rank(Context(user_id="u1", user_hash=1, params={"filters": {"color": ["red", "blue"]}}))
+    cached.rank(Context(user_id="u1", user_hash=1, params={"filters": {"color": ["red", "blue"]}}))
+
+    assert ranker.calls == 1
+
+def test_rankers_sharing_a_cache_are_keyed_by_name():
+    ranker_a, ranker_b = CountingRanker("a"), CountingRanker("b")
+    rankers = cached_rankers({"A": ranker_a, "B": ranker_b})
+    ctx = Context(user_id="u1", user_hash=1)
+
+    assert rankers["A"].rank(ctx)[0].id == "a0"
+    assert rankers["B"].rank(ctx)[0].id == "b0"
+    assert rankers["A"].rank(ctx)[0].id == "a0"
+    assert (ranker_a.calls, ranker_b.calls) == (1, 1)
+    assert rankers["A"].cache is rankers["B"].cache
+
+def test_entries_expire_after_ttl():
+    clock = FakeClock()
+    ranker = CountingRanker()
+    cache = RankingCache(ttl_seconds=10.0, clock=clock)
+    cached = CachedRanker(ranker, "A", cache)
+    ctx = Context(user_id="u1", user_hash=1)
+
+    cached.rank(ctx)
+    clock.now = 9.9
+    cached.rank(ctx)
+    assert ranker.calls == 1
+
+    clock.now = 10.0
+    cached.rank(ctx)
+    assert ranker.calls == 2
+    assert cache.stats().expirations == 1
+
+def test_least_recently_used_entry_is_evicted():
+    ranker = CountingRanker()
+    cache = RankingCache(max_entries=2)
+    cached = CachedRanker(ranker, "A", cache)
+    users = [Context(user_id=f"u{i}", user_hash=i) for i in range(3)]
+
+    cached.rank(users[0])
+    cached.rank(users[1])
+    cached.rank(users[0])  # u0 を最近使ったことにする
+    cached.rank(users[2])  # u1 が追い出される
+
+    assert len(cache) == 2
+    assert cache.stats().evictions == 1
+    cached.rank(users[0])
+    assert ranker.calls == 3
+    cached.rank(users[1])
+    assert ranker.calls == 4
+
+def test_rank_stream_stores_result_even_if_stream_is_cut_at_k():
+    ranker = CountingRanker()
+    cached = CachedRanker(ranker, "A")
+    ctx = Context(user_id="u1", user_hash=1)
+
+    # Interleaver は k 件取り出した時点でストリームを打ち切る
+    stream = cached.rank_stream(ctx)
+    next(stream)
+    del stream
+    assert len(cached.cache) == 1
+
+    assert [item.id for item in cached.rank_stream(ctx)] == [f"item{i}" for i in range(5)]
+    assert len(cached.rank(ctx)) == 5
+    assert ranker.calls == 1
+
+def test_paging_params_are_excluded_from_default_key():
+    ranker = CountingRanker()
+    cached = CachedRanker(ranker, "A")
+
+    for page in range(3):
+        cached.rank(Context(user_id="u1", user_hash=1, params={"q": "shoes", "page": page, "offset": 20 * page}))
+    cached.rank(Context(user_id="u1", user_hash=1, params={"q": "shoes", "page_token": "abc"}))
+    assert ranker.calls == 1
+
+    cached.rank(Context(user_id="u1", user_hash=1, params={"q": "bags", "page": 1}))
+    assert ranker.calls == 2
+
+    # exclude_params を空にすると params 全体をキーにする
+    strict = CachedRanker(ranker, "B", exclude_params=())
+    strict.rank(Context(user_id="u1", user_hash=1, params={"q": "shoes", "page": 1}))
+    strict.rank(Context(user_id="u1", user_hash=1, params={"q": "shoes", "page": 2}))
+    assert ranker.calls == 4
+
+def test_invalid_max_entries():
+    with pytest.raises(ValueError):
+        RankingCache(max_entries=0)
+
+def test_cache_is_safe_from_executor_threads():
+    ranker = CountingRanker()
+    cache = RankingCache(max_entries=64)
+    cached = CachedRanker(ranker, "A", cache)
+    contexts = [Context(user_id=f"u{i % 100}", user_hash=i) for i in range(2000)]
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=8) as pool:
+        results = list(pool.map(cached.rank, contexts))
+
+    assert all(len(items) == 5 for items in results)
+    stats = cache.stats()
+    assert stats.hits + stats.misses == len(contexts)
+    assert len(cache) <= 64
@@ -0,0 +1,118 @@
+import threading
+import time
+import pytest
+from src.config import ExperimentConfig
+from src.context import Context, Item
+from src.ranker.hedge import HedgedRanker, HedgePolicy, LatencyHistogram
+
+CTX = Context(user_id="u1", user_hash=1)
+
+class ScriptedRanker:
+    """呼び出しごとに (待ち時間, 例外) を順に使うランカー。結果の id に呼び出し番号を入れる"""
+    def __init__(self, script):
+        self.script = list(script)
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def rank(self, context):
+        with self._lock:
+            call = self.calls
+            self.calls += 1
+        delay, error = self.script[min(call, len(self.script) - 1)]
+        time.sleep(delay)
+        if error is not None:
+            raise error
+        return [Item(id=f"call{call}", score=1.0)]
+
+def test_latency_histogram_percentile():
+    histogram = LatencyHistogram(window=100)
+    assert histogram.percentile(0.95) is None
+    for latency in range(1, 201):
+        histogram.record(float(latency))
+    # 直近 100 件 (101..200) の分位点
+    assert len(histogram) == 100
+    assert histogram.percentile(0.95) == 195.0
+    assert histogram.percentile(0.5) == 150.0
+    assert histogram.percentile(1.0) == 200.0
+
+def test_fast_primary_is_not_hedged():
+    ranker = ScriptedRanker([(0.0, None)])
+    hedged = HedgedRanker(ranker, policy=HedgePolicy(delay_ms=200.0))
+
+    assert [item.id for item in hedged.rank(CTX)] == ["call0"]
+    assert ranker.calls == 1
+    assert hedged.stats().hedges == 0
+    assert len(hedged.histogram) == 1
+
+def test_slow_primary_is_hedged_and_hedge_wins():
+    ranker = ScriptedRanker([(0.5, None), (0.0, None)])
+    hedged = HedgedRanker(ranker, policy=HedgePolicy(delay_ms=20.0))
+
+    started_at = time.monotonic()
+    items = hedged.rank(CTX)
+
+    assert [item.id for item in items] == ["call1"]
+    assert time.monotonic() - started_at < 0.4
+    stats = hedged.stats()
+    assert (stats.calls, stats.hedges, stats.hedge_wins) == (1, 1, 1)
+
+def test_primary_result_is_used_when_hedge_fails():
+    ranker = ScriptedRanker([(0.1, None), (0.0, RuntimeError("hedge failed"))])
+    hedged = HedgedRanker(ranker, policy=HedgePolicy(delay_ms=10.0))
+
+    assert [item.id for item in hedged.rank(CTX)] == ["call0"]
+    assert hedged.stats().hedge_wins == 0
+
+def test_both_failures_raise_first_error():
+    ranker = ScriptedRanker([(0.05, ValueError("primary")), (0.2, RuntimeError("hedge"))])
+    hedged = HedgedRanker(ranker, policy=HedgePolicy(delay_ms=10.0))
+
+    with pytest.raises(ValueError, match="primary"):
+        hedged.rank(CTX)
+
+def test_error_before_delay_is_not_retried():
+    ranker = ScriptedRanker([(0.0, ValueError("boom"))])
+    hedged = HedgedRanker(ranker, policy=HedgePolicy(delay_ms=200.0))
+
+    with pytest.raises(ValueError):
+        hedged.rank(CTX)
+    assert ranker.calls == 1
+
+def test_auto_delay_follows_rolling_percentile():
+    histogram = LatencyHistogram()
+    policy = HedgePolicy(initial_delay_ms=80.0, min_samples=10, min_delay_ms=5.0)
+    hedged = HedgedRanker(ScriptedRanker([(0.0, None)]), policy=policy, histogram=histogram)
+    assert hedged.hedge_delay_ms() == 80.0
+
+    for latency in [10.0] * 18 + [40.0, 50.0]:
+        histogram.record(latency)
+    assert hedged.hedge_delay_ms() == 40.0
+
+    # 分位点が下限を下回る場合は min_delay_ms
+    hedged.policy = HedgePolicy(min_samples=10, min_delay_ms=15.0, percentile=0.5)
+    assert hedged.hedge_delay_ms() == 15.0
+
+def test_disabled_policy_runs_inline_and_records_latency():
+    ranker = ScriptedRanker([(0.0, None)])
+    hedged = HedgedRanker(ranker, policy=HedgePolicy(enabled=False))
+    caller = threading.current_thread()
+    seen = []
+    ranker.rank = lambda context, rank=ranker.rank: (seen.append(threading.current_thread()), rank(context))[1]
+
+    hedged.rank(CTX)
+
+    assert seen == [caller]
+    assert len(hedged.histogram) == 1
+
+def test_configure_applies_experiment_config():
+    hedged = HedgedRanker(ScriptedRanker([(0.0, None)]), policy=HedgePolicy(min_samples=7))
+    config = ExperimentConfig(
+        mode="INTERLEAVE", sampling_rate=1.0, parallel_enabled=True,
+        hedge_enabled=True, hedge_delay_ms=30.0, hedge_percentile=0.9,
+    )
+
+    hedged.configure(config)
+
+    assert hedged.policy == HedgePolicy(enabled=True, delay_ms=30.0, percentile=0.9, min_samples=7)
+    hedged.configure(ExperimentConfig(mode="A", sampling_rate=0.0, parallel_enabled=False))
+    assert hedged.policy.enabled is False
@@ -0,0 +1,152 @@
+import gc
+import threading
+import time
+import numpy as np
+import pytest
+from src.config import ExperimentConfig
+from src.context import CandidateBlock, Context
+from src.execution.executor import ABExecutor
+from src.ranker.two_phase import ScoringRanker, SharedRetriever, two_phase_rankers
+
+class CountingRetrieve:
+    def __init__(self, delay: float = 0.0):
+        self.delay = delay
+        self.calls = 0
+        self.lock = threading.Lock()
+
+    def __call__(self, ctx):
+        with self.lock:
+            self.calls += 1
+        time.sleep(self.delay)
+        return [{"id": f"item{i}", "ctr": i / 10.0, "price": 10.0 - i} for i in range(10)]
+
+def by_ctr(block):
+    return block["ctr"]
+
+def by_price(block):
+    return block["price"]
+
+@pytest.fixture
+def ctx():
+    return Context(user_id="u1", user_hash=1, params={"q": "shoes"})
+
+def test_retrieve_runs_once_per_context_and_is_shared(ctx):
+    retrieve = CountingRetrieve()
+    rankers = two_phase_rankers(retrieve, {"A": by_ctr, "B": by_price}, features=["ctr", "price"])
+
+    list_a = rankers["A"].rank(ctx)
+    list_b = rankers["B"].rank(ctx)
+
+    assert retrieve.calls == 1
+    assert [item.id for item in list_a[:2]] == ["item9", "item8"]
+    assert [item.id for item in list_b[:2]] == ["item0", "item1"]
+    assert list_a[0].meta["price"] == 1.0
+    # 別のリクエスト (Context) では取り直す
+    rankers["A"].rank(Context(user_id="u1", user_hash=1, params={"q": "shoes"}))
+    assert retrieve.calls == 2
+
+def test_concurrent_rankers_share_one_retrieve(ctx):
+    retrieve = CountingRetrieve(delay=0.05)
+    rankers = two_phase_rankers(retrieve, {"A": by_ctr, "B": by_price}, features=["ctr", "price"])
+
+    config = ExperimentConfig(mode="INTERLEAVE", sampling_rate=1.0, parallel_enabled=True)
+    result = ABExecutor().run(rankers["A"], rankers["B"], ctx, config)
+
+    assert retrieve.calls == 1
+    assert not result.degraded
+    assert len(result.list_a) == len(result.list_b) == 10
+
+def test_scorers_read_the_same_feature_arrays(ctx):
+    seen = []
+
+    def scorer(block):
+        seen.append(block["ctr"])
+        return block["ctr"]
+
+    rankers = two_phase_rankers(CountingRetrieve(), {"A": scorer, "B": scorer}, features=["ctr"])
+    rankers["A"].rank(ctx)
+    rankers["B"].rank(ctx)
+
+    assert seen[0] is seen[1]
+
+def test_scorer_cannot_modify_shared_features(ctx):
+    def mutating(block):
+        block["ctr"][:] = 0.0
+        return block["ctr"]
+
+    ranker = ScoringRanker(SharedRetriever(CountingRetrieve(), ["ctr"]), mutating)
+
+    with pytest.raises(ValueError):
+        ranker.rank(ctx)
+
+def test_retrieve_error_is_shared_by_waiters(ctx):
+    calls = []
+    started = threading.Event()
+    release = threading.Event()
+
+    def failing(c):
+        calls.append(1)
+        started.set()
+        release.wait(2.0)
+        raise RuntimeError("db down")
+
+    retriever = SharedRetriever(failing)
+    errors = []
+
+    def call():
+        try:
+            retriever.retrieve(ctx)
+        except RuntimeError as e:
+            errors.append(e)
+
+    first = threading.Thread(target=call)
+    first.start()
+    assert started.wait(2.0)
+    waiter = threading.Thread(target=call)
+    waiter.start()
+    time.sleep(0.05)
+    release.set()
+    first.join(2.0)
+    waiter.join(2.0)
+
+    assert len(calls) == 1
+    assert len(errors) == 2 and errors[0] is errors[1]
+
+def test_failed_retrieve_is_not_kept():
+    # 例外のトレースバックが Context を参照するため、失敗したエントリーを残すと Context ごと解放されない
+    def failing(c):
+        raise RuntimeError("db down")
+
+    retriever = SharedRetriever(failing)
+    for i in range(100):
+        with pytest.raises(RuntimeError):
+            retriever.retrieve(Context(user_id=f"u{i}", user_hash=i))
+
+    assert len(retriever) == 0
+    # 同じ Context でも失敗の後は再実行する
+    ctx = Context(user_id="u1", user_hash=1)
+    for _ in range(2):
+        with pytest.raises(RuntimeError):
+            retriever.retrieve(ctx)
+    assert retriever.calls == 102
+
+def test_retrieve_func_may_return_candidate_block(ctx):
+    def retrieve(c):
+        return CandidateBlock(["x", "y"], {"s": np.array([1.0, 2.0])})
+
+    ranker = ScoringRanker(SharedRetriever(retrieve), lambda block: block["s"] * 2)
+
+    items = list(ranker.rank_stream(ctx))
+    assert [(item.id, item.score) for item in items] == [("y", 4.0), ("x", 2.0)]
+    assert items[0].meta == {}
+
+def test_entries_are_released_with_context():
+    retriever = SharedRetriever(CountingRetrieve(), ["ctr"])
+    ctx = Context(user_id="u1", user_hash=1)
+    retriever.retrieve(ctx)
+    assert len(retriever) == 1
+
+    del ctx
+    gc.collect()
+
+    assert len(retriever) == 0
@@ -1,12 +1,13 @@
 
 import uuid
-import concurrent.futures
-from unittest.mock import MagicMock, patch
 
-from src.config import ConfigManager, ExperimentConfig
+from src.config import ConfigManager
+from src.config_source import StaticConfigSource
 from src.context import Context, Item
+from src.execution.executor import ABExecutor
 from src.interleaving.bucketer import Bucketer
 from src.interleaving.method import TeamDraftInterleaver
+from src.interleaving.rng import request_random
 from src.ranker.adapter import LambdaRankerAdapter
 from src.observability.logging import log_ranking_result
 
@@ -27,22 +28,21 @@ def logic_b(ctx: dict):
         {'id': 'B2', 'score': 9.0, 'algo': 'b'},
     ]
 
+# Executor is shared across invocations (its thread pool lives at module level)
+ab_executor = ABExecutor(timeout_b=0.2)
+interleaver = TeamDraftInterleaver()  # shared across requests; randomness is passed per call
+
 def sample_handler(user_id: str, user_hash: int):
     print(f"--- Handling Request: user_id={user_id}, hash={user_hash} ---")
     
-    # 1. Config (In real usage, this fetches from SSM)
-    # Patching boto3 to avoid NoRegionError during ConfigManager init
-    with patch('src.config.boto3.client') as mock_boto:
-        config_manager = ConfigManager()
-        # Mocking internals for demo to force INTERLEAVE mode
-        config_manager._fetch_from_ssm = MagicMock(return_value=ExperimentConfig(
-            mode="INTERLEAVE",
-            sampling_rate=0.5, # 50%
-            parallel_enabled=True
-        ))
-        
-        config = config_manager.get_config()
-        print(f"Config Loaded: mode={config.mode}, rate={config.sampling_rate}, parallel={config.parallel_enabled}")
+    # 1. Config (In real usage, this fetches from SSM; here a static document forces INTERLEAVE mode)
+    config_manager = ConfigManager(source=StaticConfigSource({
+        "mode": "INTERLEAVE",
+        "sampling_rate": 0.5, # 50%
+        "parallel_enabled": True,
+    }))
+    config = config_manager.get_config()
+    print(f"Config Loaded: mode={config.mode}, rate={config.sampling_rate}, parallel={config.parallel_enabled}")
 
     # 2. Bucketing
     bucketer = Bucketer()
@@ -58,26 +58,28 @@ def sample_handler(user_id: str, user_hash: int):
     ranker_b = LambdaRankerAdapter(logic_b)
     
     items = []
+    ranking_id = str(uuid.uuid4())
     
     if mode == "INTERLEAVE":
-        # Parallel Execution
-        with concurrent.futures.ThreadPoolExecutor(max_workers=2) as executor:
-            future_a = executor.submit(ranker_a.rank, ctx)
-            future_b = executor.submit(ranker_b.rank, ctx)
+        # Parallel Execution (honours config.parallel_enabled, degrades to A if B times out)
+        ab_result = ab_executor.run(ranker_a, ranker_b, ctx, config)
+        list_a = ab_result.list_a
+        list_b = ab_result.list_b
+        
+        if ab_result.degraded:
+            print(f"Ranker B degraded ({ab_result.reason}), serving A only")
+            mode = "A"
+            items = list_a
+        else:
+            print(f"Ranker A returned {len(list_a)} items")
+            print(f"Ranker B returned {len(list_b)} items")
             
-            list_a = future_a.result()
-            list_b = future_b.result()
+            # Interleaving (shared interleaver, reproducible per-request randomness)
+            items = interleaver.interleave(list_a, list_b, rng=request_random(user_hash, ranking_id, config.salt))
             
-        print(f"Ranker A returned {len(list_a)} items")
-        print(f"Ranker B returned {len(list_b)} items")
-        
-        # Interleaving
-        interleaver = TeamDraftInterleaver(seed=user_hash) # Use user_hash as seed for consistency
-        items = interleaver.interleave(list_a, list_b)
-        
-        # Display simplified result
-        display_res = [f"{item.id}({item.source_ranker})" for item in items]
-        print(f"Interleaved Result: {display_res}")
+            # Display simplified result
+            display_res = [f"{item.id}({item.source_ranker})" for item in items]
+            print(f"Interleaved Result: {display_res}")
         
     elif mode == "A":
         items = ranker_a.rank(ctx)
@@ -91,7 +93,6 @@ def sample_handler(user_id: str, user_hash: int):
         print(f"Result (Fallback): {[item.id for item in items]}")
         
     # 5. Logging
-    ranking_id = str(uuid.uuid4())
     log_ranking_result(ranking_id, mode, ctx, items)
     
     return items
@@ -0,0 +1,64 @@
+import json
+from benchmarks.harness import BenchmarkResult, check_thresholds, compare_to_baseline, percentile, summarize
+from benchmarks.run import main, run_cases
+from benchmarks.suite import build_cases, make_lists
+
+def _result(name: str, p90: float) -> BenchmarkResult:
+    return BenchmarkResult(name=name, samples=10, p50_us=p90 / 2, p90_us=p90, p99_us=p90 * 2, mean_us=p90 / 2)
+
+def test_percentile_interpolates():
+    values = [float(v) for v in range(1, 101)]
+    assert percentile(values, 0.5) == 50.5
+    assert percentile(values, 0.99) == 99.01
+    assert percentile([], 0.5) == 0.0
+    result = summarize("x", [3.0, 1.0, 2.0])
+    assert (result.p50_us, result.mean_us, result.samples) == (2.0, 2.0, 3)
+
+def test_make_lists_respects_overlap():
+    list_a, list_b = make_lists(100, 0.3)
+    assert len(list_a) == len(list_b) == 100
+    assert len({item.id for item in list_a} & {item.id for item in list_b}) == 30
+
+def test_check_thresholds_uses_patterns():
+    results = [_result("interleave/team_draft/n=20", 150.0), _result("interleave/optimized/n=20", 150.0)]
+    violations = check_thresholds(results, {"interleave/team_draft/*": {"p90_us": 100.0}})
+    assert len(violations) == 1
+    assert violations[0].startswith("interleave/team_draft/n=20")
+
+def test_compare_to_baseline_ignores_small_absolute_changes():
+    baseline = {"a": _result("a", 100.0).to_dict(), "b": _result("b", 2.0).to_dict()}
+    results = [_result("a", 130.0), _result("b", 4.0), _result("c", 1000.0)]
+    violations = compare_to_baseline(results, baseline, tolerance=0.25)
+    assert len(violations) == 1
+    assert violations[0].startswith("a:")
+
+def test_run_cases_filters_and_reports(tmp_path):
+    results = run_cases(build_cases(quick=True), "interleave/team_draft/n=20/*")
+    assert [result.name for result in results] == [
+        "interleave/team_draft/n=20/overlap=0.0",
+        "interleave/team_draft/n=20/overlap=0.5",
+    ]
+    assert all(result.samples == 50 and result.p50_us <= result.p99_us for result in results)
+
+def test_cold_optimized_case_misses_the_table_cache_every_time(monkeypatch):
+    import src.interleaving.optimized as optimized
+    states = []
+    original = optimized.lookup_table
+    monkeypatch.setattr(optimized, "lookup_table", lambda *args: states.append(original(*args)) or states[-1])
+
+    results = run_cases(build_cases(quick=True), "interleave/optimized_cold/n=20/overlap=0.5")
+
+    assert [result.name for result in results] == ["interleave/optimized_cold/n=20/overlap=0.5"]
+    # (求解が clear_tables と lookup_table の間に終わった回のみヒットし得る)
+    assert states and sum(table is None for table in states) >= 0.9 * len(states)
+
+def test_main_writes_json_and_fails_on_regression(tmp_path):
+    output = tmp_path / "result.json"
+    thresholds = tmp_path / "thresholds.json"
+    thresholds.write_text(json.dumps({"config/*": {"p50_us": 0.0}}))
+
+    code = main(["--quick", "--filter", "config/*", "--output", str(output), "--thresholds", str(thresholds)])
+
+    assert code == 1
+    report = json.loads(output.read_text())
+    assert set(report["results"]["config/get_config/cached"]) >= {"p50_us", "p90_us", "p99_us"}
@@ -1,12 +1,13 @@
 
 import pytest
 import time
+from typing import Optional
 from unittest.mock import MagicMock, patch
-from src.config import ConfigManager, ExperimentConfig
+from src.config import CONFIG_KEYS, ConfigManager, ExperimentConfig
 
 @pytest.fixture
 def mock_ssm_client():
-    with patch('src.config.boto3.client') as mock:
+    with patch('boto3.client') as mock:
         yield mock.return_value
 
 def test_default_values(mock_ssm_client):
@@ -88,5 +89,191 @@ def test_config_cache_expiration(mock_ssm_client):
     manager.get_config()
     time.sleep(0.2) # TTL切れ待ち
     manager.get_config()
+    manager.wait_for_refresh(timeout=1.0) # 再取得はバックグラウンドで行われる
     
     assert mock_ssm_client.get_parameters.call_count == 2
+
+class FakeSSMClient:
+    """get_parameters の応答を差し替えられるローカルな SSM クライアント"""
+    def __init__(self, mode: str = "INTERLEAVE"):
+        self.mode = mode
+        self.error: Optional[Exception] = None
+        self.delay = 0.0
+        self.call_count = 0
+
+    def get_parameters(self, Names):
+        self.call_count += 1
+        if self.delay:
+            time.sleep(self.delay)
+        if self.error is not None:
+            raise self.error
+        return {'Parameters': [{'Name': '/reco/exp/mode', 'Value': self.mode}]}
+
+def test_expired_config_is_served_while_refreshing():
+    """TTL切れでもリクエスト内ではSSMを待たず、キャッシュ済みの設定を即座に返すこと"""
+    ssm = FakeSSMClient(mode="INTERLEAVE")
+    manager = ConfigManager(ttl_seconds=0.05, ssm_client=ssm, jitter_ratio=0.0)
+    assert manager.get_config().mode == "INTERLEAVE"
+    
+    time.sleep(0.1)
+    ssm.mode = "B"
+    ssm.delay = 0.3
+    
+    started = time.monotonic()
+    config = manager.get_config()
+    assert time.monotonic() - started < 0.1
+    assert config.mode == "INTERLEAVE"
+    
+    manager.wait_for_refresh(timeout=1.0)
+    assert manager.get_config().mode == "B"
+
+def test_refresh_failure_keeps_last_good_config():
+    """更新失敗時はデフォルトではなく最後に取得できた設定を返し続けること"""
+    ssm = FakeSSMClient(mode="INTERLEAVE")
+    manager = ConfigManager(ttl_seconds=0.05, ssm_client=ssm, jitter_ratio=0.0)
+    manager.get_config()
+    
+    time.sleep(0.1)
+    ssm.error = Exception("ThrottlingException")
+    manager.get_config()
+    manager.wait_for_refresh(timeout=1.0)
+    
+    assert manager.get_config().mode == "INTERLEAVE"
+
+def test_refresh_failure_backs_off():
+    """失敗後はバックオフ期間中に再取得しないこと"""
+    ssm = FakeSSMClient()
+    ssm.error = Exception("SSM Error")
+    manager = ConfigManager(ssm_client=ssm, jitter_ratio=0.0, backoff_base_seconds=60.0)
+    
+    for _ in range(5):
+        assert manager.get_config().mode == "A"
+    manager.wait_for_refresh(timeout=1.0)
+    
+    assert ssm.call_count == 1
+
+def test_concurrent_expiry_starts_single_refresh():
+    """同時に期限切れを検知しても更新スレッドは1本だけであること"""
+    ssm = FakeSSMClient()
+    manager = ConfigManager(ttl_seconds=0.01, ssm_client=ssm, jitter_ratio=0.0)
+    manager.get_config()
+    
+    time.sleep(0.05)
+    ssm.delay = 0.1
+    for _ in range(20):
+        manager.get_config()
+    manager.wait_for_refresh(timeout=1.0)
+    
+    assert ssm.call_count == 2
+
+def test_env_source_does_not_touch_boto3(monkeypatch):
+    """env ソースでは boto3 クライアントを生成しないこと"""
+    monkeypatch.setenv("INTERLEAVING_MODE", "INTERLEAVE")
+    monkeypatch.setenv("INTERLEAVING_SAMPLING_RATE", "0.25")
+    monkeypatch.setenv("INTERLEAVING_PARALLEL_ENABLED", "TRUE")
+    
+    with patch('boto3.client') as mock_client:
+        manager = ConfigManager(source="env")
+        config = manager.get_config()
+    
+    mock_client.assert_not_called()
+    assert config.mode == "INTERLEAVE"
+    assert config.sampling_rate == 0.25
+    assert config.parallel_enabled is True
+    assert config.interleave_method == "team_draft"
+
+def test_file_source_reads_json(tmp_path, monkeypatch):
+    """file ソースで JSON ファイルから設定を読むこと (環境変数でも選択できる)"""
+    path = tmp_path / "experiment.json"
+    path.write_text('{"mode": "INTERLEAVE", "sampling_rate": 0.5, "parallel_enabled": true, "interleave_method": "optimized"}')
+    monkeypatch.setenv("INTERLEAVING_CONFIG_SOURCE", "file")
+    monkeypatch.setenv("INTERLEAVING_CONFIG_PATH", str(path))
+    
+    config = ConfigManager().get_config()
+    
+    assert config.mode == "INTERLEAVE"
+    assert config.sampling_rate == 0.5
+    assert config.parallel_enabled is True
+    assert config.interleave_method == "optimized"
+
+def test_rankers_are_parsed_from_comma_separated_string(monkeypatch):
+    monkeypatch.setenv("INTERLEAVING_MODE", "MULTILEAVE")
+    monkeypatch.setenv("INTERLEAVING_RANKERS", "prod, m1,m2 ,m3")
+    monkeypatch.setenv("INTERLEAVING_MULTILEAVE_METHOD", "probabilistic")
+    
+    config = ConfigManager(source="env").get_config()
+    
+    assert config.mode == "MULTILEAVE"
+    assert config.rankers == ("prod", "m1", "m2", "m3")
+    assert config.baseline == "prod"
+    assert config.multileave_method == "probabilistic"
+
+def test_rankers_can_be_a_json_list(tmp_path):
+    path = tmp_path / "experiment.json"
+    path.write_text('{"mode": "MULTILEAVE", "sampling_rate": 0.1, "rankers": ["A", "B", "C", "D"]}')
+    
+    config = ConfigManager(source="file", config_path=str(path)).get_config()
+    
+    assert config.rankers == ("A", "B", "C", "D")
+    assert config.multileave_method == "team_draft"
+
+def test_rankers_default_to_a_and_b(monkeypatch):
+    monkeypatch.setenv("INTERLEAVING_MODE", "INTERLEAVE")
+    
+    config = ConfigManager(source="env").get_config()
+    
+    assert config.rankers == ("A", "B")
+    assert config.baseline == "A"
+
+def test_salt_is_parsed(monkeypatch):
+    monkeypatch.setenv("INTERLEAVING_MODE", "INTERLEAVE")
+    monkeypatch.setenv("INTERLEAVING_SALT", "exp-2026-10")
+    
+    config = ConfigManager(source="env").get_config()
+    
+    assert config.salt == "exp-2026-10"
+
+def test_ssm_client_is_created_lazily(mock_ssm_client):
+    """SSM クライアントは初回取得時まで生成されないこと"""
+    mock_ssm_client.get_parameters.return_value = {'Parameters': []}
+    
+    with patch('boto3.client') as mock_client:
+        mock_client.return_value = mock_ssm_client
+        manager = ConfigManager()
+        mock_client.assert_not_called()
+        
+        manager.get_config()
+        mock_client.assert_called_once_with('ssm')
+
+def test_execution_backend_is_parsed(monkeypatch):
+    monkeypatch.setenv("INTERLEAVING_MODE", "INTERLEAVE")
+    monkeypatch.setenv("INTERLEAVING_PARALLEL_ENABLED", "true")
+    monkeypatch.setenv("INTERLEAVING_EXECUTION_BACKEND", "process")
+    
+    config = ConfigManager(source="env").get_config()
+    
+    assert config.parallel_enabled is True
+    assert config.execution_backend == "process"
+    assert ExperimentConfig(mode="A", sampling_rate=0.0, parallel_enabled=False).execution_backend == "thread"
+
+@pytest.mark.parametrize("value, enabled, delay_ms", [
+    (None, False, None),
+    ("off", False, None),
+    ("auto", True, None),
+    ("120", True, 120.0),
+])
+def test_hedge_settings_are_parsed(monkeypatch, value, enabled, delay_ms):
+    monkeypatch.setenv("INTERLEAVING_MODE", "INTERLEAVE")
+    if value is not None:
+        monkeypatch.setenv("INTERLEAVING_HEDGE_DELAY_MS", value)
+    monkeypatch.setenv("INTERLEAVING_HEDGE_PERCENTILE", "0.9")
+    
+    config = ConfigManager(source="env").get_config()
+    
+    assert config.hedge_enabled is enabled
+    assert config.hedge_delay_ms == delay_ms
+    assert config.hedge_percentile == 0.9
+
+def test_config_keys_fit_in_one_ssm_request():
+    # GetParameters は1回に 10 件まで
+    assert len(CONFIG_KEYS) <= 10
@@ -0,0 +1,160 @@
+import dataclasses
+import json
+import os
+import pytest
+from pydantic import ValidationError
+from src.config import ConfigManager, ExperimentSet
+from src.config_schema import parse_document
+from src.config_source import EnvConfigSource, FileConfigSource, StaticConfigSource
+
+DOCUMENT = {
+    "default": "home",
+    "experiments": {
+        "home": {"mode": "INTERLEAVE", "sampling_rate": 0.1, "interleave_method": "optimized", "tau": 2.0},
+        "search": {"mode": "MULTILEAVE", "sampling_rate": 0.05, "rankers": ["prod", "m1", "m2"], "salt": "search-1"},
+    },
+}
+
+def _write(path, document, mtime_ns=None):
+    path.write_text(json.dumps(document))
+    if mtime_ns is not None:
+        os.utime(path, ns=(mtime_ns, mtime_ns))
+
+def test_parse_multi_experiment_document():
+    experiments = parse_document(DOCUMENT)
+
+    assert experiments.default == "home"
+    assert experiments.get().interleave_method == "optimized"
+    assert experiments.get().tau == 2.0
+    assert experiments.get("search").rankers == ("prod", "m1", "m2")
+    assert experiments.get("search").baseline == "prod"
+    assert experiments.get("unknown") is None
+
+def test_parse_flat_document_as_single_experiment():
+    # SSM / 環境変数の値は文字列
+    experiments = parse_document({"mode": "INTERLEAVE", "sampling_rate": "0.2", "parallel_enabled": "TRUE", "rankers": "A, B"})
+
+    assert list(experiments.experiments) == ["default"]
+    config = experiments.get()
+    assert (config.mode, config.sampling_rate, config.parallel_enabled, config.rankers) == ("INTERLEAVE", 0.2, True, ("A", "B"))
+
+@pytest.mark.parametrize("document", [
+    {"mode": "INTERLEAVE", "sampling_rate": 1.5},
+    {"mode": "INTERLEAVE", "interleave_method": "unknown"},
+    {"mode": "INTERLEAVE", "sampling_rat": 0.1},
+    {"mode": "C", "rankers": ["A", "B"]},
+    {"experiments": {}},
+    {"experiments": {"x": {"mode": "A"}}, "default": "y"},
+])
+def test_invalid_documents_are_rejected(document):
+    with pytest.raises(ValidationError):
+        parse_document(document)
+
+def test_parsed_result_is_immutable():
+    experiments = parse_document(DOCUMENT)
+
+    with pytest.raises(TypeError):
+        experiments.experiments["new"] = experiments.get()
+    with pytest.raises(dataclasses.FrozenInstanceError):
+        experiments.get().sampling_rate = 1.0
+
+def test_manager_serves_named_experiments(tmp_path):
+    path = tmp_path / "experiments.json"
+    _write(path, DOCUMENT)
+    manager = ConfigManager(source=FileConfigSource(str(path)))
+
+    assert manager.get_config().mode == "INTERLEAVE"
+    assert manager.get_config("search").mode == "MULTILEAVE"
+    # 未定義の実験は安全側のデフォルト
+    assert manager.get_config("unknown").mode == "A"
+    assert isinstance(manager.get_experiments(), ExperimentSet)
+
+def test_file_source_is_watched_by_mtime(tmp_path):
+    path = tmp_path / "experiments.json"
+    _write(path, DOCUMENT, mtime_ns=1_000_000_000)
+    manager = ConfigManager(source=FileConfigSource(str(path)), ttl_seconds=0.0, jitter_ratio=0.0)
+    first = manager.get_experiments()
+
+    # 変更が無ければ解析せず、同じ ExperimentSet を使い続ける
+    manager._refresh()
+    assert manager.get_experiments() is first
+
+    changed = {**DOCUMENT, "default": "search"}
+    _write(path, changed, mtime_ns=2_000_000_000)
+    manager._refresh()
+    assert manager.get_experiments() is not first
+    assert manager.get_config().mode == "MULTILEAVE"
+
+def test_invalid_update_keeps_last_good_config(tmp_path):
+    path = tmp_path / "experiments.json"
+    _write(path, DOCUMENT, mtime_ns=1_000_000_000)
+    manager = ConfigManager(source=FileConfigSource(str(path)), jitter_ratio=0.0)
+    assert manager.get_config().tau == 2.0
+
+    _write(path, {"experiments": {"home": {"mode": "INTERLEAVE", "tau": -1}}}, mtime_ns=2_000_000_000)
+    manager._refresh()
+
+    assert manager.get_config().tau == 2.0
+    assert manager._consecutive_failures == 1
+
+def test_yaml_file_source(tmp_path):
+    pytest.importorskip("yaml")
+    path = tmp_path / "experiments.yaml"
+    path.write_text(
+        "default: home\n"
+        "experiments:\n"
+        "  home:\n"
+        "    mode: INTERLEAVE\n"
+        "    sampling_rate: 0.3\n"
+        "    hedge_delay_ms: auto\n"
+    )
+
+    config = ConfigManager(source=FileConfigSource(str(path))).get_config("home")
+
+    assert config.sampling_rate == 0.3
+    assert config.hedge_enabled is True
+    assert config.hedge_delay_ms is None
+
+class FakeDocumentSSMClient:
+    def __init__(self, document):
+        self.value = json.dumps(document)
+        self.version = 1
+        self.calls = 0
+
+    def get_parameter(self, Name):
+        self.calls += 1
+        return {"Parameter": {"Name": Name, "Value": self.value, "Version": self.version}}
+
+def test_ssm_document_parameter_needs_one_call_per_refresh():
+    ssm = FakeDocumentSSMClient(DOCUMENT)
+    manager = ConfigManager(ssm_client=ssm, ssm_parameter="/reco/exp/experiments", jitter_ratio=0.0)
+
+    assert manager.get_config("search").salt == "search-1"
+    assert manager.get_config("home").tau == 2.0
+    first = manager.get_experiments()
+    assert ssm.calls == 1
+
+    manager._refresh()
+    assert ssm.calls == 2
+    assert manager.get_experiments() is first
+
+    ssm.value = json.dumps({**DOCUMENT, "default": "search"})
+    ssm.version = 2
+    manager._refresh()
+    assert manager.get_config().mode == "MULTILEAVE"
+
+def test_sources_report_unchanged_versions(tmp_path):
+    env = EnvConfigSource({"INTERLEAVING_MODE": "INTERLEAVE"})
+    version, document = env.load()
+    assert document == {"mode": "INTERLEAVE"}
+    assert env.load(version) is None
+
+    static = StaticConfigSource({"mode": "B"})
+    version, _ = static.load()
+    assert static.load(version) is None
+    static.update({"mode": "A"})
+    assert static.load(version)[1] == {"mode": "A"}
+
+def test_file_source_requires_path():
+    with pytest.raises(ValueError):
+        FileConfigSource("").load()
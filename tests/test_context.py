@@ -0,0 +1,88 @@
+
+import pytest
+from src.context import CandidateBlock, CompactItem, Item, ItemBatch, MetaView
+
+def test_item_with_attribution_returns_copy():
+    item = Item(id="i1", score=1.0, meta={"algo": "a"})
+    attributed = item.with_attribution("A", 0.5)
+    
+    assert attributed.source_ranker == "A"
+    assert attributed.prob == 0.5
+    assert attributed.meta is item.meta
+    assert item.source_ranker is None
+
+def test_compact_item_is_immutable_and_slotted():
+    item = CompactItem("i1", 1.0)
+    
+    with pytest.raises(AttributeError):
+        item.score = 2.0
+    assert not hasattr(item, "__dict__")
+
+def test_compact_item_meta_is_view_over_raw():
+    raw = {"id": "i1", "score": 1.0, "algo": "a"}
+    item = CompactItem("i1", 1.0, raw=raw)
+    
+    assert isinstance(item.meta, MetaView)
+    assert item.meta == {"algo": "a"}
+    assert len(item.meta) == 1
+    assert "id" not in item.meta
+    # コピーではなくビュー
+    raw["extra"] = 1
+    assert item.meta["extra"] == 1
+
+def test_compact_item_without_raw_has_empty_meta():
+    assert dict(CompactItem("i1", 1.0).meta) == {}
+
+def test_compact_item_with_attribution_keeps_raw():
+    raw = {"id": "i1", "score": 1.0}
+    item = CompactItem("i1", 1.0, raw=raw).with_attribution("B", 1.0)
+    
+    assert item.source_ranker == "B"
+    assert item.raw is raw
+
+def test_item_batch_iterates_compact_items():
+    batch = ItemBatch(["x", "y"], [2.0, 1.0])
+    items = list(batch)
+    
+    assert [i.id for i in items] == ["x", "y"]
+    assert [i.score for i in items] == [2.0, 1.0]
+    assert [i.original_rank for i in items] == [1, 2]
+    assert type(items[0].score) is float
+    assert batch[1].id == "y"
+
+def test_item_batch_from_scores_sorts_descending_stable():
+    batch = ItemBatch.from_scores(["a", "b", "c"], [1.0, 3.0, 1.0], raws=[{"n": 0}, {"n": 1}, {"n": 2}])
+    
+    assert batch.ids == ["b", "a", "c"]
+    assert batch.scores.tolist() == [3.0, 1.0, 1.0]
+    assert [i.meta["n"] for i in batch] == [1, 0, 2]
+
+def test_item_batch_rejects_length_mismatch():
+    with pytest.raises(ValueError):
+        ItemBatch(["a"], [1.0, 2.0])
+
+def test_candidate_block_features_are_read_only_views():
+    import numpy as np
+    prices = np.array([1.0, 2.0, 3.0])
+    block = CandidateBlock(["a", "b", "c"], {"price": prices})
+    
+    assert len(block) == 3
+    assert np.shares_memory(block["price"], prices)
+    with pytest.raises(ValueError):
+        block["price"][0] = 10.0
+    # 渡した配列自体は書き換え可能なまま
+    assert prices.flags.writeable
+
+def test_candidate_block_from_records_and_to_batch():
+    records = [{"id": 1, "ctr": 0.1}, {"id": 2, "ctr": 0.5, "cat": "x"}, {"id": 3}]
+    block = CandidateBlock.from_records(records, ["ctr"])
+    
+    assert block.ids == ["1", "2", "3"]
+    assert block["ctr"].tolist() == [0.1, 0.5, 0.0]
+    batch = block.to_batch(block["ctr"])
+    assert batch.ids == ["2", "1", "3"]
+    assert batch[0].meta == {"ctr": 0.5, "cat": "x"}
+
+def test_candidate_block_rejects_length_mismatch():
+    with pytest.raises(ValueError):
+        CandidateBlock(["a"], {"x": [1.0, 2.0]})
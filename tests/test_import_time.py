@@ -0,0 +1,45 @@
+
+import json
+import os
+import subprocess
+import sys
+import pytest
+
+# コールドスタートで支払う import コストの上限 (秒)。CI 環境差を見込んで余裕を持たせている
+IMPORT_BUDGET_SECONDS = float(os.environ.get("INTERLEAVING_IMPORT_BUDGET", "0.15"))
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def _measure_import(module: str) -> dict:
+    """新しいインタプリタで module を import し、所要時間と読み込まれた重いモジュールを返す"""
+    code = (
+        "import json, sys, time\n"
+        "started = time.perf_counter()\n"
+        f"import {module}\n"
+        "elapsed = time.perf_counter() - started\n"
+        "print(json.dumps({'seconds': elapsed, 'boto3': 'boto3' in sys.modules, 'botocore': 'botocore' in sys.modules}))\n"
+    )
+    output = subprocess.run(
+        [sys.executable, "-c", code],
+        cwd=REPO_ROOT,
+        check=True,
+        capture_output=True,
+        text=True,
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+@pytest.mark.parametrize("module", [
+    "src.interleaving.api",
+    "src.config",
+    "src.interleaving.bucketer",
+    "src.execution.executor",
+])
+def test_import_does_not_load_boto3(module):
+    result = _measure_import(module)
+    assert result["boto3"] is False
+    assert result["botocore"] is False
+
+def test_interleaving_api_import_time_within_budget():
+    # 1回目はバイトコード生成を含むため、ウォームアップ後の最小値で判定する
+    seconds = min(_measure_import("src.interleaving.api")["seconds"] for _ in range(3))
+    assert seconds < IMPORT_BUDGET_SECONDS
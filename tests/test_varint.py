@@ -0,0 +1,18 @@
+import pytest
+from src.varint import read_varints, write_varints
+
+def test_round_trip_including_64bit_values():
+    values = [0, 1, 127, 128, 300, (1 << 63) - 1, (1 << 64) - 1]
+    data = write_varints(values)
+    
+    assert read_varints(data, len(values)) == (values, len(data))
+
+def test_read_from_offset_returns_end_position():
+    data = b"\xff" + write_varints([5, 1000]) + b"tail"
+    
+    assert read_varints(data, 2, offset=1) == ([5, 1000], len(data) - 4)
+
+@pytest.mark.parametrize("data", [b"", b"\x80", b"\xff" * 10 + b"\x01"])
+def test_rejects_truncated_or_oversized_varints(data):
+    with pytest.raises(ValueError):
+        read_varints(data, 1)